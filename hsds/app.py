@@ -223,6 +223,12 @@ def main():
         dest="config_dir",
         help="directory for config data",
     )
+    parser.add_argument(
+        "--in_process",
+        action="store_true",
+        dest="in_process",
+        help="run the service node and one data node in this process",
+    )
 
     args = parser.parse_args()
 
@@ -338,6 +344,9 @@ def main():
 
     if args.dn_count:
         kwargs["dn_count"] = args.dn_count
+    if args.in_process:
+        kwargs["in_process"] = True
+        kwargs["dn_count"] = 1
 
     if args.bucket_name:
         bucket_name = args.bucket_name
@@ -17,8 +17,8 @@ from bisect import bisect_left
 
 from aiohttp.web_exceptions import HTTPBadRequest, HTTPConflict, HTTPNotFound, HTTPGone
 from aiohttp.web_exceptions import HTTPInternalServerError
-from aiohttp.web import json_response
 
+from .util.httpUtil import rpcResponse, getRequestJson
 from .util.attrUtil import validateAttributeName, isEqualAttr
 from .util.hdf5dtype import getItemSize, createDataType
 from .util.globparser import globmatch
@@ -251,7 +251,7 @@ async def GET_Attributes(request):
         attr_list.append(des_attr)
 
     resp_json = {"attributes": attr_list}
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
 
@@ -267,7 +267,7 @@ async def POST_Attributes(request):
         log.warn(msg)
         raise HTTPBadRequest(reason=msg)
 
-    body = await request.json()
+    body = await getRequestJson(request)
     if "attributes" not in body:
         msg = f"POST_Attributes expected attributes in body but got: {body.keys()}"
         log.warn(msg)
@@ -348,7 +348,7 @@ async def POST_Attributes(request):
         log.info("one or mores attributes not found, returning 404")
         raise HTTPNotFound()
     log.debug(f"POST attributes returning: {resp_json}")
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
 
@@ -366,7 +366,7 @@ async def PUT_Attributes(request):
         log.error("PUT_Attribute with no body")
         raise HTTPBadRequest(message="body expected")
 
-    body = await request.json()
+    body = await getRequestJson(request)
     log.debug(f"got body: {body}")
     if "bucket" in params:
         bucket = params["bucket"]
@@ -520,7 +520,7 @@ async def PUT_Attributes(request):
 
     resp_json = {"status": status}
 
-    resp = json_response(resp_json, status=status)
+    resp = rpcResponse(request, resp_json, status=status)
     log.response(request, resp=resp)
     return resp
 
@@ -614,6 +614,6 @@ async def DELETE_Attributes(request):
         await save_metadata_obj(app, obj_id, obj_json, bucket=bucket)
 
     resp_json = {}
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
@@ -28,6 +28,7 @@ from aiohttp.web_exceptions import HTTPServiceUnavailable
 from . import config
 from .util.httpUtil import http_get, http_post, jsonResponse
 from .util.idUtil import createNodeId, getNodeNumber, getNodeCount
+from .util.idUtil import getObjHash, getDnPartitioner, getPrevDnPartitioner
 from .util.authUtil import getUserPasswordFromRequest, validateUserPassword
 from .util.authUtil import isAdminUser
 from .util.k8sClient import getDnLabelSelector, getPodIps
@@ -284,6 +285,71 @@ async def update_dn_info(app):
             log.info(f"update_dn_info - dn_nodes: {new_ids} are now active")
 
 
+def _evictMovedItems(app):
+    """After a change in dn_urls, remove cache items that this node owned
+    with the previous dn_urls, but that belong to another node now, so that
+    reads for them in the transition window come from storage rather than
+    a copy the new owner may have updated.  Items owned under both stay
+    cached.  The hottest moved items are kept in app["handoff_items"] (not
+    served from) till the new owners have had time to pull them (see
+    handoff_dn.pullHotItems).  Dirty items are removed once they have been
+    flushed.  Returns the number of moved items that still need to be
+    flushed.
+    """
+    partitioner = getDnPartitioner(app)
+    prev_partitioner = app.get("dn_partitioner_prev")
+    if partitioner is None or prev_partitioner is None:
+        return 0
+    node_url = app["dn_urls"][app["node_number"]]
+
+    def is_moved(obj_id):
+        hash_value = getObjHash(obj_id)
+        if prev_partitioner.getNode(hash_value) != node_url:
+            return False  # wasn't ours before
+        return partitioner.getNode(hash_value) != node_url
+
+    handoff_items = app["handoff_items"]
+    max_bytes = int(config.get("cache_handoff_max_bytes", default=0))
+    max_bytes -= sum(item[2] for item in handoff_items.values())
+    max_items = int(config.get("cache_handoff_max_items", default=0))
+    dirty_count = 0
+    evict_count = 0
+    for cache_name in ("meta_cache", "chunk_cache"):
+        cache = app[cache_name]
+        if max_bytes > 0:
+            kwargs = {"key_filter": is_moved}
+            if max_items > 0:
+                kwargs["max_count"] = max(max_items - len(handoff_items), 0)
+            for obj_id in cache.getHotKeys(max_bytes, **kwargs):
+                obj_size = cache.getSize(obj_id)
+                update_time = cache.getUpdateTime(obj_id)
+                handoff_items[obj_id] = (cache_name, cache.peek(obj_id), obj_size, update_time)
+                max_bytes -= obj_size
+        for obj_id in list(cache):
+            if not is_moved(obj_id):
+                continue
+            if cache.isDirty(obj_id):
+                dirty_count += 1
+            else:
+                del cache[obj_id]
+                evict_count += 1
+    if evict_count:
+        log.info(f"scaling - removed {evict_count} cache items moved to other nodes")
+    if getPrevDnPartitioner(app) is not None:
+        # SNs may still be sending reads for these, keep serving requests
+        # while the dirty items get flushed
+        return 0
+    handoff_time = float(config.get("cache_handoff_timeout", default=10))
+    handoff_time += float(config.get("node_sleep_time", default=10))
+    if time.time() < app["dn_partition_transition_end"] + handoff_time:
+        # new owners pull hot items once the transition window is over
+        return 0
+    if dirty_count == 0:
+        app["dn_partitioner_prev"] = None
+        handoff_items.clear()
+    return dirty_count
+
+
 def updateReadyState(app, old_dn_urls=None):
     """update node state (and node_number and node_count) based on number
     of dn_urls available
@@ -311,23 +377,16 @@ def updateReadyState(app, old_dn_urls=None):
         if old_number != node_number:
             msg = f"node_number was {old_number}, setting to: {node_number}"
             log.info(msg)
-            meta_cache = app["meta_cache"]
-            chunk_cache = app["chunk_cache"]
-            dirty_cache_count = meta_cache.dirtyCount + chunk_cache.dirtyCount
+            app["node_number"] = node_number
+        if is_ready and node_number >= 0:
+            dirty_cache_count = _evictMovedItems(app)
             if dirty_cache_count > 0:
-                # set the node state to waiting till the chunk cache have
+                # set the node state to waiting till the moved items have
                 # been flushed
                 msg = f"updateReadyState - waiting on {dirty_cache_count} "
                 msg += "cache items to be flushed"
                 log.info(msg)
                 is_ready = False
-            else:
-                # flush remaining items from cache
-                meta_cache.clearCache()
-                chunk_cache.clearCache()
-                msg = f"scaling - setting node_number to: {node_number} (old value: {old_number}"
-                log.info(msg)
-                app["node_number"] = node_number
     else:
         # sn node
         if old_dn_urls:
@@ -527,6 +586,8 @@ async def info(request):
         cc_stats["utililization_per"] = cc.cacheUtilizationPercent
         cc_stats["mem_used"] = cc.memUsed
         cc_stats["mem_target"] = cc.memTarget
+        cc_stats["mem_free"] = cc.memFree
+        cc_stats["flush_rate"] = cc.flushRate
     answer["chunk_cache_stats"] = cc_stats
     dc_stats = {}
     if "domain_cache" in app:
@@ -537,14 +598,50 @@ async def info(request):
         dc_stats["mem_used"] = dc.memUsed
         dc_stats["mem_target"] = dc.memTarget
     answer["domain_cache_stats"] = dc_stats
+    wal_stats = {}
+    if app.get("wal") is not None:
+        wal = app["wal"]  # only DN nodes with a write-ahead log have this
+        wal_stats["fsync"] = wal.fsyncPolicy
+        wal_stats["dirty_count"] = wal.dirtyCount
+        wal_stats["pending_count"] = wal.pendingCount
+        wal_stats["segment_count"] = wal.segmentCount
+        wal_stats["record_count"] = wal.recordCount
+        wal_stats["commit_count"] = wal.commitCount
+    answer["wal_stats"] = wal_stats
+    write_stats = {}
+    if app.get("write_concurrency") is not None:
+        wc = app["write_concurrency"]  # DN only
+        write_stats["concurrency"] = wc.limit
+        write_stats["min_concurrency"] = wc.minCount
+        write_stats["max_concurrency"] = wc.maxCount
+        write_stats["pending_count"] = len(app["pending_s3_write_tasks"])
+        write_stats["latency"] = wc.latency
+        write_stats["flush_bandwidth"] = int(wc.bandwidth)
+        write_stats["write_count"] = wc.writeCount
+        write_stats["error_count"] = wc.errorCount
+    answer["s3sync_stats"] = write_stats
+    dn_concurrency_stats = {}
+    if app.get("dn_concurrency"):
+        for dn_url, dc in app["dn_concurrency"].items():  # SN only
+            limiter_stats = {}
+            limiter_stats["limit"] = dc.limit
+            limiter_stats["inflight"] = dc.inflight
+            limiter_stats["latency"] = dc.latency
+            limiter_stats["base_latency"] = dc.baseLatency
+            limiter_stats["request_count"] = dc.requestCount
+            limiter_stats["overload_count"] = dc.overloadCount
+            dn_concurrency_stats[dn_url] = limiter_stats
+    answer["dn_concurrency_stats"] = dn_concurrency_stats
 
     resp = await jsonResponse(request, answer)
     log.response(request, resp=resp)
     return resp
 
 
-def baseInit(node_type):
-    """Intitialize application and return app object"""
+def baseInit(node_type, standalone=None, node_number=None, dn_urls=None, readonly=None):
+    """Intitialize application and return app object.  Any of standalone,
+    node_number, dn_urls, or readonly not given are taken from the command
+    line."""
 
     # setup log config
     log_level = config.get("log_level")
@@ -570,7 +667,10 @@ def baseInit(node_type):
     app["max_task_count"] = config.get("max_task_count")
     app["storage_clients"] = {}  # storage client drivers
 
-    is_standalone = config.getCmdLineArg("standalone")
+    if standalone is None:
+        is_standalone = config.getCmdLineArg("standalone")
+    else:
+        is_standalone = standalone
 
     if is_standalone:
         log.info("running in standalone mode")
@@ -579,7 +679,8 @@ def baseInit(node_type):
         # set node_number and node_id
         # for standalone, node_number will be passed on command line
         # create node_id based on the node_number
-        node_number = config.getCmdLineArg("node_number")
+        if node_number is None:
+            node_number = config.getCmdLineArg("node_number")
         if node_number is None:
             log.info("No node_number argument")
             node_number = 0
@@ -594,7 +695,10 @@ def baseInit(node_type):
         log.info(f"using node port: {node_port}")
         app["node_port"] = node_port
 
-    is_readonly = config.getCmdLineArg("readonly")
+    if readonly is None:
+        is_readonly = config.getCmdLineArg("readonly")
+    else:
+        is_readonly = readonly
     if is_readonly:
         log.info("running in readonly mode")
         app["is_readonly"] = True
@@ -614,10 +718,12 @@ def baseInit(node_type):
     app["dn_ids"] = []  # node ids for each dn_url
 
     if is_standalone:
-        dn_urls_arg = config.getCmdLineArg("dn_urls")
-        if dn_urls_arg:
-            dn_urls = dn_urls_arg.split(",")
-            dn_urls.sort()
+        if dn_urls is None:
+            dn_urls_arg = config.getCmdLineArg("dn_urls")
+            if dn_urls_arg:
+                dn_urls = dn_urls_arg.split(",")
+        if dn_urls:
+            dn_urls = sorted(dn_urls)
             dn_ids = []
             for i in range(len(dn_urls)):
                 dn_url = dn_urls[i]
@@ -25,6 +25,7 @@ from aiohttp.web_exceptions import HTTPInternalServerError
 from aiohttp.client_exceptions import ClientError
 
 from .util.httpUtil import http_get, http_put, http_post, get_http_client
+from .util.httpUtil import http_post_frames
 from .util.httpUtil import isUnixDomainUrl
 from .util.idUtil import getDataNodeUrl, getNodeCount
 from .util.hdf5dtype import createDataType
@@ -33,7 +34,13 @@ from .util.dsetUtil import getSelectionShape, getChunkLayout
 from .util.chunkUtil import getChunkCoverage, getDataCoverage
 from .util.chunkUtil import getChunkIdForPartition, getQueryDtype
 from .util.arrayUtil import jsonToArray, getNumpyValue
-from .util.arrayUtil import getNumElements, arrayToBytes, bytesToArray
+from .util.arrayUtil import getNumElements, arrayToBytes, bytesToArray, isVlen
+from .util.writeCredit import WriteCredit
+from .util.dnConcurrency import DnConcurrency, DnWorkQueue
+from .util.batchUtil import encodeFrames
+from .util.aggregateUtil import getAggregateParams, getPartialAggregate
+from .util.shmUtil import isSameHost
+from .util.zoneMapUtil import getChunkCoordKey, isZoneMapDataset
 
 from . import config
 from . import hsds_logger as log
@@ -72,6 +79,52 @@ def getFillValue(dset_json):
     return arr
 
 
+def getWriteCredit(app, dn_url):
+    """Return the WriteCredit object for the given DN.  These are shared
+    by all requests in this SN process."""
+    if "dn_write_credits" not in app:
+        app["dn_write_credits"] = {}
+    write_credits = app["dn_write_credits"]
+    if dn_url not in write_credits:
+        max_wait = config.get("write_credit_max_wait", default=1.0)
+        write_credits[dn_url] = WriteCredit(name=dn_url, max_wait=max_wait)
+    return write_credits[dn_url]
+
+
+def getDnConcurrency(app, dn_url):
+    """Return the DnConcurrency object for the given DN.  These are shared
+    by all requests in this SN process."""
+    if "dn_concurrency" not in app:
+        app["dn_concurrency"] = {}
+    dn_concurrency = app["dn_concurrency"]
+    if dn_url not in dn_concurrency:
+        kwargs = {
+            "name": dn_url,
+            "min_limit": int(config.get("dn_concurrency_min", default=1)),
+            "max_limit": int(config.get("dn_concurrency_max", default=32)),
+            "initial_limit": int(config.get("max_tasks_per_node_per_request", default=16)),
+            "tolerance": float(config.get("dn_concurrency_tolerance", default=2.0)),
+        }
+        dn_concurrency[dn_url] = DnConcurrency(**kwargs)
+    return dn_concurrency[dn_url]
+
+
+def getShmLease(app, dn_url, nbytes):
+    """Return a shared memory lease for the DN to write nbytes of response
+    data to, or None if the data should come in the response body"""
+    shm_pool = app.get("shm_pool")
+    if shm_pool is None or not isSameHost(dn_url):
+        return None
+    return shm_pool.lease(nbytes)
+
+
+def releaseShmLease(app, shm_lease, reuse=True):
+    """Give back a lease from getShmLease.  Use reuse=False if the request
+    didn't complete, since the DN may still write to it"""
+    if shm_lease is not None:
+        app["shm_pool"].release(shm_lease, reuse=reuse)
+
+
 async def write_chunk_hyperslab(
     app, chunk_id, dset_json, slices, arr, bucket=None, client=None
 ):
@@ -136,23 +189,376 @@ async def write_chunk_hyperslab(
     else:
         arr_chunk = arr[data_sel]
 
-    req = getDataNodeUrl(app, chunk_id)
-    req += "/chunks/" + chunk_id
+    dn_url = getDataNodeUrl(app, chunk_id)
+    req = dn_url + "/chunks/" + chunk_id
 
     data = arrayToBytes(arr_chunk)
 
     log.debug(f"PUT chunk req: {req}, {len(data)} bytes")
 
+    # charge a full chunk against the DN's write credit since that's what
+    # a new chunk will take up in the DN's cache
+    nbytes = len(data)
+    if not isVlen(dset_dtype):
+        chunk_bytes = int(np.prod(layout)) * dset_dtype.itemsize
+        if chunk_bytes > nbytes:
+            nbytes = chunk_bytes
+
     # pass itemsize, type, dimensions, and selection as query params
     select = getSliceQueryParam(chunk_sel)
     params["select"] = select
     if bucket:
         params["bucket"] = bucket
 
-    json_rsp = await http_put(app, req, data=data, params=params, client=client)
+    write_credit = getWriteCredit(app, dn_url)
+    await write_credit.acquire(nbytes)
+    try:
+        json_rsp = await http_put(app, req, data=data, params=params, client=client)
+    except HTTPServiceUnavailable:
+        # DN is out of room, hold off till it's flushed some chunks
+        write_credit.update(0)
+        raise
+    finally:
+        write_credit.release(nbytes)
     msg = f"got rsp: {json_rsp} for put binary request: {req}, "
     msg += f"{len(data)} bytes"
     log.debug(msg)
+    if isinstance(json_rsp, dict) and "write_credit" in json_rsp:
+        write_credit.update(json_rsp["write_credit"], flush_rate=json_rsp.get("flush_rate"))
+
+
+def _getBatchValue(value):
+    """convert s3offset/s3size/hyper_dims values to json-able ints"""
+    if isinstance(value, (list, tuple)):
+        return [int(x) for x in value]
+    return int(value)
+
+
+async def read_chunk_batch(
+    app,
+    chunk_ids,
+    dset_json,
+    np_arr,
+    select_dtype=None,
+    chunk_map=None,
+    bucket=None,
+    client=None,
+):
+    """read the chunk selections for a set of chunks that are all on the same
+    DN with one request.  Returns a dict of chunk_id to status code.  Chunks
+    missing from the dict should be retried with read_chunk_hyperslab.
+    """
+    log.info(f"read_chunk_batch - {len(chunk_ids)} chunks, bucket: {bucket}")
+    if select_dtype is None:
+        select_dtype = np_arr.dtype
+    dset_dt = createDataType(dset_json["type"])
+    params = {"action": "read", "bucket": bucket}
+    if len(select_dtype) < len(dset_dt):
+        # field selection, pass in the field names
+        params["fields"] = ":".join(select_dtype.names)
+
+    status_map = {}
+    items = []
+    id_map = {}  # map of id sent to the DN to chunk_id
+    shm_offsets = {}  # map of chunk_id to offset in the shared memory lease
+    shm_nbytes = 0
+    for chunk_id in chunk_ids:
+        if chunk_id not in chunk_map:
+            log.warn(f"expected to find {chunk_id} in chunk_map")
+            status_map[chunk_id] = 200
+            continue
+        chunk_info = chunk_map[chunk_id]
+        partition_chunk_id = getChunkIdForPartition(chunk_id, dset_json)
+        id_map[partition_chunk_id] = chunk_id
+        header = {"id": partition_chunk_id}
+        header["select"] = getSliceQueryParam(chunk_info["chunk_sel"])
+        if "s3path" in chunk_info:
+            header["s3path"] = chunk_info["s3path"]
+        for key in ("s3offset", "s3size", "hyper_dims"):
+            if key in chunk_info:
+                header[key] = _getBatchValue(chunk_info[key])
+        if not isVlen(np_arr.dtype):
+            shm_offsets[chunk_id] = shm_nbytes
+            chunk_shape = getSelectionShape(chunk_info["chunk_sel"])
+            shm_nbytes += getNumElements(chunk_shape) * np_arr.dtype.itemsize
+        items.append((header, b""))
+    if not items:
+        return status_map
+
+    dn_url = getDataNodeUrl(app, items[0][0]["id"])
+    shm_lease = None
+    if shm_offsets:
+        shm_lease = getShmLease(app, dn_url, shm_nbytes)
+    if shm_lease is not None:
+        # have the DN put the data in shared memory rather than the response
+        for header, _ in items:
+            chunk_info = chunk_map[id_map[header["id"]]]
+            offset = shm_offsets[id_map[header["id"]]]
+            chunk_shape = getSelectionShape(chunk_info["chunk_sel"])
+            nbytes = getNumElements(chunk_shape) * np_arr.dtype.itemsize
+            header["shm"] = shm_lease.getHandle(offset, nbytes)
+
+    req = dn_url + "/chunks/batch"
+    kwargs = {"data": encodeFrames(items), "params": params, "client": client}
+    try:
+        async for header, data in http_post_frames(app, req, **kwargs):
+            chunk_id = id_map.get(header.get("id"))
+            if chunk_id is None:
+                log.warn(f"read_chunk_batch - unexpected frame: {header}")
+                continue
+            status = header.get("status")
+            if status == 404:
+                # nothing stored for this chunk, leave the fill value
+                status_map[chunk_id] = 200
+            elif status != 200:
+                log.info(f"read_chunk_batch - status {status} for {chunk_id}")
+                status_map[chunk_id] = status
+            else:
+                chunk_info = chunk_map[chunk_id]
+                chunk_shape = getSelectionShape(chunk_info["chunk_sel"])
+                if "shm_nbytes" in header and shm_lease is not None:
+                    # DN wrote the data to shared memory
+                    offset = shm_offsets[chunk_id]
+                    chunk_arr = shm_lease.getArray(np_arr.dtype, chunk_shape, offset=offset)
+                    if header["shm_nbytes"] != chunk_arr.nbytes:
+                        log.warn(f"read_chunk_batch - unexpected shm_nbytes: {header}")
+                        continue  # will get retried
+                else:
+                    try:
+                        chunk_arr = bytesToArray(data, np_arr.dtype, chunk_shape)
+                    except ValueError as ve:
+                        log.warn(f"read_chunk_batch - bytesToArray ValueError: {ve}")
+                        continue  # will get retried
+                np_arr[chunk_info["data_sel"]] = chunk_arr
+                status_map[chunk_id] = 200
+    except BaseException:
+        releaseShmLease(app, shm_lease, reuse=False)
+        raise
+    releaseShmLease(app, shm_lease)
+    return status_map
+
+
+async def write_chunk_batch(
+    app,
+    chunk_ids,
+    dset_json,
+    slices,
+    arr,
+    bucket=None,
+    client=None,
+):
+    """write the chunk selections for a set of chunks that are all on the same
+    DN with one request.  Returns a dict of chunk_id to status code.  Chunks
+    missing from the dict should be retried with write_chunk_hyperslab.
+    """
+    log.info(f"write_chunk_batch - {len(chunk_ids)} chunks, bucket: {bucket}")
+    dset_dtype = createDataType(dset_json["type"])
+    params = {"action": "write", "bucket": bucket}
+    if len(arr.dtype) < len(dset_dtype):
+        # field selection, pass in the field names
+        params["fields"] = ":".join(arr.dtype.names)
+
+    layout = getChunkLayout(dset_json)
+    chunk_bytes = int(np.prod(layout)) * dset_dtype.itemsize
+
+    # broadcast data if arr has one element and no stride is set
+    do_broadcast = True
+    if np.prod(arr.shape) != 1:
+        do_broadcast = False
+    else:
+        for s in slices:
+            if s.step is not None and s.step > 1:
+                do_broadcast = False
+
+    status_map = {}
+    items = []
+    id_map = {}  # map of id sent to the DN to chunk_id
+    nbytes = 0
+    for chunk_id in chunk_ids:
+        partition_chunk_id = getChunkIdForPartition(chunk_id, dset_json)
+        chunk_sel = getChunkCoverage(chunk_id, slices, layout)
+        if chunk_sel is None:
+            log.warn(f"getChunkCoverage returned None for: {chunk_id}, {slices}, {layout}")
+            status_map[chunk_id] = 200
+            continue
+        id_map[partition_chunk_id] = chunk_id
+        header = {"id": partition_chunk_id, "select": getSliceQueryParam(chunk_sel)}
+        if do_broadcast:
+            header["element_count"] = 1
+            data = arrayToBytes(arr)
+        else:
+            data_sel = getDataCoverage(chunk_id, slices, layout)
+            data = arrayToBytes(arr[data_sel])
+        items.append((header, data))
+        # charge a full chunk against the DN's write credit
+        nbytes += max(len(data), chunk_bytes)
+    if not items:
+        return status_map
+
+    dn_url = getDataNodeUrl(app, items[0][0]["id"])
+    req = dn_url + "/chunks/batch"
+    kwargs = {"data": encodeFrames(items), "params": params, "client": client}
+    write_credit = getWriteCredit(app, dn_url)
+    await write_credit.acquire(nbytes)
+    try:
+        async for header, _ in http_post_frames(app, req, **kwargs):
+            chunk_id = id_map.get(header.get("id"))
+            if chunk_id is None:
+                log.warn(f"write_chunk_batch - unexpected frame: {header}")
+                continue
+            status = header.get("status")
+            if status not in (200, 201):
+                log.info(f"write_chunk_batch - status {status} for {chunk_id}")
+            status_map[chunk_id] = status
+            if "write_credit" in header:
+                write_credit.update(header["write_credit"], flush_rate=header.get("flush_rate"))
+    finally:
+        write_credit.release(nbytes)
+    return status_map
+
+
+async def invalidate_zone_map(app, dset_json, chunk_ids, bucket=None):
+    """Remove the stats of chunks that have been written or deleted from
+    the zone map of the dataset, so that queries don't skip them based on
+    the old values.  This needs to be done before the write returns."""
+    if not chunk_ids or not config.get("zone_maps", default=True):
+        return
+    if not isZoneMapDataset(dset_json):
+        return
+    dset_id = dset_json["id"]
+    chunk_keys = sorted(set(getChunkCoordKey(chunk_id) for chunk_id in chunk_ids))
+    log.debug(f"invalidate_zone_map - {dset_id}: {len(chunk_keys)} chunks")
+    req = getDataNodeUrl(app, dset_id) + "/datasets/" + dset_id + "/zonemap"
+    params = {}
+    if bucket:
+        params["bucket"] = bucket
+    try:
+        await http_put(app, req, data={"invalidate": chunk_keys}, params=params)
+    except Exception as e:
+        # queries could skip the updated chunks, so fail the write
+        log.error(f"invalidate_zone_map - got {type(e)} exception for {dset_id}: {e}")
+        raise HTTPServiceUnavailable()
+
+
+def getScratchArray(scratch, dtype, shape):
+    """Return an array of the given type and shape that uses the buffer
+    saved in the scratch dict, growing the buffer if it's too small.
+    Returns a new array if scratch is None."""
+    if scratch is None:
+        return np.empty(shape, dtype=dtype)
+    nbytes = getNumElements(shape) * dtype.itemsize
+    buffer = scratch.get("buffer")
+    if buffer is None or buffer.size < nbytes:
+        buffer = np.empty((nbytes,), dtype=np.uint8)
+        scratch["buffer"] = buffer
+    return buffer[:nbytes].view(dtype).reshape(shape)
+
+
+def resetSelection(np_arr, data_sel, dset_json):
+    """Set the data_sel region of np_arr back to the fill value it was
+    initialized with, after a failed read into it left partial data there"""
+    dest = np_arr[data_sel]  # view into np_arr
+    fill_value = getFillValue(dset_json)
+    if fill_value is None:
+        dest[...] = 0
+    elif np_arr.dtype.names:
+        for name in np_arr.dtype.names:
+            dest[name] = fill_value[0][name]
+    else:
+        dest[...] = fill_value[0]
+
+
+def getChunkLocationParams(chunk_info):
+    """ Return the DN request params for the location of the chunk in
+    the chunk_map entry chunk_info (for chunks in external files) """
+    params = {}
+    if "s3path" in chunk_info:
+        params["s3path"] = chunk_info["s3path"]
+
+    if "s3offset" in chunk_info:
+        s3offset = chunk_info["s3offset"]
+        if isinstance(s3offset, list):
+            # convert to a colon seperated string
+            s3offset = ":".join(map(str, s3offset))
+        else:
+            s3offset = int(s3offset)
+        params["s3offset"] = s3offset
+
+    if "s3size" in chunk_info:
+        s3size = chunk_info["s3size"]
+        if isinstance(s3size, list):
+            # convert to a colon seperated string
+            s3size = ":".join(map(str, s3size))
+        else:
+            s3size = int(s3size)
+        params["s3size"] = s3size
+
+    if "hyper_dims" in chunk_info:
+        hyper_dims = chunk_info["hyper_dims"]
+        if isinstance(hyper_dims, list):
+            # convert to colon seperated string
+            hyper_dims = ":".join(map(str, hyper_dims))
+        params["hyper_dims"] = hyper_dims
+    return params
+
+
+async def read_chunk_aggregate(
+    app,
+    chunk_id,
+    dset_json,
+    select_dtype=None,
+    aggregate=None,
+    chunk_map=None,
+    bucket=None,
+    client=None,
+):
+    """have the DN reduce the chunk selection and save the partial result
+    to chunk_map[chunk_id]["aggregate"]
+    aggregate: dict with the op, axis, bins and hist_range of the aggregate
+    """
+    if chunk_map is None or chunk_id not in chunk_map:
+        log.error(f"read_chunk_aggregate - expected to find {chunk_id} in chunk_map")
+        raise HTTPInternalServerError()
+    chunk_info = chunk_map[chunk_id]
+    chunk_sel = chunk_info["chunk_sel"]
+    log.info(f"read_chunk_aggregate, chunk_id: {chunk_id}, bucket: {bucket}")
+
+    partition_chunk_id = getChunkIdForPartition(chunk_id, dset_json)
+    if partition_chunk_id != chunk_id:
+        log.debug(f"using partition_chunk_id: {partition_chunk_id}")
+        chunk_id = partition_chunk_id  # replace the chunk_id
+
+    dset_dt = createDataType(dset_json["type"])
+    if select_dtype is None:
+        select_dtype = dset_dt
+
+    params = getChunkLocationParams(chunk_info)
+    params.update(getAggregateParams(**aggregate))
+    if len(select_dtype) < len(dset_dt):
+        # field selection, pass in the field names
+        params["fields"] = ":".join(select_dtype.names)
+    params["select"] = getSliceQueryParam(chunk_sel)
+    params["bucket"] = bucket
+
+    req = getDataNodeUrl(app, chunk_id) + "/chunks/" + chunk_id
+    try:
+        rsp_json = await http_get(app, req, params=params, client=client)
+        partials = rsp_json["aggregate"]
+    except HTTPNotFound:
+        # chunk hasn't been written, so reduce the fill value
+        log.debug(f"read_chunk_aggregate - no chunk: {chunk_id}, using fill value")
+        fill_arr = np.zeros((1,), dtype=select_dtype)
+        fill_value = getFillValue(dset_json)
+        if fill_value is not None:
+            if select_dtype.names:
+                for name in select_dtype.names:
+                    fill_arr[name] = fill_value[name]
+            else:
+                fill_arr[...] = fill_value
+        chunk_shape = getSelectionShape(chunk_sel)
+        arr = np.broadcast_to(fill_arr.reshape(()), chunk_shape)
+        partials = getPartialAggregate(arr, **aggregate)
+    chunk_info["aggregate"] = partials
 
 
 async def read_chunk_hyperslab(
@@ -167,6 +573,7 @@ async def read_chunk_hyperslab(
     chunk_map=None,
     bucket=None,
     client=None,
+    scratch=None,
 ):
     """read the chunk selection from the DN
     chunk_id: id of chunk to write to
@@ -177,6 +584,8 @@ async def read_chunk_hyperslab(
         chunk_size: size of chunk within the s3 object (or 0 if the
            entire object)
     bucket: s3 bucket to read from
+    scratch: dict the caller keeps between calls to hold a reusable buffer
+       for responses that can't be read directly into np_arr
     """
 
     if chunk_map is None:
@@ -261,35 +670,8 @@ async def read_chunk_hyperslab(
     array_data = None
 
     # pass dset json and selection as query params
-    params = {}
+    params = getChunkLocationParams(chunk_info)
     # params["select"] = select
-    if "s3path" in chunk_info:
-        params["s3path"] = chunk_info["s3path"]
-
-    if "s3offset" in chunk_info:
-        s3offset = chunk_info["s3offset"]
-        if isinstance(s3offset, list):
-            # convert to a colon seperated string
-            s3offset = ":".join(map(str, s3offset))
-        else:
-            s3offset = int(s3offset)
-        params["s3offset"] = s3offset
-
-    if "s3size" in chunk_info:
-        s3size = chunk_info["s3size"]
-        if isinstance(s3size, list):
-            # convert to a colon seperated string
-            s3size = ":".join(map(str, s3size))
-        else:
-            s3size = int(s3size)
-        params["s3size"] = s3size
-
-    if "hyper_dims" in chunk_info:
-        hyper_dims = chunk_info["hyper_dims"]
-        if isinstance(hyper_dims, list):
-            # convert to colon seperated string
-            hyper_dims = ":".join(map(str, hyper_dims))
-        params["hyper_dims"] = hyper_dims
 
     if len(select_dtype) < len(dset_dt):
         # field selection, pass in the field names
@@ -318,8 +700,8 @@ async def read_chunk_hyperslab(
     elif query_update is not None:
         method = "PUT"
 
-    req = getDataNodeUrl(app, chunk_id)
-    req += "/chunks/" + chunk_id
+    dn_url = getDataNodeUrl(app, chunk_id)
+    req = dn_url + "/chunks/" + chunk_id
 
     if select is not None:
         # use post if the select param is long
@@ -348,28 +730,90 @@ async def read_chunk_hyperslab(
         if select is not None:
             params["select"] = select
 
+    # for fixed size types, read the response directly into np_arr if the
+    # selection is contiguous there, otherwise into the scratch buffer
+    out_arr = None
+    in_place = False
+    if np_arr is not None and query_dtype is None and not isVlen(np_arr.dtype):
+        if data_sel is not None and all(isinstance(s, slice) for s in data_sel):
+            dest = np_arr[data_sel]  # view into np_arr
+            if dest.flags["C_CONTIGUOUS"]:
+                out_arr = dest.reshape(chunk_shape)
+                in_place = True
+        if out_arr is None:
+            out_arr = getScratchArray(scratch, np_arr.dtype, chunk_shape)
+    if out_arr is not None and out_arr.size > 0:
+        kwargs = {"params": params, "client": client, "out": out_arr.reshape(-1).view(np.uint8)}
+    else:
+        out_arr = None
+        kwargs = {"params": params, "client": client}
+
+    # for hyperslabs from a DN on this host, the DN can put the data in
+    # shared memory and just send back the number of bytes
+    shm_lease = None
+    if out_arr is not None and point_list is None and method != "PUT":
+        shm_lease = getShmLease(app, dn_url, out_arr.nbytes)
+    if shm_lease is not None:
+        params["shm"] = shm_lease.getHandle()
+
     # send request
     try:
         log.debug(f"read_chunk_hyperslab - {method} chunk req: {req}")
         log.debug(f"params: {params}")
         if method == "GET":
-            array_data = await http_get(app, req, params=params, client=client)
-            log.debug(f"http_get {req}, returned {len(array_data)} bytes")
+            array_data = await http_get(app, req, **kwargs)
         elif method == "PUT":
             array_data = await http_put(app, req, data=body, params=params, client=client)
-            log.debug(f"http_put {req}, returned {len(array_data)} bytes")
         else:  # POST
-            array_data = await http_post(app, req, data=body, params=params, client=client)
-            log.debug(f"http_post {req}, returned {len(array_data)} bytes")
+            array_data = await http_post(app, req, data=body, **kwargs)
+        if isinstance(array_data, int):
+            log.debug(f"{method} {req}, read {array_data} bytes into buffer")
+        elif array_data is not None:
+            log.debug(f"{method} {req}, returned {len(array_data)} bytes")
     except HTTPNotFound:
         if query is None and "s3path" in params:
             s3path = params["s3path"]
             # external HDF5 file, should exist
             log.warn(f"chunk {chunk_id} with s3path: {s3path} not found")
+    except BaseException:
+        # the DN may still write to the segment, so don't reuse it
+        releaseShmLease(app, shm_lease, reuse=False)
+        if in_place:
+            # don't leave part of the response in np_arr if the read is
+            # retried and the chunk is gone
+            resetSelection(np_arr, data_sel, dset_json)
+        raise
+    if shm_lease is not None and not isinstance(array_data, dict):
+        # not needed, any data is in the response
+        releaseShmLease(app, shm_lease)
 
     # process response
     if array_data is None:
         log.debug(f"read_chunk_hyperslab - No data returned for chunk: {chunk_id}")
+    elif shm_lease is not None and isinstance(array_data, dict):
+        try:
+            nbytes_expected = out_arr.size * out_arr.itemsize
+            if array_data.get("nbytes") != nbytes_expected:
+                msg = f"Expected {nbytes_expected} bytes for chunk: {chunk_id}, "
+                msg += f"but DN wrote: {array_data}"
+                log.error(msg)
+                raise HTTPInternalServerError()
+            np_arr[data_sel] = shm_lease.getArray(np_arr.dtype, chunk_shape)
+        finally:
+            releaseShmLease(app, shm_lease)
+    elif out_arr is not None and isinstance(array_data, int):
+        nbytes_expected = out_arr.size * out_arr.itemsize
+        if array_data != nbytes_expected:
+            msg = f"Expected {nbytes_expected} bytes for chunk: {chunk_id}, "
+            msg += f"but got: {array_data}"
+            log.error(msg)
+            if in_place:
+                resetSelection(np_arr, data_sel, dset_json)
+            raise HTTPInternalServerError()
+        if point_list is not None:
+            np_arr[point_index] = out_arr
+        elif not in_place:
+            np_arr[data_sel] = out_arr
     elif not isinstance(array_data, bytes):
         log.warn(f"read_chunk_hyperslab - expected bytes but got: {array_data}")
         raise HTTPInternalServerError()
@@ -563,8 +1007,8 @@ async def write_point_sel(
         log.debug(f"using partition_chunk_id: {partition_chunk_id}")
         chunk_id = partition_chunk_id  # replace the chunk_id
 
-    req = getDataNodeUrl(app, chunk_id)
-    req += "/chunks/" + chunk_id
+    dn_url = getDataNodeUrl(app, chunk_id)
+    req = dn_url + "/chunks/" + chunk_id
     log.debug("POST chunk req: " + req)
 
     num_points = len(point_list)
@@ -572,7 +1016,9 @@ async def write_point_sel(
     # create a numpy array with point_data
 
     # if point data was already decoded from binary, don't decode again
-    if len(point_data) > 0 and isinstance(point_data[0], np.ndarray):
+    if isinstance(point_data, np.ndarray):
+        data_arr = point_data
+    elif len(point_data) > 0 and isinstance(point_data[0], np.ndarray):
         data_arr = point_data
     else:
         data_arr = jsonToArray((num_points,), dset_dtype, point_data)
@@ -588,12 +1034,16 @@ async def write_point_sel(
     np_arr = np.zeros((num_points,), dtype=comp_type)
 
     # Zip together coordinate and point_data to one numpy array
-    for i in range(num_points):
-        if rank == 1:
-            elem = (point_list[i], data_arr[i])
-        else:
-            elem = (tuple(point_list[i]), data_arr[i])
-        np_arr[i] = elem
+    if isinstance(point_list, np.ndarray) and isinstance(data_arr, np.ndarray):
+        np_arr["coord"] = point_list.reshape(np_arr["coord"].shape)
+        np_arr["value"] = data_arr
+    else:
+        for i in range(num_points):
+            if rank == 1:
+                elem = (point_list[i], data_arr[i])
+            else:
+                elem = (tuple(point_list[i]), data_arr[i])
+            np_arr[i] = elem
 
     post_data = arrayToBytes(np_arr)
 
@@ -626,19 +1076,38 @@ class ChunkCrawler:
         limit=0,
         points=None,
         action=None,
+        num_chunks=None,
+        query_rsp_callback=None,
+        aggregate=None,
     ):
 
+        # per DN request limits adapt between dn_concurrency_min and
+        # dn_concurrency_max, so have enough workers for the max
         max_tasks_per_node = config.get("max_tasks_per_node_per_request", default=16)
+        max_tasks_per_node = max(max_tasks_per_node, config.get("dn_concurrency_max", default=32))
         client_pool_count = config.get("client_pool_count", default=10)
-        log.info(f"ChunkCrawler.__init__  {len(chunk_ids)} chunks, action={action}")
-        if len(chunk_ids) < 10:
-            log.debug(f"ChunkCrawler - chunk_ids: {chunk_ids}")
+        if isinstance(chunk_ids, (list, tuple)):
+            num_chunks = len(chunk_ids)
+            self._chunk_iter = None
+            if num_chunks < 10:
+                log.debug(f"ChunkCrawler - chunk_ids: {chunk_ids}")
+            else:
+                log.debug(f"ChunkCrawler - chunk_ids: {chunk_ids[:10]} ...")
         else:
-            log.debug(f"ChunkCrawler - chunk_ids: {chunk_ids[:10]} ...")
+            # iterator mode - chunk ids get pulled as workers are ready for them
+            if num_chunks is None:
+                msg = "ChunkCrawler - num_chunks must be set for chunk id iterator"
+                log.error(msg)
+                raise ValueError(msg)
+            self._chunk_iter = iter(chunk_ids)
+            chunk_ids = None
+        log.info(f"ChunkCrawler.__init__  {num_chunks} chunks, action={action}")
 
         self._app = app
         self._slices = slices
         self._chunk_ids = chunk_ids
+        self._num_chunks = num_chunks
+        self._chunk_count = 0  # number of chunks processed
         self._chunk_map = chunk_map
         self._dset_json = dset_json
         self._arr = arr
@@ -648,22 +1117,76 @@ class ChunkCrawler:
         self._query_update = query_update
         self._hits = 0
         self._limit = limit
-        self._status_map = {}  # map of chunk_ids to status code
-        self._q = asyncio.Queue()
+        # query reads with a limit or a callback go through the chunk
+        # responses in chunk_ids order: the rows for each chunk are passed to
+        # query_rsp_callback as soon as the chunks before it are done, and
+        # once the chunks done so far have limit rows, the chunks that
+        # haven't been read yet are dropped
+        self._query_rsp_callback = query_rsp_callback
+        self._chunk_order = None  # map of chunk id to position in chunk_ids
+        if query is not None and query_update is None and chunk_ids is not None:
+            if limit > 0 or query_rsp_callback is not None:
+                self._chunk_order = {chunk_id: i for i, chunk_id in enumerate(chunk_ids)}
+        self._next_order = 0  # position of the first chunk not done
+        self._done_order = set()  # positions of done chunks after that
+        self._ordered_hits = 0  # rows in the chunks before _next_order
+        self._query_rsps = []  # rows waiting to be passed to the callback
+        self._query_rsp_lock = asyncio.Lock()
+        self._limit_reached = False
+        self._in_flight = {}  # map of chunk id to worker task
+        # map of chunk_ids to status code - only failed chunks are
+        # kept for iterator mode
+        self._status_map = {}
         self._fail_count = 0
         self._action = action
-
-        for chunk_id in chunk_ids:
-            self._q.put_nowait(chunk_id)
+        self._aggregate = aggregate
+        # chunks that have been sent updates - their zone map stats
+        # get invalidated when the crawl is done
+        is_update = action in ("write_chunk_hyperslab", "write_point_sel")
+        if query_update is not None:
+            is_update = True
+        if is_update and config.get("zone_maps", default=True) and isZoneMapDataset(dset_json):
+            self._updated_ids = set()
+        else:
+            self._updated_ids = None
 
         self._bucket = bucket
         max_tasks = max_tasks_per_node * getNodeCount(app)
-        if len(chunk_ids) > max_tasks:
+        if num_chunks > max_tasks:
             self._max_tasks = max_tasks
         else:
-            self._max_tasks = len(chunk_ids)
+            self._max_tasks = num_chunks
         log.debug(f"ChunkCrawler max_tasks: {max_tasks}")
 
+        # hyperslab reads and writes of fixed size types can send the chunks
+        # for a DN in batches rather than one request per chunk
+        self._batch_size = 0
+        batch_actions = ("read_chunk_hyperslab", "write_chunk_hyperslab")
+        if action in batch_actions and query is None and query_update is None and dset_json:
+            dset_dt = createDataType(dset_json["type"])
+            batch_size = int(config.get("chunk_batch_size", default=64))
+            if batch_size > 1 and not isVlen(dset_dt):
+                # keep the batch data within a reasonable request size
+                max_bytes = int(config.get("max_request_size")) // 2
+                chunk_bytes = int(np.prod(getChunkLayout(dset_json))) * dset_dt.itemsize
+                batch_size = min(batch_size, max_bytes // max(chunk_bytes, 1))
+                if batch_size > 1:
+                    self._batch_size = batch_size
+                    log.debug(f"ChunkCrawler - batch_size: {batch_size}")
+
+        # workers take the next item for a DN that has room for another
+        # request, rather than the next item in queue order
+        def get_limiter(dn_url):
+            return getDnConcurrency(app, dn_url)
+
+        if self._chunk_iter is None:
+            self._q = DnWorkQueue(get_limiter)
+            for dn_url, item in self._getQueueItems(chunk_ids):
+                self._q.put_nowait(dn_url, item)
+        else:
+            # keep just enough ids queued up to keep the workers busy
+            self._q = DnWorkQueue(get_limiter, maxsize=self._max_tasks * 2)
+
         if self._max_tasks >= client_pool_count:
             self._client_pool = 1
         else:
@@ -676,12 +1199,26 @@ class ChunkCrawler:
         self._clients = app["cc_clients"]
 
     def get_status(self):
-        if len(self._status_map) != len(self._chunk_ids):
+        if self._chunk_iter is not None:
+            if self._chunk_count != self._num_chunks:
+                msg = "get_status code while crawler not complete"
+                log.error(msg)
+                raise ValueError(msg)
+            for chunk_id in self._status_map:
+                chunk_status = self._status_map[chunk_id]
+                log.info(f"returning chunk_status: {chunk_status} for chunk: {chunk_id}")
+                return chunk_status
+            return 200  # all good
+
+        if len(self._status_map) != len(self._chunk_ids) and not self._limit_reached:
             msg = "get_status code while crawler not complete"
             log.error(msg)
             raise ValueError(msg)
         for chunk_id in self._chunk_ids:
             if chunk_id not in self._status_map:
+                if self._limit_reached:
+                    # chunk wasn't needed
+                    continue
                 msg = f"expected to find chunk_id {chunk_id} in ChunkCrawler status_map"
                 log.error(msg)
                 raise KeyError(msg)
@@ -692,6 +1229,55 @@ class ChunkCrawler:
 
         return 200  # all good
 
+    def _getDataNodeUrl(self, chunk_id):
+        """Return the url of the DN that the chunk's requests go to"""
+        if self._dset_json:
+            chunk_id = getChunkIdForPartition(chunk_id, self._dset_json)
+        return getDataNodeUrl(self._app, chunk_id)
+
+    def _getQueueItems(self, chunk_ids):
+        """Generator of (dn_url, item) tuples for the work queue.  Each item is
+        a chunk id, or, when batching, a list of chunk ids that are all on the
+        same DN."""
+        if not self._batch_size:
+            for chunk_id in chunk_ids:
+                yield self._getDataNodeUrl(chunk_id), chunk_id
+            return
+        batches = {}  # map of dn url to list of chunk ids
+        for chunk_id in chunk_ids:
+            dn_url = self._getDataNodeUrl(chunk_id)
+            if self._action == "read_chunk_hyperslab":
+                chunk_info = self._chunk_map.get(chunk_id)
+                if not chunk_info or "chunk_sel" not in chunk_info:
+                    # point selections are read one chunk at a time
+                    yield dn_url, chunk_id
+                    continue
+            batch = batches.setdefault(dn_url, [])
+            batch.append(chunk_id)
+            if len(batch) >= self._batch_size:
+                yield dn_url, batch
+                del batches[dn_url]
+        for dn_url, batch in batches.items():
+            if len(batch) == 1:
+                yield dn_url, batch[0]
+            else:
+                yield dn_url, batch
+
+    async def feed(self):
+        """Add chunk ids from the iterator to the queue as space frees up"""
+        count = 0
+        for dn_url, item in self._getQueueItems(self._chunk_iter):
+            await self._q.put(dn_url, item)
+            if isinstance(item, list):
+                count += len(item)
+            else:
+                count += 1
+        if count != self._num_chunks:
+            msg = f"ChunkCrawler - expected {self._num_chunks} chunk ids "
+            msg += f"from iterator but got {count}"
+            log.warn(msg)
+            self._num_chunks = count
+
     async def crawl(self):
         workers = [
             asyncio.Task(self.work(), name=f"cc_task_{i}")
@@ -699,15 +1285,25 @@ class ChunkCrawler:
         ]
         # When all work is done, exit.
         msg = f"ChunkCrawler max_tasks {self._max_tasks} = await queue.join "
-        msg += f"- count: {len(self._chunk_ids)}"
+        msg += f"- count: {self._num_chunks}"
         log.info(msg)
-        await self._q.join()
-        msg = f"ChunkCrawler - join complete - count: {len(self._chunk_ids)}"
-        log.info(msg)
-
-        for w in workers:
-            w.cancel()
-        log.debug("ChunkCrawler - workers canceled")
+        try:
+            if self._chunk_iter is not None:
+                await self.feed()
+            await self._q.join()
+            msg = f"ChunkCrawler - join complete - count: {self._num_chunks}"
+            log.info(msg)
+            await self._sendQueryRsps()
+        finally:
+            for w in workers:
+                w.cancel()
+            log.debug("ChunkCrawler - workers canceled")
+            # drop anything left over if we were cancelled
+            self._q.close()
+            if self._updated_ids:
+                # chunks may have been updated even if the crawl failed partway
+                kwargs = {"bucket": self._bucket}
+                await invalidate_zone_map(self._app, self._dset_json, self._updated_ids, **kwargs)
 
     async def work(self):
         """Process chunk ids from queue till we are done"""
@@ -717,33 +1313,16 @@ class ChunkCrawler:
         task_suffix = random.randrange(0, self._client_pool)
         client_name = f"{task_name}.{task_suffix}"
         log.info(f"ChunkCrawler - client_name: {client_name}")
+        scratch = {}  # response buffer reused for each chunk this task reads
         while True:
             try:
                 start = time.time()
-                chunk_id = await self._q.get()
-                if self._limit > 0 and self._hits >= self._limit:
-                    msg = f"ChunkCrawler - maxhits exceeded, skipping fetch for chunk: {chunk_id}"
-                    log.debug(msg)
-                else:
-                    dn_url = getDataNodeUrl(self._app, chunk_id)
-                    if isUnixDomainUrl(dn_url):
-                        # need a client per url for unix sockets
-                        client = get_http_client(self._app, url=dn_url, cache_client=True)
-                    else:
-                        # create a pool of clients and store the handles in the app dict
-                        if client_name not in self._clients:
-                            client = get_http_client(
-                                self._app, url=dn_url, cache_client=False
-                            )
-                            msg = "ChunkCrawler - creating new SessionClient for "
-                            msg += f"task: {client_name}"
-                            log.info(msg)
-                            self._clients[client_name] = client
-                        else:
-                            client = self._clients[client_name]
-                    await self.do_work(chunk_id, client=client)
-
-                self._q.task_done()
+                dn_url, chunk_id = await self._q.get()
+                try:
+                    await self._doItem(dn_url, chunk_id, client_name, scratch)
+                finally:
+                    # give back the DN request slot even if cancelled
+                    self._q.task_done(dn_url)
                 elapsed = time.time() - start
                 msg = f"ChunkCrawler - task {chunk_id} start: {start:.3f} "
                 msg += f"elapsed: {elapsed:.3f}"
@@ -753,7 +1332,53 @@ class ChunkCrawler:
                 # raise the exception so worker is truly cancelled
                 raise
 
-    async def do_work(self, chunk_id, client=None):
+    async def _doItem(self, dn_url, item, client_name, scratch):
+        """Process one work queue item: a chunk id, or a list of chunk ids"""
+        if isinstance(item, list):
+            batch = item
+            chunk_id = batch[0]
+        else:
+            batch = None
+            chunk_id = item
+        if self._chunk_order is not None:
+            skip = self._limit_reached
+        else:
+            skip = self._limit > 0 and self._hits >= self._limit
+        if skip:
+            msg = f"ChunkCrawler - maxhits exceeded, skipping fetch for chunk: {chunk_id}"
+            log.debug(msg)
+            return
+        if self._updated_ids is not None:
+            if batch is not None:
+                self._updated_ids.update(batch)
+            else:
+                self._updated_ids.add(chunk_id)
+        if isUnixDomainUrl(dn_url):
+            # need a client per url for unix sockets
+            client = get_http_client(self._app, url=dn_url, cache_client=True)
+        else:
+            # create a pool of clients and store the handles in the app dict
+            if client_name not in self._clients:
+                client = get_http_client(
+                    self._app, url=dn_url, cache_client=False
+                )
+                msg = "ChunkCrawler - creating new SessionClient for "
+                msg += f"task: {client_name}"
+                log.info(msg)
+                self._clients[client_name] = client
+            else:
+                client = self._clients[client_name]
+        if batch is not None:
+            await self.do_batch_work(batch, client=client, scratch=scratch)
+        else:
+            self._in_flight[chunk_id] = asyncio.current_task()
+            try:
+                await self.do_work(chunk_id, client=client, scratch=scratch)
+            finally:
+                del self._in_flight[chunk_id]
+            await self._sendQueryRsps()
+
+    async def do_work(self, chunk_id, client=None, scratch=None):
         """fetch the indicated chunk and update status map"""
         msg = f"ChunkCrawler - do_work for chunk: {chunk_id} bucket: "
         msg += f"{self._bucket}"
@@ -761,9 +1386,11 @@ class ChunkCrawler:
         max_retries = config.get("dn_max_retries", default=3)
         retry_exp = config.get("dn_retry_backoff_exp", 0.1)
         log.debug(f"ChunkCrawler - retry_exp: {retry_exp:.3f}")
+        limiter = getDnConcurrency(self._app, self._getDataNodeUrl(chunk_id))
         retry = 0
         status_code = None
         while retry < max_retries:
+            request_start = time.time()
             try:
                 if self._action == "read_chunk_hyperslab":
                     await read_chunk_hyperslab(
@@ -778,10 +1405,25 @@ class ChunkCrawler:
                         chunk_map=self._chunk_map,
                         bucket=self._bucket,
                         client=client,
+                        scratch=scratch,
                     )
                     msg = f"read_chunk_hyperslab - got 200 status for chunk_id: {chunk_id}"
                     log.debug(msg)
                     status_code = 200
+                elif self._action == "read_chunk_aggregate":
+                    await read_chunk_aggregate(
+                        self._app,
+                        chunk_id,
+                        self._dset_json,
+                        select_dtype=self._select_dtype,
+                        aggregate=self._aggregate,
+                        chunk_map=self._chunk_map,
+                        bucket=self._bucket,
+                        client=client,
+                    )
+                    msg = f"read_chunk_aggregate - got 200 status for chunk_id: {chunk_id}"
+                    log.debug(msg)
+                    status_code = 200
                 elif self._action == "write_chunk_hyperslab":
                     await write_chunk_hyperslab(
                         self._app,
@@ -863,7 +1505,12 @@ class ChunkCrawler:
                 msg = f"ClientError {type(ce)} for {self._action}({chunk_id}): {ce} "
                 log.warn(msg)
             except CancelledError as cle:
+                if self._limit_reached:
+                    # the rows from earlier chunks are all that's needed
+                    log.debug(f"ChunkCrawler - limit reached, {chunk_id} read cancelled")
+                    raise
                 status_code = 503
+                limiter.recordOverload()
                 log.warn(f"CancelledError for {self._action}({chunk_id}): {cle}")
             except HTTPBadRequest as hbr:
                 status_code = 400
@@ -884,6 +1531,7 @@ class ChunkCrawler:
                 log.warn(msg)
             except HTTPServiceUnavailable as sue:
                 status_code = 503
+                limiter.recordOverload()
                 msg = f"HTTPServiceUnavailable for {self._action}({chunk_id}): {sue}"
                 log.warn(msg)
             except Exception as e:
@@ -892,8 +1540,15 @@ class ChunkCrawler:
                 log.error(msg)
                 tb = traceback.format_exc()
                 print("traceback:", tb)
+            if self._limit_reached and status_code != 200:
+                # the read was likely cancelled by _stopCrawl, but came back
+                # as an error (the http helpers can't tell before python
+                # 3.11).  Don't record it or retry it.
+                log.debug(f"ChunkCrawler - limit reached, {chunk_id} read stopped")
+                raise CancelledError()
             retry += 1
             if status_code == 200:
+                limiter.record(time.time() - request_start)
                 break
             if retry == max_retries:
                 msg = f"ChunkCrawler action: {self._action} failed after: {retry} retries"
@@ -903,12 +1558,119 @@ class ChunkCrawler:
                 msg = f"ChunkCrawler.doWork - retry: {retry}, sleeping for {sleep_time:.2f}"
                 await asyncio.sleep(sleep_time)
 
-        # save status_code
-        self._status_map[chunk_id] = status_code
+        self._setStatus(chunk_id, status_code)
+
+    async def do_batch_work(self, chunk_ids, client=None, scratch=None):
+        """fetch or write a batch of chunks on one DN with one request,
+        any chunks in the batch that don't succeed are retried with do_work"""
+        log.debug(f"ChunkCrawler - do_batch_work for {len(chunk_ids)} chunks")
+        limiter = getDnConcurrency(self._app, self._getDataNodeUrl(chunk_ids[0]))
+        request_start = time.time()
+        status_map = {}
+        try:
+            if self._action == "read_chunk_hyperslab":
+                status_map = await read_chunk_batch(
+                    self._app,
+                    chunk_ids,
+                    self._dset_json,
+                    self._arr,
+                    select_dtype=self._select_dtype,
+                    chunk_map=self._chunk_map,
+                    bucket=self._bucket,
+                    client=client,
+                )
+            else:
+                status_map = await write_chunk_batch(
+                    self._app,
+                    chunk_ids,
+                    self._dset_json,
+                    self._slices,
+                    self._arr,
+                    bucket=self._bucket,
+                    client=client,
+                )
+        except HTTPServiceUnavailable as sue:
+            limiter.recordOverload()
+            msg = f"ChunkCrawler - batch {self._action} got 503: {sue}, "
+            msg += "retrying chunks individually"
+            log.warn(msg)
+        except Exception as e:
+            msg = f"ChunkCrawler - batch {self._action} failed: {type(e)} {e}, "
+            msg += "retrying chunks individually"
+            log.warn(msg)
+        if 503 in status_map.values():
+            limiter.recordOverload()
+        elif status_map:
+            # compare per chunk latency with single chunk requests
+            elapsed = time.time() - request_start
+            limiter.record(elapsed / len(chunk_ids))
+        for chunk_id in chunk_ids:
+            status_code = status_map.get(chunk_id)
+            if status_code in (200, 201):
+                self._setStatus(chunk_id, status_code)
+            elif status_code in (400, 404):
+                # retrying won't help
+                self._setStatus(chunk_id, status_code)
+            else:
+                await self.do_work(chunk_id, client=client, scratch=scratch)
+
+    def _setStatus(self, chunk_id, status_code):
+        """save status_code for the chunk"""
+        self._chunk_count += 1
+        if self._chunk_iter is None or status_code not in (200, 201):
+            self._status_map[chunk_id] = status_code
         if self._query is not None and status_code == 200:
             item = self._chunk_map[chunk_id]
             if "query_rsp" in item:
                 query_rsp = item["query_rsp"]
                 self._hits += len(query_rsp)
-        msg = f"ChunkCrawler - worker status for chunk {chunk_id}: {self._status_map[chunk_id]}"
+        msg = f"ChunkCrawler - worker status for chunk {chunk_id}: {status_code}"
+        log.info(msg)
+        if self._chunk_order is not None and chunk_id in self._chunk_order:
+            self._updateChunkOrder(chunk_id)
+
+    def _updateChunkOrder(self, chunk_id):
+        """Move past the chunks that are done in chunk_ids order, queueing
+        their rows for the callback, and stop the crawl if the limit has
+        been reached"""
+        self._done_order.add(self._chunk_order[chunk_id])
+        while self._next_order in self._done_order and not self._limit_reached:
+            self._done_order.remove(self._next_order)
+            item = self._chunk_map.get(self._chunk_ids[self._next_order], {})
+            self._next_order += 1
+            query_rsp = item.get("query_rsp")
+            if query_rsp is None or len(query_rsp) == 0:
+                continue
+            if self._limit > 0:
+                remaining = self._limit - self._ordered_hits
+                if len(query_rsp) >= remaining:
+                    query_rsp = query_rsp[:remaining]
+                    self._limit_reached = True
+            self._ordered_hits += len(query_rsp)
+            if self._query_rsp_callback is not None:
+                self._query_rsps.append(query_rsp)
+        if self._limit_reached:
+            self._stopCrawl()
+
+    def _stopCrawl(self):
+        """Drop the chunks that haven't been started and cancel the reads
+        in flight"""
+        drop_count = self._q.drain()
+        this_task = asyncio.current_task()
+        cancel_count = 0
+        for task in self._in_flight.values():
+            if task is not this_task:
+                task.cancel()
+                cancel_count += 1
+        msg = f"ChunkCrawler - limit of {self._limit} rows reached, dropped {drop_count} "
+        msg += f"chunks and cancelled {cancel_count} chunk reads"
         log.info(msg)
+
+    async def _sendQueryRsps(self):
+        """Pass the rows that are ready to the query_rsp_callback"""
+        if self._query_rsp_callback is None:
+            return
+        async with self._query_rsp_lock:
+            while self._query_rsps:
+                query_rsp = self._query_rsps.pop(0)
+                await self._query_rsp_callback(query_rsp)
@@ -14,15 +14,18 @@
 # handles regauests to read/write chunk data
 #
 
+import asyncio
 import numpy as np
 import traceback
 from aiohttp.web_exceptions import HTTPBadRequest, HTTPInternalServerError
 from aiohttp.web_exceptions import HTTPNotFound, HTTPServiceUnavailable
 from aiohttp.web import json_response, StreamResponse
 
-from .util.httpUtil import request_read, getContentType
-from .util.arrayUtil import bytesToArray, arrayToBytes, getBroadcastShape
-from .util.idUtil import getS3Key, validateInPartition, isValidUuid
+from .util.httpUtil import request_read, getContentType, getRequestJson
+from .util.httpUtil import MSGPACK_CONTENT_TYPE
+from .util.arrayUtil import bytesToArray, arrayToBytes, getBroadcastShape, isVlen
+from .util.idUtil import getS3Key, validateInPartition, isValidUuid, toChunkId
+from .util.idUtil import isMovedId
 from .util.storUtil import isStorObj, deleteStorObj
 from .util.hdf5dtype import createDataType, getSubType
 from .util.dsetUtil import getSelectionList, getChunkLayout, getShapeDims
@@ -31,8 +34,10 @@ from .util.chunkUtil import getChunkIndex, getDatasetId, chunkQuery
 from .util.chunkUtil import chunkWriteSelection, chunkReadSelection
 from .util.chunkUtil import chunkWritePoints, chunkReadPoints
 from .util.domainUtil import isValidBucketName
-from .util.boolparser import BooleanParser
-from .datanode_lib import get_metadata_obj, get_chunk, save_chunk
+from .util.batchUtil import decodeFrames, encodeFrame
+from .util.aggregateUtil import getAggregateOptions, getPartialAggregate
+from .datanode_lib import get_metadata_obj, get_chunk, save_chunk, get_chunk_selection
+from .datanode_lib import get_write_credit, discard_zone_map_stats
 
 from . import hsds_logger as log
 from . import config
@@ -67,6 +72,7 @@ async def PUT_Chunk(request):
         msg = f"Invalid chunk id: {chunk_id}"
         log.warn(msg)
         raise HTTPBadRequest(reason=msg)
+    chunk_id = toChunkId(chunk_id)  # parse the id just once
 
     log.debug(f"PUT_Chunk - id: {chunk_id}")
 
@@ -178,6 +184,51 @@ async def PUT_Chunk(request):
     else:
         chunk_init = True
 
+    if not query:
+        # read the data before getting the chunk.  A new chunk isn't cached
+        # till it's saved, so another write to it while this request waits
+        # for its data would start from a separate copy and one of the
+        # updates would be lost
+        # check that the content_length is what we expect
+        if itemsize != "H5T_VARIABLE":
+            log.debug(f"expected content_length: {num_elements * itemsize}")
+        log.debug(f"actual content_length: {request.content_length}")
+
+        actual = request.content_length
+        if itemsize != "H5T_VARIABLE":
+            expected = num_elements * itemsize
+            if expected % actual != 0:
+                msg = f"Expected content_length of: {expected}, but got: {actual}"
+                log.error(msg)
+                raise HTTPBadRequest(reason=msg)
+
+        # create a numpy array for incoming data
+        input_bytes = await request_read(request)
+        # TBD - will it cause problems when failures are raised before
+        #    reading data?
+        if len(input_bytes) != actual:
+            msg = f"Read {len(input_bytes)} bytes, expecting: {actual}"
+            log.error(msg)
+            raise HTTPInternalServerError()
+
+        try:
+            input_arr = bytesToArray(input_bytes, select_dt, [num_elements, ])
+        except ValueError as ve:
+            log.error(f"bytesToArray threw ValueError: {ve}")
+            tb = traceback.format_exc()
+            log.error(f"traceback: {tb}")
+
+            raise HTTPBadRequest(reason="unable to decode bytestring")
+
+        if bcshape:
+            input_arr = input_arr.reshape(bcshape)
+            log.debug(f"broadcasting {bcshape} to mshape {mshape}")
+            arr_tmp = np.zeros(mshape, dtype=select_dt)
+            arr_tmp[...] = input_arr
+            input_arr = arr_tmp
+        else:
+            input_arr = input_arr.reshape(mshape)
+
     kwargs = {"bucket": bucket, "chunk_init": chunk_init}
     chunk_arr = await get_chunk(app, chunk_id, dset_json, **kwargs)
     is_dirty = False
@@ -197,21 +248,7 @@ async def PUT_Chunk(request):
             log.error("expected one-dimensional array for PUT query")
             raise HTTPInternalServerError()
 
-        try:
-            parser = BooleanParser(query)
-        except Exception as e:
-            msg = f"query: {query} is not valid, got exception: {e}"
-            log.error(msg)
-            raise HTTPInternalServerError()
-        try:
-            eval_str = parser.getEvalStr()
-        except Exception as e:
-            msg = f"query: {query} unable to get eval str, got exception: {e}"
-            log.error(msg)
-            raise HTTPInternalServerError()
-        log.debug(f"got eval str: {eval_str} for query: {query}")
-
-        query_update = await request.json()
+        query_update = await getRequestJson(request)
         if not query_update:
             log.warn("PUT_Chunk with query but no query update")
             raise HTTPBadRequest()
@@ -223,7 +260,7 @@ async def PUT_Chunk(request):
                 "chunk_layout": dims,
                 "chunk_arr": chunk_arr,
                 "slices": selection,
-                "query": eval_str,
+                "query": query,
                 "query_update": query_update,
                 "limit": limit,
             }
@@ -239,7 +276,7 @@ async def PUT_Chunk(request):
         if num_hits > 0:
             is_dirty = True
             # save chunk
-            save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
+            await save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
             status_code = 201
         # stream back response array
         read_resp = arrayToBytes(rsp_arr)
@@ -258,57 +295,20 @@ async def PUT_Chunk(request):
         return
     else:
         # regular chunk update
-        # check that the content_length is what we expect
-        if itemsize != "H5T_VARIABLE":
-            log.debug(f"expected content_length: {num_elements * itemsize}")
-        log.debug(f"actual content_length: {request.content_length}")
-
-        actual = request.content_length
-        if itemsize != "H5T_VARIABLE":
-            expected = num_elements * itemsize
-            if expected % actual != 0:
-                msg = f"Expected content_length of: {expected}, but got: {actual}"
-                log.error(msg)
-                raise HTTPBadRequest(reason=msg)
-
-        # create a numpy array for incoming data
-        input_bytes = await request_read(request)
-        # TBD - will it cause problems when failures are raised before
-        #    reading data?
-        if len(input_bytes) != actual:
-            msg = f"Read {len(input_bytes)} bytes, expecting: {actual}"
-            log.error(msg)
-            raise HTTPInternalServerError()
-
-        try:
-            input_arr = bytesToArray(input_bytes, select_dt, [num_elements, ])
-        except ValueError as ve:
-            log.error(f"bytesToArray threw ValueError: {ve}")
-            tb = traceback.format_exc()
-            log.error(f"traceback: {tb}")
-
-            raise HTTPBadRequest(reason="unable to decode bytestring")
-
-        if bcshape:
-            input_arr = input_arr.reshape(bcshape)
-            log.debug(f"broadcasting {bcshape} to mshape {mshape}")
-            arr_tmp = np.zeros(mshape, dtype=select_dt)
-            arr_tmp[...] = input_arr
-            input_arr = arr_tmp
-        else:
-            input_arr = input_arr.reshape(mshape)
-
         kwargs = {"chunk_arr": chunk_arr, "slices": selection, "data": input_arr}
         is_dirty = chunkWriteSelection(**kwargs)
 
         # chunk update successful
         resp = {}
     if is_dirty or config.get("write_zero_chunks", default=False):
-        save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
+        await save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
         status_code = 201
     else:
         status_code = 200
 
+    # let the SN know how much more it can send us
+    resp.update(get_write_credit(app))
+
     resp = json_response(resp, status=status_code)
     log.response(request, resp=resp)
     return resp
@@ -341,9 +341,10 @@ async def GET_Chunk(request):
         msg = f"Invalid chunk id: {chunk_id}"
         log.warn(msg)
         raise HTTPBadRequest(reason=msg)
+    chunk_id = toChunkId(chunk_id)  # parse the id just once
 
     try:
-        validateInPartition(app, chunk_id)
+        validateInPartition(app, chunk_id, readonly=True)
     except KeyError:
         msg = f"invalid partition for obj id: {chunk_id}"
         log.error(msg)
@@ -476,53 +477,46 @@ async def GET_Chunk(request):
 
     kwargs["chunk_init"] = chunk_init
 
-    chunk_arr = await get_chunk(app, chunk_id, dset_json, **kwargs)
-    if chunk_arr is None:
-        msg = f"chunk {chunk_id} not found"
-        log.warn(msg)
-        raise HTTPNotFound()
+    output_arr = None
+    if not s3path and not query and not select_fields and "aggregate" not in params:
+        # small reads of uncached indexed vlen chunks decode just the selection
+        output_arr = await get_chunk_selection(app, chunk_id, dset_json, selection, bucket=bucket)
 
-    if chunk_init:
-        save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
+    if output_arr is None:
+        chunk_arr = await get_chunk(app, chunk_id, dset_json, **kwargs)
+        if chunk_arr is None:
+            msg = f"chunk {chunk_id} not found"
+            log.warn(msg)
+            raise HTTPNotFound()
 
-    if select_fields:
+        if chunk_init and not isMovedId(app, chunk_id):
+            # the new owner saves chunks that have moved
+            await save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
+
+        if select_fields:
+            try:
+                select_dt = getSubType(chunk_arr.dtype, select_fields)
+            except TypeError as te:
+                # this shouldn't happen, but just in case...
+                msg = f"invalid fields selection: {te}"
+                log.warn(msg)
+                raise HTTPBadRequest(reason=msg)
+        else:
+            select_dt = chunk_arr.dtype
+
+    if "aggregate" in params:
+        # reduce the selection here and just send back the partial result
+        arr = chunkReadSelection(chunk_arr, slices=selection, select_dt=select_dt)
         try:
-            select_dt = getSubType(chunk_arr.dtype, select_fields)
-        except TypeError as te:
-            # this shouldn't happen, but just in case...
-            msg = f"invalid fields selection: {te}"
+            options = getAggregateOptions(params)
+            partials = getPartialAggregate(arr, params["aggregate"], **options)
+        except ValueError as ve:
+            msg = f"GET_Chunk - invalid aggregate: {ve}"
             log.warn(msg)
             raise HTTPBadRequest(reason=msg)
-    else:
-        select_dt = chunk_arr.dtype
+        return json_response({"aggregate": partials})
 
     if query:
-        # if there's a where clause, just use the expression
-        # part with BooleanParser
-        # TBD: Remove when BooleanParser knows how to use where keyword
-        if query.startswith("where"):
-            query_expr = None
-        else:
-            n = query.find(" where ")
-            if n > 0:
-                query_expr = query[:n]
-            else:
-                query_expr = query
-        if query_expr:
-            try:
-                parser = BooleanParser(query_expr)
-            except Exception as e:
-                msg = f"query: {query} is not valid, got exception: {e}"
-                log.error(msg)
-                raise HTTPInternalServerError()
-            try:
-                eval_str = parser.getEvalStr()
-            except Exception as e:
-                msg = f"query: {query} unable to get eval str, got exception: {e}"
-                log.error(msg)
-                raise HTTPInternalServerError()
-            log.debug(f"got eval str: {eval_str} for query: {query}")
-
         # run given query
         try:
             kwargs = {
@@ -547,10 +541,16 @@ async def GET_Chunk(request):
             log.debug(msg)
             raise HTTPNotFound()
         log.debug(f"test - got output_arr: {output_arr}")
-    else:
+    elif output_arr is None:
         # read selected data from chunk
         output_arr = chunkReadSelection(chunk_arr, slices=selection, select_dt=select_dt)
 
+    if output_arr is not None and not query and "shm" in params:
+        # the SN is on this host and gave us a place to put the data
+        shm_nbytes = _writeShm(app, params["shm"], output_arr)
+        if shm_nbytes is not None:
+            return json_response({"shm": params["shm"], "nbytes": shm_nbytes})
+
     # write response
     if output_arr is not None:
         log.debug(f"GET_Chunk - returning arr: {output_arr.shape}")
@@ -582,7 +582,10 @@ async def POST_Chunk(request):
     log.request(request)
     app = request.app
     params = request.rel_url.query
-    content_type = getContentType(request)
+    if request.content_type == MSGPACK_CONTENT_TYPE:
+        content_type = "json"  # selection sent by the SN with msgpack
+    else:
+        content_type = getContentType(request)
 
     put_points = False
     select = None  # for hyperslab/fancy selection
@@ -657,9 +660,10 @@ async def POST_Chunk(request):
         msg = f"Invalid chunk id: {chunk_id}"
         log.warn(msg)
         raise HTTPBadRequest(reason=msg)
+    chunk_id = toChunkId(chunk_id)  # parse the id just once
 
     try:
-        validateInPartition(app, chunk_id)
+        validateInPartition(app, chunk_id, readonly=not put_points)
     except KeyError:
         msg = f"invalid partition for obj id: {chunk_id}"
         log.error(msg)
@@ -728,7 +732,7 @@ async def POST_Chunk(request):
         point_arr = bytesToArray(input_bytes, point_dt, point_shape)
     else:
         # fancy/hyperslab selection
-        body = await request.json()
+        body = await getRequestJson(request)
         if "select" not in body:
             log.warn("expected 'select' key in body of POST_Value request")
             raise HTTPBadRequest()
@@ -760,9 +764,9 @@ async def POST_Chunk(request):
         log.warn(f"chunk {chunk_id} not found")
         raise HTTPNotFound()
 
-    if chunk_init and not put_points:
+    if chunk_init and not put_points and not isMovedId(app, chunk_id):
         # lazily write chunk to storage
-        save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
+        await save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
 
     if put_points:
         # writing point data
@@ -779,7 +783,7 @@ async def POST_Chunk(request):
             log.warn(f"got value error from chunkWritePoints: {ve}")
             raise HTTPBadRequest()
         # lazily write chunk to storage
-        save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
+        await save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
     elif select:
         # hyperslab/fancy read selection
         try:
@@ -827,6 +831,286 @@ async def POST_Chunk(request):
     return resp
 
 
+def _writeShm(app, handle, arr):
+    """Copy arr to the shared memory region the SN passed in handle.  Returns
+    the number of bytes written, or None if the data should go in the
+    response body instead."""
+    try:
+        return app["shm_segments"].writeArray(handle, arr)
+    except ValueError as ve:
+        log.warn(f"unable to use shared memory region {handle}: {ve}")
+        return None
+
+
+async def _read_batch_item(app, chunk_id, dset_json, header, select_dt, bucket=None):
+    """Return bytes of the selection for one chunk of a batch read, or the
+    number of bytes written to shared memory if the header has a shm handle"""
+    dims = getChunkLayout(dset_json)
+    try:
+        selection = getSelectionList(header.get("select"), dims)
+    except ValueError as ve:
+        log.warn(f"ChunkBatch - invalid select for {chunk_id}: {ve}")
+        raise HTTPBadRequest()
+
+    chunk_init = True if getChunkInitializer(dset_json) else False
+    kwargs = {"chunk_init": chunk_init}
+    if "s3path" in header:
+        s3size = header.get("s3size", 0)
+        if isinstance(s3size, list):
+            num_bytes = sum(s3size)
+        else:
+            num_bytes = s3size
+        if num_bytes == 0:
+            log.warn(f"ChunkBatch - s3path for {chunk_id} with empty byte range")
+            raise HTTPNotFound()
+        kwargs["s3path"] = header["s3path"]
+        kwargs["s3offset"] = header.get("s3offset", 0)
+        kwargs["s3size"] = s3size
+        if header.get("hyper_dims"):
+            kwargs["hyper_dims"] = header["hyper_dims"]
+    else:
+        kwargs["bucket"] = bucket
+
+    output_arr = None
+    if "s3path" not in header and not select_dt.names:
+        output_arr = await get_chunk_selection(app, chunk_id, dset_json, selection, bucket=bucket)
+    if output_arr is None:
+        chunk_arr = await get_chunk(app, chunk_id, dset_json, **kwargs)
+        if chunk_arr is None:
+            raise HTTPNotFound()
+        if chunk_init and not isMovedId(app, chunk_id):
+            await save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
+        output_arr = chunkReadSelection(chunk_arr, slices=selection, select_dt=select_dt)
+    if "shm" in header:
+        shm_nbytes = _writeShm(app, header["shm"], output_arr)
+        if shm_nbytes is not None:
+            return shm_nbytes
+    return arrayToBytes(output_arr)
+
+
+async def _write_batch_item(app, chunk_id, dset_json, header, data, select_dt, bucket=None):
+    """Write the data for one chunk of a batch write, return the status code"""
+    chunk_cache = app["chunk_cache"]
+    min_chunk_size = int(config.get("min_chunk_size"))
+    if chunk_id not in chunk_cache and chunk_cache.memFree < min_chunk_size:
+        log.warn(f"ChunkBatch {chunk_id} - not enough room in chunk cache")
+        raise HTTPServiceUnavailable()
+
+    dims = getChunkLayout(dset_json)
+    try:
+        selection = getSelectionList(header.get("select"), dims)
+    except ValueError as ve:
+        log.warn(f"ChunkBatch - invalid select for {chunk_id}: {ve}")
+        raise HTTPBadRequest()
+    mshape = getSelectionShape(selection)
+    element_count = header.get("element_count")
+    if element_count is not None:
+        bcshape = getBroadcastShape(mshape, element_count)
+    else:
+        bcshape = None
+    if bcshape:
+        num_elements = int(np.prod(bcshape))
+    else:
+        num_elements = int(np.prod(mshape))
+    if not isVlen(select_dt) and num_elements * select_dt.itemsize != len(data):
+        msg = f"ChunkBatch - expected {num_elements * select_dt.itemsize} bytes "
+        msg += f"for {chunk_id} but got {len(data)}"
+        log.warn(msg)
+        raise HTTPBadRequest()
+
+    kwargs = {"bucket": bucket, "chunk_init": True}
+    chunk_arr = await get_chunk(app, chunk_id, dset_json, **kwargs)
+    if chunk_arr is None:
+        log.error(f"ChunkBatch - failed to create array for {chunk_id}")
+        raise HTTPInternalServerError()
+
+    input_arr = bytesToArray(data, select_dt, [num_elements, ])
+    if bcshape:
+        input_arr = input_arr.reshape(bcshape)
+        arr_tmp = np.zeros(mshape, dtype=select_dt)
+        arr_tmp[...] = input_arr
+        input_arr = arr_tmp
+    else:
+        input_arr = input_arr.reshape(mshape)
+
+    kwargs = {"chunk_arr": chunk_arr, "slices": selection, "data": input_arr}
+    is_dirty = chunkWriteSelection(**kwargs)
+    if is_dirty or config.get("write_zero_chunks", default=False):
+        await save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=bucket)
+        return 201
+    return 200
+
+
+async def POST_ChunkBatch(request):
+    """
+    Read or write hyperslab selections for a batch of chunks of one dataset.
+    The request body is a sequence of frames (see batchUtil) with the chunk
+    id and selection in each header, and the data to write for writes.  The
+    response has a frame with the status (and selection data for reads)
+    for each chunk, written as each chunk completes.
+    """
+    log.request(request)
+    app = request.app
+    params = request.rel_url.query
+
+    bucket = params.get("bucket")
+    if not bucket:
+        msg = "POST_ChunkBatch - bucket is None"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    elif not isValidBucketName(bucket):
+        msg = f"Invalid bucket name: {bucket}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+
+    action = params.get("action")
+    if action not in ("read", "write"):
+        msg = f"POST_ChunkBatch - unexpected action: {action}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+
+    if "fields" in params:
+        select_fields = params["fields"].split(":")
+    else:
+        select_fields = []
+
+    body = await request_read(request)
+    try:
+        items = list(decodeFrames(body))
+    except ValueError as ve:
+        msg = f"POST_ChunkBatch - unable to decode request: {ve}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    if not items:
+        msg = "POST_ChunkBatch - no chunks in request"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+
+    dset_id = None
+    chunk_ids = []
+    for header, _ in items:
+        chunk_id = header.get("id")
+        if not chunk_id or not isValidUuid(chunk_id, "Chunk"):
+            msg = f"POST_ChunkBatch - invalid chunk id: {chunk_id}"
+            log.warn(msg)
+            raise HTTPBadRequest(reason=msg)
+        chunk_id = toChunkId(chunk_id)  # parse the id just once
+        if dset_id is None:
+            dset_id = getDatasetId(chunk_id)
+        elif getDatasetId(chunk_id) != dset_id:
+            msg = "POST_ChunkBatch - chunks must all be from the same dataset"
+            log.warn(msg)
+            raise HTTPBadRequest(reason=msg)
+        try:
+            validateInPartition(app, chunk_id, readonly=action == "read")
+        except KeyError:
+            log.error(f"invalid partition for obj id: {chunk_id}")
+            raise HTTPInternalServerError()
+        chunk_ids.append(chunk_id)
+    log.info(f"POST_ChunkBatch - {action} {len(chunk_ids)} chunks for {dset_id}")
+
+    # one metadata lookup for the whole batch
+    dset_json = await get_metadata_obj(app, dset_id, bucket=bucket)
+    dset_dt = createDataType(dset_json["type"])
+    if select_fields:
+        try:
+            select_dt = getSubType(dset_dt, select_fields)
+        except TypeError as te:
+            msg = f"invalid fields selection: {te}"
+            log.warn(msg)
+            raise HTTPBadRequest(reason=msg)
+    else:
+        select_dt = dset_dt
+
+    async def do_item(chunk_id, header, data):
+        rsp_header = {"id": chunk_id}
+        rsp_data = b""
+        try:
+            if action == "read":
+                kwargs = {"bucket": bucket}
+                rsp_data = await _read_batch_item(app, chunk_id, dset_json, header, select_dt,
+                                                  **kwargs)
+                if isinstance(rsp_data, int):
+                    rsp_header["shm_nbytes"] = rsp_data
+                    rsp_data = b""
+                status = 200
+            else:
+                kwargs = {"bucket": bucket}
+                status = await _write_batch_item(app, chunk_id, dset_json, header, data,
+                                                 select_dt, **kwargs)
+        except HTTPNotFound:
+            status = 404
+        except HTTPBadRequest:
+            status = 400
+        except HTTPServiceUnavailable:
+            status = 503
+        except HTTPInternalServerError:
+            status = 500
+        except Exception as e:
+            log.error(f"POST_ChunkBatch - unexpected exception for {chunk_id}: {e}")
+            status = 500
+        rsp_header["status"] = status
+        return rsp_header, rsp_data
+
+    # each write adds a dirty chunk to the chunk cache.  Reserve free cache
+    # memory for as many new dirty chunks as fit, and write the rest one at
+    # a time once the others are done, so that the memFree check for each
+    # of them sees the memory used by the ones before it
+    serial_ids = set()
+    if action == "write":
+        chunk_cache = app["chunk_cache"]
+        chunk_size = int(np.prod(getChunkLayout(dset_json))) * dset_dt.itemsize
+        mem_free = chunk_cache.memFree
+        for chunk_id in chunk_ids:
+            if chunk_cache.isDirty(chunk_id):
+                continue  # already counted
+            if chunk_size <= mem_free:
+                mem_free -= chunk_size
+            else:
+                serial_ids.add(chunk_id)
+        if serial_ids:
+            msg = f"POST_ChunkBatch - no room reserved for {len(serial_ids)} chunks, "
+            msg += "writing them one at a time"
+            log.info(msg)
+    serial_lock = asyncio.Lock()
+    reserved_tasks = []
+
+    async def do_serial_item(chunk_id, header, data):
+        async with serial_lock:
+            if reserved_tasks:
+                await asyncio.wait(reserved_tasks)
+            return await do_item(chunk_id, header, data)
+
+    tasks = []
+    for chunk_id, (header, data) in zip(chunk_ids, items):
+        if chunk_id in serial_ids:
+            task = asyncio.ensure_future(do_serial_item(chunk_id, header, data))
+        else:
+            task = asyncio.ensure_future(do_item(chunk_id, header, data))
+            reserved_tasks.append(task)
+        tasks.append(task)
+
+    resp = StreamResponse()
+    resp.headers["Content-Type"] = "application/octet-stream"
+    try:
+        await resp.prepare(request)
+        for task in asyncio.as_completed(tasks):
+            rsp_header, rsp_data = await task
+            if action == "write":
+                # let the SN know how much more it can send us
+                rsp_header.update(get_write_credit(app))
+            await resp.write(encodeFrame(rsp_header, rsp_data))
+    except Exception as e:
+        # the SN will retry any chunks it didn't get a frame for
+        log.error(f"POST_ChunkBatch - exception during response write: {e}")
+        for task in tasks:
+            task.cancel()
+    finally:
+        await resp.write_eof()
+    log.response(request, resp=resp)
+    return resp
+
+
 async def DELETE_Chunk(request):
     """HTTP DELETE method for /chunks/
     """
@@ -844,6 +1128,7 @@ async def DELETE_Chunk(request):
         msg = f"Invalid chunk id: {chunk_id}"
         log.warn(msg)
         raise HTTPBadRequest(reason=msg)
+    chunk_id = toChunkId(chunk_id)  # parse the id just once
     if "bucket" in params:
         bucket = params["bucket"]
 
@@ -869,6 +1154,14 @@ async def DELETE_Chunk(request):
 
     if chunk_id in chunk_cache:
         del chunk_cache[chunk_id]
+    await discard_zone_map_stats(app, chunk_id)
+
+    wal = app["wal"]
+    if wal is not None:
+        # don't resurrect the chunk if the log gets replayed
+        lsn = wal.append(chunk_id, op="delete", header={"bucket": bucket})
+        if wal.fsyncPolicy != "interval":
+            await wal.commit(lsn)
 
     filter_map = app["filter_map"]
     dset_id = getDatasetId(chunk_id)
@@ -877,6 +1170,8 @@ async def DELETE_Chunk(request):
         # deleted, so it should be safe to remove this entry now
         log.info(f"Removing filter_map entry for {dset_id}")
         del filter_map[dset_id]
+    app["indexed_vlen_dsets"].discard(dset_id)
+    app["indexed_field_dsets"].pop(dset_id, None)
 
     if await isStorObj(app, s3key, bucket=bucket):
         await deleteStorObj(app, s3key, bucket=bucket)
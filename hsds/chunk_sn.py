@@ -14,10 +14,12 @@
 # handles dataset /value requests for service node
 #
 
+import asyncio
 import base64
 import math
 import numpy as np
 
+from collections import deque
 from json import JSONDecodeError
 from asyncio import IncompleteReadError
 from aiohttp.web_exceptions import HTTPException, HTTPBadRequest
@@ -34,13 +36,14 @@ from .util.hdf5dtype import getItemSize, getDtypeItemSize, getSubType, createDat
 from .util.dsetUtil import isNullSpace, isScalarSpace, get_slices, getShapeDims
 from .util.dsetUtil import isExtensible, getSelectionPagination
 from .util.dsetUtil import getSelectionShape, getDsetMaxDims, getChunkLayout
-from .util.chunkUtil import getNumChunks, getChunkIds, getChunkId
+from .util.chunkUtil import getNumChunks, iterChunkIds, getPointChunks
 from .util.arrayUtil import bytesArrayToList, jsonToArray
 from .util.arrayUtil import getNumElements, arrayToBytes, bytesToArray
 from .util.arrayUtil import squeezeArray, getBroadcastShape
 from .util.authUtil import getUserPasswordFromRequest, validateUserPassword
+from .util.aggregateUtil import AGGREGATE_OPS, getAggregateOptions, getAggregateFields
 from .servicenode_lib import getDsetJson, validateAction
-from .dset_lib import getSelectionData, getParser, extendShape
+from .dset_lib import getSelectionData, getSelectionAggregate, getParser, extendShape
 from .chunk_crawl import ChunkCrawler
 from . import config
 from . import hsds_logger as log
@@ -49,6 +52,98 @@ from . import hsds_logger as log
 VARIABLE_AVG_ITEM_SIZE = 512  # guess at avg variable type length
 
 
+def _getPipelineDepth():
+    """ return max number of pages of a paginated request to have in flight """
+    depth = int(config.get("stream_pipeline_depth", default=2))
+    return max(depth, 1)
+
+
+async def _fetchPagesInOrder(page_count, fetch, consume, depth):
+    """ call fetch(page_number) for each page, with up to depth fetches in
+    flight, and consume(page_number, result) with the results in page order.
+    The page being consumed counts towards depth.  Fetches still pending
+    are cancelled if a fetch or consume fails """
+    pending = deque()  # (page_number, task) items in page order
+    next_page = 0
+    try:
+        while pending or next_page < page_count:
+            while len(pending) < depth and next_page < page_count:
+                pending.append((next_page, asyncio.create_task(fetch(next_page))))
+                next_page += 1
+            page_number, task = pending.popleft()
+            result = await task
+            await consume(page_number, result)
+            # release the page before the next one is fetched
+            result = None
+    finally:
+        tasks = [task for _, task in pending]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _writePagesInOrder(page_count, read, write, depth):
+    """ call read(page_number) for each page in turn and start
+    write(page_number, data) for it, with at most depth writes in flight
+    counting the page being read.  Returns once all the writes are done.
+    Writes still pending are cancelled if a read or write fails """
+    pending = deque()  # write tasks in page order
+    try:
+        for page_number in range(page_count):
+            while len(pending) >= depth:
+                await pending.popleft()
+            data = await read(page_number)
+            pending.append(asyncio.create_task(write(page_number, data)))
+            data = None
+        while pending:
+            await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _streamQueryPages(app, resp, dset_id, dset_json, pages, select_dtype=None,
+                            query=None, bucket=None, limit=0):
+    """ write the rows matching query to resp as they are read, page by page
+    and chunk by chunk in order, till limit rows have been written.
+    Returns the number of bytes written """
+    counts = {"rows": 0, "bytes": 0}
+
+    async def write_rows(arr):
+        output_data = arrayToBytes(arr)
+        await resp.write(output_data)
+        counts["rows"] += arr.shape[0]
+        counts["bytes"] += len(output_data)
+
+    for page_number, page in enumerate(pages):
+        if limit > 0:
+            page_limit = limit - counts["rows"]
+            if page_limit <= 0:
+                log.debug("skipping remaining pages, query limit reached")
+                break
+        else:
+            page_limit = 0
+        msg = f"streaming query rows for page: {page_number + 1} "
+        msg += f"of {len(pages)}, selection: {page}"
+        log.info(msg)
+        await getSelectionData(
+            app,
+            dset_id,
+            dset_json,
+            slices=page,
+            select_dtype=select_dtype,
+            query=query,
+            bucket=bucket,
+            limit=page_limit,
+            query_rsp_callback=write_rows,
+        )
+    log.debug(f"streamed {counts['rows']} query rows")
+    return counts["bytes"]
+
+
 def get_hrefs(request, dset_json):
     """
     Convience function to set up hrefs for GET
@@ -481,46 +576,25 @@ async def _doPointWrite(app,
     dims = getShapeDims(datashape)
     rank = len(dims)
 
-    chunk_dict = {}  # chunk ids to list of points in chunk
+    points = np.asarray(points)
+    if rank == 1:
+        coords = points.reshape((num_points, 1))
+    elif points.shape != (num_points, rank):
+        msg = "PUT Value point value did not match dataset rank"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    else:
+        coords = points
+    if np.any(coords < 0) or np.any(coords >= np.array(dims, dtype=np.uint64)):
+        msg = "PUT Value point is not within the bounds of the dataset"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
 
-    for pt_indx in range(num_points):
-        if rank == 1:
-            point = int(points[pt_indx])
-        else:
-            point_tuple = points[pt_indx]
-            point = []
-            for i in range(len(point_tuple)):
-                point.append(int(point_tuple[i]))
-        if rank == 1:
-            if point < 0 or point >= dims[0]:
-                msg = f"PUT Value point: {point} is not within the "
-                msg += "bounds of the dataset"
-                log.warn(msg)
-                raise HTTPBadRequest(reason=msg)
-        else:
-            if len(point) != rank:
-                msg = "PUT Value point value did not match dataset rank"
-                log.warn(msg)
-                raise HTTPBadRequest(reason=msg)
-            for i in range(rank):
-                if point[i] < 0 or point[i] >= dims[i]:
-                    msg = f"PUT Value point: {point} is not within the "
-                    msg += "bounds of the dataset"
-                    log.warn(msg)
-                    raise HTTPBadRequest(reason=msg)
-        chunk_id = getChunkId(dset_id, point, layout)
-        # get the pt_indx element from the input data
-        value = data[pt_indx]
-        if chunk_id not in chunk_dict:
-            point_list = [point, ]
-            point_data = [value, ]
-            chunk_dict[chunk_id] = {"indices": point_list, "points": point_data}
-        else:
-            item = chunk_dict[chunk_id]
-            point_list = item["indices"]
-            point_list.append(point)
-            point_data = item["points"]
-            point_data.append(value)
+    # chunk ids to points in chunk and the values for those points
+    chunk_dict = {}
+    point_chunks = getPointChunks(dset_id, points, layout)
+    for chunk_id, point_index in point_chunks.items():
+        chunk_dict[chunk_id] = {"indices": points[point_index], "points": data[point_index]}
 
     num_chunks = len(chunk_dict)
     log.debug(f"num_chunks: {num_chunks}")
@@ -552,6 +626,34 @@ async def _doPointWrite(app,
         log.info("doPointWrite success")
 
 
+async def _readPageData(request, page, select_dtype, item_size, page_number=0):
+    """ read the binary data for the given page selection from the request stream """
+    select_shape = getSelectionShape(page)
+    num_bytes = math.prod(select_shape) * item_size
+    log.debug(f"reading {num_bytes} from request stream")
+    # read page of data from input stream
+    try:
+        page_bytes = await request_read(request, count=num_bytes)
+    except HTTPRequestEntityTooLarge as tle:
+        msg = "Got HTTPRequestEntityTooLarge exception during "
+        msg += f"binary read: {tle}) for page: {page_number}"
+        log.warn(msg)
+        raise  # re-throw
+    except IncompleteReadError as ire:
+        msg = "Got asyncio.IncompleteReadError during binary "
+        msg += f"read: {ire} for page: {page_number}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    log.debug(f"read {len(page_bytes)} for page: {page_number}")
+    try:
+        arr = bytesToArray(page_bytes, select_dtype, select_shape)
+    except ValueError as ve:
+        msg = f"bytesToArray value error for page: {page_number}: {ve}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    return arr
+
+
 async def _doHyperslabWrite(app,
                             request,
                             page_number=0,
@@ -587,43 +689,15 @@ async def _doHyperslabWrite(app,
     log.debug(f"got select_shape: {select_shape} for page: {page_number}")
 
     if data is None:
-        num_bytes = math.prod(select_shape) * item_size
-        log.debug(f"reading {num_bytes} from request stream")
-        # read page of data from input stream
-        try:
-            page_bytes = await request_read(request, count=num_bytes)
-        except HTTPRequestEntityTooLarge as tle:
-            msg = "Got HTTPRequestEntityTooLarge exception during "
-            msg += f"binary read: {tle}) for page: {page_number}"
-            log.warn(msg)
-            raise  # re-throw
-        except IncompleteReadError as ire:
-            msg = "Got asyncio.IncompleteReadError during binary "
-            msg += f"read: {ire} for page: {page_number}"
-            log.warn(msg)
-            raise HTTPBadRequest(reason=msg)
-        log.debug(f"read {len(page_bytes)} for page: {page_number}")
-        try:
-            arr = bytesToArray(page_bytes, select_dtype, select_shape)
-        except ValueError as ve:
-            msg = f"bytesToArray value error for page: {page_number}: {ve}"
-            log.warn(msg)
-            raise HTTPBadRequest(reason=msg)
+        arr = await _readPageData(request, page, select_dtype, item_size, page_number)
     else:
         arr = data  # use array provided to function
 
-    try:
-        chunk_ids = getChunkIds(dset_id, page, layout)
-    except ValueError:
-        log.warn("getChunkIds failed")
+    if not dset_id.startswith("d-"):
+        log.warn(f"unexpected dset_id: {dset_id}")
         raise HTTPInternalServerError()
-    if len(chunk_ids) < 10:
-        log.debug(f"chunk_ids: {chunk_ids}")
-    else:
-        log.debug(f"chunk_ids: {chunk_ids[:10]} ...")
-    if len(chunk_ids) > max_chunks:
-        msg = f"got {len(chunk_ids)} for page: {page_number}.  max_chunks: {max_chunks}"
-        log.warn(msg)
+    # let the crawler pull chunk ids as it needs them
+    chunk_ids = iterChunkIds(dset_id, page, layout)
 
     crawler = ChunkCrawler(
         app,
@@ -633,6 +707,7 @@ async def _doHyperslabWrite(app,
         slices=page,
         arr=arr,
         action="write_chunk_hyperslab",
+        num_chunks=num_chunks,
     )
     await crawler.crawl()
 
@@ -923,24 +998,36 @@ async def PUT_Value(request):
             log.debug(f"non-streaming data, setting page list to: {slices}")
         else:
             max_request_size = int(config.get("max_request_size"))
-            pages = getSelectionPagination(slices, dims, select_item_size, max_request_size)
+            layout = getChunkLayout(dset_json)
+            pages = getSelectionPagination(
+                slices, dims, select_item_size, max_request_size, layout=layout
+            )
             log.debug(f"getSelectionPagination returned: {len(pages)} pages")
 
-        for page_number in range(len(pages)):
+        # read the next page from the request stream while the DN writes for
+        # the previous pages are in progress
+        depth = _getPipelineDepth()
+        log.debug(f"stream pipeline depth: {depth}")
+
+        async def read_page(page_number):
             page = pages[page_number]
             msg = f"streaming request data for page: {page_number + 1} of {len(pages)}, "
             msg += f"selection: {page}"
             log.info(msg)
-            kwargs = {"page_number": page_number, "page": page}
+            if arr is not None and page_number == 0:
+                return arr
+            return await _readPageData(request, page, select_dtype, select_item_size, page_number)
+
+        async def write_page(page_number, data):
+            # do write for one page selection
+            kwargs = {"page_number": page_number, "page": pages[page_number]}
             kwargs["dset_json"] = dset_json
             kwargs["bucket"] = bucket
             kwargs["select_dtype"] = select_dtype
-            if arr is not None and page_number == 0:
-                kwargs["data"] = arr
-            else:
-                kwargs["data"] = None
-            # do write for one page selection
+            kwargs["data"] = data
             await _doHyperslabWrite(app, request, **kwargs)
+
+        await _writePagesInOrder(len(pages), read_page, write_page, depth)
     else:
         #
         # Do point put
@@ -1095,49 +1182,54 @@ async def GET_Value(request):
                 page_item_size = VARIABLE_AVG_ITEM_SIZE  # random guess of avg item_size
             else:
                 page_item_size = item_size
-            pages = getSelectionPagination(slices, dims, page_item_size, max_request_size)
+            pages = getSelectionPagination(
+                slices, dims, page_item_size, max_request_size, layout=layout
+            )
             log.debug(f"getSelectionPagination returned: {len(pages)} pages")
             bytes_streamed = 0
-            try:
-                for page_number in range(len(pages)):
-                    page = pages[page_number]
-                    msg = f"streaming response data for page: {page_number + 1} "
-                    msg += f"of {len(pages)}, selection: {page}"
-                    log.info(msg)
+            # fetch the following pages from the DNs while the current page
+            # is written to the client
+            depth = _getPipelineDepth()
+            log.debug(f"stream pipeline depth: {depth}")
+
+            async def fetch_page(page_number):
+                page = pages[page_number]
+                msg = f"streaming response data for page: {page_number + 1} "
+                msg += f"of {len(pages)}, selection: {page}"
+                log.info(msg)
+                log.debug("calling getSelectionData!")
+                return await getSelectionData(
+                    app,
+                    dset_id,
+                    dset_json,
+                    slices=page,
+                    select_dtype=select_dtype,
+                    bucket=bucket,
+                )
+
+            async def write_page(page_number, arr):
+                nonlocal bytes_streamed
+                if arr is None or math.prod(arr.shape) == 0:
+                    log.warn(f"no data returned for streaming page: {page_number}")
+                    return
+                log.debug("preparing binary response")
+                output_data = arrayToBytes(arr)
+                log.debug(f"got {len(output_data)} bytes for resp")
+                bytes_streamed += len(output_data)
+                log.debug("write request")
+                await resp.write(output_data)
 
-                    log.debug("calling getSelectionData!")
-
-                    arr = await getSelectionData(
-                        app,
-                        dset_id,
-                        dset_json,
-                        slices=page,
-                        select_dtype=select_dtype,
-                        query=query,
-                        bucket=bucket,
-                        limit=limit
+            try:
+                if query:
+                    # query pages are read one at a time so that rows get
+                    # written in order and the limit applies across pages
+                    kwargs = {"select_dtype": select_dtype, "query": query,
+                              "bucket": bucket, "limit": limit}
+                    bytes_streamed = await _streamQueryPages(
+                        app, resp, dset_id, dset_json, pages, **kwargs
                     )
-
-                    if arr is None or math.prod(arr.shape) == 0:
-                        log.warn(f"no data returned for streaming page: {page_number}")
-                        continue
-
-                    log.debug("preparing binary response")
-                    output_data = arrayToBytes(arr)
-                    log.debug(f"got {len(output_data)} bytes for resp")
-                    bytes_streamed += len(output_data)
-                    log.debug("write request")
-                    await resp.write(output_data)
-
-                    if query and limit > 0:
-                        query_rows = arr.shape[0]
-                        msg = f"streaming page {page_number} returned {query_rows} rows"
-                        log.debug(msg)
-                        limit -= query_rows
-                        if limit <= 0:
-                            log.debug("skipping remaining pages, query limit reached")
-                            break
-
+                else:
+                    await _fetchPagesInOrder(len(pages), fetch_page, write_page, depth)
             except HTTPException as he:
                 # close the response stream
                 log.error(f"got {type(he)} exception doing getSelectionData: {he}")
@@ -1396,25 +1488,15 @@ async def POST_Value(request):
 
     if points is not None:
         # validate content of points input array
-        for i in range(len(points)):
-            point = points[i]
-            if rank == 1:
-                if point < 0 or point >= dims[0]:
-                    msg = f"POST Value point: {point} is not within the bounds "
-                    msg += "of the dataset"
-                    log.warn(msg)
-                    raise HTTPBadRequest(reason=msg)
-            else:
-                if len(point) != rank:
-                    msg = "POST Value point value did not match dataset rank"
-                    log.warn(msg)
-                    raise HTTPBadRequest(reason=msg)
-                for i in range(rank):
-                    if point[i] < 0 or point[i] >= dims[i]:
-                        msg = f"POST Value point: {point} is not within the "
-                        msg += "bounds of the dataset"
-                        log.warn(msg)
-                        raise HTTPBadRequest(reason=msg)
+        if points.ndim > 2 or points.size != len(points) * rank:
+            msg = "POST Value point value did not match dataset rank"
+            log.warn(msg)
+            raise HTTPBadRequest(reason=msg)
+        coords = points.reshape((len(points), rank))
+        if np.any(coords >= np.array(dims, dtype=np.uint64)):
+            msg = "POST Value point is not within the bounds of the dataset"
+            log.warn(msg)
+            raise HTTPBadRequest(reason=msg)
 
     # write response
     resp = StreamResponse()
@@ -1484,3 +1566,123 @@ async def POST_Value(request):
 
     log.response(request, resp=resp)
     return resp
+
+
+async def GET_Aggregate(request):
+    """
+    Handler for GET /datasets/<dset_uuid>/aggregate request - reduce a
+    selection with the op given by the "op" param on the DNs
+    """
+    log.request(request)
+    app = request.app
+    params = request.rel_url.query
+
+    dset_id = request.match_info.get("id")
+    if not dset_id:
+        msg = "Missing dataset id"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    if not isValidUuid(dset_id, "Dataset"):
+        msg = f"Invalid dataset id: {dset_id}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+
+    username, pswd = getUserPasswordFromRequest(request)
+    if username is None and app["allow_noauth"]:
+        username = "default"
+    else:
+        await validateUserPassword(app, username, pswd)
+
+    domain = getDomainFromRequest(request)
+    if not isValidDomain(domain):
+        msg = f"Invalid domain: {domain}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    bucket = getBucketForDomain(domain)
+
+    op = params.get("op")
+    if op not in AGGREGATE_OPS:
+        msg = f"op param should be one of: {', '.join(AGGREGATE_OPS)}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    try:
+        aggregate = getAggregateOptions(params)
+    except ValueError as ve:
+        msg = f"GET Aggregate - {ve}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    aggregate["op"] = op
+
+    dset_json = await getDsetJson(app, dset_id, bucket=bucket)
+    dset_dtype = createDataType(dset_json["type"])
+    if isNullSpace(dset_json) or isScalarSpace(dset_json):
+        msg = "GET Aggregate requires a simple dataspace"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    dims = getShapeDims(dset_json["shape"])
+    rank = len(dims)
+
+    await validateAction(app, domain, dset_id, username, "read")
+
+    slices = _getSelect(params, dset_json)
+    select_dtype = _getSelectDtype(params, dset_dtype)
+    try:
+        fields = getAggregateFields(select_dtype)
+    except ValueError as ve:
+        msg = f"GET Aggregate - {ve}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+
+    axis = aggregate["axis"]
+    if axis is not None:
+        if op == "histogram":
+            msg = "axis can't be used with histogram"
+            log.warn(msg)
+            raise HTTPBadRequest(reason=msg)
+        if axis >= rank:
+            msg = f"invalid axis: {axis} for dataset of rank {rank}"
+            log.warn(msg)
+            raise HTTPBadRequest(reason=msg)
+        if not all(isinstance(s, slice) for s in slices):
+            msg = "axis requires a hyperslab selection"
+            log.warn(msg)
+            raise HTTPBadRequest(reason=msg)
+        # check the result will fit in a response
+        shape = getSelectionShape(slices)
+        result_size = math.prod(shape) // shape[axis] * 8 * len(fields)
+        max_request_size = int(config.get("max_request_size"))
+        if result_size >= max_request_size:
+            msg = "GET aggregate response too large"
+            log.warn(msg)
+            raise HTTPRequestEntityTooLarge(max_request_size, result_size)
+
+    kwargs = {"slices": slices, "select_dtype": select_dtype, "bucket": bucket}
+    if op == "histogram" and aggregate["hist_range"] is None:
+        # use the min and max of the selection for the bin range
+        if len(fields) > 1:
+            msg = "histogram of more than one field requires a range"
+            log.warn(msg)
+            raise HTTPBadRequest(reason=msg)
+        bounds = await asyncio.gather(*[
+            getSelectionAggregate(app, dset_id, dset_json, aggregate={"op": bound}, **kwargs)
+            for bound in ("min", "max")
+        ])
+        if isinstance(bounds[0], dict):
+            bounds = [list(bound.values())[0] for bound in bounds]
+        lo, hi = (float(bound) for bound in bounds)
+        if np.isnan(lo):
+            # no values
+            lo, hi = 0.0, 1.0
+        elif lo == hi:
+            # same as numpy.histogram
+            lo, hi = lo - 0.5, hi + 0.5
+        aggregate["hist_range"] = (lo, hi)
+
+    value = await getSelectionAggregate(app, dset_id, dset_json, aggregate=aggregate, **kwargs)
+
+    resp_json = {"op": op, "value": value}
+    resp_json["hrefs"] = get_hrefs(request, dset_json)
+    ignore_nan = _isIgnoreNan(params)
+    resp = await jsonResponse(request, resp_json, ignore_nan=ignore_nan)
+    log.response(request, resp=resp)
+    return resp
@@ -175,6 +175,14 @@ def _load_cfg():
         cfg[x] = cfgval
 
 
+def setOverride(x, value):
+    """set x to value, replacing any config file, environment or command
+    line setting"""
+    if not cfg:
+        _load_cfg()
+    cfg[x] = value
+
+
 def get(x, default=None):
     """get x if found in config
     otherwise return default
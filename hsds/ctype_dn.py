@@ -16,8 +16,8 @@
 
 from aiohttp.web_exceptions import HTTPBadRequest, HTTPNotFound
 from aiohttp.web_exceptions import HTTPInternalServerError
-from aiohttp.web import json_response
 
+from .util.httpUtil import rpcResponse, getRequestJson
 from .util.idUtil import isValidUuid, validateUuid
 from .datanode_lib import get_obj_id, get_metadata_obj, save_metadata_obj
 from .datanode_lib import delete_metadata_obj, check_metadata_obj
@@ -59,7 +59,7 @@ async def GET_Datatype(request):
     if "include_attrs" in params and params["include_attrs"]:
         resp_json["attributes"] = ctype_json["attributes"]
 
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
 
@@ -76,7 +76,7 @@ async def POST_Datatype(request):
         log.error(msg)
         raise HTTPBadRequest(reason=msg)
 
-    body = await request.json()
+    body = await getRequestJson(request)
     if "bucket" in params:
         bucket = params["bucket"]
     elif "bucket" in body:
@@ -144,7 +144,7 @@ async def POST_Datatype(request):
     resp_json["lastModified"] = ctype_json["lastModified"]
     resp_json["type"] = type_json
     resp_json["attributeCount"] = 0
-    resp = json_response(resp_json, status=201)
+    resp = rpcResponse(request, resp_json, status=201)
 
     log.response(request, resp=resp)
     return resp
@@ -191,6 +191,6 @@ async def DELETE_Datatype(request):
     await delete_metadata_obj(app, ctype_id, bucket=bucket, notify=notify)
 
     resp_json = {}
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
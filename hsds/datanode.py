@@ -14,11 +14,16 @@
 #
 
 import asyncio
+import os
+from collections import OrderedDict
 import traceback
 from aiohttp.web import run_app
 
 from . import config
 from .util.lruCache import LruCache
+from .util.shmUtil import ShmAttachments
+from .util.writeAheadLog import WriteAheadLog
+from .util.writeConcurrency import WriteConcurrency
 from .util.idUtil import isValidUuid, isSchema2Id, getCollectionForId
 from .util.idUtil import isRootObjId
 from .util.httpUtil import isUnixDomainUrl, bindToSocket, getPortFromUrl
@@ -29,23 +34,24 @@ from .basenode import healthCheck, baseInit
 from . import hsds_logger as log
 from .domain_dn import GET_Domain, PUT_Domain, DELETE_Domain, PUT_ACL
 from .group_dn import GET_Group, POST_Group, DELETE_Group, PUT_Group
-from .group_dn import POST_Root
+from .group_dn import POST_Root, POST_Roots
 from .link_dn import GET_Links, POST_Links, PUT_Links, DELETE_Links
 from .attr_dn import GET_Attributes, POST_Attributes
 from .attr_dn import PUT_Attributes, DELETE_Attributes
 from .ctype_dn import GET_Datatype, POST_Datatype, DELETE_Datatype
 from .dset_dn import GET_Dataset, POST_Dataset, DELETE_Dataset
-from .dset_dn import PUT_DatasetShape
-from .chunk_dn import PUT_Chunk, GET_Chunk, POST_Chunk, DELETE_Chunk
-from .datanode_lib import s3syncCheck
+from .dset_dn import PUT_DatasetShape, PUT_DatasetZoneMap, POST_DatasetZoneMap
+from .chunk_dn import PUT_Chunk, GET_Chunk, POST_Chunk, DELETE_Chunk, POST_ChunkBatch
+from .datanode_lib import s3syncCheck, replay_wal, walCommitCheck
+from .handoff_dn import GET_Handoff, PUT_Handoff, pushHotItems, pullHotItems
 from .async_lib import scanRoot, removeKeys
 from aiohttp.web_exceptions import HTTPNotFound, HTTPInternalServerError
 from aiohttp.web_exceptions import HTTPForbidden, HTTPBadRequest
 
 
-async def init():
+async def init(**kwargs):
     """Intitialize application and return app object"""
-    app = baseInit("dn")
+    app = baseInit("dn", **kwargs)
 
     #
     # call app.router.add_get() here to add node-specific routes
@@ -77,16 +83,22 @@ async def init():
     app.router.add_route("DELETE", "/datasets/{id}", DELETE_Dataset)
     app.router.add_route("POST", "/datasets", POST_Dataset)
     app.router.add_route("PUT", "/datasets/{id}/shape", PUT_DatasetShape)
+    app.router.add_route("PUT", "/datasets/{id}/zonemap", PUT_DatasetZoneMap)
+    app.router.add_route("POST", "/datasets/{id}/zonemap", POST_DatasetZoneMap)
     app.router.add_route("GET", "/datasets/{id}/attributes", GET_Attributes)
     app.router.add_route("POST", "/datasets/{id}/attributes", POST_Attributes)
     app.router.add_route("DELETE", "/datasets/{id}/attributes", DELETE_Attributes)
     app.router.add_route("PUT", "/datasets/{id}/attributes", PUT_Attributes)
+    app.router.add_route("POST", "/chunks/batch", POST_ChunkBatch)
     app.router.add_route("PUT", "/chunks/{id}", PUT_Chunk)
     app.router.add_route("GET", "/chunks/{id}", GET_Chunk)
     app.router.add_route("POST", "/chunks/{id}", POST_Chunk)
     app.router.add_route("DELETE", "/chunks/{id}", DELETE_Chunk)
     app.router.add_route("POST", "/roots/{id}", POST_Root)
+    app.router.add_route("POST", "/roots", POST_Roots)
     app.router.add_route("DELETE", "/prestop", preStop)
+    app.router.add_route("GET", "/handoff", GET_Handoff)
+    app.router.add_route("PUT", "/handoff", PUT_Handoff)
 
     return app
 
@@ -243,8 +255,16 @@ async def start_background_tasks(app):
 
     if "is_standalone" not in app:
         loop.create_task(healthCheck(app))
+        # warm our cache with items from the previous owners
+        loop.create_task(pullHotItems(app))
 
     if "is_readonly" not in app:
+        if app["wal"] is not None:
+            # recover any updates that didn't get written before the
+            # last shutdown, then keep the log committed
+            await replay_wal(app)
+            loop.create_task(walCommitCheck(app))
+
         # run data sync tasks
         loop.create_task(s3syncCheck(app))
 
@@ -255,10 +275,10 @@ async def start_background_tasks(app):
         loop.create_task(bucketGC(app))
 
 
-def create_app():
+def create_app(**kwargs):
     """Create datanode aiohttp application
 
-    :param loop: The asyncio loop to use for the application
+    :param kwargs: node settings passed on to baseInit, e.g. node_number
     :rtype: aiohttp.web.Application
     """
 
@@ -285,7 +305,7 @@ def create_app():
 
     # create the app object
     loop = asyncio.get_event_loop()
-    app = loop.run_until_complete(init())
+    app = loop.run_until_complete(init(**kwargs))
     kwargs = {
         "mem_target": metadata_mem_cache_size,
         "name": "MetaCache",
@@ -305,19 +325,67 @@ def create_app():
     app["dirty_ids"] = {}
     # map of dataset ids to deflate levels (if compressed)
     app["filter_map"] = {}
+    # ids of datasets whose vlen chunks are written in the offset-indexed format
+    app["indexed_vlen_dsets"] = set()
+    # map of dataset ids to the fields with a key index
+    app["indexed_field_dsets"] = {}
     # map of objid to timestamp for in-flight read requests
     app["pending_s3_read"] = {}
     # map of objid to timestamp for in-flight write requests
     app["pending_s3_write"] = {}
     # map of objid to asyncio Task objects for writes
     app["pending_s3_write_tasks"] = {}
+    # limit on in-flight writes - adjusted based on storage latency & throughput
+    kwargs = {
+        "min_count": config.get("min_pending_write_requests", default=2),
+        "max_count": config.get("max_pending_write_requests", default=100),
+    }
+    app["write_concurrency"] = WriteConcurrency(**kwargs)
     # map of root_id to bucket name used for notify root of changes in domain
     app["root_notify_ids"] = {}
+    # asyncio Task for in-flight batched root notifications
+    app["root_notify_task"] = None
+    # chunk stats waiting to be sent to the DN that owns the dataset:
+    # map of dset_id to {"bucket": bucket, "chunks": {chunk key: stats},
+    #   "index": {chunk key: key index}}
+    app["zone_map_updates"] = {}
+    # (dset_id, chunk key) pairs in the stats being sent
+    app["zone_map_sending"] = set()
+    app["zone_map_lock"] = asyncio.Lock()
+    # zone maps of datasets owned by this DN, see datanode_lib.get_zone_map
+    app["zone_maps"] = {}
+    # asyncio Task for sending chunk stats and saving zone maps
+    app["zone_map_task"] = None
     # map of root_id to bucket name for pending root scans
     app["root_scan_ids"] = {}
     # set of root or dataset ids for deletion
     app["gc_buckets"] = {}
     app["objDelete_prefix"] = None  # used by async_lib removeKeys
+    app["cache_handoff_done"] = False  # set once hot items are pushed on shutdown
+    # hot items moved to other nodes, kept for them to pull (not served from)
+    app["handoff_items"] = {}
+    # map of objid to the time this node last wrote it to storage, so that
+    # older copies from other nodes aren't taken in a cache handoff
+    app["flush_times"] = OrderedDict()
+    # shared memory segments of SNs on this host
+    app["shm_segments"] = ShmAttachments()
+
+    # optional write-ahead log for dirty objects
+    wal_dir = config.get("wal_dir")
+    if wal_dir and "is_readonly" not in app:
+        if "is_standalone" in app:
+            # multiple DNs on the same host - use a directory per node
+            wal_dir = os.path.join(wal_dir, f"dn_{app['node_number']}")
+        wal_fsync = config.get("wal_fsync", default="always")
+        log.info(f"Using write-ahead log: {wal_dir} with fsync: {wal_fsync}")
+        kwargs = {
+            "fsync": wal_fsync,
+            "segment_size": int(config.get("wal_segment_size", default=64 * 1024 * 1024)),
+            "commit_delay": float(config.get("wal_commit_delay", default=0.0)),
+        }
+        app["wal"] = WriteAheadLog(wal_dir, **kwargs)
+    else:
+        app["wal"] = None
 
     # TODO - there's nothing to prevent the deflate_map from getting
     # ever larger
@@ -352,6 +420,17 @@ async def on_shutdown(app):
         log.warning(msg)
         await asyncio.sleep(sleep_interval)
 
+    # let any in-flight root notifications go out
+    notify_task = app["root_notify_task"]
+    if notify_task is not None and not notify_task.done():
+        log.debug("on_shutdown - waiting on root notify task")
+        await notify_task
+
+    zone_map_task = app["zone_map_task"]
+    if zone_map_task is not None and not zone_map_task.done():
+        log.debug("on_shutdown - waiting on zone map task")
+        await zone_map_task
+
     # wait on gc tasks to complete
     while True:
         gc_count = get_gc_count(app)
@@ -363,6 +442,21 @@ async def on_shutdown(app):
         log.warning(msg)
         await asyncio.sleep(sleep_interval)
 
+    if "is_standalone" not in app and not app["cache_handoff_done"]:
+        # everything is flushed, pass on our hot items to the new owners
+        app["cache_handoff_done"] = True
+        await pushHotItems(app)
+
+    wal = app["wal"]
+    if wal is not None:
+        await wal.commit()
+        wal.close()
+        if len(app["dirty_ids"]) == 0:
+            # everything has been written, log no longer needed
+            wal.removeSegments()
+
+    app["shm_segments"].close()
+
     # finally release any http_clients
     await release_http_client(app)
 
@@ -21,27 +21,35 @@ from aiohttp.web_exceptions import HTTPNotFound, HTTPForbidden
 from aiohttp.web_exceptions import HTTPServiceUnavailable, HTTPBadRequest
 from .util.idUtil import validateInPartition, getS3Key, isValidUuid
 from .util.idUtil import isValidChunkId, getDataNodeUrl, isSchema2Id
-from .util.idUtil import getRootObjId, isRootObjId
+from .util.idUtil import getRootObjId, isRootObjId, isMovedId
 from .util.storUtil import getStorJSONObj, putStorJSONObj, putStorBytes
 from .util.storUtil import getStorBytes, isStorObj, deleteStorObj, getHyperChunks
 from .util.storUtil import getBucketFromStorURI, getKeyFromStorURI, getURIFromKey
 from .util.domainUtil import isValidDomain, getBucketForDomain
 from .util.attrUtil import getRequestCollectionName
-from .util.httpUtil import http_post
+from .util.httpUtil import http_post, http_put, isConnectionError
 from .util.dsetUtil import getChunkLayout, getFilterOps, getShapeDims
 from .util.dsetUtil import getChunkInitializer, getSliceQueryParam, getFilters
+from .util.dsetUtil import getVlenChunkFormat, getSelectionShape
 from .util.chunkUtil import getDatasetId, getChunkSelection, getChunkIndex
 from .util.arrayUtil import arrayToBytes, bytesToArray, jsonToArray
+from .util.arrayUtil import arrayToIndexedBytes, isVlen, isIndexedVlen, indexedBytesToArray
 from .util.hdf5dtype import createDataType
 from .util.rangegetUtil import ChunkLocation, chunkMunge, getHyperChunkIndex, getHyperChunkFactors
 from .util.timeUtil import getNow
+from .util.zoneMapUtil import getChunkCoordKey, getChunkStats, getZoneMapKey
+from .util.zoneMapUtil import getChunkKeyIndex, getIndexedFields
 from . import config
 from . import hsds_logger as log
 from .dset_lib import getFillValue
+from .handoff_dn import recordFlush
 
 # supported initializer commands
 INITIALIZER_CMDS = ["chunklocator", "arange"]
 
+# max number of dataset zone maps a DN keeps in memory
+ZONE_MAP_CACHE_COUNT = 1000
+
 
 def get_obj_id(request, body=None):
     """Get object id from request
@@ -68,7 +76,9 @@ def get_obj_id(request, body=None):
         raise HTTPInternalServerError()
 
     try:
-        validateInPartition(app, obj_id)
+        # previous owners only take reads
+        readonly = request.method == "GET"
+        validateInPartition(app, obj_id, readonly=readonly)
     except KeyError:
         log.error(f"Object {obj_id} not in partition")
         raise HTTPInternalServerError()
@@ -94,13 +104,261 @@ async def notify_root(app, root_id, bucket=None):
     await http_post(app, notify_req, data={}, params=params)
 
 
+async def notify_roots(app, notify_ids):
+    """Notify the DNs owning each root in the notify_ids map (root_id to
+    bucket) with one POST request per DN.  Roots that could not be
+    notified are put back in app["root_notify_ids"] for the next s3sync.
+    """
+    dn_roots = {}  # dn url to list of roots for that node
+    for root_id in notify_ids:
+        if not isValidUuid(root_id) or not isSchema2Id(root_id):
+            log.error(f"unexpected call to notify with invalid id: {root_id}")
+            continue
+        bucket = notify_ids[root_id]
+        if not bucket:
+            log.error(f"notify_roots - bucket not set for {root_id}")
+            continue
+        dn_url = getDataNodeUrl(app, root_id)
+        if dn_url not in dn_roots:
+            dn_roots[dn_url] = []
+        dn_roots[dn_url].append({"id": root_id, "bucket": bucket})
+
+    async def notify_node(dn_url, roots):
+        notify_req = dn_url + "/roots"
+        log.info(f"Notify: {notify_req} for {len(roots)} roots")
+        try:
+            await http_post(app, notify_req, data={"roots": roots})
+        except Exception as e:
+            if not isinstance(e, HTTPServiceUnavailable) and not isConnectionError(e):
+                # retrying won't help
+                log.error(f"got {type(e)} exception notifying {dn_url}, dropping roots: {e}")
+                return
+            # this can happen if we go into a WAITING state, or the
+            # node is restarting - try again on the next s3sync
+            log.warning(f"got {type(e)} exception notifying {dn_url}: {e}")
+            root_notify_ids = app["root_notify_ids"]
+            for item in roots:
+                root_id = item["id"]
+                if root_id not in root_notify_ids:
+                    root_notify_ids[root_id] = item["bucket"]
+
+    tasks = []
+    for dn_url in dn_roots:
+        tasks.append(notify_node(dn_url, dn_roots[dn_url]))
+    await asyncio.gather(*tasks)
+    log.info(f"notify_roots - {len(notify_ids)} roots sent to {len(tasks)} nodes")
+
+
+def queue_zone_map_stats(app, chunk_id, chunk_arr, bucket=None):
+    """Compute the stats and key index for a chunk that's been written to
+    storage and queue them to be sent to the DN that owns the dataset"""
+    if not config.get("zone_maps", default=True):
+        return
+    dset_id = getDatasetId(chunk_id)
+    if not isSchema2Id(dset_id):
+        return
+    stats = getChunkStats(chunk_arr)
+    index = None
+    indexed_fields = app["indexed_field_dsets"].get(dset_id)
+    if indexed_fields:
+        max_keys = int(config.get("index_max_keys", default=4096))
+        index = getChunkKeyIndex(chunk_arr, indexed_fields, max_keys=max_keys)
+    if stats is None and index is None:
+        return
+    updates = app["zone_map_updates"]
+    if dset_id not in updates:
+        updates[dset_id] = {"bucket": bucket, "chunks": {}, "index": {}}
+    chunk_key = getChunkCoordKey(chunk_id)
+    if stats is not None:
+        updates[dset_id]["chunks"][chunk_key] = stats
+    if index is not None:
+        updates[dset_id]["index"][chunk_key] = index
+
+
+async def discard_zone_map_stats(app, chunk_id):
+    """The chunk has been updated, so stats computed from the earlier data
+    are stale.  Drop them if they haven't been sent, and wait for any send
+    in progress to finish.  The SN invalidates the chunk on the dataset's
+    DN once the update returns, so after that no stale stats can arrive.
+    """
+    dset_id = getDatasetId(chunk_id)
+    chunk_key = getChunkCoordKey(chunk_id)
+    updates = app["zone_map_updates"]
+    if dset_id in updates:
+        updates[dset_id]["chunks"].pop(chunk_key, None)
+        updates[dset_id]["index"].pop(chunk_key, None)
+    if (dset_id, chunk_key) in app["zone_map_sending"]:
+        async with app["zone_map_lock"]:
+            pass
+
+
+async def send_zone_map_stats(app):
+    """Send queued chunk stats to the DNs that own each dataset.  Stats
+    that can't be sent are dropped - the chunks just won't be skipped
+    by queries until they get written again."""
+    async with app["zone_map_lock"]:
+        updates = app["zone_map_updates"]
+        if not updates:
+            return
+        dset_updates = dict(updates)
+        updates.clear()
+        sending = app["zone_map_sending"]
+        for dset_id in dset_updates:
+            for chunk_key in dset_updates[dset_id]["chunks"]:
+                sending.add((dset_id, chunk_key))
+            for chunk_key in dset_updates[dset_id]["index"]:
+                sending.add((dset_id, chunk_key))
+
+        async def send_stats(dset_id, item):
+            params = {}
+            if item["bucket"]:
+                params["bucket"] = item["bucket"]
+            data = {"chunks": item["chunks"], "index": item["index"]}
+            try:
+                req = getDataNodeUrl(app, dset_id) + "/datasets/" + dset_id + "/zonemap"
+                await http_put(app, req, data=data, params=params)
+            except Exception as e:
+                msg = f"send_zone_map_stats - got {type(e)} exception for {dset_id}: {e}, "
+                chunk_keys = set(item["chunks"]) | set(item["index"])
+                msg += f"dropping stats for {len(chunk_keys)} chunks"
+                log.warn(msg)
+
+        tasks = []
+        for dset_id in dset_updates:
+            tasks.append(send_stats(dset_id, dset_updates[dset_id]))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            sending.clear()
+        log.info(f"send_zone_map_stats - sent stats for {len(tasks)} datasets")
+
+
+async def get_zone_map(app, dset_id, bucket=None):
+    """Return the zone map for a dataset owned by this DN, loading the
+    stats object from storage if needed.  The returned dict has the per
+    chunk stats in "chunks", the per chunk key index in "index", and the
+    chunk keys stored in "persisted"."""
+    zone_maps = app["zone_maps"]
+    zone_map = zone_maps.get(dset_id)
+    if zone_map and zone_map["dn_urls"] != app["dn_urls"] and not zone_map["lock"].locked():
+        # other DNs may have owned the dataset since this was loaded
+        log.info(f"get_zone_map - DNs have changed, reloading zone map for {dset_id}")
+        zone_map = None
+    if zone_map is None:
+        zone_map = {
+            "bucket": bucket,
+            "chunks": {},
+            "index": {},
+            "persisted": set(),
+            "dirty": 0,  # time of the first update since the last save
+            "loaded": False,
+            "lock": asyncio.Lock(),
+            "dn_urls": list(app["dn_urls"]),
+        }
+        zone_maps[dset_id] = zone_map
+    if not zone_map["loaded"]:
+        async with zone_map["lock"]:
+            if not zone_map["loaded"]:
+                s3key = getZoneMapKey(dset_id)
+                try:
+                    stats_json = await getStorJSONObj(app, s3key, bucket=bucket)
+                except HTTPNotFound:
+                    log.debug(f"get_zone_map - no stats object for {dset_id}")
+                    stats_json = {}
+                chunks = stats_json.get("chunks", {})
+                index = stats_json.get("index", {})
+                zone_map["persisted"] = set(chunks) | set(index)
+                chunks.update(zone_map["chunks"])
+                zone_map["chunks"] = chunks
+                index.update(zone_map["index"])
+                zone_map["index"] = index
+                zone_map["loaded"] = True
+    return zone_map
+
+
+async def save_zone_map(app, dset_id):
+    """Write the zone map for the dataset to storage"""
+    zone_map = app["zone_maps"].get(dset_id)
+    if zone_map is None:
+        return
+    async with zone_map["lock"]:
+        chunks = dict(zone_map["chunks"])
+        index = dict(zone_map["index"])
+        chunk_keys = set(chunks) | set(index)
+        dirty = zone_map["dirty"]
+        zone_map["dirty"] = 0
+        # an invalidate while the write is in progress needs to write again
+        zone_map["persisted"].update(chunk_keys)
+        s3key = getZoneMapKey(dset_id)
+        log.debug(f"save_zone_map - {dset_id}: {len(chunk_keys)} chunks")
+        stats_json = {"chunks": chunks}
+        if index:
+            stats_json["index"] = index
+        try:
+            await putStorJSONObj(app, s3key, stats_json, bucket=zone_map["bucket"])
+        except Exception:
+            if not zone_map["dirty"]:
+                zone_map["dirty"] = dirty
+            raise
+        zone_map["persisted"] = chunk_keys
+
+
+async def update_zone_map(app, dset_id, chunks=None, index=None, invalidate=None, bucket=None):
+    """Add stats and key index entries for the given chunks and remove
+    the entries for the chunks in the invalidate list.  Entries that have
+    been written to storage are removed from storage before returning."""
+    if dset_id in app["deleted_ids"]:
+        log.info(f"update_zone_map - ignoring update for deleted dataset: {dset_id}")
+        return
+    zone_map = await get_zone_map(app, dset_id, bucket=bucket)
+    if chunks:
+        zone_map["chunks"].update(chunks)
+    if index:
+        zone_map["index"].update(index)
+    if (chunks or index) and not zone_map["dirty"]:
+        zone_map["dirty"] = getNow(app)
+    save_now = False
+    for chunk_key in invalidate or ():
+        zone_map["chunks"].pop(chunk_key, None)
+        zone_map["index"].pop(chunk_key, None)
+        if chunk_key in zone_map["persisted"]:
+            save_now = True
+    if save_now:
+        await save_zone_map(app, dset_id)
+
+
+async def sync_zone_maps(app, s3_age_time=0):
+    """Send queued chunk stats, then write zone maps that were updated at
+    least s3_age_time seconds ago to storage and drop unused ones from
+    memory"""
+    await send_zone_map_stats(app)
+    zone_maps = app["zone_maps"]
+    now = getNow(app)
+    for dset_id in list(zone_maps):
+        zone_map = zone_maps.get(dset_id)
+        if zone_map is None or zone_map["lock"].locked():
+            continue
+        if not zone_map["dirty"] or now - zone_map["dirty"] < s3_age_time:
+            continue
+        try:
+            await save_zone_map(app, dset_id)
+        except Exception as e:
+            log.warn(f"sync_zone_maps - got {type(e)} exception saving {dset_id}: {e}")
+    for dset_id in list(zone_maps):
+        if len(zone_maps) <= ZONE_MAP_CACHE_COUNT:
+            break
+        zone_map = zone_maps[dset_id]
+        if not zone_map["dirty"] and not zone_map["lock"].locked():
+            del zone_maps[dset_id]
+
+
 async def check_metadata_obj(app, obj_id, bucket=None):
     """Return False is obj does not exist"""
     if isValidDomain(obj_id):
         bucket = getBucketForDomain(obj_id)
 
     try:
-        validateInPartition(app, obj_id)
+        validateInPartition(app, obj_id, readonly=True)
     except KeyError:
         log.error(f"Object {obj_id} not in partition")
         raise HTTPInternalServerError()
@@ -123,6 +381,11 @@ async def check_metadata_obj(app, obj_id, bucket=None):
     return found
 
 
+# storage write failures that count against the write concurrency limit,
+# errors from the storage clients for 5xx responses and timeouts
+STORAGE_WRITE_ERRORS = (HTTPInternalServerError, HTTPServiceUnavailable, asyncio.TimeoutError)
+
+
 async def write_s3_obj(app, obj_id, bucket=None):
     """writes the given object to s3"""
     s3key = getS3Key(obj_id)
@@ -137,7 +400,10 @@ async def write_s3_obj(app, obj_id, bucket=None):
     filter_map = app["filter_map"]
     notify_objs = app["root_notify_ids"]
     deleted_ids = app["deleted_ids"]
+    write_concurrency = app["write_concurrency"]
     success = False
+    storage_error = False
+    nbytes = 0
 
     if isValidDomain(obj_id):
         domain_bucket = getBucketForDomain(obj_id)
@@ -194,8 +460,11 @@ async def write_s3_obj(app, obj_id, bucket=None):
                 log.error(f"expected chunk cache obj {obj_id} to be dirty")
                 raise ValueError("bad dirty state for obj")
             chunk_arr = chunk_cache[obj_id]
-            chunk_bytes = arrayToBytes(chunk_arr)
             dset_id = getDatasetId(obj_id)
+            if dset_id in app["indexed_vlen_dsets"]:
+                chunk_bytes = arrayToIndexedBytes(chunk_arr)
+            else:
+                chunk_bytes = arrayToBytes(chunk_arr)
             if dset_id in filter_map:
                 filter_ops = filter_map[dset_id]
                 msg = f"write_s3_obj: got filter_op: {filter_ops} "
@@ -206,7 +475,12 @@ async def write_s3_obj(app, obj_id, bucket=None):
                 log.debug(f"write_s3_obj: no filter_op for dset: {dset_id}")
 
             kwargs = {"bucket": bucket, "filter_ops": filter_ops}
-            await putStorBytes(app, s3key, chunk_bytes, **kwargs)
+            try:
+                await putStorBytes(app, s3key, chunk_bytes, **kwargs)
+            except STORAGE_WRITE_ERRORS:
+                storage_error = True
+                raise
+            nbytes = len(chunk_bytes)
             success = True
 
             # if chunk has been evicted from cache something has gone wrong
@@ -227,6 +501,7 @@ async def write_s3_obj(app, obj_id, bucket=None):
                     # no new write, can clear dirty
                     # allow eviction from cache
                     chunk_cache.clearDirty(obj_id)
+                    queue_zone_map_stats(app, obj_id, chunk_arr, bucket=bucket)
                     cache_utilization = chunk_cache.cacheUtilizationPercent
                     dirty_count = chunk_cache.dirtyCount
                     msg = f"write_s3_obj: {obj_id} updated - "
@@ -247,8 +522,15 @@ async def write_s3_obj(app, obj_id, bucket=None):
                 log.error(msg)
                 raise ValueError("bad dirty state for obj")
             obj_json = meta_cache[obj_id]
+            # get the size now - the object may be evicted or deleted
+            # while the write is in progress
+            nbytes = meta_cache.getSize(obj_id)
 
-            await putStorJSONObj(app, s3key, obj_json, bucket=bucket)
+            try:
+                await putStorJSONObj(app, s3key, obj_json, bucket=bucket)
+            except STORAGE_WRITE_ERRORS:
+                storage_error = True
+                raise
             success = True
             # should still be in meta_cache...
             if obj_id in deleted_ids:
@@ -280,6 +562,11 @@ async def write_s3_obj(app, obj_id, bucket=None):
     finally:
         # clear pending_s3_write item
         log.debug(f"write_s3_obj finally block, success={success}")
+        if success:
+            write_concurrency.record(nbytes, getNow(app) - now)
+            recordFlush(app, obj_id)
+        elif storage_error:
+            write_concurrency.recordError()
         if obj_id in pending_s3_write:
             if pending_s3_write[obj_id] != now:
                 msg = "pending_s3_write timestamp got updated unexpectedly "
@@ -307,6 +594,10 @@ async def write_s3_obj(app, obj_id, bucket=None):
         else:
             log.debug(f"clearing dirty flag for {obj_id}")
             del dirty_ids[obj_id]
+            wal = app["wal"]
+            if wal is not None:
+                # object is persisted, log records no longer needed
+                wal.markClean(obj_id)
 
     # add to map so that root can be notified about changed objects
     if isValidUuid(obj_id) and isSchema2Id(obj_id):
@@ -358,7 +649,9 @@ async def get_metadata_obj(app, obj_id, bucket=None):
         s3_key = getS3Key(obj_id)
         log.debug(f"get_metadata_obj - using s3_key: {s3_key}")
         pending_s3_read = app["pending_s3_read"]
-        if obj_id in pending_s3_read:
+        # objects that moved to another node are read from storage each time
+        use_cache = not isMovedId(app, obj_id)
+        if use_cache and obj_id in pending_s3_read:
             # already a read in progress, wait for it to complete
             read_start_time = pending_s3_read[obj_id]
             msg = f"s3 read request for {s3_key} was "
@@ -382,7 +675,7 @@ async def get_metadata_obj(app, obj_id, bucket=None):
         # invoke S3 read unless the object has just come in from pending read
         if not obj_json:
             log.debug(f"getS3JSONObj({obj_id}, bucket={bucket})")
-            if obj_id not in pending_s3_read:
+            if use_cache and obj_id not in pending_s3_read:
                 pending_s3_read[obj_id] = getNow(app)
             # read S3 object as JSON
             try:
@@ -391,9 +684,10 @@ async def get_metadata_obj(app, obj_id, bucket=None):
                 if obj_id in pending_s3_read:
                     elapsed_time = getNow(app) - pending_s3_read[obj_id]
                     log.info(f"s3 read for {obj_id} took {elapsed_time}")
-                else:
+                elif use_cache:
                     log.warn(f"s3 read complete but pending object: {obj_id} not found")
-                meta_cache[obj_id] = obj_json  # add to cache
+                if use_cache:
+                    meta_cache[obj_id] = obj_json  # add to cache
             except HTTPNotFound:
                 msg = f"HTTPNotFound for {obj_id} bucket:{bucket} "
                 msg += f"s3key: {s3_key}"
@@ -466,6 +760,14 @@ async def save_metadata_obj(
         log.warn(f"bucket is not defined for save_metadata_obj: {obj_id}")
     dirty_ids[obj_id] = (now, bucket)
 
+    wal = app["wal"]
+    if wal is not None and not flush:
+        header = {"bucket": bucket}
+        data = json.dumps(obj_json).encode("utf-8")
+        lsn = wal.append(obj_id, header=header, data=data)
+        if wal.fsyncPolicy != "interval":
+            await wal.commit(lsn)
+
     if flush:
         # write to S3 immediately
         if isValidChunkId(obj_id):
@@ -528,6 +830,13 @@ async def delete_metadata_obj(app, obj_id, notify=True, root_id=None, bucket=Non
         log.debug(f"removing dirty_ids for: {obj_id}")
         del dirty_ids[obj_id]
 
+    wal = app["wal"]
+    if wal is not None:
+        # don't resurrect the object if the log gets replayed
+        lsn = wal.append(obj_id, op="delete", header={"bucket": bucket})
+        if wal.fsyncPolicy != "interval":
+            await wal.commit(lsn)
+
     # remove from S3 (if present)
     s3key = getS3Key(obj_id)
 
@@ -1048,8 +1357,10 @@ async def get_chunk(
     else:
         # TBD - potential race condition?
         pending_s3_read = app["pending_s3_read"]
+        # chunks that moved to another node are read from storage each time
+        use_cache = not isMovedId(app, chunk_id)
 
-        if chunk_id in pending_s3_read:
+        if use_cache and chunk_id in pending_s3_read:
             # already a read in progress, wait for it to complete
             read_start_time = pending_s3_read[chunk_id]
             msg = f"s3 read request for {chunk_id} was requested at: "
@@ -1074,7 +1385,7 @@ async def get_chunk(
                 log.warn(msg)
 
         if chunk_arr is None:
-            if chunk_id not in pending_s3_read:
+            if use_cache and chunk_id not in pending_s3_read:
                 pending_s3_read[chunk_id] = getNow(app)
 
             try:
@@ -1097,7 +1408,7 @@ async def get_chunk(
                     # read complete - remove from pending map
                     elapsed_time = getNow(app) - pending_s3_read[chunk_id]
                     log.info(f"s3 read for {chunk_id} took {elapsed_time}")
-                else:
+                elif use_cache:
                     msg = f"expected to find {chunk_id} in "
                     msg += "pending_s3_read map"
                     log.warn(msg)
@@ -1113,7 +1424,7 @@ async def get_chunk(
                 if chunk_id in pending_s3_read:
                     del pending_s3_read[chunk_id]
 
-        if chunk_arr is not None:
+        if chunk_arr is not None and use_cache:
             # check that there's room in the cache before adding it
             if chunk_id in chunk_cache or chunk_cache.memFree >= chunk_arr.size:
                 chunk_cache[chunk_id] = chunk_arr  # store in cache
@@ -1151,7 +1462,61 @@ async def get_chunk(
     return chunk_arr
 
 
-def save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=None):
+async def get_chunk_selection(app, chunk_id, dset_json, selection, bucket=None):
+    """
+    Return the selected elements of a vlen chunk that isn't in the chunk
+    cache, decoding just the selected elements if the chunk is stored in
+    the offset-indexed format.  Returns None if the chunk should be read
+    with get_chunk instead (the chunk is cached or being read, or the
+    selection is a large part of the chunk).
+    """
+    if getVlenChunkFormat(dset_json) != "indexed" or getChunkInitializer(dset_json):
+        return None
+    chunk_cache = app["chunk_cache"]
+    if chunk_id in chunk_cache or chunk_id in app["pending_s3_read"]:
+        return None
+    chunk_dims = getChunkLayout(dset_json)
+    num_selected = np.prod(getSelectionShape(selection))
+    max_fraction = float(config.get("vlen_select_max_fraction", default=0.25))
+    if num_selected > np.prod(chunk_dims) * max_fraction:
+        return None  # cache the whole chunk for later reads
+
+    dt = createDataType(dset_json["type"])
+    filters = getFilters(dset_json)
+    dset_id = dset_json["id"]
+    filter_ops = getFilterOps(app, dset_id, filters, dtype=dt, chunk_shape=chunk_dims)
+    s3key = getS3Key(chunk_id)
+    chunk_bytes = await getStorBytes(app, s3key, filter_ops=filter_ops, bucket=bucket)
+    if chunk_bytes is None:
+        log.error(f"read {chunk_id} bucket: {bucket} returned None")
+        raise HTTPInternalServerError()
+    try:
+        if isIndexedVlen(chunk_bytes):
+            log.debug(f"get_chunk_selection - decoding {num_selected} elements of {chunk_id}")
+            arr = indexedBytesToArray(chunk_bytes, dt, chunk_dims, select=selection)
+        else:
+            # written in the sequential format, decode the whole chunk
+            chunk_arr = bytesToArray(chunk_bytes, dt, chunk_dims)
+            arr = chunk_arr[tuple(selection)]
+    except (TypeError, ValueError) as e:
+        log.error(f"Unable to decode chunk {chunk_id}: {e}")
+        raise HTTPInternalServerError()
+    return arr
+
+
+def get_write_credit(app):
+    """Return the number of bytes of chunk writes this DN can take before
+    running out of dirty cache space, and the rate at which dirty chunks
+    are being flushed to storage.  SNs use these to pace their writes."""
+    chunk_cache = app["chunk_cache"]
+    min_chunk_size = int(config.get("min_chunk_size"))
+    write_credit = chunk_cache.memFree - min_chunk_size
+    if write_credit < 0:
+        write_credit = 0
+    return {"write_credit": write_credit, "flush_rate": int(chunk_cache.flushRate)}
+
+
+async def save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=None):
     """Persist the given chunk"""
     log.info(f"save_chunk {chunk_id} bucket={bucket}")
 
@@ -1168,6 +1533,11 @@ def save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=None):
     # will store filter options into app['filter_map']
     filters = getFilters(dset_json)
     getFilterOps(app, dset_id, filters, dtype=dtype, chunk_shape=chunk_shape)
+    if isVlen(dtype) and getVlenChunkFormat(dset_json) == "indexed":
+        app["indexed_vlen_dsets"].add(dset_id)
+    indexed_fields = getIndexedFields(dset_json)
+    if indexed_fields:
+        app["indexed_field_dsets"][dset_id] = indexed_fields
 
     chunk_cache = app["chunk_cache"]
     if chunk_id not in chunk_cache:
@@ -1185,18 +1555,53 @@ def save_chunk(app, chunk_id, dset_json, chunk_arr, bucket=None):
     chunk_cache[chunk_id] = chunk_arr
     chunk_cache.setDirty(chunk_id)
     log.debug(f"chunk cache dirty count: {chunk_cache.dirtyCount}")
+    await discard_zone_map_stats(app, chunk_id)
 
     # async write to S3
     dirty_ids = app["dirty_ids"]
     now = getNow(app)
     dirty_ids[chunk_id] = (now, bucket)
 
+    wal = app["wal"]
+    if wal is not None:
+        # log the chunk so the update survives a restart before s3sync
+        header = {"bucket": bucket}
+        if dset_id in app["indexed_vlen_dsets"]:
+            chunk_bytes = arrayToIndexedBytes(chunk_arr)
+        else:
+            chunk_bytes = arrayToBytes(chunk_arr)
+        lsn = wal.append(chunk_id, header=header, data=chunk_bytes)
+        if wal.fsyncPolicy != "interval":
+            await wal.commit(lsn)
+
+
+def get_flush_order(app):
+    """Return the dirty ids in the order they should be written.  Normally
+    this is the order they were dirtied in, but when the chunk cache is near
+    full the largest dirty chunks go first to free up the most space."""
+    dirty_ids = app["dirty_ids"]
+    chunk_cache = app["chunk_cache"]
+    pressure = config.get("s3sync_cache_pressure", default=0.8)
+    if chunk_cache.memDirty < chunk_cache.memTarget * pressure:
+        return list(dirty_ids)
+
+    def dirty_bytes(obj_id):
+        if isValidChunkId(obj_id) and obj_id in chunk_cache:
+            return chunk_cache.getSize(obj_id)
+        return 0
+
+    msg = f"s3sync - chunk cache dirty: {chunk_cache.memDirty} bytes, "
+    msg += "flushing largest objects first"
+    log.info(msg)
+    # sorted is stable, so equal sized objects keep their dirty order
+    return sorted(dirty_ids, key=dirty_bytes, reverse=True)
+
 
 async def s3sync(app, s3_age_time=0):
     """Periodic method that writes dirty objects in
     the metadata cache to S3
     """
-    max_pending_write_requests = config.get("max_pending_write_requests")
+    write_limit = app["write_concurrency"].limit
     dirty_ids = app["dirty_ids"]
     pending_s3_write = app["pending_s3_write"]
     pending_s3_write_tasks = app["pending_s3_write_tasks"]
@@ -1208,7 +1613,7 @@ async def s3sync(app, s3_age_time=0):
         return 0
     msg = f"s3sync update - dirtyid count: {dirty_count}, "
     msg += f"active write tasks: {len(pending_s3_write_tasks)}/"
-    msg += f"{max_pending_write_requests}"
+    msg += f"{write_limit}"
     log.info(msg)
     log.debug(f"s3sync dirty_ids: {dirty_ids}")
     pending_keys = list(pending_s3_write.keys())
@@ -1232,8 +1637,8 @@ async def s3sync(app, s3_age_time=0):
     s3sync_start = getNow(app)
 
     log.info(f"s3sync - processing {len(dirty_ids)} dirty_ids")
-    for obj_id in dirty_ids:
-        if len(pending_s3_write_tasks) >= max_pending_write_requests:
+    for obj_id in get_flush_order(app):
+        if len(pending_s3_write_tasks) >= write_limit:
             msg = "max_pending_write requests in flight, not processing "
             msg += "more dirtyids for this run"
             log.debug(msg)
@@ -1305,24 +1710,17 @@ async def s3sync(app, s3_age_time=0):
 
     # notify root of obj updates
     notify_ids = app["root_notify_ids"]
-    if len(notify_ids) > 0:
+    notify_task = app["root_notify_task"]
+    if notify_task is not None and not notify_task.done():
+        log.debug("s3sync - root notify still in progress")
+    elif len(notify_ids) > 0:
         log.info(f"Notifying for {len(notify_ids)} S3 Updates")
-        # create a set since we are not allowed to change
-        root_ids = set()
-        for root_id in notify_ids:
-            root_ids.add(root_id)
-
-        for root_id in root_ids:
-            bucket = notify_ids[root_id]
-            try:
-                await notify_root(app, root_id, bucket=bucket)
-                del notify_ids[root_id]
-            except HTTPServiceUnavailable:
-                # this can happen if we go into a WAITING state
-                log.warning(
-                    f"got HTTPServiceUnavailable exception try to notify root_id: {root_id}"
-                )
-        log.info("root notify complete")
+        # hand off the current set of ids and notify in the background
+        # so the sync loop doesn't wait on other nodes
+        root_ids = dict(notify_ids)
+        notify_ids.clear()
+        task = asyncio.ensure_future(notify_roots(app, root_ids))
+        app["root_notify_task"] = task
 
     # return number of objects written
     return update_count
@@ -1362,6 +1760,14 @@ async def s3syncCheck(app):
             # catch any exception so don't prematurely end the s3sync task
             log.warn(f"s3syncCheck - got {type(e)} exception: {e}")
 
+        # send chunk stats to the DNs that own the datasets and save zone maps
+        zone_map_task = app["zone_map_task"]
+        if zone_map_task is not None and not zone_map_task.done():
+            log.debug("s3sync - zone map sync still in progress")
+        elif app["zone_map_updates"] or app["zone_maps"]:
+            task = asyncio.ensure_future(sync_zone_maps(app, s3_age_time=s3_age_time))
+            app["zone_map_task"] = task
+
         pending_s3_write_tasks = app["pending_s3_write_tasks"]
         log.debug(f"pending_write_tasks count: {len(pending_s3_write_tasks)}")
         dirty_ids = app["dirty_ids"]
@@ -1382,3 +1788,87 @@ async def s3syncCheck(app):
             msg += f"sleeping for {sleep_time:.2f}"
             log.debug(msg)
             await asyncio.sleep(sleep_time)
+
+
+async def replay_wal(app):
+    """Write the latest logged version of each object found in the
+    write-ahead log to storage.  Called at startup before s3sync runs.
+    """
+    wal = app["wal"]
+    if wal is None:
+        return 0
+    replay_start = getNow(app)
+    replay_count = 0
+    failed_records = []
+    dset_cache = {}  # dset_id to dset_json or None if not found
+    for header, data in wal.replay():
+        obj_id = header["id"]
+        bucket = header.get("bucket")
+        if isValidDomain(obj_id):
+            bucket = getBucketForDomain(obj_id)
+        elif not bucket:
+            bucket = app["bucket_name"]
+        s3key = getS3Key(obj_id)
+        log.info(f"replay_wal - {obj_id} bucket: {bucket}")
+        try:
+            if isValidChunkId(obj_id):
+                dset_id = getDatasetId(obj_id)
+                if dset_id not in dset_cache:
+                    dset_key = getS3Key(dset_id)
+                    try:
+                        dset_json = await getStorJSONObj(app, dset_key, bucket=bucket)
+                    except HTTPNotFound:
+                        dset_json = None
+                    dset_cache[dset_id] = dset_json
+                dset_json = dset_cache[dset_id]
+                if dset_json is None:
+                    log.warn(f"replay_wal - dataset for {obj_id} not found, skipping")
+                    continue
+                dtype = createDataType(dset_json["type"])
+                chunk_shape = getChunkLayout(dset_json)
+                filters = getFilters(dset_json)
+                kwargs = {"dtype": dtype, "chunk_shape": chunk_shape}
+                filter_ops = getFilterOps(app, dset_id, filters, **kwargs)
+                kwargs = {"bucket": bucket, "filter_ops": filter_ops}
+                await putStorBytes(app, s3key, data, **kwargs)
+            else:
+                obj_json = json.loads(data.decode("utf-8"))
+                await putStorJSONObj(app, s3key, obj_json, bucket=bucket)
+            replay_count += 1
+        except Exception as e:
+            log.error(f"replay_wal - unable to write {obj_id}: {type(e)} {e}")
+            failed_records.append((header, data))
+
+    # logged objects are now in storage, remove the old segments
+    wal.removeSegments()
+    for header, data in failed_records:
+        # keep in the log so the write is retried at next startup
+        obj_id = header["id"]
+        wal.append(obj_id, header={"bucket": header.get("bucket")}, data=data)
+    if failed_records:
+        await wal.commit()
+
+    elapsed_time = getNow(app) - replay_start
+    msg = f"replay_wal - wrote {replay_count} objects in {elapsed_time:.3f}s, "
+    msg += f"{len(failed_records)} failures"
+    log.info(msg)
+    return replay_count
+
+
+async def walCommitCheck(app):
+    """Periodic method that commits buffered write-ahead log records
+    and removes log segments that are no longer needed
+    """
+    wal = app["wal"]
+    if wal is None:
+        return
+    wal_fsync_interval = float(config.get("wal_fsync_interval", default=0.1))
+    while True:
+        try:
+            if wal.pendingCount > 0:
+                await wal.commit()
+            wal.checkpoint()
+        except Exception as e:
+            # catch any exception so don't prematurely end the commit task
+            log.warn(f"walCommitCheck - got {type(e)} exception: {e}")
+        await asyncio.sleep(wal_fsync_interval)
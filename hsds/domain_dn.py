@@ -14,8 +14,8 @@
 #
 
 from aiohttp.web_exceptions import HTTPConflict, HTTPInternalServerError
-from aiohttp.web import json_response
 
+from .util.httpUtil import rpcResponse, getRequestJson, MSGPACK_CONTENT_TYPE
 from .util.authUtil import getAclKeys
 from .util.domainUtil import isValidDomain, getBucketForDomain
 from .util.idUtil import validateInPartition
@@ -47,7 +47,9 @@ def get_domain(request, body=None):
         log.error(msg)
         raise HTTPInternalServerError()
     try:
-        validateInPartition(app, domain)
+        # previous owners only take reads
+        readonly = request.method == "GET"
+        validateInPartition(app, domain, readonly=readonly)
     except KeyError:
         log.error(f"Domain {domain} not in partition")
         raise HTTPInternalServerError()
@@ -69,7 +71,7 @@ async def GET_Domain(request):
     domain_json = await get_metadata_obj(app, domain)
     log.debug(f"returning domain_json: {domain_json}")
 
-    resp = json_response(domain_json)
+    resp = rpcResponse(request, domain_json)
     log.response(request, resp=resp)
     return resp
 
@@ -88,13 +90,13 @@ async def PUT_Domain(request):
         log.error("expected Content-Type in request headers")
         raise HTTPInternalServerError()
     content_type = request.headers["Content-Type"]
-    if content_type != "application/json":
+    if content_type not in ("application/json", MSGPACK_CONTENT_TYPE):
         msg = "PUT_Domain, expected json content-type but got: "
         msg += f"{content_type}"
         log.error(msg)
         raise HTTPInternalServerError()
 
-    body = await request.json()
+    body = await getRequestJson(request)
     log.debug(f"got body: {body}")
 
     domain = get_domain(request, body=body)
@@ -105,7 +107,7 @@ async def PUT_Domain(request):
         log.error(f"expected bucket to be used in domain: {domain}")
         raise HTTPInternalServerError()
 
-    body_json = await request.json()
+    body_json = await getRequestJson(request)
     if "owner" not in body_json:
         msg = "Expected Owner Key in Body"
         log.warn(msg)
@@ -141,7 +143,7 @@ async def PUT_Domain(request):
     # domains S3 scan
     await save_metadata_obj(app, domain, domain_json, notify=True, flush=True)
 
-    resp = json_response(domain_json, status=201)
+    resp = rpcResponse(request, domain_json, status=201)
     log.response(request, resp=resp)
     return resp
 
@@ -169,7 +171,7 @@ async def DELETE_Domain(request):
 
     json_rsp = {"domain": domain}
 
-    resp = json_response(json_rsp)
+    resp = rpcResponse(request, json_rsp)
     log.response(request, resp=resp)
     return resp
 
@@ -184,7 +186,7 @@ async def PUT_ACL(request):
         msg = "Expected body in delete domain"
         log.error(msg)
         raise HTTPInternalServerError()
-    body_json = await request.json()
+    body_json = await getRequestJson(request)
 
     domain = get_domain(request, body=body_json)
 
@@ -223,6 +225,6 @@ async def PUT_ACL(request):
 
     resp_json = {}
 
-    resp = json_response(resp_json, status=201)
+    resp = rpcResponse(request, resp_json, status=201)
     log.response(request, resp=resp)
     return resp
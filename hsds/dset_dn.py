@@ -15,14 +15,17 @@
 
 from aiohttp.web_exceptions import HTTPBadRequest, HTTPNotFound, HTTPConflict
 from aiohttp.web_exceptions import HTTPInternalServerError
-from aiohttp.web import json_response
 
 
+from .util.httpUtil import rpcResponse, getRequestJson
 from .util.idUtil import isValidUuid, validateUuid
 from .util.domainUtil import isValidBucketName
 from .util.timeUtil import getNow
+from .util.hdf5dtype import createDataType
+from .util.queryUtil import getQueryPlan
 from .datanode_lib import get_obj_id, check_metadata_obj, get_metadata_obj
 from .datanode_lib import save_metadata_obj, delete_metadata_obj
+from .datanode_lib import get_zone_map, update_zone_map
 from . import hsds_logger as log
 
 
@@ -63,7 +66,7 @@ async def GET_Dataset(request):
     if "include_attrs" in params and params["include_attrs"]:
         resp_json["attributes"] = dset_json["attributes"]
 
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
 
@@ -79,7 +82,7 @@ async def POST_Dataset(request):
         log.error(msg)
         raise HTTPBadRequest(reason=msg)
 
-    body = await request.json()
+    body = await getRequestJson(request)
     log.info(f"POST_Dataset, body: {body}")
     if "bucket" in params:
         bucket = params["bucket"]
@@ -163,7 +166,7 @@ async def POST_Dataset(request):
     resp_json["lastModified"] = dset_json["lastModified"]
     resp_json["attributeCount"] = 0
 
-    resp = json_response(resp_json, status=201)
+    resp = rpcResponse(request, resp_json, status=201)
     log.response(request, resp=resp)
     return resp
 
@@ -205,10 +208,12 @@ async def DELETE_Dataset(request):
     if "Notify" in params and not params["Notify"]:
         notify = False
     await delete_metadata_obj(app, dset_id, bucket=bucket, notify=notify)
+    # the stats object gets removed along with the chunks
+    app["zone_maps"].pop(dset_id, None)
 
     resp_json = {}
 
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
 
@@ -224,7 +229,7 @@ async def PUT_DatasetShape(request):
         log.error(f"Unexpected dset_id: {dset_id}")
         raise HTTPInternalServerError()
 
-    body = await request.json()
+    body = await getRequestJson(request)
 
     log.info(f"PUT datasetshape: {dset_id}, body: {body}")
 
@@ -301,6 +306,116 @@ async def PUT_DatasetShape(request):
     log.info(f"Updated dimensions: {dims}")
     await save_metadata_obj(app, dset_id, dset_json, bucket=bucket)
 
-    resp = json_response(resp_json, status=201)
+    resp = rpcResponse(request, resp_json, status=201)
+    log.response(request, resp=resp)
+    return resp
+
+
+async def PUT_DatasetZoneMap(request):
+    """HTTP method to update the per chunk stats of a dataset.  The body
+    has the stats for chunks that have been written to storage in "chunks"
+    and their key index in "index", and/or a list of chunks with stale
+    stats in "invalidate"."""
+    log.request(request)
+    app = request.app
+    params = request.rel_url.query
+    dset_id = request.match_info.get("id")
+
+    if not isValidUuid(dset_id, obj_class="dataset"):
+        log.error(f"Unexpected dset_id: {dset_id}")
+        raise HTTPInternalServerError()
+
+    body = await getRequestJson(request)
+    chunks = body.get("chunks")
+    index = body.get("index")
+    invalidate = body.get("invalidate")
+    msg = f"PUT zonemap: {dset_id}, chunks: {len(chunks or ())}, "
+    msg += f"index: {len(index or ())}, invalidate: {invalidate}"
+    log.info(msg)
+
+    if "bucket" in params:
+        bucket = params["bucket"]
+    else:
+        bucket = None
+
+    if not isValidBucketName(bucket):
+        msg = f"Invalid bucket name: {bucket}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+
+    kwargs = {"chunks": chunks, "index": index, "invalidate": invalidate, "bucket": bucket}
+    await update_zone_map(app, dset_id, **kwargs)
+
+    resp = rpcResponse(request, {})
+    log.response(request, resp=resp)
+    return resp
+
+
+async def POST_DatasetZoneMap(request):
+    """HTTP method to return the chunks of a dataset that can't have any
+    rows matching the query in the body, and for where-in queries on
+    indexed fields, the range of rows to read for the other chunks"""
+    log.request(request)
+    app = request.app
+    params = request.rel_url.query
+    dset_id = request.match_info.get("id")
+
+    if not isValidUuid(dset_id, obj_class="dataset"):
+        log.error(f"Unexpected dset_id: {dset_id}")
+        raise HTTPInternalServerError()
+
+    body = await getRequestJson(request)
+    if "query" not in body:
+        msg = "POST zonemap with no query"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    query = body["query"]
+
+    if "bucket" in params:
+        bucket = params["bucket"]
+    else:
+        bucket = None
+
+    if not isValidBucketName(bucket):
+        msg = f"Invalid bucket name: {bucket}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+
+    dset_json = await get_metadata_obj(app, dset_id, bucket=bucket)
+    zone_map = await get_zone_map(app, dset_id, bucket=bucket)
+
+    skip = []
+    ranges = {}
+    chunks = zone_map["chunks"]
+    index = zone_map["index"]
+    plan = None
+    if chunks or index:
+        dset_dtype = createDataType(dset_json["type"])
+        try:
+            plan = getQueryPlan(query, dset_dtype)
+        except ValueError as ve:
+            # chunk requests will return the error
+            log.info(f"POST zonemap - bad query: {ve}")
+    if plan is not None:
+        for chunk_key in chunks:
+            if not plan.mayMatch(chunks[chunk_key]):
+                skip.append(chunk_key)
+        if plan.where_field:
+            skip_keys = set(skip)
+            for chunk_key in index:
+                if chunk_key in skip_keys:
+                    continue
+                row_range = plan.getWhereRange(index[chunk_key])
+                if row_range is None:
+                    continue
+                if row_range[0] == row_range[1]:
+                    skip.append(chunk_key)
+                else:
+                    ranges[chunk_key] = row_range
+    msg = f"POST zonemap - {len(skip)} chunks can be skipped, "
+    msg += f"{len(ranges)} chunks with row ranges"
+    log.info(msg)
+
+    resp = rpcResponse(request, {"skip": skip, "ranges": ranges})
     log.response(request, resp=resp)
     return resp
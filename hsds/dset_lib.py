@@ -21,17 +21,19 @@ from .util.boolparser import BooleanParser
 from .util.dsetUtil import isNullSpace, getDatasetLayout, getDatasetLayoutClass, get_slices
 from .util.dsetUtil import getChunkLayout, getSelectionShape, getShapeDims
 from .util.chunkUtil import getChunkCoordinate, getChunkIndex, getChunkSuffix
-from .util.chunkUtil import getNumChunks, getChunkIds, getChunkId
+from .util.chunkUtil import getNumChunks, getChunkIds, getPointChunks
 from .util.chunkUtil import getChunkCoverage, getDataCoverage
 from .util.chunkUtil import getQueryDtype, get_chunktable_dims
 from .util.hdf5dtype import createDataType, getItemSize
-from .util.httpUtil import http_delete, http_put
+from .util.httpUtil import http_delete, http_put, http_post
 from .util.idUtil import getDataNodeUrl, isSchema2Id, getS3Key, getObjId
 from .util.rangegetUtil import getHyperChunkFactors
 from .util.storUtil import getStorKeys
+from .util.zoneMapUtil import getChunkCoordKey, isZoneMapDataset
+from .util.aggregateUtil import Aggregator
 
 from .servicenode_lib import getDsetJson, doFlush
-from .chunk_crawl import ChunkCrawler
+from .chunk_crawl import ChunkCrawler, invalidate_zone_map
 from . import config
 from . import hsds_logger as log
 
@@ -434,9 +436,12 @@ async def getSelectionData(
     query=None,
     query_update=None,
     bucket=None,
-    limit=0
+    limit=0,
+    query_rsp_callback=None,
 ):
-    """Read selected slices and return numpy array"""
+    """Read selected slices and return numpy array.  For queries with a
+    query_rsp_callback, the matching rows are passed to the callback in
+    chunk order as they are read and None is returned."""
     log.debug("getSelectionData")
     if slices is None and points is None:
         log.error("getSelectionData - expected either slices or points to be set")
@@ -458,30 +463,12 @@ async def getSelectionData(
         chunk_ids = getChunkIds(dset_id, slices, layout)
     else:
         # points - already checked it is not None
-        num_points = len(points)
-        chunk_ids = []
-        for pt_indx in range(num_points):
-            point = points[pt_indx]
-            chunk_id = getChunkId(dset_id, point, layout)
-            if chunk_id in chunkinfo:
-                chunk_entry = chunkinfo[chunk_id]
-            else:
-                chunk_entry = {}
-                chunkinfo[chunk_id] = chunk_entry
-                chunk_ids.append(chunk_id)
-            if "points" in chunk_entry:
-                point_list = chunk_entry["points"]
-            else:
-                point_list = []
-                chunk_entry["points"] = point_list
-            if "indices" in chunk_entry:
-                point_index = chunk_entry["indices"]
-            else:
-                point_index = []
-                chunk_entry["indices"] = point_index
-
-            point_list.append(point)
-            point_index.append(pt_indx)
+        points = np.asarray(points)
+        point_chunks = getPointChunks(dset_id, points, layout)
+        chunk_ids = list(point_chunks.keys())
+        for chunk_id in chunk_ids:
+            point_index = point_chunks[chunk_id]
+            chunkinfo[chunk_id] = {"points": points[point_index], "indices": point_index}
 
     # Get information about where chunks are located
     #   Will be None except for H5D_CHUNKED_REF_INDIRECT type
@@ -508,11 +495,135 @@ async def getSelectionData(
         limit=limit,
         chunk_map=chunkinfo,
         bucket=bucket,
+        query_rsp_callback=query_rsp_callback,
     )
 
     return arr
 
 
+async def getSelectionAggregate(
+    app,
+    dset_id,
+    dset_json,
+    slices=None,
+    select_dtype=None,
+    aggregate=None,
+    bucket=None,
+):
+    """Reduce the selected slices on the DNs and return the combined result.
+    aggregate is a dict with the op, axis, bins and hist_range to use."""
+    log.debug(f"getSelectionAggregate - {aggregate}")
+    if slices is None:
+        slices = get_slices(None, dset_json)
+    if select_dtype is None:
+        select_dtype = createDataType(dset_json["type"])
+    axis = aggregate.get("axis")
+    shape = getSelectionShape(slices)
+    if axis is not None:
+        shape = shape[:axis] + shape[(axis + 1):]
+    else:
+        shape = []
+
+    layout = getChunkLayout(dset_json)
+    chunk_ids = getChunkIds(dset_id, slices, layout)
+    chunkinfo = {}
+    await getChunkLocations(app, dset_id, dset_json, chunkinfo, chunk_ids, bucket=bucket)
+    get_chunk_selections(chunkinfo, chunk_ids, slices, dset_json)
+
+    crawler = ChunkCrawler(
+        app,
+        chunk_ids,
+        dset_json=dset_json,
+        chunk_map=chunkinfo,
+        bucket=bucket,
+        slices=slices,
+        select_dtype=select_dtype,
+        action="read_chunk_aggregate",
+        aggregate=aggregate,
+    )
+    await crawler.crawl()
+
+    crawler_status = crawler.get_status()
+    log.info(f"getSelectionAggregate complete - status:  {crawler_status}")
+    if crawler_status == 400:
+        raise HTTPBadRequest()
+    if crawler_status not in (200, 201):
+        msg = f"getSelectionAggregate raising HTTPInternalServerError for status: {crawler_status}"
+        log.info(msg)
+        raise HTTPInternalServerError()
+
+    kwargs = {"shape": shape, "bins": aggregate.get("bins"),
+              "hist_range": aggregate.get("hist_range")}
+    aggregator = Aggregator(select_dtype, aggregate["op"], **kwargs)
+    for chunk_id in chunk_ids:
+        chunk_info = chunkinfo[chunk_id]
+        if axis is None:
+            sel = ()
+        else:
+            # where the chunk's partial goes in the result
+            data_sel = chunk_info["data_sel"]
+            sel = tuple(data_sel[:axis]) + tuple(data_sel[(axis + 1):])
+        aggregator.add(chunk_info["aggregate"], sel=sel)
+    return aggregator.getValue()
+
+
+def _narrowChunkSelection(chunk_sel, row_range):
+    """Return the part of the one-dimensional chunk selection that's
+    within the given range of rows, or None if there isn't any"""
+    s = chunk_sel[0]
+    step = s.step if s.step else 1
+    start = max(s.start, row_range[0])
+    if start > s.start and step > 1:
+        # keep to the selection's stride
+        start = s.start + -(-(start - s.start) // step) * step
+    stop = min(s.stop, row_range[1])
+    if start >= stop:
+        return None
+    return (slice(start, stop, step),)
+
+
+async def pruneChunks(app, chunk_ids, dset_json, query, chunk_map=None, bucket=None):
+    """Return the chunk ids that could have rows matching the query, based
+    on the per chunk min/max values kept by the DN that owns the dataset.
+    For where-in queries on indexed fields, the chunk selections in
+    chunk_map are narrowed to the rows that have the requested keys."""
+    if not config.get("zone_maps", default=True) or len(chunk_ids) == 0:
+        return chunk_ids
+    if not isZoneMapDataset(dset_json):
+        return chunk_ids
+    dset_id = dset_json["id"]
+    req = getDataNodeUrl(app, dset_id) + "/datasets/" + dset_id + "/zonemap"
+    params = {}
+    if bucket:
+        params["bucket"] = bucket
+    try:
+        rsp_json = await http_post(app, req, data={"query": query}, params=params)
+    except Exception as e:
+        # just query all the chunks
+        log.warn(f"pruneChunks - got {type(e)} exception for {dset_id}: {e}")
+        return chunk_ids
+    skip = set(rsp_json.get("skip", ()))
+    ranges = rsp_json.get("ranges")
+    if ranges and chunk_map:
+        for chunk_id in chunk_ids:
+            chunk_key = getChunkCoordKey(chunk_id)
+            if chunk_key not in ranges or chunk_key in skip:
+                continue
+            chunk_info = chunk_map.get(chunk_id)
+            if not chunk_info or "chunk_sel" not in chunk_info:
+                continue
+            chunk_sel = _narrowChunkSelection(chunk_info["chunk_sel"], ranges[chunk_key])
+            if chunk_sel is None:
+                skip.add(chunk_key)
+            else:
+                chunk_info["chunk_sel"] = chunk_sel
+    if not skip:
+        return chunk_ids
+    chunk_ids = [chunk_id for chunk_id in chunk_ids if getChunkCoordKey(chunk_id) not in skip]
+    log.info(f"pruneChunks - {len(chunk_ids)} chunks left after zone map check")
+    return chunk_ids
+
+
 async def doReadSelection(
     app,
     chunk_ids,
@@ -525,6 +636,7 @@ async def doReadSelection(
     chunk_map=None,
     bucket=None,
     limit=0,
+    query_rsp_callback=None,
 ):
     """read selection utility function"""
     log.info(f"doReadSelection - number of chunk_ids: {len(chunk_ids)}")
@@ -596,6 +708,11 @@ async def doReadSelection(
         else:
             arr = np.zeros(np_shape, dtype=select_dtype, order="C")
 
+    if query is not None:
+        # skip chunks that can't have any rows matching the query
+        kwargs = {"chunk_map": chunk_map, "bucket": bucket}
+        chunk_ids = await pruneChunks(app, chunk_ids, dset_json, query, **kwargs)
+
     crawler = ChunkCrawler(
         app,
         chunk_ids,
@@ -609,6 +726,7 @@ async def doReadSelection(
         arr=arr,
         select_dtype=select_dtype,
         action="read_chunk_hyperslab",
+        query_rsp_callback=query_rsp_callback,
     )
     await crawler.crawl()
 
@@ -623,6 +741,10 @@ async def doReadSelection(
         log.info(msg)
         raise HTTPInternalServerError()
 
+    if query is not None and query_rsp_callback is not None:
+        # rows have already been passed to the callback
+        return None
+
     if query is not None:
         # combine chunk responses and return
         if limit > 0 and crawler._hits > limit:
@@ -946,6 +1068,7 @@ async def reduceShape(app, dset_json, shape_update, bucket=None):
         delete_ids.sort()
         log.debug(f"these ids will need to be deleted: {delete_ids}")
         await removeChunks(app, delete_ids, bucket=bucket)
+        await invalidate_zone_map(app, dset_json, delete_ids, bucket=bucket)
     else:
         log.info("no chunks need deletion for shape reduction")
 
@@ -33,6 +33,7 @@ from .util.storUtil import getSupportedFilters
 from .util.hdf5dtype import validateTypeItem, createDataType, getBaseTypeJson
 from .util.hdf5dtype import getItemSize
 from .util.linkUtil import validateLinkName
+from .util.zoneMapUtil import checkIndexedFields
 from .servicenode_lib import getDomainJson, getObjectJson, getDsetJson, getPathForObjectId
 from .servicenode_lib import getObjectIdByPath, validateAction, getRootInfo
 from .servicenode_lib import createObject, createObjectByPath, deleteObject
@@ -1023,6 +1024,23 @@ async def POST_Dataset(request):
                 log.warn(msg)
                 raise HTTPBadRequest(reason=msg)
 
+        if "vlenChunkFormat" in creationProperties:
+            vlen_format = creationProperties["vlenChunkFormat"]
+            if vlen_format not in ("sequential", "indexed"):
+                msg = f"unexpected value for vlenChunkFormat: {vlen_format}"
+                log.warn(msg)
+                raise HTTPBadRequest(reason=msg)
+
+        if "indexedFields" in creationProperties:
+            dt = createDataType(datatype)
+            rank = len(shape_json.get("dims", ()))
+            try:
+                checkIndexedFields(creationProperties["indexedFields"], dt, rank)
+            except ValueError as ve:
+                msg = f"invalid indexedFields: {ve}"
+                log.warn(msg)
+                raise HTTPBadRequest(reason=msg)
+
         if "filters" in creationProperties:
             # convert to standard representation
             # refer to https://hdf5-json.readthedocs.io/en/latest/bnf/\
@@ -17,8 +17,8 @@ import asyncio
 
 from aiohttp.web_exceptions import HTTPBadRequest, HTTPInternalServerError
 from aiohttp.web_exceptions import HTTPNotFound, HTTPServiceUnavailable
-from aiohttp.web import json_response
 
+from .util.httpUtil import rpcResponse, getRequestJson
 from .util.idUtil import isValidUuid, isSchema2Id, isRootObjId, getRootObjId
 from .util.domainUtil import isValidBucketName
 from .util.timeUtil import getNow
@@ -67,7 +67,7 @@ async def GET_Group(request):
     if "creationProperties" in group_json:
         resp_json["creationProperties"] = group_json["creationProperties"]
 
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
 
@@ -83,7 +83,7 @@ async def POST_Group(request):
         log.warn(msg)
         raise HTTPBadRequest(reason=msg)
 
-    body = await request.json()
+    body = await getRequestJson(request)
     if "bucket" in params:
         bucket = params["bucket"]
     elif "bucket" in body:
@@ -147,7 +147,7 @@ async def POST_Group(request):
     resp_json["linkCount"] = 0
     resp_json["attributeCount"] = 0
 
-    resp = json_response(resp_json, status=201)
+    resp = rpcResponse(request, resp_json, status=201)
     log.response(request, resp=resp)
     return resp
 
@@ -235,7 +235,7 @@ async def PUT_Group(request):
 
     rsp_json = {"id": app["id"]}  # return the node id
     log.debug(f"flush returning: {rsp_json}")
-    resp = json_response(rsp_json, status=200)
+    resp = rpcResponse(request, rsp_json, status=200)
     log.response(request, resp=resp)
     return resp
 
@@ -284,7 +284,7 @@ async def DELETE_Group(request):
 
     resp_json = {}
 
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
 
@@ -332,6 +332,54 @@ async def POST_Root(request):
 
     resp_json = {}
 
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
+    log.response(request, resp=resp)
+    return resp
+
+
+async def POST_Roots(request):
+    """Notify roots that content in their domains has been modified.
+    Body is a list of root id and bucket items batched by the sending node.
+    """
+    log.request(request)
+    app = request.app
+    body = await getRequestJson(request)
+    if not body or "roots" not in body:
+        msg = "POST_Roots with no roots key in body"
+        log.error(msg)
+        raise HTTPBadRequest(reason=msg)
+    roots = body["roots"]
+    if not isinstance(roots, list):
+        msg = "POST_Roots expected list of roots"
+        log.error(msg)
+        raise HTTPBadRequest(reason=msg)
+
+    # validate all the items before scheduling any scans
+    for item in roots:
+        if not isinstance(item, dict):
+            msg = "POST_Roots expected dict for root item"
+            log.error(msg)
+            raise HTTPBadRequest(reason=msg)
+        root_id = item.get("id")
+        bucket = item.get("bucket")
+        if not root_id or not isSchema2Id(root_id) or not isRootObjId(root_id):
+            log.error(f"POST_Roots - expected root id but got: {root_id}")
+            raise HTTPBadRequest(reason="invalid root id")
+        if not isValidBucketName(bucket):
+            msg = f"Invalid bucket name: {bucket}"
+            log.warn(msg)
+            raise HTTPBadRequest(reason=msg)
+
+    timestamp = getNow(app)
+    root_scan_ids = app["root_scan_ids"]
+    for item in roots:
+        # repeat notifications for the same root coalesce into one scan
+        root_scan_ids[item["id"]] = (item["bucket"], timestamp)
+
+    log.info(f"POST_Roots: {len(roots)} roots, scan count: {len(root_scan_ids)}")
+
+    resp_json = {}
+
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
@@ -0,0 +1,365 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# handoff_dn.py:
+#
+# Hand off hot cache items between DNs when a DN leaves or joins, so the new
+# owners of its objects don't start with a cold cache
+#
+import asyncio
+import json
+import time
+
+import numpy as np
+from aiohttp.web import StreamResponse
+from aiohttp.web_exceptions import HTTPBadRequest, HTTPServiceUnavailable
+
+from . import config
+from .util.batchUtil import encodeFrame, decodeFrames
+from .util.hdf5dtype import getTypeItem, createDataType
+from .util.httpUtil import http_get, http_put, request_read, jsonResponse
+from .util.idUtil import getObjHash, getDnPartitioner, createDnPartitioner
+from .util.idUtil import isValidChunkId
+from .util.chunkUtil import getDatasetId
+from . import hsds_logger as log
+
+CACHE_NAMES = ("meta_cache", "chunk_cache")
+
+
+def _getHandoffBudget():
+    """return max bytes and max items to hand off"""
+    max_bytes = int(config.get("cache_handoff_max_bytes", default=0))
+    max_items = int(config.get("cache_handoff_max_items", default=0))
+    return max_bytes, max_items
+
+
+def _getFlushTimeLimit():
+    """return how long in seconds flush times are kept.  Cache items expire
+    after this, so older copies aren't taken in a handoff."""
+    chunk_expire = config.get("chunk_mem_cache_expire", default=3600)
+    meta_expire = config.get("metadata_mem_cache_expire", default=3600)
+    return float(max(chunk_expire or 3600, meta_expire or 3600))
+
+
+def recordFlush(app, obj_id):
+    """Record that obj_id was written to storage now.  Copies of the object
+    handed off by other nodes that were cached before this are dropped."""
+    flush_times = app["flush_times"]
+    now = time.time()
+    flush_times[obj_id] = now
+    flush_times.move_to_end(obj_id)
+    # oldest entries are first
+    limit = now - _getFlushTimeLimit()
+    while flush_times:
+        oldest_id = next(iter(flush_times))
+        if flush_times[oldest_id] >= limit:
+            break
+        del flush_times[oldest_id]
+
+
+def _getNodeUrl(app):
+    """return the url for this DN, or None if not known"""
+    node_number = app["node_number"]
+    dn_urls = app["dn_urls"]
+    if node_number < 0 or node_number >= len(dn_urls):
+        return None
+    return dn_urls[node_number]
+
+
+def _encodeItem(cache_name, obj_id, data, update_time):
+    """return a (header, bytes) frame for the given cache item, or None if
+    it can't be sent.  update_time is when the data was cached."""
+    header = {"id": obj_id, "cache": cache_name, "updated": update_time}
+    if isinstance(data, np.ndarray):
+        if data.dtype.hasobject:
+            return None  # vlen data
+        try:
+            header["type"] = getTypeItem(data.dtype)
+        except TypeError:
+            return None
+        header["shape"] = list(data.shape)
+        return header, data.tobytes()
+    if isinstance(data, dict):
+        header["format"] = "json"
+        return header, json.dumps(data).encode("utf8")
+    if isinstance(data, bytes):
+        header["format"] = "bytes"
+        return header, data
+    return None
+
+
+def _decodeItem(header, data):
+    """return cache data for the given frame"""
+    if "type" in header:
+        dt = createDataType(header["type"])
+        # copy since the request buffer is read-only
+        arr = np.frombuffer(data, dtype=dt).copy()
+        return arr.reshape(header["shape"])
+    if header.get("format") == "json":
+        return json.loads(bytes(data))
+    if header.get("format") == "bytes":
+        return bytes(data)
+    raise ValueError("unknown cache item format")
+
+
+def _getFrames(app, key_filter, max_bytes, max_items):
+    """Return a list of frames for the hottest clean cache items that
+    key_filter returns True for"""
+    frames = []
+    # items that moved to other nodes are no longer cached, send them first
+    for obj_id, item in list(app["handoff_items"].items()):
+        cache_name, data, _, update_time = item
+        if max_items > 0 and len(frames) >= max_items:
+            return frames
+        if key_filter is not None and not key_filter(obj_id):
+            continue
+        frame = _encodeItem(cache_name, obj_id, data, update_time)
+        if frame is None or len(frame[1]) > max_bytes:
+            continue
+        frames.append(frame)
+        max_bytes -= len(frame[1])
+    for cache_name in CACHE_NAMES:
+        cache = app[cache_name]
+        kwargs = {"key_filter": key_filter}
+        if max_items > 0:
+            kwargs["max_count"] = max_items - len(frames)
+        for obj_id in cache.getHotKeys(max_bytes, **kwargs):
+            update_time = cache.getUpdateTime(obj_id)
+            frame = _encodeItem(cache_name, obj_id, cache.peek(obj_id), update_time)
+            if frame is None:
+                continue
+            frames.append(frame)
+            max_bytes -= len(frame[1])
+        if max_items > 0 and len(frames) >= max_items:
+            break
+    return frames
+
+
+def _addItems(app, body, is_owner):
+    """Add the cache items in body that is_owner returns True for.  Items
+    already in the cache are kept since they are at least as new.  Items
+    that were cached by the sender before this node last wrote them to
+    storage are dropped, as are items too old for that to be checked.
+    Items are only added if they fit in free cache memory.  Returns the
+    number of items added."""
+    deleted_ids = app["deleted_ids"]
+    flush_times = app["flush_times"]
+    limit = time.time() - _getFlushTimeLimit()
+    count = 0
+    for header, data in decodeFrames(body):
+        obj_id = header.get("id")
+        cache_name = header.get("cache")
+        if cache_name not in CACHE_NAMES or not obj_id:
+            raise ValueError("invalid cache item header")
+        update_time = header.get("updated")
+        if not isinstance(update_time, (int, float)):
+            raise ValueError("invalid cache item header")
+        cache = app[cache_name]
+        if obj_id in cache or obj_id in deleted_ids:
+            continue
+        if update_time < limit or flush_times.get(obj_id, 0) >= update_time:
+            log.debug(f"handoff - {obj_id} is older than the stored object")
+            continue
+        if isValidChunkId(obj_id) and getDatasetId(obj_id) in deleted_ids:
+            continue
+        if not is_owner(obj_id):
+            log.debug(f"handoff - {obj_id} not in partition")
+            continue
+        if cache.memUsed + len(data) > cache.memTarget:
+            continue  # don't push out our own items
+        cache[obj_id] = _decodeItem(header, data)
+        cache.setUpdateTime(obj_id, update_time)
+        count += 1
+    return count
+
+
+def _getOwnerFilter(partitioner, node_url):
+    """return function that checks if node_url owns an obj id"""
+    def is_owner(obj_id):
+        return partitioner.getNode(getObjHash(obj_id)) == node_url
+    return is_owner
+
+
+async def PUT_Handoff(request):
+    """HTTP method to take cache items from a DN that is leaving.  The
+    leaving param is the DN's url, items are added if this node owns them
+    now, or will own them once the leaving DN is gone."""
+    log.request(request)
+    app = request.app
+    params = request.rel_url.query
+    if app["node_state"] != "READY":
+        log.warn("handoff - node not ready")
+        raise HTTPServiceUnavailable()
+    node_url = _getNodeUrl(app)
+    if node_url is None:
+        raise HTTPServiceUnavailable()
+    leaving = params.get("leaving")
+    if not leaving:
+        msg = "handoff - expected leaving param"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    current_owner = _getOwnerFilter(getDnPartitioner(app), node_url)
+    dn_urls = [dn_url for dn_url in app["dn_urls"] if dn_url != leaving]
+    new_owner = _getOwnerFilter(createDnPartitioner(dn_urls), node_url)
+
+    def is_owner(obj_id):
+        return current_owner(obj_id) or new_owner(obj_id)
+
+    body = await request_read(request)
+    try:
+        count = _addItems(app, body, is_owner)
+    except (ValueError, TypeError, KeyError) as e:
+        msg = f"handoff - invalid request body: {e}"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    log.info(f"handoff - added {count} cache items from {leaving}")
+    resp = await jsonResponse(request, {"count": count})
+    log.response(request, resp=resp)
+    return resp
+
+
+async def GET_Handoff(request):
+    """HTTP method to send hot cache items to a DN that has joined.  The node
+    param is the url of the new DN, and max_bytes the most it will take."""
+    log.request(request)
+    app = request.app
+    params = request.rel_url.query
+    node = params.get("node")
+    if not node:
+        msg = "handoff - expected node param"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    try:
+        max_bytes = int(params.get("max_bytes", 0))
+        max_items = int(params.get("max_items", 0))
+    except ValueError:
+        msg = "handoff - invalid max_bytes or max_items param"
+        log.warn(msg)
+        raise HTTPBadRequest(reason=msg)
+    # the new node may not be in our dn_urls yet
+    dn_urls = sorted(set(app["dn_urls"]) | {node})
+    is_owner = _getOwnerFilter(createDnPartitioner(dn_urls), node)
+    frames = _getFrames(app, is_owner, max_bytes, max_items)
+    log.info(f"handoff - sending {len(frames)} cache items to {node}")
+    resp = StreamResponse()
+    resp.headers["Content-Type"] = "application/octet-stream"
+    await resp.prepare(request)
+    for header, data in frames:
+        await resp.write(encodeFrame(header, data))
+    await resp.write_eof()
+    log.response(request, resp=resp)
+    return resp
+
+
+async def _pushFrames(app, dn_url, frames, node_url):
+    """send frames to dn_url, in requests no larger than half the max
+    request size"""
+    max_request_size = int(config.get("max_request_size")) // 2
+    params = {"leaving": node_url}
+    req = dn_url + "/handoff"
+    batch = []
+    batch_size = 0
+    for i, (header, data) in enumerate(frames):
+        batch.append(encodeFrame(header, data))
+        batch_size += len(batch[-1])
+        if batch_size >= max_request_size or i == len(frames) - 1:
+            await http_put(app, req, data=b"".join(batch), params=params)
+            batch = []
+            batch_size = 0
+
+
+async def pushHotItems(app):
+    """Send the hottest clean cache items to the DNs that will own them once
+    this DN is gone.  Called on shutdown after dirty items are flushed."""
+    max_bytes, max_items = _getHandoffBudget()
+    node_url = _getNodeUrl(app)
+    if max_bytes <= 0 or node_url is None:
+        return
+    dn_urls = [dn_url for dn_url in app["dn_urls"] if dn_url != node_url]
+    if not dn_urls:
+        return
+    partitioner = createDnPartitioner(dn_urls)
+    frames = _getFrames(app, None, max_bytes, max_items)
+    dn_frames = {}  # map of new owner url to list of frames
+    for frame in frames:
+        owner = partitioner.getNode(getObjHash(frame[0]["id"]))
+        dn_frames.setdefault(owner, []).append(frame)
+    log.info(f"handoff - pushing {len(frames)} cache items to {len(dn_frames)} nodes")
+    tasks = []
+    for dn_url, items in dn_frames.items():
+        tasks.append(_pushFrames(app, dn_url, items, node_url))
+    timeout = float(config.get("cache_handoff_timeout", default=10))
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*tasks, return_exceptions=True), timeout
+        )
+    except asyncio.TimeoutError:
+        log.warn(f"handoff - push not complete after {timeout} seconds")
+        return
+    for dn_url, result in zip(dn_frames, results):
+        if isinstance(result, Exception):
+            log.warn(f"handoff - push to {dn_url} failed: {result}")
+
+
+async def _pullFrom(app, dn_url, node_url, max_bytes, max_items):
+    """get hot items that this node now owns from dn_url"""
+    req = dn_url + "/handoff"
+    params = {"node": node_url, "max_bytes": max_bytes, "max_items": max_items}
+    body = await http_get(app, req, params=params)
+    if not isinstance(body, bytes):
+        log.warn(f"handoff - unexpected response from {dn_url}")
+        return 0
+    is_owner = _getOwnerFilter(getDnPartitioner(app), node_url)
+    return _addItems(app, body, is_owner)
+
+
+async def pullHotItems(app):
+    """Once this DN is ready and the other DNs' transition window is over,
+    get the hottest cache items for its partitions from the other DNs"""
+    while app["node_state"] != "READY":
+        if app["node_state"] == "TERMINATING":
+            return
+        await asyncio.sleep(1)
+    # till the window is over the previous owners still serve reads for
+    # these items, and may be flushing updates made before the change
+    await asyncio.sleep(float(config.get("dn_partition_transition_time", default=0)))
+    if app["node_state"] == "TERMINATING":
+        return
+    max_bytes, max_items = _getHandoffBudget()
+    node_url = _getNodeUrl(app)
+    if max_bytes <= 0 or node_url is None:
+        return
+    dn_urls = [dn_url for dn_url in app["dn_urls"] if dn_url != node_url]
+    if not dn_urls:
+        return
+    # split the budget across the nodes
+    max_bytes = max_bytes // len(dn_urls)
+    if max_items > 0:
+        max_items = max(max_items // len(dn_urls), 1)
+    tasks = []
+    for dn_url in dn_urls:
+        tasks.append(_pullFrom(app, dn_url, node_url, max_bytes, max_items))
+    timeout = float(config.get("cache_handoff_timeout", default=10))
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*tasks, return_exceptions=True), timeout
+        )
+    except asyncio.TimeoutError:
+        log.warn(f"handoff - pull not complete after {timeout} seconds")
+        return
+    count = 0
+    for dn_url, result in zip(dn_urls, results):
+        if isinstance(result, Exception):
+            log.warn(f"handoff - pull from {dn_url} failed: {result}")
+        else:
+            count += result
+    log.info(f"handoff - got {count} cache items from {len(dn_urls)} nodes")
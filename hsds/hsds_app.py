@@ -100,6 +100,7 @@ class HsdsApp:
         config_dir=None,
         readonly=False,
         islambda=False,
+        in_process=False,
     ):
         """
         Initializer for class
@@ -118,6 +119,9 @@ class HsdsApp:
         self._loglevel = log_level
         self._readonly = readonly
         self._islambda = islambda
+        self._in_process = in_process
+        self._engine = None
+        self._engine_thread = None
         self._ready = False
         self._config_dir = config_dir
         self._cmd_dir = get_cmd_dir()
@@ -136,6 +140,10 @@ class HsdsApp:
         if socket_dir is not None and not os.path.isdir(socket_dir):
             os.mkdir(socket_dir)
 
+        if in_process and dn_count != 1:
+            self.log.info(f"in_process set, using one dn rather than {dn_count}")
+            self._dn_count = 1
+
         if root_dir:
             if not os.path.isdir(root_dir):
                 raise FileNotFoundError(f"storage directory: '{root_dir}' not found")
@@ -210,6 +218,10 @@ class HsdsApp:
 
     def check_processes(self):
         # self.log.debug("check processes")
+        if self._engine_thread is not None:
+            if not self._engine_thread.is_alive():
+                self.log.warning("in-process engine thread has ended")
+            return
         self.print_process_output()
         for pname in self._processes:
             p = self._processes[pname]
@@ -219,8 +231,56 @@ class HsdsApp:
                 self.log.warning(msg)
                 # TBD - restart failed process
 
+    def _serve_engine(self):
+        """create in-process engine and handle requests until stopped"""
+        # imported here so the sub-process launcher doesn't load the node code
+        from .hsds_engine import HsdsEngine
+
+        kwargs = {
+            "username": self._username,
+            "password": self._password,
+            "password_file": self._password_file,
+            "log_level": self._loglevel,
+            "root_dir": self._root_dir,
+            "sn_url": self._endpoint,
+            "readonly": self._readonly,
+        }
+        try:
+            engine = HsdsEngine(**kwargs)
+            engine.run()
+        except Exception as e:
+            self.log.error(f"unable to start in-process engine: {e}")
+            return
+        self._engine = engine
+        engine.serve_forever()
+
+    def _run_engine(self):
+        """run service node and data node in a thread of this process"""
+        start_ts = time.time()
+        MAX_INIT_TIME = 10.0  # max time to wait for engine to be ready
+        t = threading.Thread(target=self._serve_engine)
+        t.daemon = True
+        t.start()
+        self._engine_thread = t
+        while self._engine is None or not self._engine.ready:
+            if not t.is_alive():
+                raise IOError("in-process engine failed to start")
+            if time.time() > start_ts + MAX_INIT_TIME:
+                msg = f"failed to initialize after {MAX_INIT_TIME} seconds"
+                self.log.error(msg)
+                raise IOError(msg)
+            time.sleep(0.1)
+        self.log.info(f"Ready after: {(time.time() - start_ts):4.2f} s")
+        self._ready = True
+
     def run(self):
         """startup hsds processes"""
+        if self._engine_thread is not None:
+            self.check_processes()
+            return
+        if self._in_process:
+            self._run_engine()
+            return
         if self._processes:
             # just check process state and restart if necessary
             self.check_processes()
@@ -349,6 +409,15 @@ class HsdsApp:
 
     def stop(self):
         """terminate hsds processes"""
+        if self._engine_thread is not None:
+            logging.info("stopping in-process engine")
+            if self._engine is not None:
+                self._engine.stop()
+            self._engine_thread.join(timeout=10.0)
+            self._engine_thread = None
+            self._engine = None
+            self._ready = False
+            return
         if not self._processes:
             return
 
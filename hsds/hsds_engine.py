@@ -0,0 +1,170 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# hsds_engine.py:
+#
+# Service node and data node running in one process on one event loop.
+# The SN's requests to the DN are dispatched to the DN handlers directly,
+# so there are no sub-processes or sockets between them.
+#
+import asyncio
+from urllib.parse import urlparse
+
+from aiohttp.web import AppRunner, SockSite, TCPSite
+
+from . import config
+from . import servicenode
+from . import datanode
+from .util.httpUtil import isUnixDomainUrl, bindToSocket, getPortFromUrl
+from .util.inProcessUtil import InProcessClient, getInProcessUrl
+from . import hsds_logger as log
+
+
+class HsdsEngine:
+    """
+    Class to run HSDS in this process.
+
+    The SN is reached either with invoke(), or if sn_url is given, over
+    http as with HsdsApp.  The engine uses an event loop of its own, so
+    create it in the thread that will call its methods.
+    """
+
+    def __init__(
+        self,
+        username=None,
+        password=None,
+        password_file=None,
+        log_level=None,
+        root_dir=None,
+        sn_url=None,
+        readonly=False,
+    ):
+        """
+        Initializer for class
+        """
+        self._sn_url = sn_url
+        self._sn_runner = None
+        self._dn_runner = None
+        self._serving = False
+        self._ready = False
+
+        # settings that HsdsApp passes on the node command lines
+        if root_dir:
+            config.setOverride("root_dir", root_dir)
+        if password_file is not None:
+            config.setOverride("password_file", password_file)
+        if log_level:
+            config.setOverride("log_level", log_level)
+        if username:
+            # make this user admin
+            config.setOverride("admin_user", username)
+        if sn_url:
+            config.setOverride("hsds_endpoint", sn_url)
+
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+
+        dn_url = getInProcessUrl("dn_1")
+        node_args = {"standalone": True, "dn_urls": [dn_url], "readonly": readonly}
+        self._dn_app = datanode.create_app(node_number=0, **node_args)
+        self._sn_app = servicenode.create_app(
+            hs_username=username, hs_password=password, **node_args
+        )
+        # both nodes send requests to the DN
+        inprocess_clients = {dn_url: InProcessClient(self._dn_app)}
+        self._sn_app["inprocess_clients"] = inprocess_clients
+        self._dn_app["inprocess_clients"] = inprocess_clients
+        self._sn_client = InProcessClient(self._sn_app)
+
+    @property
+    def endpoint(self):
+        if self._sn_url:
+            return self._sn_url
+        return getInProcessUrl("sn_1")
+
+    @property
+    def ready(self):
+        return self._ready
+
+    async def _start(self):
+        self._dn_runner = AppRunner(self._dn_app, handle_signals=False)
+        await self._dn_runner.setup()
+        self._sn_runner = AppRunner(self._sn_app, handle_signals=False)
+        await self._sn_runner.setup()
+        if not self._sn_url:
+            return
+        if isUnixDomainUrl(self._sn_url):
+            site = SockSite(self._sn_runner, bindToSocket(self._sn_url))
+        else:
+            host = urlparse(self._sn_url).hostname
+            site = TCPSite(self._sn_runner, host=host, port=getPortFromUrl(self._sn_url))
+        await site.start()
+        log.info(f"HsdsEngine - listening on: {self._sn_url}")
+
+    async def _invoke(self, method, path, params=None, headers=None, body=None):
+        kwargs = {"params": params, "headers": headers}
+        if isinstance(body, (dict, list)):
+            kwargs["json"] = body
+        else:
+            kwargs["data"] = body
+        req = self.endpoint + path
+        async with self._sn_client.request(method, req, **kwargs) as rsp:
+            return rsp
+
+    async def _shutdown(self):
+        # SN first so nothing new gets to the DN, then let the DN
+        # write out any dirty objects
+        if self._sn_runner is not None:
+            await self._sn_runner.cleanup()
+        if self._dn_runner is not None:
+            await self._dn_runner.cleanup()
+        # cancel background tasks like the DN's s3sync check
+        tasks = [x for x in asyncio.all_tasks() if x is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self):
+        """Start up the SN and DN"""
+        if self._ready:
+            return
+        self._loop.run_until_complete(self._start())
+        self._ready = True
+        log.info("HsdsEngine - ready")
+
+    def invoke(self, method, path, params=None, headers=None, body=None):
+        """Send a request to the SN and return the response, with status,
+        headers, and body attributes"""
+        coro = self._invoke(method, path, params=params, headers=headers, body=body)
+        return self._loop.run_until_complete(coro)
+
+    def serve_forever(self):
+        """Handle requests to sn_url until stop() is called"""
+        self._serving = True
+        try:
+            self._loop.run_forever()
+        finally:
+            self._serving = False
+            self._close()
+
+    def stop(self):
+        """Shut down the SN and DN.  If serve_forever() is running in another
+        thread, it does the shutdown once its loop stops."""
+        if self._serving:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        elif not self._loop.is_closed():
+            self._close()
+
+    def _close(self):
+        self._ready = False
+        self._loop.run_until_complete(self._shutdown())
+        self._loop.close()
@@ -18,8 +18,8 @@ from bisect import bisect_left
 
 from aiohttp.web_exceptions import HTTPBadRequest, HTTPNotFound, HTTPGone, HTTPConflict
 from aiohttp.web_exceptions import HTTPInternalServerError
-from aiohttp.web import json_response
 
+from .util.httpUtil import rpcResponse, getRequestJson
 from .util.idUtil import isValidUuid
 from .util.globparser import globmatch
 from .util.linkUtil import validateLinkName, getLinkClass, isEqualLink
@@ -157,7 +157,7 @@ async def GET_Links(request):
         link_list.append(link)
 
     resp_json = {"links": link_list}
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
 
@@ -174,7 +174,7 @@ async def POST_Links(request):
         log.error(f"Unexpected group_id: {group_id}")
         raise HTTPInternalServerError()
 
-    body = await request.json()
+    body = await getRequestJson(request)
     if "titles" not in body:
         msg = f"POST_Links expected titles in body but got: {body.keys()}"
         log.warn(msg)
@@ -272,7 +272,7 @@ async def POST_Links(request):
         raise HTTPNotFound()
 
     rspJson = {"links": link_list}
-    resp = json_response(rspJson)
+    resp = rpcResponse(request, rspJson)
     log.response(request, resp=resp)
     return resp
 
@@ -294,7 +294,7 @@ async def PUT_Links(request):
         log.warn(msg)
         raise HTTPBadRequest(reason=msg)
 
-    body = await request.json()
+    body = await getRequestJson(request)
 
     if "links" not in body:
         msg = "PUT_Links with no links key in body"
@@ -392,7 +392,7 @@ async def PUT_Links(request):
     # used by the the SN won't return it
     resp_json = {"status": status}
 
-    resp = json_response(resp_json, status=status)
+    resp = rpcResponse(request, resp_json, status=status)
     log.response(request, resp=resp)
     return resp
 
@@ -481,6 +481,6 @@ async def DELETE_Links(request):
 
     resp_json = {}
 
-    resp = json_response(resp_json)
+    resp = rpcResponse(request, resp_json)
     log.response(request, resp=resp)
     return resp
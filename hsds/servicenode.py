@@ -18,6 +18,7 @@ import time
 from aiohttp.web import run_app
 import aiohttp_cors
 from .util.lruCache import LruCache
+from .util.shmUtil import ShmPool
 from .util.httpUtil import isUnixDomainUrl, bindToSocket, getPortFromUrl
 from .util.httpUtil import release_http_client, jsonResponse
 
@@ -36,12 +37,12 @@ from .attr_sn import DELETE_Attributes, DELETE_Attribute, GET_AttributeValue, PU
 from .ctype_sn import GET_Datatype, POST_Datatype, DELETE_Datatype
 from .dset_sn import GET_Dataset, POST_Dataset, DELETE_Dataset
 from .dset_sn import GET_DatasetShape, PUT_DatasetShape, GET_DatasetType
-from .chunk_sn import PUT_Value, GET_Value, POST_Value
+from .chunk_sn import PUT_Value, GET_Value, POST_Value, GET_Aggregate
 
 
-async def init():
+async def init(**kwargs):
     """Intitialize application and return app object"""
-    app = baseInit("sn")
+    app = baseInit("sn", **kwargs)
 
     # call app.router.add_get() here to add node-specific routes
     #
@@ -178,6 +179,9 @@ async def init():
     app.router.add_route("GET", path, GET_Value)
     app.router.add_route("POST", path, POST_Value)
 
+    path = "/datasets/{id}/aggregate"
+    app.router.add_route("GET", path, GET_Aggregate)
+
     # Add CORS to all routes
     cors_domain = config.get("cors_domain")
     if cors_domain:
@@ -205,6 +209,8 @@ async def start_background_tasks(app):
 async def on_shutdown(app):
     """Release any held resources"""
     log.info("on_shutdown")
+    if app["shm_pool"] is not None:
+        app["shm_pool"].close()
     # finally release any http_clients
     await release_http_client(app)
 
@@ -232,12 +238,13 @@ async def preStop(request):
     return resp
 
 
-def create_app():
-    """Create servicenode aiohttp application"""
+def create_app(hs_username=None, hs_password=None, **kwargs):
+    """Create servicenode aiohttp application.  Arguments that aren't given
+    are taken from the command line."""
     log.info("service node initializing")
 
     loop = asyncio.get_event_loop()
-    app = loop.run_until_complete(init())
+    app = loop.run_until_complete(init(**kwargs))
 
     metadata_mem_cache_size = int(config.get("metadata_mem_cache_size"))
     msg = f"Using metadata memory cache size of: {metadata_mem_cache_size}"
@@ -261,12 +268,22 @@ def create_app():
         log.info("allow_noauth = False")
         app["allow_noauth"] = False
 
+    if config.get("shm_transport", default=False):
+        # DNs on this host can return data in shared memory
+        shm_pool_size = int(config.get("shm_pool_size", default=256 * 1024 * 1024))
+        log.info(f"using shared memory transport with pool size: {shm_pool_size}")
+        app["shm_pool"] = ShmPool(max_bytes=shm_pool_size)
+    else:
+        app["shm_pool"] = None
+
     initUserDB(app)
     initGroupDB(app)
 
     # typically these are null
-    hs_username = config.getCmdLineArg("hs_username")
-    hs_password = config.getCmdLineArg("hs_password")
+    if hs_username is None:
+        hs_username = config.getCmdLineArg("hs_username")
+    if hs_password is None:
+        hs_password = config.getCmdLineArg("hs_password")
     if hs_username:
         log.info(f"getCmdLine hs_username: {hs_username}")
     if hs_password:
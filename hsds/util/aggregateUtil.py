@@ -0,0 +1,251 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# aggregateUtil.py:
+#
+# Reductions (sum, min, max, mean, count, histogram) over a dataset
+# selection.  Each DN reduces its chunk selections to a small "partial"
+# result and the SN combines the partials with an Aggregator.  NaNs are
+# skipped, and compound types are reduced per field.
+#
+import numpy as np
+
+AGGREGATE_OPS = ("sum", "min", "max", "mean", "count", "histogram")
+
+# kinds of values that can be aggregated
+AGGREGATE_KINDS = ("b", "i", "u", "f")
+
+DEFAULT_BINS = 10
+
+
+def getAggregateFields(dtype):
+    """Return the names of the fields of dtype that get aggregated, or
+    [None] for a numeric non-compound type.  Raises ValueError if there
+    aren't any."""
+    if not dtype.names:
+        if dtype.shape or dtype.kind not in AGGREGATE_KINDS:
+            raise ValueError(f"can't aggregate values of type: {dtype}")
+        return [None, ]
+    fields = []
+    for name in dtype.names:
+        field_dt = dtype[name]
+        if field_dt.shape or field_dt.kind not in AGGREGATE_KINDS:
+            continue
+        fields.append(name)
+    if not fields:
+        raise ValueError("no numeric fields to aggregate")
+    return fields
+
+
+def getAggregateOptions(params):
+    """Return a dict with the axis, bins and hist_range options for an
+    aggregate from the request params "axis", "bins" and "range" (given as
+    "min:max").  Raises ValueError for invalid values."""
+    options = {"axis": None, "bins": None, "hist_range": None}
+    if params.get("axis") not in (None, ""):
+        try:
+            options["axis"] = int(params["axis"])
+        except ValueError:
+            raise ValueError(f"invalid axis: {params['axis']}")
+        if options["axis"] < 0:
+            raise ValueError(f"invalid axis: {params['axis']}")
+    if params.get("bins") not in (None, ""):
+        try:
+            options["bins"] = int(params["bins"])
+        except ValueError:
+            raise ValueError(f"invalid bins: {params['bins']}")
+        if options["bins"] < 1:
+            raise ValueError(f"invalid bins: {params['bins']}")
+    if params.get("range") not in (None, ""):
+        try:
+            hist_range = tuple(float(x) for x in params["range"].split(":"))
+        except ValueError:
+            raise ValueError(f"invalid range: {params['range']}")
+        if len(hist_range) != 2 or not hist_range[0] < hist_range[1]:
+            raise ValueError(f"invalid range: {params['range']}")
+        if not np.all(np.isfinite(hist_range)):
+            raise ValueError(f"invalid range: {params['range']}")
+        options["hist_range"] = hist_range
+    return options
+
+
+def getAggregateParams(op, axis=None, bins=None, hist_range=None):
+    """Return the request params for an aggregate, the inverse of
+    getAggregateOptions"""
+    params = {"aggregate": op}
+    if axis is not None:
+        params["axis"] = axis
+    if bins is not None:
+        params["bins"] = bins
+    if hist_range is not None:
+        params["range"] = f"{hist_range[0]!r}:{hist_range[1]!r}"
+    return params
+
+
+def _getSumDtype(dtype):
+    """Return the dtype used to sum values of the given dtype"""
+    if dtype.kind == "f":
+        return np.dtype("f8")
+    if dtype.kind == "u":
+        return np.dtype("u8")
+    return np.dtype("i8")
+
+
+def _toJson(value):
+    """Return numpy scalars and arrays as python values"""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
+
+def getPartialAggregate(arr, op, axis=None, bins=None, hist_range=None):
+    """
+    Reduce the numpy array arr for the given op, and return a list with a
+    dict for each field from getAggregateFields.  The dict has "count",
+    the number of values that aren't nan, along with "sum", "min", "max"
+    or "hist" as needed for op.  For an axis, the values are lists with
+    that dimension of arr removed.  The result can be sent as json.
+    """
+    if op not in AGGREGATE_OPS:
+        raise ValueError(f"unknown aggregate op: {op}")
+    if op == "histogram":
+        if axis is not None:
+            raise ValueError("axis can't be used with histogram")
+        if hist_range is None:
+            raise ValueError("histogram requires a range")
+    partials = []
+    for field in getAggregateFields(arr.dtype):
+        if field is None:
+            col = arr
+        else:
+            col = arr[field]
+        if col.dtype.kind == "f":
+            nans = np.isnan(col)
+            if axis is None:
+                count = col.size - np.count_nonzero(nans)
+            else:
+                count = col.shape[axis] - np.count_nonzero(nans, axis=axis)
+        else:
+            nans = None
+            if axis is None:
+                count = col.size
+            else:
+                count = np.full(col.shape[:axis] + col.shape[axis + 1:], col.shape[axis])
+        partial = {"count": _toJson(count)}
+        if op in ("sum", "mean"):
+            sum_dt = _getSumDtype(col.dtype)
+            if nans is None:
+                value = np.sum(col, axis=axis, dtype=sum_dt)
+            else:
+                value = np.nansum(col, axis=axis, dtype=sum_dt)
+            partial["sum"] = _toJson(value)
+        elif op in ("min", "max"):
+            if col.dtype.kind == "b":
+                col = col.astype("u1")
+            # fmin and fmax skip nans, and give nan if there's nothing else
+            ufunc = np.fmin if op == "min" else np.fmax
+            partial[op] = _toJson(ufunc.reduce(col, axis=axis))
+        elif op == "histogram":
+            if nans is not None:
+                col = col[~nans]
+            hist, _ = np.histogram(col, bins=bins or DEFAULT_BINS, range=hist_range)
+            partial["hist"] = hist.tolist()
+        partials.append(partial)
+    return partials
+
+
+class Aggregator:
+    """Combines the partial results from getPartialAggregate into the
+    result for a selection.  shape is the shape of the result for each
+    field, i.e. the selection shape with the axis dimension removed, or ()
+    if there's no axis."""
+
+    def __init__(self, dtype, op, shape=(), bins=None, hist_range=None):
+        if op not in AGGREGATE_OPS:
+            raise ValueError(f"unknown aggregate op: {op}")
+        self._op = op
+        self._fields = getAggregateFields(dtype)
+        self._shape = tuple(shape)
+        self._bins = bins or DEFAULT_BINS
+        self._hist_range = hist_range
+        self._counts = []
+        self._values = []
+        for field in self._fields:
+            field_dt = dtype if field is None else dtype[field]
+            self._counts.append(np.zeros(self._shape, dtype="i8"))
+            if op in ("sum", "mean"):
+                value = np.zeros(self._shape, dtype=_getSumDtype(field_dt))
+            elif op in ("min", "max"):
+                if field_dt.kind == "b":
+                    field_dt = np.dtype("u1")
+                value = np.zeros(self._shape, dtype=field_dt)
+            elif op == "histogram":
+                value = np.zeros((self._bins,), dtype="i8")
+            else:
+                value = None
+            self._values.append(value)
+
+    def add(self, partials, sel=()):
+        """Add the partials for one chunk, where sel is the part of the
+        result they are for"""
+        if len(partials) != len(self._fields):
+            raise ValueError("unexpected number of fields in aggregate partial")
+        for i, partial in enumerate(partials):
+            counts = self._counts[i]
+            count = np.asarray(partial["count"], dtype="i8")
+            value = self._values[i]
+            if self._op in ("sum", "mean"):
+                value[sel] += np.asarray(partial["sum"], dtype=value.dtype)
+            elif self._op in ("min", "max"):
+                # nan for floats with no values, so use count to
+                # tell if there's anything to compare with
+                chunk_value = np.asarray(partial[self._op], dtype=value.dtype)
+                prev_count = counts[sel]
+                prev_value = value[sel]
+                if self._op == "min":
+                    both = np.fmin(prev_value, chunk_value)
+                else:
+                    both = np.fmax(prev_value, chunk_value)
+                combined = np.where(prev_count > 0, both, chunk_value)
+                value[sel] = np.where(count > 0, combined, prev_value)
+            elif self._op == "histogram":
+                value += np.asarray(partial["hist"], dtype=value.dtype)
+            counts[sel] += count
+
+    def getValue(self):
+        """Return the result as json: a value, or a list for an axis, for
+        non-compound types, or a dict of field name to value otherwise.
+        Histograms are a dict with "hist" and "bin_edges"."""
+        results = []
+        for i in range(len(self._fields)):
+            counts = self._counts[i]
+            value = self._values[i]
+            if self._op == "count":
+                result = counts
+            elif self._op == "sum":
+                result = value
+            elif self._op == "mean":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    result = np.true_divide(value, counts)
+            elif self._op == "histogram":
+                bin_edges = np.histogram_bin_edges([], bins=self._bins, range=self._hist_range)
+                result = {"hist": value.tolist(), "bin_edges": bin_edges.tolist()}
+            else:
+                # min or max of no values is nan
+                if np.all(counts > 0):
+                    result = value
+                else:
+                    result = np.where(counts > 0, value.astype("f8"), np.nan)
+            results.append(_toJson(result))
+        if self._fields == [None, ]:
+            return results[0]
+        return dict(zip(self._fields, results))
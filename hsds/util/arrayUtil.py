@@ -13,9 +13,16 @@
 import math
 import base64
 import binascii
+import struct
 import numpy as np
 
 MAX_VLEN_ELEMENT = 1_000_000  # restrict largest vlen element to one million
+_VLEN_COUNT = struct.Struct("<i")  # byte count that precedes each vlen element
+# offset-indexed vlen format, the magic value is too large to be the byte
+# count of the first element in the length-prefixed format
+VLEN_INDEX_MAGIC = b"HSVX"
+VLEN_INDEX_VERSION = 1
+_VLEN_INDEX_HEADER = struct.Struct("<4sIQ")  # magic, version, element count
 
 
 def bytesArrayToList(data):
@@ -437,6 +444,274 @@ def readElement(buffer, offset, arr, index, dt):
     return offset
 
 
+def _getVlenBase(dt):
+    """
+    Return the vlen base type if dt is a simple vlen type (vlen str, vlen bytes,
+    or vlen of a fixed size non-compound type) that can use the vectorized
+    conversions.  Otherwise return None.
+    """
+    if len(dt) > 1 or not dt.metadata or "vlen" not in dt.metadata:
+        return None
+    vlen = dt.metadata["vlen"]
+    if vlen in (str, bytes):
+        return vlen
+    if not isinstance(vlen, np.dtype):
+        return None
+    if vlen.names or vlen.shape or vlen.kind not in "biufcS" or isVlen(vlen):
+        return None
+    return vlen
+
+
+def _getVlenParts(arr1d, vlen):
+    """
+    Return list with the bytes of each element of a 1d simple vlen array,
+    or None if an element is of a type the fast path doesn't handle.
+    """
+    parts = []
+    if vlen is str or vlen is bytes:
+        for e in arr1d:
+            if isinstance(e, str):
+                parts.append(e.encode("utf-8"))
+            elif isinstance(e, bytes):
+                parts.append(e)
+            elif isinstance(e, int) and e == 0:
+                parts.append(b"")  # non-initialized element
+            else:
+                return None
+    else:
+        for e in arr1d:
+            if isinstance(e, np.ndarray):
+                if e.dtype.kind == "O":
+                    return None
+                parts.append(e.tobytes())
+            elif isinstance(e, (list, tuple)):
+                parts.append(np.asarray(e, dtype=vlen).tobytes())
+            elif isinstance(e, int) and e == 0:
+                parts.append(b"")
+            else:
+                return None
+    return parts
+
+
+def _packVlen(arr1d, vlen):
+    """
+    Return the length-prefixed byte representation of a 1d simple vlen
+    array, or None if an element is of a type the fast path doesn't handle.
+    """
+    parts = _getVlenParts(arr1d, vlen)
+    if parts is None:
+        return None
+    nElements = len(parts)
+    counts = np.fromiter(map(len, parts), dtype="<i4", count=nElements)
+    if nElements and counts.max() > MAX_VLEN_ELEMENT:
+        raise ValueError("vlen element too large")
+    # each element is a four byte count followed by the element bytes
+    sizes = counts.astype(np.int64) + 4
+    starts = np.cumsum(sizes) - sizes
+    nSize = int(sizes.sum())
+    buffer = np.empty((nSize,), dtype=np.uint8)
+    count_index = starts[:, np.newaxis] + np.arange(4)
+    is_data = np.ones((nSize,), dtype=bool)
+    is_data[count_index] = False
+    buffer[count_index] = counts.view(np.uint8).reshape((nElements, 4))
+    buffer[is_data] = np.frombuffer(b"".join(parts), dtype=np.uint8)
+    return buffer.tobytes()
+
+
+def _unpackVlen(data, nelements, dt, vlen):
+    """
+    Return 1d array of nelements read from the length-prefixed buffer, or
+    None if the buffer doesn't hold exactly nelements.
+    """
+    # the element offsets depend on the preceding counts, so this has to
+    # be a sequential scan, but only the counts are read here
+    buffer = memoryview(data).cast("B")
+    nbytes = len(buffer)
+    unpack_count = _VLEN_COUNT.unpack_from
+    counts = [0] * nelements
+    offset = 0
+    try:
+        for index in range(nelements):
+            count = unpack_count(buffer, offset)[0]
+            counts[index] = count
+            offset += 4 + count
+    except struct.error:
+        return None  # ran off the end of the buffer
+    counts = np.array(counts, dtype=np.int64)
+    if nelements and counts.min() < 0:
+        count = int(counts.min())
+        raise ValueError(f"Unexpected count value for varlen element: {count}")
+    if nelements and counts.max() > MAX_VLEN_ELEMENT:
+        raise ValueError("varlen element size expected to be less than 1MB")
+    if offset > nbytes:
+        return None
+    starts = np.cumsum(counts + 4) - counts
+
+    arr = np.zeros((nelements,), dtype=dt)
+    nonempty = np.nonzero(counts)[0]
+    if len(nonempty) == 0:
+        return arr
+    if vlen in (str, bytes):
+        if not isinstance(data, bytes):
+            data = buffer.tobytes()
+        ranges = zip(starts[nonempty].tolist(), (starts + counts)[nonempty].tolist())
+        if vlen is str:
+            values = [data[n:m].decode("utf-8") for n, m in ranges]
+        else:
+            values = [data[n:m] for n, m in ranges]
+        arr[nonempty] = values
+        return arr
+    bad = np.nonzero(counts % vlen.itemsize)[0]
+    if len(bad) > 0:
+        s = int(starts[bad[0]])
+        e_buffer = bytes(buffer[s:s + int(counts[bad[0]])])
+        msg = f"Failed to parse vlen data: {e_buffer} with dtype: {vlen}"
+        raise ValueError(msg)
+    # gather all the element data into one array and split it up
+    is_data = np.ones((offset,), dtype=bool)
+    is_data[(starts - 4)[:, np.newaxis] + np.arange(4)] = False
+    packed = np.frombuffer(buffer, dtype=np.uint8)[:offset][is_data].view(vlen)
+    splits = np.cumsum(counts[nonempty] // vlen.itemsize)[:-1]
+    values = np.split(packed, splits)
+    for index, value in zip(nonempty.tolist(), values):
+        arr[index] = value
+    return arr
+
+
+def isIndexedVlen(data):
+    """
+    Return True if data holds vlen elements in the offset-indexed format
+    """
+    if len(data) < _VLEN_INDEX_HEADER.size:
+        return False
+    return bytes(data[:4]) == VLEN_INDEX_MAGIC
+
+
+def arrayToIndexedBytes(arr):
+    """
+    Return offset-indexed byte representation of a vlen numpy array.
+
+    The layout is a header (magic, version, and element count), a table of
+    element count + 1 little-endian uint64 offsets, and a data region with the
+    element bytes packed end to end.  Element i is
+    data[offsets[i]:offsets[i + 1]], so elements can be read without scanning
+    the ones before them.  Types the format doesn't cover (e.g. compound
+    types with vlen fields) are returned in the length-prefixed format,
+    which bytesToArray reads as well.
+    """
+    vlen = _getVlenBase(arr.dtype)
+    parts = None
+    nElements = math.prod(arr.shape)
+    if vlen is not None:
+        parts = _getVlenParts(arr.reshape((nElements,)), vlen)
+    if parts is None:
+        return arrayToBytes(arr)
+    lengths = np.fromiter(map(len, parts), dtype=np.int64, count=nElements)
+    if nElements and lengths.max() > MAX_VLEN_ELEMENT:
+        raise ValueError("vlen element too large")
+    offsets = np.zeros((nElements + 1,), dtype="<u8")
+    offsets[1:] = np.cumsum(lengths)
+    header = _VLEN_INDEX_HEADER.pack(VLEN_INDEX_MAGIC, VLEN_INDEX_VERSION, nElements)
+    parts.insert(0, offsets.tobytes())
+    parts.insert(0, header)
+    return b"".join(parts)
+
+
+def _getVlenIndex(buffer):
+    """
+    Return start of the data region and the offsets table for the given
+    offset-indexed buffer
+    """
+    header_size = _VLEN_INDEX_HEADER.size
+    if len(buffer) < header_size:
+        raise ValueError("buffer too small for vlen index header")
+    magic, version, count = _VLEN_INDEX_HEADER.unpack_from(buffer, 0)
+    if magic != VLEN_INDEX_MAGIC:
+        raise ValueError("buffer is not in the offset-indexed vlen format")
+    if version != VLEN_INDEX_VERSION:
+        raise ValueError(f"unsupported vlen index version: {version}")
+    data_start = header_size + (count + 1) * 8
+    if len(buffer) < data_start:
+        raise ValueError("vlen index table is truncated")
+    offsets = np.frombuffer(buffer, dtype="<u8", count=count + 1, offset=header_size)
+    offsets = offsets.astype(np.int64)
+    if offsets[0] != 0 or np.any(offsets[1:] < offsets[:-1]):
+        raise ValueError("invalid vlen index table")
+    if offsets[-1] > len(buffer) - data_start:
+        raise ValueError("vlen data region is truncated")
+    return data_start, offsets
+
+
+def indexedBytesToArray(data, dt, shape, select=None):
+    """
+    Create numpy array from offset-indexed vlen bytes.
+
+    If select is given (a tuple of slices or index arrays with respect to
+    shape), only the selected elements are decoded and an array with the
+    selection shape is returned.  If data is writable (e.g. a bytearray or
+    a writable memory map) numeric elements are views of the data region,
+    otherwise the data region is copied once.
+    """
+    vlen = _getVlenBase(dt)
+    if vlen is None:
+        raise TypeError(f"offset-indexed format is not supported for type: {dt}")
+    buffer = memoryview(data).cast("B")
+    data_start, offsets = _getVlenIndex(buffer)
+    nelements = len(offsets) - 1
+    if shape is None:
+        shape = (nelements,)
+    if getNumElements(shape) != nelements:
+        msg = f"vlen index has {nelements} elements, but shape {shape} was given"
+        raise ValueError(msg)
+    starts = offsets[:-1]
+    ends = offsets[1:]
+    if select is None:
+        out_shape = shape
+    else:
+        index = np.arange(nelements).reshape(shape)[tuple(select)]
+        out_shape = index.shape
+        index = index.reshape((index.size,))
+        starts = starts[index]
+        ends = ends[index]
+    lengths = ends - starts
+    nonempty = np.nonzero(lengths)[0]
+    arr = np.zeros((len(starts),), dtype=dt)
+    region = buffer[data_start:]
+
+    if vlen is str or vlen is bytes:
+        if select is None:
+            region = region.tobytes()  # cheaper to slice bytes than a memoryview
+        ranges = zip(starts[nonempty].tolist(), ends[nonempty].tolist())
+        if vlen is str:
+            values = [str(region[n:m], "utf-8") for n, m in ranges]
+        else:
+            values = [bytes(region[n:m]) for n, m in ranges]
+        if values:
+            arr[nonempty] = values
+    else:
+        itemsize = vlen.itemsize
+        bad = np.nonzero(lengths % itemsize)[0]
+        if len(bad) > 0:
+            msg = f"Failed to parse vlen data of {int(lengths[bad[0]])} bytes "
+            msg += f"with dtype: {vlen}"
+            raise ValueError(msg)
+        if select is None:
+            packed = np.frombuffer(region, dtype=vlen, count=int(offsets[-1]) // itemsize)
+            if buffer.readonly:
+                packed = packed.copy()
+            values = np.split(packed, offsets[1:-1] // itemsize)
+            for index in nonempty.tolist():
+                arr[index] = values[index]
+        else:
+            for index in nonempty.tolist():
+                count = int(lengths[index]) // itemsize
+                e = np.frombuffer(region, dtype=vlen, count=count, offset=int(starts[index]))
+                if buffer.readonly:
+                    e = e.copy()
+                arr[index] = e
+    return arr.reshape(out_shape)
+
+
 def encodeData(data, encoding="base64"):
     """ Encode given data """
     if encoding != "base64":
@@ -474,15 +749,20 @@ def arrayToBytes(arr, encoding=None):
     Return byte representation of numpy array
     """
     if isVlen(arr.dtype):
-        nSize = getByteArraySize(arr)
-        buffer = bytearray(nSize)
-        offset = 0
         nElements = math.prod(arr.shape)
         arr1d = arr.reshape((nElements,))
-        for e in arr1d:
-            # print("arrayToBytes:", e)
-            offset = copyElement(e, arr1d.dtype, buffer, offset)
-        data = bytes(buffer)
+        data = None
+        vlen = _getVlenBase(arr.dtype)
+        if vlen is not None:
+            data = _packVlen(arr1d, vlen)
+        if data is None:
+            nSize = getByteArraySize(arr)
+            buffer = bytearray(nSize)
+            offset = 0
+            for e in arr1d:
+                # print("arrayToBytes:", e)
+                offset = copyElement(e, arr1d.dtype, buffer, offset)
+            data = bytes(buffer)
     else:
         # fixed length type
         data = arr.tobytes()
@@ -505,11 +785,17 @@ def bytesToArray(data, dt, shape, encoding=None):
         arr = np.frombuffer(data, dtype=dt)
     else:
         nelements = getNumElements(shape)
-
-        arr = np.zeros((nelements,), dtype=dt)
-        offset = 0
-        for index in range(nelements):
-            offset = readElement(data, offset, arr, index, dt)
+        arr = None
+        vlen = _getVlenBase(dt)
+        if vlen is not None and isIndexedVlen(data):
+            arr = indexedBytesToArray(data, dt, shape)
+        elif vlen is not None:
+            arr = _unpackVlen(data, nelements, dt, vlen)
+        if arr is None:
+            arr = np.zeros((nelements,), dtype=dt)
+            offset = 0
+            for index in range(nelements):
+                offset = readElement(data, offset, arr, index, dt)
     if shape is not None:
         arr = arr.reshape(shape)
     # check that we can update the array if needed
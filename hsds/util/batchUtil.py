@@ -0,0 +1,94 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# batchUtil.py:
+#
+# Framing for batched chunk requests between SN and DN nodes
+#
+import asyncio
+import json
+import struct
+
+# each frame is: header length, data length, json header, data
+FRAME_PREFIX = struct.Struct("<IQ")
+MAX_FRAME_HEADER = 64 * 1024  # headers are just ids and selections
+
+
+def encodeFrame(header, data=b""):
+    """Return bytes for a frame with the given header dict and data bytes"""
+    header_bytes = json.dumps(header).encode("utf-8")
+    prefix = FRAME_PREFIX.pack(len(header_bytes), len(data))
+    return b"".join((prefix, header_bytes, data))
+
+
+def encodeFrames(items):
+    """Return bytes for a sequence of (header, data) items"""
+    parts = []
+    for header, data in items:
+        header_bytes = json.dumps(header).encode("utf-8")
+        parts.append(FRAME_PREFIX.pack(len(header_bytes), len(data)))
+        parts.append(header_bytes)
+        parts.append(data)
+    return b"".join(parts)
+
+
+def _decodeHeader(header_bytes):
+    try:
+        header = json.loads(header_bytes)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"unable to decode frame header: {e}")
+    if not isinstance(header, dict):
+        raise ValueError("expected frame header to be a dict")
+    return header
+
+
+def decodeFrames(buffer):
+    """Generator of (header, data) items from the given bytes.  data is a
+    memoryview into buffer.  Raises ValueError if buffer is not a sequence
+    of whole frames."""
+    buffer = memoryview(buffer).cast("B")
+    offset = 0
+    while offset < len(buffer):
+        if offset + FRAME_PREFIX.size > len(buffer):
+            raise ValueError("truncated frame prefix")
+        header_len, data_len = FRAME_PREFIX.unpack_from(buffer, offset)
+        if header_len > MAX_FRAME_HEADER:
+            raise ValueError(f"frame header of {header_len} bytes is too large")
+        offset += FRAME_PREFIX.size
+        if offset + header_len + data_len > len(buffer):
+            raise ValueError("truncated frame")
+        header = _decodeHeader(bytes(buffer[offset:offset + header_len]))
+        offset += header_len
+        data = buffer[offset:offset + data_len]
+        offset += data_len
+        yield header, data
+
+
+async def readFrame(stream):
+    """Read the next frame from an aiohttp StreamReader.  Returns a
+    (header, data) tuple, or None at the end of the stream.  Raises
+    ValueError if the stream ends partway through a frame."""
+    try:
+        prefix = await stream.readexactly(FRAME_PREFIX.size)
+    except asyncio.IncompleteReadError as ire:
+        if ire.partial:
+            raise ValueError("truncated frame prefix")
+        return None
+    header_len, data_len = FRAME_PREFIX.unpack(prefix)
+    if header_len > MAX_FRAME_HEADER:
+        raise ValueError(f"frame header of {header_len} bytes is too large")
+    try:
+        header = _decodeHeader(await stream.readexactly(header_len))
+        data = await stream.readexactly(data_len) if data_len else b""
+    except asyncio.IncompleteReadError:
+        raise ValueError("truncated frame")
+    return header, data
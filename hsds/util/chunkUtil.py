@@ -1,6 +1,10 @@
+import itertools
+import sys
 import numpy as np
 from .. import hsds_logger as log
 from .arrayUtil import ndarray_compare
+from .idUtil import ChunkId
+from .queryUtil import getQueryPlan
 
 CHUNK_BASE = 16 * 1024  # Multiplier by which chunks are adjusted
 CHUNK_MIN = 512 * 1024  # Soft lower limit (512k)
@@ -359,8 +363,48 @@ def getChunkId(dset_id, point, layout):
     return chunk_id
 
 
+def getPointChunks(dset_id, points, layout):
+    """Group the given points by chunk.
+    points: ndarray of shape (num_points, rank), or (num_points,) for 1d datasets
+    Returns a dict of chunk_id to an ndarray of the indices of the points that
+    fall in that chunk.  Chunk ids are ordered by chunk coordinate and the indices
+    for each chunk are in increasing order.
+    """
+    rank = len(layout)
+    coords = np.asarray(points, dtype=np.uint64).reshape((-1, rank))
+    num_points = coords.shape[0]
+    point_chunks = {}
+    if num_points == 0:
+        return point_chunks
+
+    chunk_coords = coords // np.array(layout, dtype=np.uint64)
+    grid = chunk_coords.max(axis=0).astype(np.int64) + 1
+    if np.prod(grid.astype(float)) < 2**62:
+        # flatten to one integer per chunk - much faster to sort than rows
+        keys = np.ravel_multi_index(tuple(chunk_coords.astype(np.int64).T), tuple(grid))
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        chunk_indices = np.stack(np.unravel_index(unique_keys, tuple(grid)), axis=1)
+    else:
+        chunk_indices, inverse = np.unique(chunk_coords, axis=0, return_inverse=True)
+    inverse = inverse.reshape((num_points,))
+    # stable sort keeps the point order within each chunk
+    order = np.argsort(inverse, kind="stable")
+    counts = np.bincount(inverse, minlength=len(chunk_indices))
+    splits = np.split(order, np.cumsum(counts)[:-1])
+
+    prefix = "c-" + dset_id[2:] + "_"
+    dset_id = sys.intern(dset_id)
+    for chunk_index, point_index in zip(chunk_indices.tolist(), splits):
+        chunk_id = prefix + "_".join(map(str, chunk_index))
+        chunk_id = ChunkId(chunk_id, dset_id=dset_id, index=tuple(chunk_index))
+        point_chunks[chunk_id] = point_index
+    return point_chunks
+
+
 def getDatasetId(chunk_id):
     """Get dataset id given a chunk id"""
+    if isinstance(chunk_id, ChunkId):
+        return chunk_id.dsetId
     n = chunk_id.find("-") + 1
     if n <= 0:
         raise ValueError("Unexpected chunk id")
@@ -374,6 +418,8 @@ def getChunkIndex(chunk_id):
     """given a chunk_id (e.g.: c-12345678-1234-1234-1234-1234567890ab_6_4)
     return the coordinates of the chunk. In this case (6,4)
     """
+    if isinstance(chunk_id, ChunkId):
+        return list(chunk_id.chunkIndex)
     # go to the first underscore
     n = chunk_id.find("_") + 1
     if n == 0:
@@ -421,9 +467,10 @@ def getPartitionKey(chunk_id, partition_count):
         partition_index += chunk_index[dim] * prime_factor
 
     partition_index %= partition_count
+    dset_id = getDatasetId(chunk_id)
     n = chunk_id.find("-")  # get the part after the first hyphen
     s = chunk_id[n:]
-    chunk_id = "c" + str(partition_index) + s
+    chunk_id = ChunkId("c" + str(partition_index) + s, dset_id=dset_id, index=tuple(chunk_index))
     return chunk_id
 
 
@@ -443,38 +490,33 @@ def getChunkIdForPartition(chunk_id, dset_json):
     return chunk_id
 
 
-def getChunkIds(dset_id, selection, layout, prefix=None):
-    """Get the all the chunk ids for chunks that lie in the
-    selection of the given dataset.
+def _getSliceChunkIndices(s, c):
+    """Return ndarray of the chunk indices the slice s intersects
+    along a dimension with chunk extent c
     """
+    step = s.step
+    if step is None:
+        step = 1
+    if step > c:
+        # chunks may not be contiguous, skip along the selection and add
+        # whatever chunks we land in
+        return np.unique(np.arange(s.start, s.stop, step, dtype=np.int64) // c)
+    # get a contiguous set of chunks along the selection
+    if step > 1:
+        num_points = frac((s.stop - s.start), step)
+        w = num_points * step - (step - 1)
+    else:
+        w = s.stop - s.start  # selection width (>0)
+    return np.arange(s.start // c, frac((s.start + w), c), dtype=np.int64)
 
-    def chunk_index_to_id(indices):
-        """ Convert chunk index list to string with '_' as seperator.
-            None values will be replaced with '*' """
-        items = []
-        for x in indices:
-            if x is None:
-                items.append("*")
-            else:
-                items.append(str(x))
-        return "_".join(items)
-
-    def chunk_id_to_index(chunk_id):
-        """ convert chunk_id to list of indices.
-        Any '*' values will be replaced with None """
-        indices = []
-        items = chunk_id.split("_")
-        for item in items:
-            if item == "*":
-                x = None
-            else:
-                x = int(item)
-            indices.append(x)
-        return indices
 
+def iterChunkIds(dset_id, selection, layout, prefix=None):
+    """Generator version of getChunkIds.  Chunk ids are created as they
+    are consumed so callers don't need to hold the entire list in memory.
+    """
     num_chunks = getNumChunks(selection, layout)
     if num_chunks == 0:
-        return []  # empty list
+        return
     if prefix is None:
         # construct a prefix using "c-" with the uuid of the dset_id
         if not dset_id.startswith("d-"):
@@ -482,91 +524,62 @@ def getChunkIds(dset_id, selection, layout, prefix=None):
             log.warning(msg)
             raise ValueError(msg)
         prefix = "c-" + dset_id[2:] + "_"
+        dset_id = sys.intern(dset_id)
+    else:
+        dset_id = None  # work it out from the chunk id if needed
     rank = len(selection)
 
-    # initialize chunk_ids based on coordinate index, if any
-    num_coordinates = None
-    chunk_items = set()
-    for s in selection:
-        if isinstance(s, slice):
-            continue
-        elif num_coordinates is None:
-            num_coordinates = len(s)
+    coord_dims = []
+    slice_dims = []
+    for dim in range(rank):
+        if isinstance(selection[dim], slice):
+            slice_dims.append(dim)
         else:
+            coord_dims.append(dim)
+
+    # distinct chunk indices for any coordinate selections
+    if coord_dims:
+        num_coordinates = len(selection[coord_dims[0]])
+        coord_indices = []
+        for dim in coord_dims:
+            s = selection[dim]
             if len(s) != num_coordinates:
                 raise ValueError("coordinate length mismatch")
-
-    if num_coordinates is None:
+            coord_indices.append(np.asarray(s, dtype=np.int64) // layout[dim])
+        coord_chunks = np.unique(np.stack(coord_indices, axis=1), axis=0)
+    else:
         # no coordinates, all slices
-        num_coordinates = 1  # this will iniialize the list with one wildcard chunk index
+        coord_chunks = np.zeros((1, 0), dtype=np.int64)
+
+    # chunk indices along each sliced dimension
+    slice_chunks = []
+    for dim in slice_dims:
+        slice_chunks.append(_getSliceChunkIndices(selection[dim], layout[dim]))
+
+    # chunk ids are the product of the coordinate chunks and the slice chunks,
+    # in row-major order.  Each index gets converted to a string just once
+    # and itertools.product generates the combinations lazily
+    slice_strs = [[str(x) for x in arr.tolist()] for arr in slice_chunks]
+    if not coord_dims:
+        for chunk_index in itertools.product(*slice_strs):
+            yield ChunkId(prefix + "_".join(chunk_index), dset_id=dset_id)
+        return
+
+    coord_strs = [tuple(map(str, x)) for x in coord_chunks.tolist()]
+    parts = [None, ] * rank
+    for chunk_index in itertools.product(coord_strs, *slice_strs):
+        for dim, x in zip(coord_dims, chunk_index[0]):
+            parts[dim] = x
+        for dim, x in zip(slice_dims, chunk_index[1:]):
+            parts[dim] = x
+        yield ChunkId(prefix + "_".join(parts), dset_id=dset_id)
 
-    for i in range(num_coordinates):
-        chunk_idx = []
-        for dim in range(rank):
-            s = selection[dim]
-            c = layout[dim]
-            if isinstance(s, slice):
-                chunk_index = None
-            else:
-                chunk_index = s[i] // c
-            chunk_idx.append(chunk_index)
-        chunk_id = chunk_index_to_id(chunk_idx)
-        chunk_items.add(chunk_id)
-    chunk_ids = list(chunk_items)  # convert to a list, remove any dups
-    # convert str ids back to indices
-    chunk_items = []
-    for chunk_id in chunk_ids:
-        chunk_index = chunk_id_to_index(chunk_id)
-        chunk_items.append(chunk_index)
-
-    # log.debug(f"getChunkIds - selection: {selection}")
-    for dim in range(rank):
-        s = selection[dim]
-        c = layout[dim]
 
-        if not isinstance(s, slice):
-            continue  # chunk indices for coordinate list already factored in
-
-        # log.debug(f"getChunkIds - layout: {layout}")
-        if s.step is None:
-            s = slice(s.start, s.stop, 1)
-
-        chunk_indices = []
-        if s.step > c:
-            # chunks may not be contiguous, skip along the selection and add
-            # whatever chunks we land in
-            for i in range(s.start, s.stop, s.step):
-                chunk_index = i // c
-                chunk_indices.append(chunk_index)
-        else:
-            # get a contiguous set of chunks along the selection
-            if s.step > 1:
-                num_points = frac((s.stop - s.start), s.step)
-                w = num_points * s.step - (s.step - 1)
-            else:
-                w = s.stop - s.start  # selection width (>0)
-
-            chunk_index_start = s.start // c
-            chunk_index_end = frac((s.start + w), c)
-            chunk_indices = list(range(chunk_index_start, chunk_index_end))
-
-        # append the set of chunk_indices to our set of chunk_ids
-        chunk_items_next = []
-        for chunk_idx in chunk_items:
-            for chunk_index in chunk_indices:
-                chunk_idx_next = chunk_idx.copy()
-                chunk_idx_next[dim] = chunk_index
-                chunk_items_next.append(chunk_idx_next)
-        chunk_items = chunk_items_next
-
-    # convert chunk indices to chunk ids
-    chunk_ids = []
-    for chunk_idx in chunk_items:
-        chunk_id = prefix + chunk_index_to_id(chunk_idx)
-        chunk_ids.append(chunk_id)
-
-    # got the complete list, return it!
-    return chunk_ids
+def getChunkIds(dset_id, selection, layout, prefix=None):
+    """Get the all the chunk ids for chunks that lie in the
+    selection of the given dataset.
+    """
+    return list(iterChunkIds(dset_id, selection, layout, prefix=prefix))
 
 
 def getChunkSuffix(chunk_id):
@@ -1027,24 +1040,27 @@ def chunkReadPoints(chunk_id=None,
 
     log.debug(f"got {num_points} points")
 
-    output_arr = np.zeros((num_points,), dtype=select_dt)
-
     chunk_coord = getChunkCoordinate(chunk_id, chunk_layout)
 
-    for i in range(num_points):
-        # TBD: there's likely a better way to do this that
-        # doesn't require iterating through each point...
-        point = point_arr[i, :]
-        tr_point = getChunkRelativePoint(chunk_coord, point)
-        val = chunk_arr[tuple(tr_point)]
-        if len(select_dt) < len(dset_dtype):
-            # just update the relevant fields
-            subfield_val = []
-            for (x, field) in zip(val, dset_dtype.names):
-                if field in select_dt.names:
-                    subfield_val.append(x)
-            val = tuple(subfield_val)
-        output_arr[i] = val
+    # convert all the points to chunk relative coordinates in one go
+    tr_points = point_arr.astype(np.int64) - np.array(chunk_coord, dtype=np.int64)
+    if np.any(tr_points < 0):
+        msg = "unexpected point index"
+        raise IndexError(msg)
+
+    # gather the values - raises IndexError for points past the chunk extent
+    vals = chunk_arr[tuple(tr_points.T)]
+
+    if select_dt == dset_dtype:
+        return vals
+
+    output_arr = np.zeros((num_points,), dtype=select_dt)
+    if len(select_dt) < len(dset_dtype):
+        # just copy the relevant fields
+        for field in select_dt.names:
+            output_arr[field] = vals[field]
+    else:
+        output_arr[...] = vals
     return output_arr
 
 
@@ -1098,246 +1114,27 @@ def chunkWritePoints(chunk_id=None,
             msg = "unexpected dtype for point array"
             raise ValueError(msg)
 
-    num_points = len(point_arr)
-
     chunk_coord = getChunkCoordinate(chunk_id, chunk_layout)
 
-    for i in range(num_points):
-        elem = point_arr[i]
-        log.debug(f"non-relative coordinate: {elem}")
-        if rank == 1:
-            coord = int(elem[0])
-            coord = coord - chunk_coord[0]  # adjust to chunk relative
-            if coord < 0 or coord >= dims[0]:
-                msg = f"chunkWritePoints - invalid index: {int(elem[0])}"
-                log.warn(msg)
-                raise IndexError(msg)
-        else:
-            coord = elem[0]  # index to update
-            for dim in range(rank):
-                # adjust to chunk relative
-                coord[dim] = int(coord[dim]) - chunk_coord[dim]
-            coord = tuple(coord)  # need to convert to a tuple
-        log.debug(f"relative coordinate: {coord}")
-
-        val = elem[1]  # value
-        if len(select_dt) < len(dset_dtype):
-            # get the element from the chunk
-            chunk_val = list(chunk_arr[coord])
-            # and just update the relevant fields
-            index = 0
-            for (x, field) in zip(val, dset_dtype.names):
-                if field in select_dt.names:
-                    chunk_val[index] = x
-                index += 1
-            val = tuple(chunk_val)  # this will get written back
-
-        chunk_arr[coord] = val  # update the point
-
-
-def _getWhereFieldName(query):
-    """
-    Get the field name for a where clause.
-    Returns None if no where statement
-    """
-    if query.startswith("where "):
-        i = len("where ")
+    # convert the coordinates to chunk relative in one go
+    coord_field, value_field = comp_dtype.names
+    coords = point_arr[coord_field].astype(np.int64)
+    if rank == 1:
+        coords = coords.reshape((-1, 1))
+    coords -= np.array(chunk_coord, dtype=np.int64)
+    if np.any(coords < 0) or np.any(coords >= np.array(dims, dtype=np.int64)):
+        msg = "chunkWritePoints - invalid index"
+        log.warn(msg)
+        raise IndexError(msg)
+    index = tuple(coords.T)
+    vals = point_arr[value_field]
+
+    if len(select_dt) < len(dset_dtype):
+        # just update the relevant fields
+        for field in select_dt.names:
+            chunk_arr[field][index] = vals[field]
     else:
-        i = query.find(" where ")
-        if i > 0:
-            i += len(" where ")
-    if i < 0:
-        # no where statement
-        return None
-
-    field_name = ""
-    end_quote_char = None
-    while i < len(query):
-        ch = query[i]
-        i += 1
-        if end_quote_char and ch == end_quote_char:
-            # end of variable
-            end_quote_char = None
-            break
-        elif ch in ("'", '"'):
-            end_quote_char = ch
-            continue
-        if field_name and not ch.isalnum() and not ch == "_" and not end_quote_char:
-            # end of variable
-            break
-        if end_quote_char or ch.isalnum() or ch == "_":
-            field_name += ch
-    if not field_name:
-        # got a where keyword, but no field name
-        raise ValueError("query where with no fieldname")
-    if end_quote_char:
-        raise ValueError("unclosed quote")
-
-    return field_name
-
-
-def _getWhereElements(query):
-    """
-    Get the values from a where clause
-    """
-
-    n = query.find(" in ")
-    if n < 0:
-        raise ValueError("where query with no 'in' keyword")
-    n += 4  # advance past " in "
-    elements = []
-    i = query[n:].find("(")
-    if i < 0:
-        raise ValueError("where in query with no '(' character)")
-    i += n + 1  # advance past '('
-
-    end_quote_char = None
-    s = None
-
-    while i < len(query):
-        ch = query[i]
-        i += 1
-        if end_quote_char and ch == end_quote_char:
-            # end of variable
-            end_quote_char = None
-            if s is None:
-                s = ""
-            elements.append(s)
-            s = None
-            continue
-        if ch in ("'", '"'):
-            end_quote_char = ch
-            if s == "b":
-                # use bytes not str
-                s = b''
-            else:
-                s = ""
-            continue
-        if ch == ",":
-            if s is not None:
-                elements.append(s)
-                s = None
-            continue
-        if ch == ")":
-            if end_quote_char:
-                raise ValueError("unclosed quote in 'where in' list")
-            if s is not None:
-                elements.append(s)
-            break
-        if ch.isspace():
-            if end_quote_char:
-                if isinstance(s, bytes):
-                    ch = ch.encode('utf8')
-                s += ch
-            continue
-        # anything else, just add to our variable
-        if isinstance(s, bytes):
-            ch = ch.encode('utf8')
-        if s is None:
-            s = ch
-        else:
-            s += ch
-
-    if end_quote_char:
-        raise ValueError("unclosed quote")
-
-    return elements
-
-
-def _getEvalStr(query, arr_name, field_names):
-    """
-    _getEvalStr: Get eval string for given query
-    Gets Eval string to use with numpy where method.
-    """
-    i = 0
-    eval_str = ""
-    var_name = None
-    end_quote_char = None
-    var_count = 0
-    paren_count = 0
-    black_list = ("import",)  # field names that are not allowed
-    for item in black_list:
-        if item in field_names:
-            msg = "invalid field name"
-            log.warn(f"Bad query: {msg}")
-            raise ValueError(msg)
-
-    if query.startswith("where "):
-        # no eval, return None
-        return None
-    # strip off any where clause after the query
-    n = query.find(" where ")
-
-    where_field = None
-    if n > 0:
-        where_field = _getWhereFieldName(query)
-        log.debug(f"where field: [{where_field}]")
-        log.debug(f"query orig: {query}")
-        query = query[:n]
-        log.debug(f"query adjusted: {query}")
-
-    while i < len(query):
-        ch = query[i]
-        if (i + 1) < len(query):
-            ch_next = query[i + 1]
-        else:
-            ch_next = None
-        if var_name and not ch.isalnum() and not ch == "_":
-            # end of variable
-            if var_name not in field_names:
-                # invalid
-                msg = f"query variable: {var_name}"
-                log.warn("Bad query: " + msg)
-                raise ValueError(msg)
-            eval_str += arr_name + "['" + var_name + "']"
-            var_name = None
-            var_count += 1
-
-        if end_quote_char:
-            if ch == end_quote_char:
-                # end of literal
-                end_quote_char = None
-            eval_str += ch
-        elif ch in ("'", '"'):
-            end_quote_char = ch
-            eval_str += ch
-        elif ch.isalnum() or ch == "_":
-            if ch == "b" and ch_next in ("'", '"'):
-                eval_str += "b"  # start of a byte string literal
-            elif var_name is None:
-                if ch.isalpha():
-                    var_name = ch  # start of a variable
-                else:
-                    eval_str += ch  # assume a numeric value
-            else:
-                var_name += ch
-        elif ch == "(" and end_quote_char is None:
-            paren_count += 1
-            eval_str += ch
-        elif ch == ")" and end_quote_char is None:
-            paren_count -= 1
-            if paren_count < 0:
-                msg = "Mismatched paren"
-                log.warn("Bad query: " + msg)
-                raise ValueError(msg)
-            eval_str += ch
-        else:
-            # just add to eval_str
-            eval_str += ch
-        i = i + 1
-    if end_quote_char:
-        msg = "no matching quote character"
-        log.warn("Bad Query: " + msg)
-        raise ValueError(msg)
-    if var_count == 0:
-        msg = "No field value"
-        log.warn("Bad query: " + msg)
-        raise ValueError(msg)
-    if paren_count != 0:
-        msg = "Mismatched paren"
-        log.warn("Bad query: " + msg)
-        raise ValueError(msg)
-    return eval_str
+        chunk_arr[index] = vals  # update the points
 
 
 def getQueryDtype(dt):
@@ -1406,59 +1203,11 @@ def chunkQuery(
     # do query selection
     field_names = dset_dt.names
 
-    # get the eval str
-    eval_str = _getEvalStr(query, "chunk_sel", field_names)
-    if eval_str:
-        log.debug(f"eval_str: {eval_str}")
-    else:
-        log.debug("no eval_str")
-
-    # check for a where in statement
-    where_field = _getWhereFieldName(query)
-    if where_field:
-        log.debug(f"where_field: {where_field}")
-        if where_field not in field_names:
-            msg = f"where field {where_field} is not a member of dataset type"
-            raise ValueError(msg)
-        where_elements = _getWhereElements(query)
-        if not where_elements:
-            msg = "query: where key word with no elements"
-            raise ValueError(msg)
-        # convert to ndarray, checking that we can convert to our dtype along the way
-        try:
-            where_elements_arr = np.array(where_elements, dtype=dset_dt[where_field])
-        except ValueError:
-            msg = "where elements are not compatible with field datatype"
-            raise ValueError(msg)
-        isin_mask = np.isin(chunk_sel[where_field], where_elements_arr)
-
-        if not np.any(isin_mask):
-            # all false
-            log.debug("query - no rows found for where elements")
-            return None
-
-        isin_indices = np.where(isin_mask)
-        if not isinstance(isin_indices, tuple):
-            log.warn(f"expected where_indices of tuple but got: {type(isin_indices)}")
-            return None
-        if len(isin_indices) == 0:
-            log.warn("chunkQuery - got empty tuple where in result")
-            return None
-
-        isin_indices = isin_indices[0]
-        if not isinstance(isin_indices, np.ndarray):
-            log.warn(f"expected isin_indices of ndarray but got: {type(isin_indices)}")
-            return None
-        nrows = isin_indices.shape[0]
-    elif eval_str:
-        log.debug("no where keyword")
-        isin_indices = None
-    else:
-        log.warn("query  - no eval and no where in, returning None")
-        return None
+    # get the compiled query
+    plan = getQueryPlan(query, dset_dt)
 
     if query_update:
-        if where_field:
+        if plan.where_field:
             msg = "query update is not supported with where in"
             raise ValueError(msg)
         replace_mask = [None,] * len(field_names)
@@ -1474,42 +1223,12 @@ def chunkQuery(
     else:
         replace_mask = None
 
-    if eval_str:
-        where_indices = np.where(eval(eval_str))
-        if not isinstance(where_indices, tuple):
-            log.warn(f"expected where_indices of tuple but got: {type(where_indices)}")
-            return None
-        if len(where_indices) == 0:
-            log.warn("chunkQuery - got empty tuple where result")
-            return None
-
-        where_indices = where_indices[0]
-        if not isinstance(where_indices, np.ndarray):
-            log.warn(f"expected where_indices of ndarray but got: {type(where_indices)}")
-            return None
-        nrows = where_indices.shape[0]
-        log.debug(f"chunkQuery - {nrows} where rows found")
-    else:
-        where_indices = None
-
-    if isin_indices is None:
-        pass  # skip intersection
-    else:
-        if where_indices is None:
-            # just use the isin_indices
-            where_indices = isin_indices
-        else:
-            # interest the two sets of indices
-            intersect = np.intersect1d(where_indices, isin_indices)
-
-            nrows = intersect.shape[0]
-            if nrows == 0:
-                log.debug("chunkQuery - no rows found after intersect with is in")
-                return None
-            else:
-                log.debug(f"chunkQuery - intersection, {nrows} found")
-            # use the intsection as our new where index
-            where_indices = intersect
+    where_indices = plan.getIndices(chunk_sel)
+    nrows = where_indices.shape[0]
+    log.debug(f"chunkQuery - {nrows} where rows found")
+    if nrows == 0 and plan.where_field:
+        log.debug("query - no rows found for where elements")
+        return None
 
     if limit > 0 and nrows > limit:
         # truncate to limit rows
@@ -1526,10 +1245,7 @@ def chunkQuery(
             if replace_mask[i] is not None:
                 where_result[field] = replace_mask[i]
         # update source array
-        for i in range(nrows):
-            index = where_indices[i]
-            row = where_result[i]
-            chunk_arr[index] = row
+        chunk_arr[where_indices] = where_result
 
     # adjust the index to correspond with the dataset
     s = slices[0]
@@ -0,0 +1,283 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# dnConcurrency.py:
+#
+# Adaptive limits on the number of SN requests in flight to each DN, and a
+# work queue that hands out items for DNs that have room for more requests
+#
+import asyncio
+import math
+from collections import deque
+
+from .. import hsds_logger as log
+
+
+class DnConcurrency(object):
+    """Gradient control of the number of requests in flight to one DN.
+
+    Each completed request updates a short term and a long term moving
+    average of the latency.  The limit is scaled by the ratio of the long
+    term latency (times tolerance) to the short term latency, so it shrinks
+    as requests start queuing up in the DN, and grows by about sqrt(limit)
+    while latency stays near the long term average.  A 503 or timeout from
+    the DN cuts the limit by backoff_factor.
+    """
+
+    def __init__(
+        self,
+        name="",
+        min_limit=1,
+        max_limit=32,
+        initial_limit=None,
+        tolerance=2.0,
+        smoothing=0.2,
+        base_smoothing=0.01,
+        backoff_factor=0.5,
+    ):
+        if min_limit < 1:
+            min_limit = 1
+        if max_limit < min_limit:
+            max_limit = min_limit
+        if initial_limit is None:
+            initial_limit = min_limit
+        self._name = name
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._tolerance = tolerance
+        self._smoothing = smoothing
+        self._base_smoothing = base_smoothing
+        self._backoff_factor = backoff_factor
+        self._inflight = 0
+        self._base_latency = None  # long term average latency
+        self._latency = None  # short term average latency
+        self._request_count = 0
+        self._overload_count = 0
+        self._listeners = set()  # work queues waiting on a free slot
+
+    def _setLimit(self, limit):
+        limit = min(max(limit, self._min_limit), self._max_limit)
+        prev_limit = int(self._limit)
+        self._limit = limit
+        if int(limit) != prev_limit:
+            msg = f"DnConcurrency {self._name} - limit {prev_limit} -> {int(limit)}, "
+            msg += f"latency: {self._latency}, inflight: {self._inflight}"
+            log.debug(msg)
+        if int(limit) > prev_limit:
+            self._notify()
+
+    def _notify(self):
+        for listener in list(self._listeners):
+            listener.wakeup()
+
+    def addListener(self, listener):
+        """have listener.wakeup() called when a slot may have freed up"""
+        self._listeners.add(listener)
+
+    def removeListener(self, listener):
+        self._listeners.discard(listener)
+
+    def record(self, latency):
+        """record a successful request that took latency seconds"""
+        self._request_count += 1
+        if self._latency is None:
+            self._latency = latency
+            self._base_latency = latency
+        else:
+            self._latency += self._smoothing * (latency - self._latency)
+            self._base_latency += self._base_smoothing * (latency - self._base_latency)
+            if self._base_latency > self._latency * self._tolerance:
+                # the DN has recovered from a slow period, don't let the old
+                # baseline hide the next one
+                self._base_latency = self._latency * self._tolerance
+        if self._latency <= 0.0:
+            gradient = 1.0
+        else:
+            gradient = self._base_latency * self._tolerance / self._latency
+            gradient = min(max(gradient, 0.5), 1.0)
+        if gradient >= 1.0 and self._inflight < self._limit / 2:
+            # not using the current limit, so no evidence more would help
+            return
+        new_limit = self._limit * gradient + math.sqrt(self._limit)
+        self._setLimit(self._limit + self._smoothing * (new_limit - self._limit))
+
+    def recordOverload(self):
+        """record a 503 or timed out request"""
+        self._overload_count += 1
+        self._setLimit(self._limit * self._backoff_factor)
+
+    def tryAcquire(self):
+        """take a request slot if one is available, return True if it was"""
+        if self._inflight >= int(self._limit):
+            return False
+        self._inflight += 1
+        return True
+
+    def release(self):
+        """return a request slot and wake up anyone waiting on one"""
+        self._inflight -= 1
+        if self._inflight < 0:
+            self._inflight = 0
+        self._notify()
+
+    @property
+    def limit(self):
+        """number of requests that can be in flight"""
+        return int(self._limit)
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    @property
+    def latency(self):
+        return self._latency
+
+    @property
+    def baseLatency(self):
+        return self._base_latency
+
+    @property
+    def requestCount(self):
+        return self._request_count
+
+    @property
+    def overloadCount(self):
+        return self._overload_count
+
+
+class DnWorkQueue(object):
+    """Work queue that keeps a FIFO of items for each DN.
+
+    get() returns the next item for a DN with a free request slot (going
+    round-robin over the DNs), rather than the next item in put order, and
+    waits if every DN with pending items is at its limit.  The slot is
+    given back by task_done().  get_limiter is called with a DN url to get
+    the DnConcurrency object for that DN.
+    """
+
+    def __init__(self, get_limiter, maxsize=0):
+        self._get_limiter = get_limiter
+        self._maxsize = maxsize
+        self._queues = {}  # map of dn url to deque of items
+        self._count = 0  # number of items waiting
+        self._unfinished = 0  # number of items put but not done
+        self._getters = deque()  # futures for get calls that are waiting
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def qsize(self):
+        return self._count
+
+    def full(self):
+        return self._maxsize > 0 and self._count >= self._maxsize
+
+    def put_nowait(self, dn_url, item):
+        """add an item for the given DN"""
+        if dn_url not in self._queues:
+            self._queues[dn_url] = deque()
+            self._get_limiter(dn_url).addListener(self)
+        self._queues[dn_url].append(item)
+        self._count += 1
+        self._unfinished += 1
+        self._finished.clear()
+        if self.full():
+            self._not_full.clear()
+        self.wakeup()
+
+    async def put(self, dn_url, item):
+        """add an item for the given DN, waiting if the queue is full"""
+        while self.full():
+            await self._not_full.wait()
+        self.put_nowait(dn_url, item)
+
+    def _getReady(self):
+        """return (dn_url, item) for the first DN with a free slot or None"""
+        for dn_url in list(self._queues):
+            limiter = self._get_limiter(dn_url)
+            if not limiter.tryAcquire():
+                continue
+            q = self._queues.pop(dn_url)
+            item = q.popleft()
+            if q:
+                # re-insert at the end so DNs are served round-robin
+                self._queues[dn_url] = q
+            else:
+                limiter.removeListener(self)
+            self._count -= 1
+            if not self.full():
+                self._not_full.set()
+            return dn_url, item
+        return None
+
+    def wakeup(self):
+        """wake up one waiting get call to check for work"""
+        while self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                break
+
+    async def get(self):
+        """return (dn_url, item) for the next item whose DN has room"""
+        while True:
+            ready = self._getReady()
+            if ready is not None:
+                if self._count and self._getters:
+                    # there may be room for another waiting get
+                    self.wakeup()
+                return ready
+            # wait for a new item or for a slot to free up on a DN that
+            # has items waiting
+            getter = asyncio.get_running_loop().create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except asyncio.CancelledError:
+                if getter.done() and not getter.cancelled():
+                    # pass the wakeup on to someone else
+                    self.wakeup()
+                raise
+
+    def task_done(self, dn_url):
+        """item returned by get for the given DN is complete"""
+        self._get_limiter(dn_url).release()
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._finished.set()
+
+    def close(self):
+        """drop any items still waiting and stop listening for free slots"""
+        for dn_url in self._queues:
+            self._get_limiter(dn_url).removeListener(self)
+        self._queues = {}
+        self._count = 0
+        self._not_full.set()
+
+    def drain(self):
+        """drop any items still waiting and count them as done, returns
+        the number of items dropped"""
+        count = self._count
+        self.close()
+        self._unfinished -= count
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._finished.set()
+        return count
+
+    async def join(self):
+        """wait till every item that was put has been marked done"""
+        await self._finished.wait()
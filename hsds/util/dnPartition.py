@@ -0,0 +1,102 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# dnPartition.py:
+#
+# Mapping of object hash values to DN nodes
+#
+import bisect
+import hashlib
+
+HASH_BITS = 20  # object ids hash to the first 5 hex digits of their md5
+
+
+class ModuloPartitioner(object):
+    """Map hash values to nodes with hash % node count.  Adding or removing
+    a node moves almost every object to a different node."""
+
+    def __init__(self, nodes):
+        self._nodes = tuple(nodes)
+
+    @property
+    def nodes(self):
+        return self._nodes
+
+    def getPartition(self, hash_value):
+        """return the index of the node for the given hash value"""
+        return hash_value % len(self._nodes)
+
+    def getNode(self, hash_value):
+        """return the node for the given hash value"""
+        return self._nodes[self.getPartition(hash_value)]
+
+
+class HashRing(object):
+    """Consistent hash ring with vnodes points for each node.
+
+    An object belongs to the node owning the first point at or after the
+    object's hash value (wrapping around at the end of the ring).  Points
+    only depend on the node name, so when a node is added or removed only
+    the objects on the arcs it gains or loses move, about 1/node count of
+    them, rather than nearly all of them.
+    """
+
+    def __init__(self, nodes, vnodes=128):
+        if vnodes < 1:
+            vnodes = 1
+        self._nodes = tuple(nodes)
+        self._vnodes = vnodes
+        points = []
+        for index, node in enumerate(self._nodes):
+            for i in range(vnodes):
+                points.append((self._pointHash(f"{node}#{i}"), node, index))
+        # sort on node name for equal hashes so the order doesn't depend on
+        # the node's position in the list
+        points.sort()
+        self._hashes = [point[0] for point in points]
+        self._owners = [point[2] for point in points]
+
+    @staticmethod
+    def _pointHash(key):
+        hexdigest = hashlib.md5(key.encode("utf8")).hexdigest()
+        return int(hexdigest[: HASH_BITS // 4], 16)
+
+    @property
+    def nodes(self):
+        return self._nodes
+
+    @property
+    def vnodes(self):
+        return self._vnodes
+
+    def getPartition(self, hash_value):
+        """return the index of the node for the given hash value"""
+        i = bisect.bisect_left(self._hashes, hash_value)
+        if i == len(self._hashes):
+            i = 0
+        return self._owners[i]
+
+    def getNode(self, hash_value):
+        """return the node for the given hash value"""
+        return self._nodes[self.getPartition(hash_value)]
+
+
+def createPartitioner(nodes, scheme="ring", vnodes=128):
+    """Return a partitioner for the given list of nodes.  scheme is "ring"
+    for consistent hashing or "modulo" for hash % node count"""
+    if not nodes:
+        raise ValueError("no nodes to partition over")
+    if scheme == "modulo":
+        return ModuloPartitioner(nodes)
+    if scheme == "ring":
+        return HashRing(nodes, vnodes=vnodes)
+    raise ValueError(f"unknown partition scheme: {scheme}")
@@ -686,10 +686,132 @@ def get_slices(select, dset_json):
     return slices
 
 
-def getSelectionPagination(select, dims, itemsize, max_request_size):
+def _getSliceCount(start, stop, step):
+    """ number of indices selected by slice(start, stop, step) """
+    if stop <= start:
+        return 0
+    return -(-(stop - start) // step)
+
+
+def _getNextIndex(start, step, boundary):
+    """ first index of a slice starting at start that is >= boundary """
+    if boundary <= start:
+        return start
+    return start + -(-(boundary - start) // step) * step
+
+
+def _getSelectionChunkCount(s, chunk_extent):
+    """ number of chunks along one dimension touched by the selection s """
+    if not isinstance(s, slice):
+        # coordinate list
+        return len(set(c // chunk_extent for c in s))
+    step = s.step if s.step else 1
+    count = _getSliceCount(s.start, s.stop, step)
+    if count == 0:
+        return 0
+    if step >= chunk_extent:
+        return count  # each index falls in a different chunk
+    last = s.start + (count - 1) * step
+    return last // chunk_extent - s.start // chunk_extent + 1
+
+
+def _getChunkAlignedPages(s, chunk_extent, max_count):
+    """ Paginate slice s along chunk boundaries with at most max_count
+    indices per page.  Returns a list of page slices and the number of
+    chunk intervals that had to be split across pages """
+    step = s.step if s.step else 1
+    pages = []
+    split_count = 0
+    page_start = s.start
+    page_stop = s.start
+    chunk_start = s.start  # first selected index in the current chunk
+    while chunk_start < s.stop:
+        chunk_stop = min((chunk_start // chunk_extent + 1) * chunk_extent, s.stop)
+        if _getSliceCount(page_start, chunk_stop, step) <= max_count:
+            # add this chunk to the current page
+            page_stop = chunk_stop
+        else:
+            if page_stop > page_start:
+                pages.append(slice(page_start, page_stop, step))
+            page_start = chunk_start
+            chunk_count = _getSliceCount(chunk_start, chunk_stop, step)
+            if chunk_count <= max_count:
+                page_stop = chunk_stop
+            else:
+                # chunk is too big for one page, split it evenly
+                split_count += 1
+                sub_page_count = -(-chunk_count // max_count)
+                sub_page_extent = -(-chunk_count // sub_page_count) * step
+                while page_start < chunk_stop:
+                    page_stop = min(page_start + sub_page_extent, chunk_stop)
+                    pages.append(slice(page_start, page_stop, step))
+                    page_start = page_stop
+                page_start = _getNextIndex(s.start, step, chunk_stop)
+                page_stop = page_start
+        chunk_start = _getNextIndex(s.start, step, chunk_stop)
+    if page_stop > page_start:
+        pages.append(slice(page_start, page_stop, step))
+    return pages, split_count
+
+
+def _getChunkAlignedPagination(select, layout, itemsize, max_request_size, contiguous=True):
+    """ Return page selections with page boundaries on chunk boundaries,
+    using the dimension that splits the fewest chunks across pages.
+    If contiguous is set, only the first dimension with more than one index
+    selected is used, so that the pages follow one another in row-major order.
+    Returns None if no dimension can be used """
+    rank = len(select)
+    select_shape = getSelectionShape(select)
+    chunk_counts = [_getSelectionChunkCount(select[i], layout[i]) for i in range(rank)]
+    best = None
+    for dim in range(rank):
+        s = select[dim]
+        if select_shape[dim] <= 1:
+            continue
+        if not isinstance(s, slice):
+            if contiguous:
+                break
+            continue
+        # bytes for each index selected along this dimension
+        index_size = math.prod(select_shape) // select_shape[dim] * itemsize
+        if index_size > max_request_size:
+            # one index along this dimension is already too big
+            if contiguous:
+                # a later dimension would put the pages out of row-major order
+                break
+            continue
+        max_count = max_request_size // index_size
+        pages, split_count = _getChunkAlignedPages(s, layout[dim], max_count)
+        # each split chunk interval means that many chunks read by two or more pages
+        split_chunks = split_count * math.prod(chunk_counts) // chunk_counts[dim]
+        key = (split_chunks, len(pages), dim)
+        log.debug(f"getSelectionPagination - dim: {dim}, (split_chunks, pages): {key[:2]}")
+        if best is None or key < best[0]:
+            best = (key, dim, pages)
+        if contiguous:
+            break
+    if best is None:
+        return None
+    key, paginate_dim, paginate_slices = best
+    log.debug(f"getSelectionPagination - using chunk aligned pagination on dim: {paginate_dim}")
+    pagination = []
+    for page_slice in paginate_slices:
+        page = list(select)
+        page[paginate_dim] = page_slice
+        pagination.append(tuple(page))
+    return tuple(pagination)
+
+
+def getSelectionPagination(
+    select, dims, itemsize, max_request_size, layout=None, contiguous=True
+):
     """
     Paginate a select tupe into multiple selects where each
-        select requires less than max_request_size bytes"""
+        select requires less than max_request_size bytes.
+        If the chunk layout is given, page boundaries are put on chunk
+        boundaries where possible so no chunk is read by more than one page.
+        Set contiguous to False to let any dimension be paginated when the
+        caller doesn't need the pages to be in row-major order"""
     msg = f"getSelectionPagination - select: {select}, dims: {dims}, "
     msg += f"itemsize: {itemsize}, max_request_size: {max_request_size}"
     log.debug(msg)
@@ -702,6 +824,13 @@ def getSelectionPagination(select, dims, itemsize, max_request_size):
         log.debug("getSelectionPagination - not needed")
         return (select,)
 
+    if layout is not None:
+        pagination = _getChunkAlignedPagination(
+            select, layout, itemsize, max_request_size, contiguous=contiguous
+        )
+        if pagination is not None:
+            return pagination
+
     # get pagination dimension - first dimension with > 1 extent
     rank = len(dims)
     paginate_dim = None
@@ -926,6 +1055,17 @@ def getChunkInitializer(dset_json):
     return initializer
 
 
+def getVlenChunkFormat(dset_json):
+    """ return storage format for vlen chunks - "indexed" if the dataset has
+    opted in to the offset-indexed format, otherwise "sequential" """
+    vlen_format = "sequential"
+    if "creationProperties" in dset_json:
+        cprops = dset_json["creationProperties"]
+        if cprops.get("vlenChunkFormat") == "indexed":
+            vlen_format = "indexed"
+    return vlen_format
+
+
 def getPreviewQuery(dims):
     """
     Helper method - return query options for a "reasonable" size
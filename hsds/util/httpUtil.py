@@ -13,11 +13,13 @@
 # httpUtil:
 # http-related helper functions
 #
+import asyncio
 from asyncio import CancelledError, TimeoutError
 import os
 import socket
 import numpy as np
-from aiohttp.web import json_response
+from aiohttp.web import json_response, Response
+import msgpack
 import simplejson
 from aiohttp import ClientSession, UnixConnector, TCPConnector
 from aiohttp.web_exceptions import HTTPForbidden, HTTPNotFound, HTTPConflict
@@ -26,10 +28,14 @@ from aiohttp.web_exceptions import HTTPRequestEntityTooLarge
 from aiohttp.web_exceptions import HTTPServiceUnavailable, HTTPBadRequest
 from aiohttp.client_exceptions import ClientError
 from hsds.util.idUtil import isValidUuid
+from hsds.util.batchUtil import readFrame
+from hsds.util.inProcessUtil import isInProcessUrl
 
 from .. import hsds_logger as log
 from .. import config
 
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
+
 
 def isOK(http_response):
     """return True for successful http_status codes"""
@@ -175,7 +181,7 @@ def get_base_url(url):
     """return protocal+dns+port part of url.
     Returns just url if a non-standard protocol is given."""
     n = len(url)
-    for protocol in ("http://", "https://", "http+unix://"):
+    for protocol in ("http://", "https://", "http+unix://", "http+inproc://"):
         if url.startswith(protocol):
             start = len(protocol)
             n = url.find("/", start)
@@ -189,6 +195,9 @@ def get_base_url(url):
 def get_http_client(app, url=None, cache_client=True):
     """get http client"""
     log.debug(f"get_http_client, url: {url}")
+    if url is not None and isInProcessUrl(url):
+        # node is running in this process, no connection needed
+        return app["inprocess_clients"][get_base_url(url)]
     if url is None or not isUnixDomainUrl(url):
         socket_path = None
     else:
@@ -280,28 +289,149 @@ async def request_read(request, count=None) -> bytes:
     return bytes(body)
 
 
-async def http_get(app, url, params=None, client=None):
+async def _read_into(rsp, out):
+    """
+    Read a binary response body into the writable buffer out as it arrives
+    rather than joining it into a bytes object.  Returns the number of bytes
+    read.
+    """
+    buffer = memoryview(out).cast("B")
+    offset = 0
+    async for data in rsp.content.iter_any():
+        end = offset + len(data)
+        if end > len(buffer):
+            msg = f"response to {rsp.url} larger than buffer of {len(buffer)} bytes"
+            log.error(msg)
+            raise HTTPInternalServerError()
+        buffer[offset:end] = data
+        offset = end
+    return offset
+
+
+def isConnectionError(e):
+    """Return True if e was raised by the http helpers for a failed
+    connection, rather than for an error response"""
+    return isinstance(e.__cause__, (ClientError, ConnectionResetError))
+
+
+def _isCancelling():
+    """Return True if the current task has been cancelled, as opposed to a
+    CancelledError from inside the client.  Always False before python 3.11,
+    which doesn't track this."""
+    task = asyncio.current_task()
+    if task is None or not hasattr(task, "cancelling"):
+        return False
+    return task.cancelling() > 0
+
+
+def _isMsgpackUrl(app, url):
+    """
+    Return True if requests to url should use msgpack rather than JSON.
+    Only DNs know how to decode msgpack, so requests to other nodes are
+    always JSON.
+    """
+    if config.get("rpc_encoding", default="json") != "msgpack":
+        return False
+    dn_urls = app.get("dn_urls")
+    if not dn_urls:
+        return False
+    return get_base_url(url) in dn_urls
+
+
+def _getRpcKwargs(app, url, data=None):
+    """
+    Return the client request kwargs to send the JSON-able data (if any)
+    to url, using msgpack for requests to DNs.
+    """
+    if not _isMsgpackUrl(app, url):
+        if data is None:
+            return {}
+        return {"json": data}
+    headers = {"Accept": MSGPACK_CONTENT_TYPE}
+    kwargs = {"headers": headers}
+    if data is not None:
+        try:
+            kwargs["data"] = msgpack.packb(data, use_bin_type=True)
+            headers["Content-Type"] = MSGPACK_CONTENT_TYPE
+        except (TypeError, ValueError, OverflowError) as e:
+            log.debug(f"unable to msgpack body for {url}: {e}, using json")
+            kwargs["json"] = data
+    return kwargs
+
+
+async def _read_json(rsp):
+    """
+    Read a JSON response, or a msgpack response for requests that
+    asked for one.
+    """
+    content_type = rsp.headers.get("Content-Type")
+    if content_type and content_type.startswith(MSGPACK_CONTENT_TYPE):
+        data = await rsp.read()
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    return await rsp.json()
+
+
+async def getRequestJson(request):
+    """
+    Return the JSON body of a request.  Bodies sent with
+    the msgpack content type are decoded with msgpack.
+    """
+    if request.content_type != MSGPACK_CONTENT_TYPE:
+        return await request.json()
+    # same size limit as request.json
+    body = await request.read()
+    try:
+        return msgpack.unpackb(body, raw=False, strict_map_key=False)
+    except (ValueError, msgpack.UnpackException) as e:
+        log.warn(f"unable to decode msgpack request body: {e}")
+        raise HTTPBadRequest(reason="Invalid msgpack body")
+
+
+def rpcResponse(request, data, status=200):
+    """
+    Create a response object for a request from another node.  The
+    data is returned with msgpack if the request accepts it, otherwise
+    as JSON.
+    """
+    accept = request.headers.get("Accept")
+    if accept and MSGPACK_CONTENT_TYPE in accept:
+        try:
+            body = msgpack.packb(data, use_bin_type=True)
+        except (TypeError, ValueError, OverflowError) as e:
+            log.debug(f"unable to msgpack response: {e}, using json")
+        else:
+            return Response(body=body, status=status, content_type=MSGPACK_CONTENT_TYPE)
+    return json_response(data, status=status)
+
+
+async def http_get(app, url, params=None, client=None, out=None):
     """
     Helper function  - async HTTP GET
+    If out is set, a binary response is read into it and the number of bytes
+    read is returned.
     """
     log.info(f"http_get('{url}')")
     if client is None:
         client = get_http_client(app, url=url)
+    kwargs = _getRpcKwargs(app, url)
     url = get_http_std_url(url)
     status_code = None
     timeout = config.get("timeout")
     # TBD: use read_bufsize parameter to optimize read for large responses
     try:
-        async with client.get(url, params=params, timeout=timeout) as rsp:
+        async with client.get(url, params=params, timeout=timeout, **kwargs) as rsp:
             log.info(f"http_get status: {rsp.status} for req: {url}")
             status_code = rsp.status
             if rsp.status == 200:
                 # 200, so read the response
                 if isBinaryResponse(rsp):
-                    # return binary data
-                    retval = await rsp.read()  # read response as bytes
+                    if out is not None:
+                        retval = await _read_into(rsp, out)
+                    else:
+                        # return binary data
+                        retval = await rsp.read()  # read response as bytes
                 else:
-                    retval = await rsp.json()
+                    retval = await _read_json(rsp)
             elif status_code == 400:
                 log.warn(f"BadRequest to {url}")
                 raise HTTPBadRequest(reason="Bad Request")
@@ -323,13 +453,15 @@ async def http_get(app, url, params=None, client=None):
 
     except ClientError as ce:
         log.warn(f"ClientError: {ce}")
-        raise HTTPInternalServerError()
+        raise HTTPInternalServerError() from ce
     except CancelledError as cle:
         log.warn(f"CancelledError for http_get({url}): {cle}")
+        if _isCancelling():
+            raise  # the caller doesn't want the response
         raise HTTPInternalServerError()
     except ConnectionResetError as cre:
         log.warn(f"ConnectionResetError for http_get({url}): {cre}")
-        raise HTTPInternalServerError()
+        raise HTTPInternalServerError() from cre
     except TimeoutError as toe:
         log.warn(f"TimeoutError for http_get({url}: {toe})")
         raise HTTPServiceUnavailable()
@@ -337,9 +469,11 @@ async def http_get(app, url, params=None, client=None):
     return retval
 
 
-async def http_post(app, url, data=None, params=None, client=None):
+async def http_post(app, url, data=None, params=None, client=None, out=None):
     """
     Helper function  - async HTTP POST
+    If out is set, a binary response is read into it and the number of bytes
+    read is returned.
     """
     if not url:
         log.error("http_post with no url")
@@ -355,12 +489,12 @@ async def http_post(app, url, data=None, params=None, client=None):
     logmsg(msg)
     if client is None:
         client = get_http_client(app, url=url)
-    url = get_http_std_url(url)
     if isinstance(data, bytes):
         log.debug("setting http_post for binary")
         kwargs = {"data": data}
     else:
-        kwargs = {"json": data}
+        kwargs = _getRpcKwargs(app, url, data=data)
+    url = get_http_std_url(url)
     timeout = config.get("timeout")
     if timeout:
         kwargs["timeout"] = timeout
@@ -394,23 +528,28 @@ async def http_post(app, url, data=None, params=None, client=None):
                 msg = f"POST request error for url: {url} status: {rsp.status}"
                 log.error(msg)
                 raise HTTPInternalServerError()
-            if isBinaryResponse(rsp):
+            if isBinaryResponse(rsp) and out is not None:
+                retval = await _read_into(rsp, out)
+                log.debug(f"http_post({url}) read {retval} bytes into buffer")
+            elif isBinaryResponse(rsp):
                 # return binary data
                 retval = await (rsp.read())
                 log.debug(f"http_post({url}) returning {len(retval)} bytes")
             else:
-                retval = await rsp.json()
+                retval = await _read_json(rsp)
                 log.debug(f"http_post({url}) response: {retval}")
 
     except ClientError as ce:
         log.warn(f"ClientError for http_post({url}): {ce} ")
-        raise HTTPInternalServerError()
+        raise HTTPInternalServerError() from ce
     except CancelledError as cle:
         log.warn(f"CancelledError for http_post({url}): {cle}")
+        if _isCancelling():
+            raise  # the caller doesn't want the response
         raise HTTPInternalServerError()
     except ConnectionResetError as cre:
         log.warn(f"ConnectionResetError for http_post({url}): {cre}")
-        raise HTTPInternalServerError()
+        raise HTTPInternalServerError() from cre
     except TimeoutError as toe:
         log.warn(f"TimeoutError for http_post({url}: {toe})")
         raise HTTPServiceUnavailable()
@@ -418,6 +557,65 @@ async def http_post(app, url, data=None, params=None, client=None):
     return retval
 
 
+async def http_post_frames(app, url, data=None, params=None, client=None):
+    """
+    Helper function  - async HTTP POST of a batch request
+    Yields (header, data) frames from the response as they arrive
+    """
+    log.info(f"http_post_frames('{url}' {len(data)} bytes)")
+    if client is None:
+        client = get_http_client(app, url=url)
+    url = get_http_std_url(url)
+    kwargs = {"data": data}
+    timeout = config.get("timeout")
+    if timeout:
+        kwargs["timeout"] = timeout
+    if params:
+        kwargs["params"] = params
+
+    try:
+        async with client.post(url, **kwargs) as rsp:
+            log.info(f"http_post_frames status: {rsp.status}")
+            if rsp.status == 200:
+                pass  # ok
+            elif rsp.status == 400:
+                log.warn(f"POST request HTTPBadRequest error for url: {url}")
+                raise HTTPBadRequest(reason="Bad Request")
+            elif rsp.status == 404:
+                log.warn(f"POST request HTTPNotFound error for url: {url}")
+                raise HTTPNotFound()
+            elif rsp.status == 503:
+                log.warn(f"503 error for http_post_frames {url}")
+                raise HTTPServiceUnavailable()
+            else:
+                msg = f"POST request error for url: {url} status: {rsp.status}"
+                log.error(msg)
+                raise HTTPInternalServerError()
+            while True:
+                try:
+                    frame = await readFrame(rsp.content)
+                except ValueError as ve:
+                    log.warn(f"http_post_frames({url}) - {ve}")
+                    raise HTTPInternalServerError()
+                if frame is None:
+                    break
+                yield frame
+    except ClientError as ce:
+        log.warn(f"ClientError for http_post_frames({url}): {ce} ")
+        raise HTTPInternalServerError() from ce
+    except CancelledError as cle:
+        log.warn(f"CancelledError for http_post_frames({url}): {cle}")
+        if _isCancelling():
+            raise  # the caller doesn't want the response
+        raise HTTPInternalServerError()
+    except ConnectionResetError as cre:
+        log.warn(f"ConnectionResetError for http_post_frames({url}): {cre}")
+        raise HTTPInternalServerError() from cre
+    except TimeoutError as toe:
+        log.warn(f"TimeoutError for http_post_frames({url}: {toe})")
+        raise HTTPServiceUnavailable()
+
+
 async def http_put(app, url, data=None, params=None, client=None):
     """
     Helper function  - async HTTP PUT
@@ -425,13 +623,13 @@ async def http_put(app, url, data=None, params=None, client=None):
     log.info(f"http_put('{url}')")
     if client is None:
         client = get_http_client(app, url=url)
-    url = get_http_std_url(url)
     if isinstance(data, bytes):
         log.debug(f"setting http_put for binary, {len(data)} bytes")
         kwargs = {"data": data}
     else:
         log.debug("setting http_put for json")
-        kwargs = {"json": data}
+        kwargs = _getRpcKwargs(app, url, data=data)
+    url = get_http_std_url(url)
 
     rsp_json = None
     if params is not None:
@@ -467,17 +665,19 @@ async def http_put(app, url, data=None, params=None, client=None):
                 retval = await rsp.read()  # read response as bytes
                 log.debug(f"http_put({url}): return {len(retval)} bytes")
             else:
-                retval = await rsp.json()
+                retval = await _read_json(rsp)
                 log.debug(f"http_put({url}) response: {rsp_json}")
     except ClientError as ce:
         log.warn(f"ClientError for http_put({url}): {ce} ")
-        raise HTTPInternalServerError()
+        raise HTTPInternalServerError() from ce
     except CancelledError as cle:
         log.warn(f"CancelledError for http_put({url}): {cle}")
+        if _isCancelling():
+            raise  # the caller doesn't want the response
         raise HTTPInternalServerError()
     except ConnectionResetError as cre:
         log.warn(f"ConnectionResetError for http_put({url}): {cre}")
-        raise HTTPInternalServerError()
+        raise HTTPInternalServerError() from cre
     except TimeoutError as toe:
         log.warn(f"TimeoutError for http_put({url}: {toe})")
         raise HTTPServiceUnavailable()
@@ -522,13 +722,15 @@ async def http_delete(app, url, data=None, params=None, client=None):
             # log.debug(f"http_delete({url}) response: {rsp_json}")
     except ClientError as ce:
         log.warn(f"ClientError for http_delete({url}): {ce} ")
-        raise HTTPInternalServerError()
+        raise HTTPInternalServerError() from ce
     except CancelledError as cle:
         log.warn(f"CancelledError for http_delete({url}): {cle}")
+        if _isCancelling():
+            raise  # the caller doesn't want the response
         raise HTTPInternalServerError()
     except ConnectionResetError as cre:
         log.warn(f"ConnectionResetError for http_delete({url}): {cre}")
-        raise HTTPInternalServerError()
+        raise HTTPInternalServerError() from cre
     except TimeoutError as toe:
         log.warn(f"TimeoutError for http_delete({url}: {toe})")
         raise HTTPServiceUnavailable()
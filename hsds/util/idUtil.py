@@ -16,9 +16,13 @@
 
 import os.path
 import hashlib
+import sys
+import time
 import uuid
 from aiohttp.web_exceptions import HTTPServiceUnavailable
+from .dnPartition import createPartitioner
 from .. import hsds_logger as log
+from .. import config
 
 
 S3_URI = "s3://"
@@ -79,6 +83,60 @@ def isSchema2Id(id):
         return False
 
 
+class ChunkId(str):
+    """Chunk id string that keeps what gets parsed or computed from it.
+
+    Behaves as the regular "c-<uuid>_x_y_z" string (e.g. for use in urls,
+    as a dict key, or for logging), but the dataset id, chunk index,
+    partition hash, and storage key are only worked out once per chunk.
+    The dataset id is interned so all chunks of a dataset share one string.
+    """
+
+    __slots__ = ("_dset_id", "_index", "_hash_value", "_s3key")
+
+    def __new__(cls, chunk_id, dset_id=None, index=None):
+        obj = str.__new__(cls, chunk_id)
+        obj._dset_id = dset_id
+        obj._index = index
+        obj._hash_value = None
+        obj._s3key = None
+        return obj
+
+    @property
+    def dsetId(self):
+        """id of the dataset the chunk belongs to"""
+        if self._dset_id is None:
+            n = self.find("-") + 1
+            if n <= 0:
+                raise ValueError("Unexpected chunk id")
+            self._dset_id = sys.intern("d-" + self[n:(n + 36)])
+        return self._dset_id
+
+    @property
+    def chunkIndex(self):
+        """chunk index as a tuple of ints"""
+        if self._index is None:
+            n = self.find("_") + 1
+            if n == 0:
+                raise ValueError(f"Invalid chunk_id: {self}")
+            self._index = tuple(map(int, self[n:].split("_")))
+        return self._index
+
+    @property
+    def hashValue(self):
+        """integer value of the id hash used for partitioning"""
+        if self._hash_value is None:
+            self._hash_value = int(getIdHash(self), 16)
+        return self._hash_value
+
+
+def toChunkId(chunk_id):
+    """Return the given chunk id string as a ChunkId"""
+    if isinstance(chunk_id, ChunkId):
+        return chunk_id
+    return ChunkId(chunk_id)
+
+
 def getIdHexChars(id):
     """get the hex chars of the given id"""
     if id[0] == "c":
@@ -190,6 +248,12 @@ def getS3Key(id):
         include that along with the bucket name. e.g.: "s3://mybucket/a_folder/a_file.h5"
     """
 
+    if isinstance(id, ChunkId):
+        # use the key that was already worked out for this chunk
+        if id._s3key is None:
+            id._s3key = getS3Key(str(id))
+        return id._s3key
+
     base_id = _getBaseName(id)  # strip any s3://, etc.
     if base_id.find("/") > 0:
         # a domain id
@@ -296,6 +360,9 @@ def getObjId(s3key):
             elif parts[2] == "d":
                 if parts[4] == ".dataset.json":
                     prefix = "d"  # dataset json
+                elif parts[4].startswith("."):
+                    # other dataset metadata, e.g. .stats.json
+                    raise ValueError(f"not an object key: {s3key}")
                 else:
                     # chunk object
                     prefix = "c"
@@ -478,14 +545,79 @@ def getUuidFromId(id):
     return id[2:]
 
 
-def getObjPartition(id, count):
-    """Get the id of the dn node that should be handling the given obj id"""
+def getObjHash(id):
+    """Return the integer hash value used to partition the given obj id"""
+    if isinstance(id, ChunkId):
+        return id.hashValue
     hash_code = getIdHash(id)
-    hash_value = int(hash_code, 16)
-    number = hash_value % count
+    return int(hash_code, 16)
+
+
+def getObjPartition(id, count):
+    """Get the id of the dn node that should be handling the given obj id
+    with hash % count partitioning"""
+    number = getObjHash(id) % count
     return number
 
 
+def createDnPartitioner(dn_urls):
+    """Return a partitioner over the given dn_urls using the configured
+    partition scheme"""
+    scheme = config.get("dn_partition_scheme", default="ring")
+    vnodes = int(config.get("dn_partition_vnodes", default=128))
+    return createPartitioner(dn_urls, scheme=scheme, vnodes=vnodes)
+
+
+def getDnPartitioner(app):
+    """Return the partitioner for the current dn_urls, or None if there are
+    no dn_urls.  When the dn_urls change, the previous partitioner is kept
+    in app["dn_partitioner_prev"] and the dn_partition_transition_time
+    window starts."""
+    dn_urls = tuple(app["dn_urls"])
+    if not dn_urls:
+        return None
+    partitioner = app.get("dn_partitioner")
+    if partitioner is not None and partitioner.nodes == dn_urls:
+        return partitioner
+    new_partitioner = createDnPartitioner(dn_urls)
+    if partitioner is not None:
+        transition_time = float(config.get("dn_partition_transition_time", default=0))
+        msg = f"dn partitioning changed from {len(partitioner.nodes)} to "
+        msg += f"{len(dn_urls)} nodes, transition for {transition_time}s"
+        log.info(msg)
+        app["dn_partitioner_prev"] = partitioner
+        app["dn_partition_transition_end"] = time.time() + transition_time
+    app["dn_partitioner"] = new_partitioner
+    return new_partitioner
+
+
+def getPrevDnPartitioner(app):
+    """Return the partitioner from before the last change in dn_urls if still
+    in the transition window, otherwise None"""
+    if time.time() >= app.get("dn_partition_transition_end", 0):
+        return None
+    return app.get("dn_partitioner_prev")
+
+
+def isMovedId(app, obj_id):
+    """Return True if obj_id belonged to this node before the last change in
+    dn_urls, but belongs to another node now.  Such ids are only read from
+    storage, not cached, till the moved items have been flushed and evicted
+    (see basenode._evictMovedItems)"""
+    prev_partitioner = app.get("dn_partitioner_prev")
+    if prev_partitioner is None:
+        return False
+    node_number = app.get("node_number", -1)
+    dn_urls = app["dn_urls"]
+    if node_number < 0 or node_number >= len(dn_urls):
+        return False
+    node_url = dn_urls[node_number]
+    hash_value = getObjHash(obj_id)
+    if prev_partitioner.getNode(hash_value) != node_url:
+        return False
+    return getDnPartitioner(app).getNode(hash_value) != node_url
+
+
 def getNodeNumber(app):
     if app["node_type"] == "sn":
         log.error("node number if only for DN nodes")
@@ -509,32 +641,49 @@ def getNodeCount(app):
     return dn_node_count
 
 
-def validateInPartition(app, obj_id):
+def validateInPartition(app, obj_id, readonly=False):
+    """Raise KeyError if obj_id doesn't belong to this node.  During the
+    dn_partition_transition_time window, ids this node owned before the last
+    change in dn_urls are valid for reads only, so that the new owner's
+    cache doesn't miss updates.  Reads for these are served from storage,
+    see isMovedId."""
     node_number = getNodeNumber(app)
     node_count = getNodeCount(app)
     msg = f"obj_id: {obj_id}, node_count: {node_count}, "
     msg += f"node_number: {node_number}"
     log.debug(msg)
-    partition_number = getObjPartition(obj_id, node_count)
-    if partition_number != node_number:
-        # The request shouldn't have come to this node'
-        msg = f"wrong node for 'id':{obj_id}, expected node {node_number} "
-        msg += f"got {partition_number}"
+    if node_number < 0 or node_number >= node_count:
+        msg = f"wrong node for 'id':{obj_id}, node_number {node_number} not valid"
         log.error(msg)
         raise KeyError(msg)
+    hash_value = getObjHash(obj_id)
+    partition_number = getDnPartitioner(app).getPartition(hash_value)
+    if partition_number == node_number:
+        return
+    prev_partitioner = getPrevDnPartitioner(app)
+    if readonly and prev_partitioner is not None:
+        # SNs may still be routing with the old dn_urls
+        node_url = app["dn_urls"][node_number]
+        if prev_partitioner.getNode(hash_value) == node_url:
+            log.debug(f"obj_id: {obj_id} in previous partition for this node")
+            return
+    # The request shouldn't have come to this node'
+    msg = f"wrong node for 'id':{obj_id}, expected node {node_number} "
+    msg += f"got {partition_number}"
+    log.error(msg)
+    raise KeyError(msg)
 
 
 def getDataNodeUrl(app, obj_id):
     """Return host/port for datanode for given obj_id.
     Throw exception if service is not ready"""
-    dn_urls = app["dn_urls"]
     dn_node_count = getNodeCount(app)
     node_state = app["node_state"]
     if node_state != "READY" or dn_node_count <= 0:
         msg = "Service not ready"
         log.warn(msg)
         raise HTTPServiceUnavailable()
-    dn_number = getObjPartition(obj_id, dn_node_count)
-    url = dn_urls[dn_number]
+    partitioner = getDnPartitioner(app)
+    url = partitioner.getNode(getObjHash(obj_id))
     log.debug(f"got dn_url: {url} for obj_id: {obj_id}")
     return url
@@ -0,0 +1,243 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# inProcessUtil.py:
+#
+# Dispatch requests to an aiohttp app running in this process.  The request
+# goes through the app's router and handlers as it would for a request off
+# a socket, but no connection or HTTP framing is involved.
+#
+import asyncio
+import json
+
+from aiohttp.abc import AbstractStreamWriter
+from aiohttp.base_protocol import BaseProtocol
+from aiohttp.http import HttpVersion11, RawRequestMessage
+from aiohttp.streams import EMPTY_PAYLOAD, StreamReader
+from aiohttp.web import Request
+from aiohttp.web_exceptions import HTTPException
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from .. import hsds_logger as log
+
+INPROCESS_SCHEME = "http+inproc"
+READ_LIMIT = 2 ** 16
+
+
+def isInProcessUrl(url):
+    """Return True if url is for a node in this process"""
+    return url.startswith(INPROCESS_SCHEME + "://")
+
+
+def getInProcessUrl(name):
+    """Return url for an in-process node with the given name"""
+    return f"{INPROCESS_SCHEME}://{name}"
+
+
+class _Transport(asyncio.Transport):
+    """Transport for requests that don't have a connection"""
+
+    def is_closing(self):
+        return False
+
+
+class _ResponseWriter(AbstractStreamWriter):
+    """Collect the status, headers, and body written for a response"""
+
+    def __init__(self):
+        self.status_line = None
+        self.headers = None
+        self.chunks = []
+
+    async def write_headers(self, status_line, headers):
+        self.status_line = status_line
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+
+    async def write(self, chunk):
+        if chunk:
+            # the handler may reuse its buffer once write returns
+            self.chunks.append(bytes(chunk))
+            self.output_size += len(chunk)
+
+    async def write_eof(self, chunk=b""):
+        await self.write(chunk)
+
+    async def drain(self):
+        pass
+
+    def enable_compression(self, encoding="deflate"):
+        pass  # the body is passed as is
+
+    def enable_chunking(self):
+        pass  # no framing needed
+
+
+def _createReader(data, loop):
+    """Return a StreamReader holding data"""
+    protocol = BaseProtocol(loop)
+    reader = StreamReader(protocol, READ_LIMIT, loop=loop)
+    if data:
+        reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+class InProcessResponse(object):
+    """Response to an in-process request.  Has the parts of the aiohttp
+    ClientResponse interface the http helpers use."""
+
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self._body = body
+        self.content = _createReader(body, asyncio.get_running_loop())
+
+    @property
+    def body(self):
+        return self._body
+
+    async def read(self):
+        return self._body
+
+    async def json(self):
+        if not self._body:
+            return None
+        return json.loads(self._body)
+
+    def release(self):
+        pass
+
+
+async def _handle(app, method, url, params=None, data=None, json_data=None, headers=None):
+    """Run the handler for the given request and return an
+    InProcessResponse"""
+    loop = asyncio.get_running_loop()
+    url = URL(url)
+    rel_url = URL.build(path=url.path, query_string=url.query_string, encoded=True)
+    if params:
+        rel_url = rel_url.update_query(params)
+
+    req_headers = CIMultiDict(headers or {})
+    req_headers.setdefault("Host", url.host or "localhost")
+    if json_data is not None:
+        data = json.dumps(json_data).encode("utf8")
+        req_headers.setdefault("Content-Type", "application/json")
+    elif isinstance(data, str):
+        data = data.encode("utf8")
+    elif data is not None:
+        data = bytes(data)
+        req_headers.setdefault("Content-Type", "application/octet-stream")
+    if data is not None:
+        req_headers["Content-Length"] = str(len(data))
+        payload = _createReader(data, loop)
+    else:
+        payload = EMPTY_PAYLOAD
+
+    raw_headers = tuple((k.encode("utf8"), v.encode("utf8")) for k, v in req_headers.items())
+    message = RawRequestMessage(
+        method,
+        str(rel_url),
+        HttpVersion11,
+        CIMultiDictProxy(req_headers),
+        raw_headers,
+        False,  # should_close
+        None,  # compression
+        False,  # upgrade
+        False,  # chunked
+        rel_url,
+    )
+    protocol = BaseProtocol(loop)
+    protocol.transport = _Transport()
+    writer = _ResponseWriter()
+    request = Request(
+        message,
+        payload,
+        protocol,
+        writer,
+        asyncio.current_task(),
+        loop,
+        client_max_size=app._client_max_size,
+    )
+
+    try:
+        resp = await app._handle(request)
+    except HTTPException as he:
+        resp = he
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        log.error(f"in-process {method} {rel_url} - unexpected exception {type(e)}: {e}")
+        return InProcessResponse(url, 500, CIMultiDictProxy(CIMultiDict()), b"")
+    await resp.prepare(request)
+    await resp.write_eof()
+    return InProcessResponse(url, resp.status, writer.headers, b"".join(writer.chunks))
+
+
+class _RequestContext(object):
+    """Async context manager returned by InProcessClient request methods"""
+
+    def __init__(self, app, method, url, timeout=None, **kwargs):
+        self._app = app
+        self._method = method
+        self._url = url
+        self._timeout = getattr(timeout, "total", timeout)
+        self._kwargs = kwargs
+
+    async def __aenter__(self):
+        kwargs = self._kwargs
+        if "json" in kwargs:
+            kwargs["json_data"] = kwargs.pop("json")
+        coro = _handle(self._app, self._method, self._url, **kwargs)
+        if not self._timeout:
+            return await coro
+        # like a server, keep running the handler if the caller gives up
+        task = asyncio.ensure_future(coro)
+        return await asyncio.wait_for(asyncio.shield(task), self._timeout)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class InProcessClient(object):
+    """Stands in for an aiohttp ClientSession for requests to an app in this
+    process.  Requests are passed to the app's handlers directly."""
+
+    def __init__(self, app):
+        self._app = app
+
+    @property
+    def app(self):
+        return self._app
+
+    @property
+    def closed(self):
+        return False
+
+    def request(self, method, url, **kwargs):
+        return _RequestContext(self._app, method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    async def close(self):
+        pass
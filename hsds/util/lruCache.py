@@ -14,6 +14,9 @@ import time
 
 from .. import hsds_logger as log
 
+# time period (in seconds) over which flushed bytes are averaged
+FLUSH_RATE_WINDOW = 1.0
+
 
 def getArraySize(arr):
     """Return size in bytes of numpy array"""
@@ -32,6 +35,8 @@ class Node(object):
         self._prev = prev
         self._next = next
         self._last_access = time.time()
+        self._hits = 0  # number of reads
+        self._last_hit = self._last_access
 
 
 class LruCache(object):
@@ -49,6 +54,9 @@ class LruCache(object):
         self._expire_time = expire_time
         self._name = name
         self._dirty_set = set()
+        self._flush_rate = 0.0  # bytes/sec of dirty nodes being cleared
+        self._flush_window_bytes = 0
+        self._flush_window_start = time.time()
 
     def _delNode(self, key):
         # remove from LRU
@@ -153,8 +161,44 @@ class LruCache(object):
         if not self._hasKey(key):
             raise KeyError(key)
         node = self._moveToFront(key)
+        node._hits += 1
+        node._last_hit = time.time()
         return node._data
 
+    def peek(self, key):
+        """Return data for key without changing the LRU order or hit count"""
+        if not self._hasKey(key):
+            raise KeyError(key)
+        return self._hash[key]._data
+
+    def getHotKeys(self, max_bytes, max_count=None, key_filter=None, half_life=300.0):
+        """Return keys of clean nodes with the most recent hits, up to
+        max_count keys and max_bytes total size.  Hit counts are halved for
+        every half_life seconds since the node's last hit.  If key_filter is
+        given, only keys it returns True for are included."""
+        now = time.time()
+        candidates = []
+        node = self._lru_head
+        while node is not None:
+            if node._isdirty or not self._hasKey(node._id):
+                pass
+            elif key_filter is None or key_filter(node._id):
+                score = node._hits * 0.5 ** ((now - node._last_hit) / half_life)
+                candidates.append((score, node))
+            node = node._next
+        # sort is stable, so equal scores stay in LRU order
+        candidates.sort(key=lambda x: x[0], reverse=True)
+        keys = []
+        total_size = 0
+        for _, node in candidates:
+            if max_count is not None and len(keys) >= max_count:
+                break
+            if total_size + node._mem_size > max_bytes:
+                continue
+            keys.append(node._id)
+            total_size += node._mem_size
+        return keys
+
     def __setitem__(self, key, data):
         log.debug(f"setitem, key: {key}")
         if isinstance(data, numpy.ndarray):
@@ -341,6 +385,7 @@ class LruCache(object):
         node = self._moveToFront(key)
         if node._isdirty:
             self._dirty_size -= node._mem_size
+            self._updateFlushRate(node._mem_size)
         log.debug(f"LRU {self._name} dirty_size: {self._dirty_size}")
         node._isdirty = False
 
@@ -350,6 +395,40 @@ class LruCache(object):
                 # maybe we can free up some memory now
                 self._reduceCache()
 
+    def _updateFlushRate(self, nbytes):
+        """update the average rate at which dirty bytes are being cleared"""
+        now = time.time()
+        self._flush_window_bytes += nbytes
+        elapsed = now - self._flush_window_start
+        if elapsed >= FLUSH_RATE_WINDOW:
+            rate = self._flush_window_bytes / elapsed
+            if self._flush_rate > 0.0:
+                # exponential moving average
+                self._flush_rate = (self._flush_rate + rate) / 2.0
+            else:
+                self._flush_rate = rate
+            self._flush_window_bytes = 0
+            self._flush_window_start = now
+
+    def getSize(self, key):
+        """Return memory size of the given node"""
+        if key not in self._hash:
+            raise KeyError(key)
+        return self._hash[key]._mem_size
+
+    def getUpdateTime(self, key):
+        """Return the time the data for the given node was set"""
+        if key not in self._hash:
+            raise KeyError(key)
+        return self._hash[key]._last_access
+
+    def setUpdateTime(self, key, update_time):
+        """Set the time the data for the given node was set, for data that
+        was copied from another cache"""
+        if key not in self._hash:
+            raise KeyError(key)
+        self._hash[key]._last_access = update_time
+
     def isDirty(self, key):
         """return dirty flag"""
         # don't adjust LRU position
@@ -402,3 +481,8 @@ class LruCache(object):
     @property
     def memDirty(self):
         return self._dirty_size
+
+    @property
+    def flushRate(self):
+        """average bytes/sec of dirty data cleared"""
+        return self._flush_rate
@@ -0,0 +1,747 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# queryUtil.py:
+#
+# Compile dataset query strings, e.g. "(temp > 70) & (wind == b'N 5')" or
+# "date >= 22 where 'temp' in (61, 68, 72)", into plans of numpy operations
+# that can be run on each chunk without re-parsing the query.
+#
+import ast
+import functools
+import operator
+import re
+
+import numpy as np
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+from .zoneMapUtil import decodeKeys
+from .. import config
+from .. import hsds_logger as log
+
+# number of compiled plans to keep
+QUERY_CACHE_SIZE = 256
+
+# numexpr has a startup cost per call, so only use it for larger arrays.
+# It's off unless the query_use_numexpr config is set, since it's
+# slower than numpy for simple compares on a single core
+NUMEXPR_MIN_ROWS = 64 * 1024
+
+# evaluate the right side of an AND or OR on just the undecided rows
+# if they are less than this fraction of the total
+SUBSET_FRACTION = 0.25
+
+_TOKEN_RE = re.compile(
+    r"""\s*(?:
+    (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?) |
+    (?P<bytes>b'[^']*'|b"[^"]*") |
+    (?P<str>'[^']*'|"[^"]*") |
+    (?P<name>[A-Za-z_]\w*) |
+    (?P<op>==|!=|<=|>=|<|>|&|\||\+|-|\*|/|%|\(|\))
+    )""",
+    re.VERBOSE,
+)
+
+_COMPARE_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+_ARITH_OPS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "%": operator.mod,
+}
+
+# field names that are not allowed
+_BLACK_LIST = ("import",)
+
+# field types numexpr can evaluate
+_NUMEXPR_TYPES = ("b1", "i1", "i2", "i4", "i8", "f4", "f8")
+
+# fixed length string sizes that can be compared as unsigned ints
+_UINT_TYPES = {1: "u1", 2: "u2", 4: "u4", 8: "u8"}
+
+
+def _getWhereFieldName(query):
+    """
+    Get the field name for a where clause.
+    Returns None if no where statement
+    """
+    if query.startswith("where "):
+        i = len("where ")
+    else:
+        i = query.find(" where ")
+        if i > 0:
+            i += len(" where ")
+    if i < 0:
+        # no where statement
+        return None
+
+    field_name = ""
+    end_quote_char = None
+    while i < len(query):
+        ch = query[i]
+        i += 1
+        if end_quote_char and ch == end_quote_char:
+            # end of variable
+            end_quote_char = None
+            break
+        elif ch in ("'", '"'):
+            end_quote_char = ch
+            continue
+        if field_name and not ch.isalnum() and not ch == "_" and not end_quote_char:
+            # end of variable
+            break
+        if end_quote_char or ch.isalnum() or ch == "_":
+            field_name += ch
+    if not field_name:
+        # got a where keyword, but no field name
+        raise ValueError("query where with no fieldname")
+    if end_quote_char:
+        raise ValueError("unclosed quote")
+
+    return field_name
+
+
+def _getWhereElements(query):
+    """
+    Get the values from a where clause
+    """
+
+    n = query.find(" in ")
+    if n < 0:
+        raise ValueError("where query with no 'in' keyword")
+    n += 4  # advance past " in "
+    elements = []
+    i = query[n:].find("(")
+    if i < 0:
+        raise ValueError("where in query with no '(' character)")
+    i += n + 1  # advance past '('
+
+    end_quote_char = None
+    s = None
+
+    while i < len(query):
+        ch = query[i]
+        i += 1
+        if end_quote_char and ch == end_quote_char:
+            # end of variable
+            end_quote_char = None
+            if s is None:
+                s = ""
+            elements.append(s)
+            s = None
+            continue
+        if ch in ("'", '"'):
+            end_quote_char = ch
+            if s == "b":
+                # use bytes not str
+                s = b''
+            else:
+                s = ""
+            continue
+        if ch == ",":
+            if s is not None:
+                elements.append(s)
+                s = None
+            continue
+        if ch == ")":
+            if end_quote_char:
+                raise ValueError("unclosed quote in 'where in' list")
+            if s is not None:
+                elements.append(s)
+            break
+        if ch.isspace():
+            if end_quote_char:
+                if isinstance(s, bytes):
+                    ch = ch.encode('utf8')
+                s += ch
+            continue
+        # anything else, just add to our variable
+        if isinstance(s, bytes):
+            ch = ch.encode('utf8')
+        if s is None:
+            s = ch
+        else:
+            s += ch
+
+    if end_quote_char:
+        raise ValueError("unclosed quote")
+
+    return elements
+
+
+def _tokenize(expr):
+    """Return list of (kind, value) tuples for the given query expression"""
+    tokens = []
+    i = 0
+    expr = expr.rstrip()
+    while i < len(expr):
+        m = _TOKEN_RE.match(expr, i)
+        if not m:
+            ch = expr[i:].lstrip()[:1]
+            if ch in ("'", '"', "b"):
+                raise ValueError("no matching quote character")
+            raise ValueError(f"unexpected character: {ch}")
+        kind = m.lastgroup
+        text = m.group(kind)
+        if kind == "num":
+            try:
+                value = int(text)
+            except ValueError:
+                value = float(text)
+        elif kind in ("bytes", "str"):
+            # handle escapes like b'\x00' the way python would
+            try:
+                value = ast.literal_eval(text)
+            except (ValueError, SyntaxError):
+                # e.g. non-ascii chars in a bytes literal
+                value = text[2:-1].encode("utf8") if kind == "bytes" else text[1:-1]
+        elif kind == "name" and text in ("AND", "OR"):
+            kind = "op"
+            value = "&" if text == "AND" else "|"
+        else:
+            value = text
+        tokens.append((kind, value))
+        i = m.end()
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent parser for query expressions.  Produces a tree of
+    tuples: ("field", name), ("const", value), ("neg", node),
+    ("and"|"or", left, right), ("cmp"|"arith", op, left, right).
+    AND and OR bind less tightly than comparisons, so
+    "a > 1 & b < 2" is "(a > 1) & (b < 2)".
+    """
+
+    def __init__(self, tokens, field_names):
+        self._tokens = tokens
+        self._field_names = field_names
+        self._i = 0
+        self.fields = set()
+
+    def _peek(self):
+        if self._i < len(self._tokens):
+            return self._tokens[self._i]
+        return (None, None)
+
+    def _next(self):
+        token = self._peek()
+        self._i += 1
+        return token
+
+    def _isOp(self, *ops):
+        kind, value = self._peek()
+        return kind == "op" and value in ops
+
+    def parse(self):
+        if not self._tokens:
+            raise ValueError("empty query")
+        node = self._parseOr()
+        if self._i < len(self._tokens):
+            kind, value = self._peek()
+            if kind == "op" and value == ")":
+                raise ValueError("Mismatched paren")
+            raise ValueError(f"unexpected token: {value}")
+        return node
+
+    def _parseOr(self):
+        node = self._parseAnd()
+        while self._isOp("|"):
+            self._next()
+            node = ("or", node, self._parseAnd())
+        return node
+
+    def _parseAnd(self):
+        node = self._parseCompare()
+        while self._isOp("&"):
+            self._next()
+            node = ("and", node, self._parseCompare())
+        return node
+
+    def _parseCompare(self):
+        node = self._parseSum()
+        if self._isOp(*_COMPARE_OPS):
+            op = self._next()[1]
+            node = ("cmp", op, node, self._parseSum())
+            if self._isOp(*_COMPARE_OPS):
+                raise ValueError("chained comparisons are not supported")
+        return node
+
+    def _parseSum(self):
+        node = self._parseTerm()
+        while self._isOp("+", "-"):
+            op = self._next()[1]
+            node = ("arith", op, node, self._parseTerm())
+        return node
+
+    def _parseTerm(self):
+        node = self._parseUnary()
+        while self._isOp("*", "/", "%"):
+            op = self._next()[1]
+            node = ("arith", op, node, self._parseUnary())
+        return node
+
+    def _parseUnary(self):
+        if self._isOp("-"):
+            self._next()
+            node = self._parseUnary()
+            if node[0] == "const":
+                return ("const", -node[1])
+            return ("neg", node)
+        return self._parseAtom()
+
+    def _parseAtom(self):
+        kind, value = self._next()
+        if kind is None:
+            raise ValueError("unexpected end of query")
+        if kind in ("num", "str", "bytes"):
+            return ("const", value)
+        if kind == "name":
+            if value not in self._field_names:
+                raise ValueError(f"query variable: {value}")
+            self.fields.add(value)
+            return ("field", value)
+        if value == "(":
+            node = self._parseOr()
+            if not self._isOp(")"):
+                raise ValueError("Mismatched paren")
+            self._next()
+            return node
+        raise ValueError(f"unexpected token: {value}")
+
+
+class _Columns:
+    """Field values for all the rows of an array, or a subset of the rows"""
+
+    def __init__(self, arr, rows=None):
+        self._arr = arr
+        self._rows = rows
+        self._cache = {}
+
+    @property
+    def size(self):
+        if self._rows is None:
+            return self._arr.shape[0]
+        return self._rows.shape[0]
+
+    def get(self, field):
+        col = self._cache.get(field)
+        if col is None:
+            col = self._arr[field]
+            if self._rows is not None:
+                col = col[self._rows]
+            self._cache[field] = col
+        return col
+
+    def subset(self, index):
+        """Return _Columns for the rows at the given positions of this one"""
+        if self._rows is not None:
+            index = self._rows[index]
+        return _Columns(self._arr, rows=index)
+
+
+def _isMask(value, size):
+    return isinstance(value, np.ndarray) and value.dtype == bool and value.shape == (size,)
+
+
+def _compileBytesEqual(node, dtype):
+    """
+    Return a function that does an == or != compare of a fixed length
+    string field with a bytes constant as an unsigned int compare, or
+    None if the node isn't one of those.  Fields are null padded, so
+    padding the constant gives the same result as the string compare.
+    """
+    if node[1] not in ("==", "!=") or node[2][0] != "field" or node[3][0] != "const":
+        return None
+    field = node[2][1]
+    value = node[3][1]
+    field_dt = dtype[field]
+    if field_dt.kind != "S" or field_dt.shape or not isinstance(value, bytes):
+        return None
+    uint_type = _UINT_TYPES.get(field_dt.itemsize)
+    if uint_type is None or len(value) > field_dt.itemsize:
+        return None
+    value = np.frombuffer(value.ljust(field_dt.itemsize, b"\0"), dtype=uint_type)[0]
+    op = _COMPARE_OPS[node[1]]
+    return lambda cols: op(cols.get(field).view(uint_type), value)
+
+
+def _compileNode(node, dtype):
+    """
+    Return (func, owned) for the node, where func(cols) evaluates the node
+    for a _Columns object.  owned is True if func returns a new array that
+    it's safe to update in place.
+    """
+    kind = node[0]
+    if kind == "const":
+        value = node[1]
+        return (lambda cols: value), False
+    if kind == "field":
+        field = node[1]
+        return (lambda cols: cols.get(field)), False
+    if kind == "neg":
+        func, _ = _compileNode(node[1], dtype)
+        return (lambda cols: operator.neg(func(cols))), True
+    if kind == "cmp":
+        # put the field on the left for the bytes compare
+        if node[2][0] == "const" and node[1] in ("==", "!="):
+            node = (kind, node[1], node[3], node[2])
+        func = _compileBytesEqual(node, dtype)
+        if func is not None:
+            return func, True
+    if kind in ("cmp", "arith"):
+        if kind == "cmp":
+            op = _COMPARE_OPS[node[1]]
+        else:
+            op = _ARITH_OPS[node[1]]
+        left, _ = _compileNode(node[2], dtype)
+        right, _ = _compileNode(node[3], dtype)
+        return (lambda cols: op(left(cols), right(cols))), True
+    if kind in ("and", "or"):
+        return _compileLogical(node, dtype)
+    raise ValueError(f"unexpected query node: {kind}")
+
+
+def _compileLogical(node, dtype):
+    """
+    Compile an AND or OR node.  For boolean masks the right side is skipped
+    if the left side decides every row, and evaluated on just the undecided
+    rows if there are few of them.  Other values (e.g. "(flags & 4) > 0")
+    get the bitwise operator.
+    """
+    is_and = node[0] == "and"
+    left, left_owned = _compileNode(node[1], dtype)
+    right, _ = _compileNode(node[2], dtype)
+    bitwise_op = operator.and_ if is_and else operator.or_
+
+    def evaluate(cols):
+        size = cols.size
+        lhs = left(cols)
+        if not _isMask(lhs, size):
+            return bitwise_op(lhs, right(cols))
+        # rows where the right side could change the result
+        undecided = lhs if is_and else ~lhs
+        count = np.count_nonzero(undecided)
+        if count == 0:
+            # lhs may be a field of the chunk, so copy if it's not ours
+            return lhs if left_owned else lhs.copy()
+        if count < size * SUBSET_FRACTION:
+            index = np.flatnonzero(undecided)
+            rhs = right(cols.subset(index))
+            if _isMask(rhs, count):
+                mask = lhs if left_owned else lhs.copy()
+                mask[index] = rhs
+                return mask
+            # not a mask, do the whole array
+        rhs = right(cols)
+        if not _isMask(rhs, size):
+            return bitwise_op(lhs, rhs)
+        logical_op = np.logical_and if is_and else np.logical_or
+        if left_owned:
+            return logical_op(lhs, rhs, out=lhs)
+        return logical_op(lhs, rhs)
+
+    return evaluate, True
+
+
+def _getNumexprStr(node, dtype, field_vars):
+    """
+    Return a numexpr expression for the node, or None if numexpr can't
+    evaluate it.  field_vars is updated with the variable name used
+    for each field.
+    """
+    kind = node[0]
+    if kind == "const":
+        value = node[1]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        return repr(value)
+    if kind == "field":
+        field = node[1]
+        field_dt = dtype[field]
+        if field_dt.shape or field_dt.str[1:] not in _NUMEXPR_TYPES:
+            return None
+        if field not in field_vars:
+            field_vars[field] = f"f{len(field_vars)}"
+        return field_vars[field]
+    if kind == "neg":
+        operand = _getNumexprStr(node[1], dtype, field_vars)
+        if operand is None:
+            return None
+        return f"(-{operand})"
+    if kind in ("and", "or"):
+        # numexpr only does logical and/or
+        for child in node[1:]:
+            if child[0] == "field" and dtype[child[1]] == bool:
+                continue
+            if child[0] not in ("cmp", "and", "or"):
+                return None
+        op = "&" if kind == "and" else "|"
+        lhs = _getNumexprStr(node[1], dtype, field_vars)
+        rhs = _getNumexprStr(node[2], dtype, field_vars)
+    else:
+        op = node[1]
+        lhs = _getNumexprStr(node[2], dtype, field_vars)
+        rhs = _getNumexprStr(node[3], dtype, field_vars)
+    if lhs is None or rhs is None:
+        return None
+    return f"({lhs} {op} {rhs})"
+
+
+def _flipOp(op):
+    """Return the compare op to use when the operands are swapped"""
+    return {"<": ">", "<=": ">=", ">": "<", ">=": "<="}.get(op, op)
+
+
+def _cmpMayMatch(op, field_dt, value, field_stats):
+    """
+    Return False if no row with values in the [min, max, nan_count] range
+    of field_stats can satisfy "field op value".  Compares are done with
+    numpy values of the field type, so the constant is cast the same way
+    as when the query is run on the chunk.
+    """
+    lo, hi, nan_count = field_stats
+    if op == "!=" and nan_count:
+        return True  # nan != value
+    if lo is None:
+        # all nans
+        return op == "!="
+    bounds = np.array((lo, hi), dtype=field_dt)
+    try:
+        if op in (">", ">="):
+            return bool(_COMPARE_OPS[op](bounds[1], value))
+        if op in ("<", "<="):
+            return bool(_COMPARE_OPS[op](bounds[0], value))
+        if op == "==":
+            return bool(bounds[0] <= value and bounds[1] >= value)
+        # !=
+        return not bool(bounds[0] == value and bounds[1] == value)
+    except (TypeError, ValueError, OverflowError):
+        return True
+
+
+def _nodeMayMatch(node, dtype, stats):
+    """Range check of the node against the chunk stats.  True if the node
+    might be true for some row"""
+    kind = node[0]
+    if kind == "and":
+        return _nodeMayMatch(node[1], dtype, stats) and _nodeMayMatch(node[2], dtype, stats)
+    if kind == "or":
+        return _nodeMayMatch(node[1], dtype, stats) or _nodeMayMatch(node[2], dtype, stats)
+    if kind != "cmp":
+        return True
+    op, left, right = node[1:]
+    if left[0] == "const" and right[0] == "field":
+        op = _flipOp(op)
+        left, right = right, left
+    if left[0] != "field" or right[0] != "const":
+        return True
+    field = left[1]
+    value = right[1]
+    if field not in stats or isinstance(value, (str, bytes)):
+        return True
+    return _cmpMayMatch(op, dtype[field], value, stats[field])
+
+
+class QueryPlan:
+    """
+    Compiled form of a query for a given dtype.  Use getIndices to get the
+    indices of the rows of an array that match the query.
+    """
+
+    def __init__(self, query, dtype, use_numexpr=True):
+        self._query = query
+        self._expr = None
+        self._numexpr_str = None
+        self._numexpr_fields = None
+        self._where_field = None
+        self._where_values = None
+        self._where_keys = None
+        self._where_view = None
+        self._tree = None
+        self._dtype = dtype
+
+        field_names = dtype.names
+        if not field_names:
+            raise ValueError("query requires a compound type")
+        for item in _BLACK_LIST:
+            if item in field_names:
+                msg = "invalid field name"
+                log.warn(f"Bad query: {msg}")
+                raise ValueError(msg)
+
+        expr = query
+        if query.startswith("where "):
+            expr = None
+        else:
+            n = query.find(" where ")
+            if n > 0:
+                expr = query[:n]
+
+        where_field = _getWhereFieldName(query)
+        if where_field:
+            if where_field not in field_names:
+                msg = f"where field {where_field} is not a member of dataset type"
+                raise ValueError(msg)
+            where_elements = _getWhereElements(query)
+            if not where_elements:
+                msg = "query: where key word with no elements"
+                raise ValueError(msg)
+            # check that we can convert to our dtype
+            try:
+                where_values = np.array(where_elements, dtype=dtype[where_field])
+            except ValueError:
+                msg = "where elements are not compatible with field datatype"
+                raise ValueError(msg)
+            self._where_field = where_field
+            self._where_values = where_values
+            self._where_keys = np.unique(where_values)
+            field_dt = dtype[where_field]
+            if field_dt.kind == "S" and not field_dt.shape:
+                # compare as ints if we can, like _compileBytesEqual
+                self._where_view = _UINT_TYPES.get(field_dt.itemsize)
+                if self._where_view:
+                    self._where_values = where_values.view(self._where_view)
+
+        if expr:
+            parser = _Parser(_tokenize(expr), field_names)
+            try:
+                tree = parser.parse()
+            except ValueError as ve:
+                log.warn(f"Bad query: {ve}")
+                raise
+            if not parser.fields:
+                msg = "No field value"
+                log.warn("Bad query: " + msg)
+                raise ValueError(msg)
+            self._tree = tree
+            self._expr, _ = _compileNode(tree, dtype)
+            if use_numexpr and numexpr is not None:
+                field_vars = {}
+                self._numexpr_str = _getNumexprStr(tree, dtype, field_vars)
+                self._numexpr_fields = field_vars
+        elif not where_field:
+            raise ValueError("No field value")
+
+    @property
+    def query(self):
+        return self._query
+
+    @property
+    def where_field(self):
+        return self._where_field
+
+    @property
+    def use_numexpr(self):
+        return self._numexpr_str is not None
+
+    def _evaluate(self, cols):
+        """Return the expression result as a boolean mask"""
+        if self._numexpr_str and cols.size >= NUMEXPR_MIN_ROWS:
+            local_dict = {}
+            for field, var in self._numexpr_fields.items():
+                local_dict[var] = cols.get(field)
+            result = numexpr.evaluate(self._numexpr_str, local_dict=local_dict)
+        else:
+            result = self._expr(cols)
+        result = np.asarray(result)
+        if result.ndim == 0:
+            result = np.broadcast_to(result, (cols.size,))
+        return result
+
+    def mayMatch(self, stats):
+        """
+        Return False if the query can't match any row of a chunk with the
+        given stats, a dict of field name to [min, max, nan_count] as
+        returned by zoneMapUtil.getChunkStats.  Fields without stats
+        (e.g. strings) are assumed to match.
+        """
+        if self._tree is not None and not _nodeMayMatch(self._tree, self._dtype, stats):
+            return False
+        field = self._where_field
+        if field is None or self._where_view or field not in stats:
+            return True
+        lo, hi, _ = stats[field]
+        if lo is None:
+            return False  # all nans
+        values = self._where_values
+        bounds = np.array((lo, hi), dtype=values.dtype)
+        return bool(np.any((values >= bounds[0]) & (values <= bounds[1])))
+
+    def getWhereRange(self, index):
+        """
+        Return the (start, stop) range of the rows of a chunk that can have
+        keys in the where list, given the key index for the chunk as
+        returned by zoneMapUtil.getChunkKeyIndex.  (0, 0) means no rows can
+        match.  Returns None if the index can't be used for the query.
+        """
+        field = self._where_field
+        if field is None or not index or index.get(field) is None:
+            return None
+        keys, starts, stops = index[field]
+        keys = decodeKeys(keys, self._dtype[field])
+        values = self._where_keys
+        pos = np.searchsorted(keys, values)
+        in_range = pos < keys.shape[0]
+        pos = pos[in_range]
+        found = pos[keys[pos] == values[in_range]]
+        if found.shape[0] == 0:
+            return (0, 0)
+        start = int(np.asarray(starts)[found].min())
+        stop = int(np.asarray(stops)[found].max())
+        return (start, stop)
+
+    def getIndices(self, arr):
+        """Return the indices of the rows of the one-dimensional array arr
+        that match the query"""
+        cols = _Columns(arr)
+        if self._where_field is None:
+            return np.flatnonzero(self._evaluate(cols))
+        where_col = cols.get(self._where_field)
+        if self._where_view:
+            where_col = where_col.view(self._where_view)
+        isin_mask = np.isin(where_col, self._where_values)
+        indices = np.flatnonzero(isin_mask)
+        if self._expr is None or indices.shape[0] == 0:
+            return indices
+        # just evaluate the rows in the where list
+        result = self._evaluate(cols.subset(indices))
+        return indices[np.flatnonzero(result)]
+
+
+def compileQuery(query, dtype, use_numexpr=True):
+    """Return a QueryPlan for the given query and dtype.  Raises ValueError
+    for invalid queries."""
+    return QueryPlan(query, dtype, use_numexpr=use_numexpr)
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def getQueryPlan(query, dtype):
+    """Return a QueryPlan for the given query and dtype, re-using the plan
+    from a previous call if there is one"""
+    log.debug(f"compiling query: {query}")
+    use_numexpr = config.get("query_use_numexpr", default=False)
+    return compileQuery(query, dtype, use_numexpr=use_numexpr)
@@ -0,0 +1,241 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# shmUtil.py:
+#
+# Shared memory segments for passing chunk selections from DN to SN when
+# both run on the same host.  The SN lends a region of one of its segments
+# with the request, the DN writes the selection there and responds with
+# just the number of bytes written.
+#
+import itertools
+import os
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+from urllib.parse import urlparse
+
+import numpy as np
+
+from .. import hsds_logger as log
+from .httpUtil import isUnixDomainUrl
+
+SEGMENT_PREFIX = "hsds_"
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+_segment_ids = itertools.count()
+
+
+def isSameHost(url):
+    """Return True if the node at url is on this host"""
+    if isUnixDomainUrl(url):
+        return True
+    return urlparse(url).hostname in LOCAL_HOSTS
+
+
+def encodeHandle(name, offset, nbytes):
+    """Return string describing a region of a segment"""
+    return f"{name}:{offset}:{nbytes}"
+
+
+def decodeHandle(handle):
+    """Return (name, offset, nbytes) for a handle string or list.
+    Raises ValueError if it isn't valid"""
+    if isinstance(handle, str):
+        handle = handle.split(":")
+    if not isinstance(handle, (list, tuple)) or len(handle) != 3:
+        raise ValueError(f"invalid shared memory handle: {handle}")
+    name = handle[0]
+    offset = int(handle[1])
+    nbytes = int(handle[2])
+    if not isinstance(name, str) or not name.startswith(SEGMENT_PREFIX):
+        raise ValueError(f"invalid shared memory segment name: {name}")
+    if offset < 0 or nbytes < 0:
+        raise ValueError(f"invalid shared memory region: {handle}")
+    return name, offset, nbytes
+
+
+class ShmLease(object):
+    """A segment lent out by ShmPool for one request"""
+
+    def __init__(self, segment, nbytes):
+        self._segment = segment
+        self._name = segment.name
+        self._nbytes = nbytes
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def getHandle(self, offset=0, nbytes=None):
+        """handle for a region of the segment to pass to the DN"""
+        if nbytes is None:
+            nbytes = self._nbytes - offset
+        return encodeHandle(self.name, offset, nbytes)
+
+    def getArray(self, dtype, shape, offset=0):
+        """Return array of the given type and shape backed by the segment"""
+        return np.ndarray(shape, dtype=dtype, buffer=self._segment.buf, offset=offset)
+
+
+class ShmPool(object):
+    """Shared memory segments an SN lends out for DN responses.
+
+    Segments are created as needed while the total size stays within
+    max_bytes, and go back on the free list when a lease is released.  If a
+    request fails, the DN may still be writing to the segment, so it is
+    dropped rather than reused.  close() unlinks every segment.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, min_segment_size=1024 * 1024):
+        self._max_bytes = max_bytes
+        self._min_segment_size = min_segment_size
+        self._free = []  # segments not lent out
+        self._leased = set()  # names of segments lent out
+        self._segments = {}  # map of name to segment
+        self._size = 0  # total size of segments
+        self._lease_count = 0
+        self._miss_count = 0
+
+    def _create(self, nbytes):
+        size = max(nbytes, self._min_segment_size)
+        name = f"{SEGMENT_PREFIX}{os.getpid()}_{next(_segment_ids)}"
+        segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._segments[name] = segment
+        self._size += segment.size
+        log.debug(f"ShmPool - created segment {name} of {segment.size} bytes")
+        return segment
+
+    def _drop(self, segment):
+        del self._segments[segment.name]
+        self._size -= segment.size
+        try:
+            segment.close()
+        except BufferError:
+            pass  # arrays still use it, the mapping goes when they do
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+    def lease(self, nbytes):
+        """Return a ShmLease of at least nbytes, or None if the pool doesn't
+        have room for it"""
+        if nbytes <= 0 or nbytes > self._max_bytes:
+            self._miss_count += 1
+            return None
+        # smallest free segment that's big enough
+        segment = None
+        for candidate in self._free:
+            if candidate.size >= nbytes and (segment is None or candidate.size < segment.size):
+                segment = candidate
+        if segment is not None:
+            self._free.remove(segment)
+        else:
+            # drop free segments that are too small till there's room
+            while self._free and self._size + nbytes > self._max_bytes:
+                self._drop(self._free.pop(0))
+            if self._size + nbytes > self._max_bytes:
+                self._miss_count += 1
+                return None
+            try:
+                segment = self._create(nbytes)
+            except OSError as oe:
+                log.warn(f"ShmPool - unable to create segment: {oe}")
+                self._miss_count += 1
+                return None
+        self._leased.add(segment.name)
+        self._lease_count += 1
+        return ShmLease(segment, nbytes)
+
+    def release(self, lease, reuse=True):
+        """Return the lease's segment to the pool.  Use reuse=False if the
+        DN might still write to it."""
+        if lease is None or lease.name not in self._leased:
+            return
+        self._leased.remove(lease.name)
+        segment = lease._segment
+        lease._segment = None
+        if reuse:
+            self._free.append(segment)
+        else:
+            self._drop(segment)
+
+    def close(self):
+        """Unlink all segments"""
+        for segment in list(self._segments.values()):
+            self._drop(segment)
+        self._free = []
+        self._leased = set()
+
+    def getStats(self):
+        return {
+            "segment_count": len(self._segments),
+            "size": self._size,
+            "max_bytes": self._max_bytes,
+            "leased": len(self._leased),
+            "lease_count": self._lease_count,
+            "miss_count": self._miss_count,
+        }
+
+
+class ShmAttachments(object):
+    """Segments created by SN processes that this DN has mapped.  Up to
+    max_count stay mapped, least recently used are closed after that."""
+
+    def __init__(self, max_count=64):
+        self._max_count = max_count
+        self._segments = OrderedDict()
+
+    def get(self, name):
+        """Return the SharedMemory object for the given segment name"""
+        segment = self._segments.get(name)
+        if segment is not None:
+            self._segments.move_to_end(name)
+            return segment
+        segment = shared_memory.SharedMemory(name=name)
+        # the creator owns the segment, don't let the resource tracker
+        # unlink it when this process exits
+        if not name.startswith(f"{SEGMENT_PREFIX}{os.getpid()}_"):
+            resource_tracker.unregister(segment._name, "shared_memory")
+        self._segments[name] = segment
+        while len(self._segments) > self._max_count:
+            _, old_segment = self._segments.popitem(last=False)
+            old_segment.close()
+        return segment
+
+    def writeArray(self, handle, arr):
+        """Copy arr to the region described by handle.  Returns the number of
+        bytes written, or None if the array can't be passed in shared memory.
+        Raises ValueError for an invalid handle."""
+        if arr.dtype.hasobject:
+            return None  # vlen data goes in the response body
+        name, offset, nbytes = decodeHandle(handle)
+        if arr.nbytes > nbytes:
+            raise ValueError(f"{arr.nbytes} bytes won't fit in region of {nbytes} bytes")
+        try:
+            segment = self.get(name)
+        except FileNotFoundError:
+            raise ValueError(f"shared memory segment {name} not found")
+        if offset + nbytes > segment.size:
+            raise ValueError(f"region {handle} extends past end of segment")
+        dest = np.ndarray(arr.shape, dtype=arr.dtype, buffer=segment.buf, offset=offset)
+        dest[...] = arr
+        return arr.nbytes
+
+    def close(self):
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = OrderedDict()
@@ -0,0 +1,339 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# append-only write-ahead log for DN dirty objects
+#
+import asyncio
+import json
+import os
+import os.path as pp
+import struct
+import zlib
+
+from .. import hsds_logger as log
+
+# record frame: magic, header length, data length, crc32 of header+data
+WAL_MAGIC = b"HWAL"
+WAL_FRAME = struct.Struct("<4sIQI")
+WAL_SEGMENT_PREFIX = "wal-"
+WAL_SEGMENT_SUFFIX = ".log"
+
+# supported fsync policies
+WAL_FSYNC_POLICIES = ("always", "interval", "never")
+
+
+def _getSegmentName(seg_num):
+    return f"{WAL_SEGMENT_PREFIX}{seg_num:010d}{WAL_SEGMENT_SUFFIX}"
+
+
+def _getSegmentNumber(filename):
+    if not filename.startswith(WAL_SEGMENT_PREFIX):
+        return None
+    if not filename.endswith(WAL_SEGMENT_SUFFIX):
+        return None
+    s = filename[len(WAL_SEGMENT_PREFIX):-len(WAL_SEGMENT_SUFFIX)]
+    if not s.isdigit():
+        return None
+    return int(s)
+
+
+def encodeRecord(header, data=b""):
+    """Return framed bytes for the given header dict and data payload"""
+    header_bytes = json.dumps(header).encode("utf-8")
+    if data is None:
+        data = b""
+    crc = zlib.crc32(data, zlib.crc32(header_bytes))
+    frame = WAL_FRAME.pack(WAL_MAGIC, len(header_bytes), len(data), crc)
+    return frame + header_bytes + data
+
+
+def readRecords(filepath):
+    """Iterate over (offset, header, data) tuples in the given segment file.
+    Iteration stops at the first truncated or corrupted record (e.g. a
+    partial write from a crash).
+    """
+    with open(filepath, "rb") as f:
+        offset = 0
+        while True:
+            frame = f.read(WAL_FRAME.size)
+            if len(frame) < WAL_FRAME.size:
+                if frame:
+                    log.warn(f"WAL {filepath} truncated frame at offset: {offset}")
+                break
+            magic, header_len, data_len, crc = WAL_FRAME.unpack(frame)
+            if magic != WAL_MAGIC:
+                log.warn(f"WAL {filepath} bad magic at offset: {offset}")
+                break
+            header_bytes = f.read(header_len)
+            data = f.read(data_len)
+            if len(header_bytes) != header_len or len(data) != data_len:
+                log.warn(f"WAL {filepath} truncated record at offset: {offset}")
+                break
+            if zlib.crc32(data, zlib.crc32(header_bytes)) != crc:
+                log.warn(f"WAL {filepath} checksum mismatch at offset: {offset}")
+                break
+            header = json.loads(header_bytes.decode("utf-8"))
+            yield (offset, header, data)
+            offset += WAL_FRAME.size + header_len + data_len
+
+
+class WriteAheadLog(object):
+    """Segmented append-only log of object updates.
+
+    Records are buffered by append() and written by commit().  Concurrent
+    callers of commit() share a single write (and fsync) - group commit.
+    Segments are removed by checkpoint() once every object whose latest
+    record lives in the segment has been marked clean.  A segment is also
+    kept while an older segment with records for the same objects is kept,
+    so replay doesn't bring back an older version or a deleted object.
+    """
+
+    def __init__(self, wal_dir, fsync="always", segment_size=64 * 1024 * 1024,
+                 commit_delay=0.0):
+        if fsync not in WAL_FSYNC_POLICIES:
+            raise ValueError(f"unexpected wal fsync policy: {fsync}")
+        if not pp.isdir(wal_dir):
+            os.makedirs(wal_dir)
+        self._wal_dir = wal_dir
+        self._fsync = fsync
+        self._segment_size = segment_size
+        self._commit_delay = commit_delay
+        self._pending = []  # list of (seg_num, bytes) not yet written
+        self._next_lsn = 1
+        self._durable_lsn = 0
+        self._flush_future = None
+        self._obj_segment = {}  # obj_id to segment of latest record
+        self._segment_refs = {}  # segment number to set of dirty obj_ids
+        self._segment_ids = {}  # segment number to set of obj_ids with records
+        self._segment_bytes = 0
+        self._file = None
+        self._file_seg = None
+        self._commit_count = 0
+        self._record_count = 0
+        seg_nums = self.getSegments()
+        if seg_nums:
+            # never append to a segment left behind by a previous run
+            self._seg_num = seg_nums[-1] + 1
+        else:
+            self._seg_num = 0
+
+    def _getSegmentPath(self, seg_num):
+        return pp.join(self._wal_dir, _getSegmentName(seg_num))
+
+    def getSegments(self):
+        """Return sorted list of segment numbers on disk"""
+        seg_nums = []
+        for filename in os.listdir(self._wal_dir):
+            seg_num = _getSegmentNumber(filename)
+            if seg_num is not None:
+                seg_nums.append(seg_num)
+        seg_nums.sort()
+        return seg_nums
+
+    def replay(self):
+        """Iterate over (header, data) for the latest record of each
+        object found in existing segments.  Objects whose latest record is
+        a delete are skipped.
+        """
+        index = {}  # obj_id to (seg_num, offset, is_delete)
+        for seg_num in self.getSegments():
+            filepath = self._getSegmentPath(seg_num)
+            for offset, header, _ in readRecords(filepath):
+                is_delete = header.get("op") == "delete"
+                index[header["id"]] = (seg_num, offset, is_delete)
+        log.info(f"WAL replay - found {len(index)} objects")
+        for obj_id in index:
+            seg_num, offset, is_delete = index[obj_id]
+            if is_delete:
+                continue
+            filepath = self._getSegmentPath(seg_num)
+            with open(filepath, "rb") as f:
+                f.seek(offset)
+                frame = f.read(WAL_FRAME.size)
+                _, header_len, data_len, _ = WAL_FRAME.unpack(frame)
+                header = json.loads(f.read(header_len).decode("utf-8"))
+                data = f.read(data_len)
+            yield (header, data)
+
+    def removeSegments(self, seg_nums=None):
+        """Remove the given segments (or all inactive segments)"""
+        if seg_nums is None:
+            seg_nums = [x for x in self.getSegments() if x != self._file_seg]
+        for seg_num in seg_nums:
+            filepath = self._getSegmentPath(seg_num)
+            log.info(f"WAL removing segment: {filepath}")
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                log.warn(f"WAL segment: {filepath} not found")
+            if seg_num in self._segment_refs:
+                del self._segment_refs[seg_num]
+            if seg_num in self._segment_ids:
+                del self._segment_ids[seg_num]
+
+    def append(self, obj_id, op="put", header=None, data=b""):
+        """Buffer a record for obj_id and return its log sequence number"""
+        if header is None:
+            header = {}
+        header["id"] = obj_id
+        header["op"] = op
+        record = encodeRecord(header, data=data)
+        if self._segment_bytes > 0 and \
+                self._segment_bytes + len(record) > self._segment_size:
+            # roll over to a new segment
+            self._seg_num += 1
+            self._segment_bytes = 0
+        seg_num = self._seg_num
+        self._segment_bytes += len(record)
+        self._pending.append((seg_num, record))
+
+        # track which segment holds the latest record for this object
+        old_seg = self._obj_segment.get(obj_id)
+        if old_seg is not None and old_seg in self._segment_refs:
+            self._segment_refs[old_seg].discard(obj_id)
+        if op == "delete":
+            if obj_id in self._obj_segment:
+                del self._obj_segment[obj_id]
+        else:
+            self._obj_segment[obj_id] = seg_num
+        if seg_num not in self._segment_refs:
+            self._segment_refs[seg_num] = set()
+            self._segment_ids[seg_num] = set()
+        self._segment_ids[seg_num].add(obj_id)
+        if op != "delete":
+            self._segment_refs[seg_num].add(obj_id)
+
+        lsn = self._next_lsn
+        self._next_lsn += 1
+        self._record_count += 1
+        return lsn
+
+    def _write(self, records):
+        # runs in executor thread - only one invocation at a time
+        for seg_num, record in records:
+            if self._file is None or self._file_seg != seg_num:
+                if self._file is not None:
+                    if self._fsync != "never":
+                        os.fsync(self._file.fileno())
+                    self._file.close()
+                self._file = open(self._getSegmentPath(seg_num), "ab")
+                self._file_seg = seg_num
+            self._file.write(record)
+        if self._file is not None:
+            self._file.flush()
+            if self._fsync != "never":
+                os.fsync(self._file.fileno())
+
+    async def commit(self, lsn=None):
+        """Wait until all records up to lsn are written to the log.
+        Callers arriving while a write is in progress are batched into
+        the next write."""
+        if lsn is None:
+            lsn = self._next_lsn - 1
+        loop = asyncio.get_running_loop()
+        while self._durable_lsn < lsn:
+            if self._flush_future is not None:
+                await asyncio.shield(self._flush_future)
+                continue
+            self._flush_future = loop.create_future()
+            try:
+                if self._commit_delay > 0:
+                    # give other writers a chance to join this commit
+                    await asyncio.sleep(self._commit_delay)
+                records = self._pending
+                self._pending = []
+                last_lsn = self._next_lsn - 1
+                if records:
+                    try:
+                        await loop.run_in_executor(None, self._write, records)
+                    except OSError as oe:
+                        log.error(f"WAL write failed: {oe}")
+                        # put records back so the next commit will retry
+                        self._pending = records + self._pending
+                        raise
+                    self._commit_count += 1
+                self._durable_lsn = last_lsn
+            finally:
+                future = self._flush_future
+                self._flush_future = None
+                future.set_result(None)
+
+    def markClean(self, obj_id):
+        """Object has been persisted - its records are no longer needed"""
+        seg_num = self._obj_segment.get(obj_id)
+        if seg_num is None:
+            return
+        del self._obj_segment[obj_id]
+        if seg_num in self._segment_refs:
+            self._segment_refs[seg_num].discard(obj_id)
+
+    def checkpoint(self):
+        """Remove segments that no longer hold records for dirty objects.
+        Return number of segments removed."""
+        if not self._obj_segment and not self._pending and self._flush_future is None:
+            # everything is clean - start over with a fresh segment
+            self.close()
+            seg_nums = self.getSegments()
+            if seg_nums:
+                self.removeSegments(seg_nums)
+                self._seg_num += 1
+                self._segment_bytes = 0
+            return len(seg_nums)
+        removable = []
+        kept_ids = set()  # obj_ids with records in the segments being kept
+        for seg_num in self.getSegments():
+            seg_ids = self._segment_ids.get(seg_num, set())
+            if seg_num >= self._seg_num or seg_num == self._file_seg:
+                pass  # don't remove the active segment
+            elif self._pending and seg_num >= self._pending[0][0]:
+                pass  # records still to be written
+            elif self._segment_refs.get(seg_num):
+                pass  # still needed for recovery
+            elif kept_ids.isdisjoint(seg_ids):
+                removable.append(seg_num)
+                continue
+            # else an older segment that is kept has records for the same
+            # objects - without this one replay would use the older record
+            kept_ids.update(seg_ids)
+        if removable:
+            self.removeSegments(removable)
+        return len(removable)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_seg = None
+
+    @property
+    def fsyncPolicy(self):
+        return self._fsync
+
+    @property
+    def dirtyCount(self):
+        return len(self._obj_segment)
+
+    @property
+    def pendingCount(self):
+        return len(self._pending)
+
+    @property
+    def segmentCount(self):
+        return len(self.getSegments())
+
+    @property
+    def commitCount(self):
+        return self._commit_count
+
+    @property
+    def recordCount(self):
+        return self._record_count
@@ -0,0 +1,166 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# writeConcurrency.py:
+#
+# AIMD control of the number of concurrent storage writes
+#
+import time
+
+from .. import hsds_logger as log
+
+
+class WriteConcurrency(object):
+    """Adjust the number of concurrent writes between min_count and max_count.
+
+    Completed writes are grouped into rounds of limit writes.  At the end of
+    each round the limit is increased by one (or doubled till the first
+    backoff) unless a write failed, or latency went up without a matching
+    gain in throughput, in which case the limit is cut by decrease_factor.
+    """
+
+    def __init__(
+        self,
+        min_count=1,
+        max_count=100,
+        latency_factor=2.0,
+        decrease_factor=0.5,
+    ):
+        if min_count < 1:
+            min_count = 1
+        if max_count < min_count:
+            max_count = min_count
+        self._min_count = min_count
+        self._max_count = max_count
+        self._latency_factor = latency_factor
+        self._decrease_factor = decrease_factor
+        self._limit = min_count
+        self._slow_start = True
+        self._base_latency = None  # lowest round latency seen
+        self._throughput = 0.0  # bytes/sec for the last round
+        self._bandwidth = 0.0  # moving average of throughput
+        self._latency = 0.0  # average latency for the last round
+        self._write_count = 0
+        self._error_count = 0
+        self._resetRound()
+
+    def _resetRound(self):
+        self._round_start = time.time()
+        self._round_count = 0
+        self._round_bytes = 0
+        self._round_latency = 0.0
+        self._round_errors = 0
+
+    def _decrease(self):
+        limit = int(self._limit * self._decrease_factor)
+        if limit < self._min_count:
+            limit = self._min_count
+        self._limit = limit
+        self._slow_start = False
+
+    def _increase(self):
+        if self._slow_start:
+            limit = self._limit * 2
+        else:
+            limit = self._limit + 1
+        if limit > self._max_count:
+            limit = self._max_count
+        self._limit = limit
+
+    def _endRound(self):
+        elapsed = time.time() - self._round_start
+        if elapsed <= 0.0:
+            elapsed = 0.001
+        completed = self._round_count - self._round_errors
+        if completed > 0:
+            latency = self._round_latency / completed
+        else:
+            latency = 0.0
+        throughput = self._round_bytes / elapsed
+        prev_throughput = self._throughput
+        prev_limit = self._limit
+
+        if self._round_errors > 0:
+            self._decrease()
+        elif completed > 0:
+            if self._base_latency is None or latency < self._base_latency:
+                self._base_latency = latency
+            else:
+                # let the baseline drift up slowly in case storage
+                # has gotten slower overall
+                self._base_latency *= 1.01
+            latency_limit = self._base_latency * self._latency_factor
+            if latency > latency_limit and throughput <= prev_throughput:
+                # queuing in storage without any gain
+                self._decrease()
+            else:
+                self._increase()
+
+        self._latency = latency
+        self._throughput = throughput
+        if self._bandwidth > 0.0:
+            self._bandwidth = (self._bandwidth + throughput) / 2.0
+        else:
+            self._bandwidth = throughput
+        if self._limit != prev_limit:
+            msg = f"WriteConcurrency - limit {prev_limit} -> {self._limit}, "
+            msg += f"latency: {latency:.3f}, throughput: {int(throughput)} bytes/s, "
+            msg += f"errors: {self._round_errors}"
+            log.info(msg)
+        self._resetRound()
+
+    def record(self, nbytes, elapsed):
+        """record a successful write of nbytes that took elapsed seconds"""
+        self._write_count += 1
+        self._round_count += 1
+        self._round_bytes += nbytes
+        self._round_latency += elapsed
+        if self._round_count >= self._limit:
+            self._endRound()
+
+    def recordError(self):
+        """record a failed or timed out write"""
+        self._error_count += 1
+        self._round_count += 1
+        self._round_errors += 1
+        if self._round_count >= self._limit:
+            self._endRound()
+
+    @property
+    def limit(self):
+        """number of writes that can be in flight"""
+        return self._limit
+
+    @property
+    def minCount(self):
+        return self._min_count
+
+    @property
+    def maxCount(self):
+        return self._max_count
+
+    @property
+    def latency(self):
+        return self._latency
+
+    @property
+    def bandwidth(self):
+        """average write bytes/sec"""
+        return self._bandwidth
+
+    @property
+    def writeCount(self):
+        return self._write_count
+
+    @property
+    def errorCount(self):
+        return self._error_count
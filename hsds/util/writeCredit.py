@@ -0,0 +1,113 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# writeCredit.py:
+#
+# Track the write credit each DN has published so the SN can pace chunk
+# writes rather than having the DN reject them with a 503
+#
+import asyncio
+import time
+
+from .. import hsds_logger as log
+
+
+class WriteCredit(object):
+    """Write credit for one DN.
+
+    credit is the number of bytes the DN reported it could accept when it
+    last responded, and flush_rate is the rate (bytes/sec) at which it
+    reported writing dirty chunks to storage.  Between responses the credit
+    is assumed to refill at the flush rate.  Bytes for requests that are
+    still in flight are charged against the credit.
+    """
+
+    def __init__(self, name="", min_wait=0.01, max_wait=1.0):
+        self._name = name
+        self._credit = None  # unknown till the DN tells us
+        self._flush_rate = 0.0
+        self._updated = time.time()
+        self._inflight = 0
+        self._min_wait = min_wait
+        self._max_wait = max_wait
+        self._wait_count = 0
+
+    def update(self, credit, flush_rate=None):
+        """set credit and flush rate from a DN response"""
+        self._credit = credit
+        if flush_rate is not None:
+            self._flush_rate = flush_rate
+        self._updated = time.time()
+
+    def _getAvailable(self):
+        """estimated number of bytes the DN can accept now"""
+        if self._credit is None:
+            return None
+        elapsed = time.time() - self._updated
+        available = self._credit + int(self._flush_rate * elapsed)
+        available -= self._inflight
+        return available
+
+    def hasCredit(self, nbytes):
+        """return True if a request of nbytes can be sent now"""
+        if self._inflight == 0:
+            # always let one request through so we get an updated credit
+            return True
+        available = self._getAvailable()
+        if available is None:
+            return True
+        return available >= nbytes
+
+    def getWait(self, nbytes):
+        """time to wait before trying to send nbytes again"""
+        available = self._getAvailable()
+        if available is None or self._flush_rate <= 0.0:
+            return self._max_wait
+        wait = (nbytes - available) / self._flush_rate
+        if wait < self._min_wait:
+            wait = self._min_wait
+        if wait > self._max_wait:
+            wait = self._max_wait
+        return wait
+
+    async def acquire(self, nbytes):
+        """wait till nbytes can be sent to the DN and charge them to the credit"""
+        while not self.hasCredit(nbytes):
+            wait = self.getWait(nbytes)
+            msg = f"WriteCredit {self._name} - waiting {wait:.3f}s for {nbytes} bytes, "
+            msg += f"available: {self._getAvailable()}, inflight: {self._inflight}"
+            log.debug(msg)
+            self._wait_count += 1
+            await asyncio.sleep(wait)
+        self._inflight += nbytes
+
+    def release(self, nbytes):
+        """request of nbytes has completed"""
+        self._inflight -= nbytes
+        if self._inflight < 0:
+            self._inflight = 0
+
+    @property
+    def credit(self):
+        return self._credit
+
+    @property
+    def flushRate(self):
+        return self._flush_rate
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    @property
+    def waitCount(self):
+        return self._wait_count
@@ -0,0 +1,183 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# zoneMapUtil.py:
+#
+# Per-chunk min/max "zone maps" for the numeric fields of one-dimensional
+# compound datasets.  DNs compute the stats for each chunk they write to
+# storage and send them to the DN that owns the dataset, which keeps them
+# in a per-dataset stats object: db/<root>/d/<dset>/.stats.json.  Queries
+# use the stats to skip chunks that can't have any matching rows.
+#
+# Datasets can also opt in to a key index on some fields with the
+# "indexedFields" creation property.  For each chunk the index has the
+# sorted distinct keys of the field and the range of rows each key is
+# found in, so "where field in (...)" queries just read the chunks, and
+# rows within chunks, that have the requested keys.
+#
+import numpy as np
+
+from .hdf5dtype import createDataType
+from .idUtil import getS3Key, isSchema2Id
+
+# field kinds that get min/max stats
+ZONE_MAP_KINDS = ("i", "u", "f")
+
+# field kinds that can be indexed
+INDEX_KINDS = ("i", "u", "S")
+
+_STATS_SUFFIX = ".stats.json"
+
+
+def getZoneMapFields(dtype):
+    """Return the names of the fields of dtype that get stats"""
+    if not dtype.names:
+        return []
+    fields = []
+    for name in dtype.names:
+        field_dt = dtype[name]
+        if field_dt.shape or field_dt.kind not in ZONE_MAP_KINDS:
+            continue
+        fields.append(name)
+    return fields
+
+
+def isZoneMapType(dtype, rank):
+    """Return True if datasets with the given dtype and rank get zone maps"""
+    if rank != 1:
+        return False
+    return len(getZoneMapFields(dtype)) > 0
+
+
+def isZoneMapDataset(dset_json):
+    """Return True if the dataset gets a zone map"""
+    if not isSchema2Id(dset_json["id"]):
+        return False
+    if getIndexedFields(dset_json):
+        return True
+    dset_dtype = createDataType(dset_json["type"])
+    rank = len(dset_json["shape"].get("dims", ()))
+    return isZoneMapType(dset_dtype, rank)
+
+
+def getIndexedFields(dset_json):
+    """Return the list of fields the dataset has opted in to indexing"""
+    cprops = dset_json.get("creationProperties")
+    if not cprops:
+        return []
+    return cprops.get("indexedFields", [])
+
+
+def checkIndexedFields(fields, dtype, rank):
+    """Raise ValueError if fields isn't a valid "indexedFields" creation
+    property for datasets with the given dtype and rank"""
+    if not isinstance(fields, list):
+        raise ValueError("indexedFields should be a list of field names")
+    if rank != 1 or not dtype.names:
+        raise ValueError("indexedFields requires a one-dimensional compound dataset")
+    for field in fields:
+        if field not in dtype.names:
+            raise ValueError(f"indexedFields - {field} is not a field of the dataset type")
+        field_dt = dtype[field]
+        if field_dt.shape or field_dt.kind not in INDEX_KINDS:
+            raise ValueError(f"indexedFields - field {field} can't be indexed")
+    if len(set(fields)) != len(fields):
+        raise ValueError("indexedFields has duplicate field names")
+
+
+def getZoneMapKey(dset_id):
+    """Return the storage key for the stats object of the given dataset"""
+    dset_key = getS3Key(dset_id)
+    if not dset_key.endswith("/.dataset.json"):
+        raise ValueError(f"no zone map for dataset: {dset_id}")
+    return dset_key[: -len(".dataset.json")] + _STATS_SUFFIX
+
+
+def getChunkCoordKey(chunk_id):
+    """Return the key used for a chunk in the stats object,
+    e.g. "12" for chunk "c-..._12" """
+    chunk_id = str(chunk_id)
+    index = chunk_id.find("_")
+    if index < 0:
+        raise ValueError(f"unexpected chunk id: {chunk_id}")
+    return chunk_id[(index + 1):]
+
+
+def getChunkStats(arr):
+    """
+    Return a dict of field name to [min, max, nan_count] for the numeric
+    fields of the one-dimensional compound array arr.  min and max are
+    None if every value is nan.  Returns None if arr doesn't get stats.
+    """
+    if arr is None or not isZoneMapType(arr.dtype, arr.ndim) or arr.shape[0] == 0:
+        return None
+    stats = {}
+    for name in getZoneMapFields(arr.dtype):
+        col = arr[name]
+        nan_count = 0
+        if col.dtype.kind == "f":
+            nans = np.isnan(col)
+            nan_count = int(np.count_nonzero(nans))
+            if nan_count == col.shape[0]:
+                stats[name] = [None, None, nan_count]
+                continue
+            if nan_count:
+                col = col[~nans]
+        stats[name] = [col.min().item(), col.max().item(), nan_count]
+    return stats
+
+
+def _encodeKeys(keys):
+    """Return a list of the keys that can be stored as json"""
+    if keys.dtype.kind == "S":
+        return [key.decode("latin-1") for key in keys.tolist()]
+    return keys.tolist()
+
+
+def decodeKeys(keys, dtype):
+    """Return a numpy array of the given dtype for a key list returned by
+    getChunkKeyIndex"""
+    if dtype.kind == "S":
+        keys = [key.encode("latin-1") for key in keys]
+    return np.array(keys, dtype=dtype)
+
+
+def getChunkKeyIndex(arr, fields, max_keys=None):
+    """
+    Return a dict of field name to [keys, starts, stops] for the given
+    fields of the one-dimensional compound array arr.  keys is the sorted
+    list of distinct values, and rows with keys[i] are all found in
+    arr[starts[i]:stops[i]].  If a field has more than max_keys distinct
+    values, its index is None.  Returns None if arr doesn't get an index.
+    """
+    if arr is None or arr.ndim != 1 or not arr.dtype.names or arr.shape[0] == 0:
+        return None
+    index = {}
+    for field in fields:
+        if field not in arr.dtype.names:
+            continue
+        col = arr[field]
+        # stable sort, so the first and last row of each run are the first
+        # and last rows with that key
+        order = np.argsort(col, kind="stable")
+        col_sorted = col[order]
+        run_starts = np.flatnonzero(col_sorted[1:] != col_sorted[:-1]) + 1
+        run_starts = np.concatenate(([0], run_starts))
+        if max_keys is not None and run_starts.shape[0] > max_keys:
+            index[field] = None
+            continue
+        run_stops = np.concatenate((run_starts[1:], [col.shape[0]]))
+        keys = _encodeKeys(col_sorted[run_starts])
+        starts = order[run_starts].tolist()
+        stops = (order[run_stops - 1] + 1).tolist()
+        index[field] = [keys, starts, stops]
+    return index
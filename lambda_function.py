@@ -68,6 +68,58 @@ def getEventBody(event):
     return body
 
 
+def getResult(status_code, rsp_headers, content):
+    # convert response to lambda result
+    result = {}
+    result["isBase64Encoded"] = False
+    result["statusCode"] = status_code
+    # convert case-insisitive headers to dict
+    result["headers"] = json.dumps(dict(rsp_headers))
+
+    if status_code in (200, 201):
+        if not content:
+            pass  # empty response text
+        elif rsp_headers.get("Content-Type") == "application/octet-stream":
+            # hexencode the response
+            result["body"] = content.hex()
+            result["isBase64Encoded"] = True
+        else:
+            # should be json
+            try:
+                rsp_json = json.loads(content)
+                result["body"] = rsp_json
+            except json.JSONDecodeError:
+                print(f"unexpected response: {content}")
+                result["statusCode"] = 500
+    else:
+        body = {"statusCode": status_code}
+        result["body"] = json.dumps(body)
+    return result
+
+
+def invoke_in_process(function_name, method, path, params=None, headers=None, body=None,
+                      readonly=False):
+    # invoke given request with the service and data nodes in this process
+    # imported here so the sub-process path doesn't load the node code
+    from hsds.node_runner import removeSitePackages
+
+    # as with --removesitepackages for the sub-process nodes, make sure the
+    # packages installed in the image are used rather than the user site ones
+    removeSitePackages()
+    from hsds.hsds_engine import HsdsEngine
+
+    print(f"invoke in process: {path}")
+    hsds = HsdsEngine(username=function_name, password="lambda", readonly=readonly)
+    try:
+        hsds.run()
+        rsp = hsds.invoke(method, path, params=params, headers=headers, body=body)
+        print(f"got status_code: {rsp.status} from req: {path}")
+        result = getResult(rsp.status, rsp.headers, rsp.body)
+    finally:
+        hsds.stop()
+    return result
+
+
 def invoke(hsds, method, path, params=None, headers=None, body=None):
     # invoke given request
     req = hsds.endpoint + path
@@ -89,30 +141,7 @@ def invoke(hsds, method, path, params=None, headers=None, body=None):
                 return {"status_code": 400, "error": err_msg}
 
             print(f"got status_code: {rsp.status_code} from req: {req}")
-
-            result["isBase64Encoded"] = False
-            result["statusCode"] = rsp.status_code
-            # convert case-insisitive headers to dict
-            result["headers"] = json.dumps(dict(rsp.headers))
-
-            if rsp.status_code in (200, 201):
-                if rsp.text is None or len(rsp.text) == 0:
-                    pass  # empty response text
-                elif rsp.headers.get("Content-Type") == "application/octet-stream":
-                    # hexencode the response
-                    result["body"] = rsp.content.hex()
-                    result["isBase64Encoded"] = True
-                else:
-                    # should be json
-                    try:
-                        rsp_json = json.loads(rsp.text)
-                        result["body"] = rsp_json
-                    except json.JSONDecodeError:
-                        print(f"unexpected response: {rsp.text}")
-                        result["statusCode"] = 500
-            else:
-                body = {"statusCode": rsp.status_code}
-                result["body"] = json.dumps(body)
+            result = getResult(rsp.status_code, rsp.headers, rsp.content)
 
         except Exception as e:
             print(f"got exception: {e}, quitting")
@@ -123,6 +152,51 @@ def invoke(hsds, method, path, params=None, headers=None, body=None):
     return result
 
 
+def invoke_sub_process(function_name, method, path, params=None, headers=None, body=None,
+                       readonly=False):
+    # invoke given request with the service and data nodes in sub-processes
+    cpu_count = multiprocessing.cpu_count()
+    if "TARGET_DN_COUNT" in os.environ:
+        target_dn_count = int(os.environ["TARGET_DN_COUNT"])
+    else:
+        # base dn count on half the VCPUs (rounded up)
+        target_dn_count = -(-cpu_count // 2)
+
+    tmp_dir = "/tmp"
+    rand_name = uuid.uuid4().hex[:8]
+    socket_dir = f"{tmp_dir}/hs{rand_name}/"
+
+    # instantiate hsdsapp object
+    hsds = HsdsApp(
+        username=function_name,
+        password="lambda",
+        islambda=True,
+        dn_count=target_dn_count,
+        readonly=readonly,
+        socket_dir=socket_dir,
+    )
+    hsds.run()
+
+    # wait for server to startup
+    waiting_on_ready = True
+
+    while waiting_on_ready:
+        try:
+            time.sleep(0.1)
+            hsds.check_processes()
+        except Exception as e:
+            print(f"got exception: {e}")
+            break
+        if hsds.ready:
+            waiting_on_ready = False
+            print("READY! use endpoint:", hsds.endpoint)
+
+    result = invoke(hsds, method, path, params=params, headers=headers, body=body)
+    hsds.check_processes()
+    hsds.stop()
+    return result
+
+
 def lambda_handler(event, context):
     # setup logging
     if "LOG_LEVEL" in os.environ:
@@ -203,45 +277,13 @@ def lambda_handler(event, context):
         print(err_msg)
         return {"status_code": 400, "error": err_msg}
 
-    cpu_count = multiprocessing.cpu_count()
-    if "TARGET_DN_COUNT" in os.environ:
-        target_dn_count = int(os.environ["TARGET_DN_COUNT"])
+    if os.environ.get("IN_PROCESS"):
+        # no sub-processes to start up, just run the request
+        result = invoke_in_process(function_name, method, req, params=params,
+                                   headers=headers, body=body, readonly=readonly)
     else:
-        # base dn count on half the VCPUs (rounded up)
-        target_dn_count = -(-cpu_count // 2)
-
-    tmp_dir = "/tmp"
-    rand_name = uuid.uuid4().hex[:8]
-    socket_dir = f"{tmp_dir}/hs{rand_name}/"
-
-    # instantiate hsdsapp object
-    hsds = HsdsApp(
-        username=function_name,
-        password="lambda",
-        islambda=True,
-        dn_count=target_dn_count,
-        readonly=readonly,
-        socket_dir=socket_dir,
-    )
-    hsds.run()
-
-    # wait for server to startup
-    waiting_on_ready = True
-
-    while waiting_on_ready:
-        try:
-            time.sleep(0.1)
-            hsds.check_processes()
-        except Exception as e:
-            print(f"got exception: {e}")
-            break
-        if hsds.ready:
-            waiting_on_ready = False
-            print("READY! use endpoint:", hsds.endpoint)
-
-    result = invoke(hsds, method, req, params=params, headers=headers, body=body)
-    hsds.check_processes()
-    hsds.stop()
+        result = invoke_sub_process(function_name, method, req, params=params,
+                                    headers=headers, body=body, readonly=readonly)
 
     if "requestContext" in event:
         # Invoked from API Gateway - we need to stringify the result
@@ -17,12 +17,17 @@ PYTHON_CMD = "python"  # change to "python3" if "python" invokes python version
 
 unit_tests = ('array_util_test', 'chunk_util_test', 'compression_test', 'domain_util_test',
               'dset_util_test', 'hdf5_dtype_test', 'id_util_test', 'lru_cache_test',
-              'shuffle_test', 'rangeget_util_test')
+              'shuffle_test', 'rangeget_util_test', 'write_ahead_log_test',
+              'write_credit_test', 'write_concurrency_test', 'batch_util_test',
+              'dn_concurrency_test', 'dn_partition_test', 'shm_util_test', 'in_process_test',
+              'rpc_encoding_test', 'query_util_test',
+              'zone_map_util_test', 'aggregate_util_test', 'chunk_crawl_test',
+              'datanode_lib_test', 'handoff_test', 'chunk_sn_test')
 
 integ_tests = ('uptest', 'setup_test', 'domain_test', 'group_test',
                'link_test', 'attr_test', 'datatype_test', 'dataset_test',
                'acl_test', 'value_test',  # 'filter_test',
-               'pointsel_test', 'query_test', 'vlen_test')
+               'pointsel_test', 'query_test', 'vlen_test', 'aggregate_test')
 
 skip_unit = False
 if len(sys.argv) > 1:
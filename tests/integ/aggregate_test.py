@@ -0,0 +1,192 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import unittest
+import json
+import warnings
+import numpy as np
+import helper
+
+
+class AggregateTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(AggregateTest, self).__init__(*args, **kwargs)
+        self.base_domain = helper.getTestDomainName(self.__class__.__name__)
+        helper.setupDomain(self.base_domain)
+        self.endpoint = helper.getEndpoint()
+
+    def setUp(self):
+        self.session = helper.getSession()
+
+    def tearDown(self):
+        if self.session:
+            self.session.close()
+
+    def createDataset(self, payload):
+        headers = helper.getRequestHeaders(domain=self.base_domain)
+        req = self.endpoint + "/"
+        rsp = self.session.get(req, headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+        root_uuid = json.loads(rsp.text)["root"]
+
+        req = self.endpoint + "/datasets"
+        rsp = self.session.post(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 201)  # create dataset
+        dset_uuid = json.loads(rsp.text)["id"]
+        self.assertTrue(helper.validateId(dset_uuid))
+
+        # link new dataset
+        name = "dset" + helper.getRandomName()
+        req = self.endpoint + "/groups/" + root_uuid + "/links/" + name
+        payload = {"id": dset_uuid}
+        rsp = self.session.put(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 201)
+        return dset_uuid
+
+    def getAggregate(self, dset_uuid, params, status_code=200):
+        headers = helper.getRequestHeaders(domain=self.base_domain)
+        req = self.endpoint + "/datasets/" + dset_uuid + "/aggregate"
+        rsp = self.session.get(req, params=params, headers=headers)
+        self.assertEqual(rsp.status_code, status_code)
+        if status_code != 200:
+            return None
+        rspJson = json.loads(rsp.text)
+        self.assertEqual(rspJson["op"], params["op"])
+        self.assertTrue("hrefs" in rspJson)
+        return rspJson["value"]
+
+    def testAggregate(self):
+        print("testAggregate", self.base_domain)
+        headers_bin_req = helper.getRequestHeaders(domain=self.base_domain)
+        headers_bin_req["Content-Type"] = "application/octet-stream"
+
+        # 4MB dataset with 1MB chunks
+        dims = [1024, 1024]
+        payload = {"type": "H5T_IEEE_F32LE", "shape": dims}
+        payload["creationProperties"] = {
+            "fillValue": 2.0,
+            "layout": {"class": "H5D_CHUNKED", "dims": [512, 512]},
+        }
+        dset_uuid = self.createDataset(payload)
+        req = self.endpoint + "/datasets/" + dset_uuid
+        headers = helper.getRequestHeaders(domain=self.base_domain)
+        rsp = self.session.get(req, headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(json.loads(rsp.text)["layout"]["dims"], [512, 512])
+
+        # write the top half, the rest is the fill value
+        arr = np.full(dims, 2.0, dtype="f4")
+        arr[:512, :] = np.arange(512 * 1024, dtype="f4").reshape((512, 1024)) % 1000
+        arr[3, :] = np.nan
+        arr[100:200, 7] = np.nan
+        req = self.endpoint + "/datasets/" + dset_uuid + "/value"
+        params = {"select": "[0:512,:]"}
+        data = arr[:512, :].tobytes()
+        rsp = self.session.put(req, data=data, params=params, headers=headers_bin_req)
+        self.assertEqual(rsp.status_code, 200)
+
+        arr = arr.astype("f8")
+        values = arr[~np.isnan(arr)]
+        expected = {
+            "count": values.size,
+            "sum": values.sum(),
+            "min": values.min(),
+            "max": values.max(),
+            "mean": values.mean(),
+        }
+        for op, value in expected.items():
+            self.assertAlmostEqual(self.getAggregate(dset_uuid, {"op": op}), value, places=2)
+
+        # with a selection and an axis
+        sel = arr[2:600:3, 5:900]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for op in ("count", "sum", "min", "max", "mean"):
+                for axis in (0, 1):
+                    params = {"op": op, "select": "[2:600:3,5:900]", "axis": axis}
+                    value = self.getAggregate(dset_uuid, params)
+                    if op == "count":
+                        expected = np.count_nonzero(~np.isnan(sel), axis=axis)
+                    else:
+                        expected = getattr(np, "nan" + op)(sel, axis=axis)
+                    # nans in the response are None
+                    value = np.array(value, dtype="f8")
+                    np.testing.assert_allclose(value, expected, rtol=1e-6)
+
+        # histogram
+        params = {"op": "histogram", "bins": 4, "range": "0:1000"}
+        value = self.getAggregate(dset_uuid, params)
+        hist, bin_edges = np.histogram(values, bins=4, range=(0, 1000))
+        self.assertEqual(value["hist"], hist.tolist())
+        self.assertEqual(value["bin_edges"], bin_edges.tolist())
+        # the range defaults to the min and max of the selection
+        params = {"op": "histogram", "bins": 5, "select": "[500:520,:]"}
+        value = self.getAggregate(dset_uuid, params)
+        sel = arr[500:520, :]
+        hist, bin_edges = np.histogram(sel, bins=5, range=(sel.min(), sel.max()))
+        self.assertEqual(value["hist"], hist.tolist())
+        self.assertEqual(value["bin_edges"], bin_edges.tolist())
+
+        # bad requests
+        bad_params = (
+            {},
+            {"op": "median"},
+            {"op": "sum", "axis": 2},
+            {"op": "sum", "axis": "x"},
+            {"op": "histogram", "axis": 0},
+            {"op": "histogram", "range": "5:1"},
+        )
+        for params in bad_params:
+            self.getAggregate(dset_uuid, params, status_code=400)
+
+    def testAggregateCompound(self):
+        print("testAggregateCompound", self.base_domain)
+        headers = helper.getRequestHeaders(domain=self.base_domain)
+
+        fields = (
+            {"name": "date", "type": "H5T_STD_I32LE"},
+            {"name": "symbol", "type": {"class": "H5T_STRING", "charSet": "H5T_CSET_ASCII",
+                                        "length": 4, "strPad": "H5T_STR_NULLPAD"}},
+            {"name": "temp", "type": "H5T_IEEE_F32LE"},
+        )
+        datatype = {"class": "H5T_COMPOUND", "fields": fields}
+        dset_uuid = self.createDataset({"type": datatype, "shape": [6]})
+        value = [(20240101, "AAPL", 61.5), (20240102, "IBM", 40.25),
+                 (20240103, "AAPL", 70.0), (20240104, "EBAY", 55.0)]
+        req = self.endpoint + "/datasets/" + dset_uuid + "/value"
+        payload = {"start": 0, "stop": 4, "value": value}
+        rsp = self.session.put(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+
+        # the last two rows are the zero fill value
+        value = self.getAggregate(dset_uuid, {"op": "max"})
+        self.assertEqual(value, {"date": 20240104, "temp": 70.0})
+        value = self.getAggregate(dset_uuid, {"op": "sum", "select": "[0:4]"})
+        self.assertEqual(value, {"date": 4 * 20240101 + 6, "temp": 226.75})
+        value = self.getAggregate(dset_uuid, {"op": "mean", "fields": "temp"})
+        # a field selection is still compound
+        self.assertEqual(list(value), ["temp"])
+        self.assertAlmostEqual(value["temp"], 226.75 / 6)
+
+        params = {"op": "histogram", "fields": "temp", "bins": 2}
+        value = self.getAggregate(dset_uuid, params)["temp"]
+        self.assertEqual(value["hist"], [2, 4])
+        self.assertEqual(value["bin_edges"], [0.0, 35.0, 70.0])
+        # no single range for more than one field
+        self.getAggregate(dset_uuid, {"op": "histogram"}, status_code=400)
+        # strings can't be aggregated
+        self.getAggregate(dset_uuid, {"op": "max", "fields": "symbol"}, status_code=400)
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
@@ -11,6 +11,8 @@
 ##############################################################################
 import unittest
 import json
+import time
+import numpy as np
 import helper
 import config
 
@@ -262,6 +264,296 @@ class QueryTest(unittest.TestCase):
             kwargs["expect_bin"] = False  # will always get json for null response
             verifyQueryRsp(rsp, **kwargs)
 
+    def testZoneMapQuery(self):
+        # queries on chunks with stats should get the same results as before,
+        # including right after writes to chunks the stats say can be skipped
+        print("testZoneMapQuery", self.base_domain)
+
+        headers = helper.getRequestHeaders(domain=self.base_domain)
+        headers_bin_req = helper.getRequestHeaders(domain=self.base_domain)
+        headers_bin_req["Content-Type"] = "application/octet-stream"
+        req = self.endpoint + "/"
+
+        # Get root uuid
+        rsp = self.session.get(req, headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+        rspJson = json.loads(rsp.text)
+        root_uuid = rspJson["root"]
+        helper.validateId(root_uuid)
+
+        # create 1d dataset with 1MB chunks
+        fields = (
+            {"name": "index", "type": "H5T_STD_I32LE"},
+            {"name": "temp", "type": "H5T_IEEE_F32LE"},
+        )
+        datatype = {"class": "H5T_COMPOUND", "fields": fields}
+        num_elements = 1024 * 1024
+        chunk_rows = 128 * 1024
+        payload = {"type": datatype, "shape": num_elements, "maxdims": num_elements}
+        payload["creationProperties"] = {
+            "layout": {"class": "H5D_CHUNKED", "dims": [chunk_rows]}
+        }
+        req = self.endpoint + "/datasets"
+        rsp = self.session.post(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 201)  # create dataset
+        rspJson = json.loads(rsp.text)
+        dset_uuid = rspJson["id"]
+        self.assertTrue(helper.validateId(dset_uuid))
+
+        # link new dataset
+        name = "dset" + helper.getRandomName()
+        req = self.endpoint + "/groups/" + root_uuid + "/links/" + name
+        payload = {"id": dset_uuid}
+        rsp = self.session.put(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 201)
+
+        # write entire array
+        dt = np.dtype([("index", "<i4"), ("temp", "<f4")])
+        arr = np.zeros((num_elements,), dtype=dt)
+        arr["index"] = np.arange(num_elements)
+        arr["temp"] = 40.0 + arr["index"] / 1024
+        req = self.endpoint + "/datasets/" + dset_uuid + "/value"
+        rsp = self.session.put(req, data=arr.tobytes(), headers=headers_bin_req)
+        self.assertEqual(rsp.status_code, 200)
+
+        def getQueryIndices(query):
+            params = {"query": query}
+            rsp = self.session.get(req, params=params, headers=headers)
+            self.assertEqual(rsp.status_code, 200)
+            rspJson = json.loads(rsp.text)
+            self.assertTrue("value" in rspJson)
+            return [item[0] for item in rspJson["value"]]
+
+        last = num_elements - 1
+        queries = {
+            f"index >= {last - 4}": list(range(last - 4, last + 1)),
+            "(temp > 100.0) & (temp < 100.003)": [61441, 61442, 61443],
+            f"where index in (3, {chunk_rows + 5}, {num_elements})": [3, chunk_rows + 5],
+            "index < 0": [],
+        }
+        for query, expected in queries.items():
+            self.assertEqual(getQueryIndices(query), expected)
+
+        # flush to storage so the chunk stats get created
+        domain_req = self.endpoint + "/"
+        rsp = self.session.put(domain_req, params={"flush": 1}, headers=headers)
+        self.assertEqual(rsp.status_code, 204)
+        time.sleep(3)
+        for query, expected in queries.items():
+            self.assertEqual(getQueryIndices(query), expected)
+
+        # write to a chunk that the stats say doesn't have matches
+        payload = {"start": 5, "stop": 6, "value": [(num_elements, 2000.0)]}
+        rsp = self.session.put(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(getQueryIndices(f"index > {last}"), [5])
+        self.assertEqual(getQueryIndices("temp == 2000.0"), [5])
+        query = f"where index in (3, {chunk_rows + 5}, {num_elements})"
+        self.assertEqual(getQueryIndices(query), [3, 5, chunk_rows + 5])
+
+        # update with a query, then query for the new values
+        params = {"query": f"index == {chunk_rows + 5}"}
+        rsp = self.session.put(req, params=params, data=json.dumps({"index": -1}),
+                               headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(getQueryIndices("index < 0"), [chunk_rows + 5])
+
+        # shrink the dataset, then grow it back
+        shape_req = self.endpoint + "/datasets/" + dset_uuid + "/shape"
+        payload = {"shape": 3 * chunk_rows}
+        rsp = self.session.put(shape_req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 201)
+        payload = {"shape": num_elements}
+        rsp = self.session.put(shape_req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 201)
+        self.assertEqual(getQueryIndices(f"index >= {last - 4}"), [5])
+        self.assertEqual(getQueryIndices("temp > 1000.0"), [5])
+
+    def testIndexedFieldQuery(self):
+        # where queries on indexed fields should get the same results as
+        # before, including right after writes to chunks with other keys
+        print("testIndexedFieldQuery", self.base_domain)
+
+        headers = helper.getRequestHeaders(domain=self.base_domain)
+        headers_bin_req = helper.getRequestHeaders(domain=self.base_domain)
+        headers_bin_req["Content-Type"] = "application/octet-stream"
+        req = self.endpoint + "/"
+
+        # Get root uuid
+        rsp = self.session.get(req, headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+        rspJson = json.loads(rsp.text)
+        root_uuid = rspJson["root"]
+        helper.validateId(root_uuid)
+
+        fixed_str4_type = {
+            "charSet": "H5T_CSET_ASCII",
+            "class": "H5T_STRING",
+            "length": 4,
+            "strPad": "H5T_STR_NULLPAD",
+        }
+        fields = (
+            {"name": "symbol", "type": fixed_str4_type},
+            {"name": "date", "type": "H5T_STD_I32LE"},
+            {"name": "open", "type": "H5T_IEEE_F32LE"},
+        )
+        datatype = {"class": "H5T_COMPOUND", "fields": fields}
+        num_elements = 1024 * 1024
+        chunk_rows = 128 * 1024
+        payload = {"type": datatype, "shape": num_elements}
+        req = self.endpoint + "/datasets"
+
+        # invalid indexedFields
+        for indexed_fields in ("symbol", ["open"], ["foo"]):
+            payload["creationProperties"] = {"indexedFields": indexed_fields}
+            rsp = self.session.post(req, data=json.dumps(payload), headers=headers)
+            self.assertEqual(rsp.status_code, 400)
+
+        # create 1d dataset with 1MB chunks and an index on symbol and date
+        payload["creationProperties"] = {
+            "layout": {"class": "H5D_CHUNKED", "dims": [chunk_rows]},
+            "indexedFields": ["symbol", "date"],
+        }
+        rsp = self.session.post(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 201)  # create dataset
+        rspJson = json.loads(rsp.text)
+        dset_uuid = rspJson["id"]
+        self.assertTrue(helper.validateId(dset_uuid))
+
+        # link new dataset
+        name = "dset" + helper.getRandomName()
+        req = self.endpoint + "/groups/" + root_uuid + "/links/" + name
+        payload = {"id": dset_uuid}
+        rsp = self.session.put(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 201)
+
+        # write entire array - each symbol is in a run of 1000 rows
+        dt = np.dtype([("symbol", "S4"), ("date", "<i4"), ("open", "<f4")])
+        arr = np.zeros((num_elements,), dtype=dt)
+        rows = np.arange(num_elements)
+        arr["symbol"] = np.char.mod("S%03d", rows // 1000).astype("S4")
+        arr["date"] = rows % 31
+        arr["open"] = rows % 1000
+        req = self.endpoint + "/datasets/" + dset_uuid + "/value"
+        rsp = self.session.put(req, data=arr.tobytes(), headers=headers_bin_req)
+        self.assertEqual(rsp.status_code, 200)
+
+        def getQueryIndices(query):
+            params = {"query": query}
+            rsp = self.session.get(req, params=params, headers=headers)
+            self.assertEqual(rsp.status_code, 200)
+            rspJson = json.loads(rsp.text)
+            self.assertTrue("value" in rspJson)
+            return [item[0] for item in rspJson["value"]]
+
+        queries = {
+            "where symbol in (b'S500', b'XXXX')": list(range(500000, 501000)),
+            "open < 3 where symbol in (b'S130', b'S900')": [130000, 130001, 130002,
+                                                            900000, 900001, 900002],
+            "open > 997 where date in (7, 100)": [i for i in range(7, num_elements, 31)
+                                                  if i % 1000 > 997],
+            "where symbol in (b'S', b'XYZ')": [],
+        }
+        for query, expected in queries.items():
+            self.assertEqual(getQueryIndices(query), expected)
+
+        # flush to storage so the chunk index gets created
+        domain_req = self.endpoint + "/"
+        rsp = self.session.put(domain_req, params={"flush": 1}, headers=headers)
+        self.assertEqual(rsp.status_code, 204)
+        time.sleep(3)
+        for query, expected in queries.items():
+            self.assertEqual(getQueryIndices(query), expected)
+
+        # write a key to a chunk that doesn't have it
+        payload = {"start": 5, "stop": 6, "value": [("S500", 100, 0.0)]}
+        rsp = self.session.put(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+        expected = [5] + list(range(500000, 501000))
+        self.assertEqual(getQueryIndices("where symbol in (b'S500')"), expected)
+        self.assertEqual(getQueryIndices("where date in (100)"), [5])
+
+    def testLimitQuery(self):
+        # queries with a limit on multi-chunk datasets return the first
+        # matching rows in order
+        print("testLimitQuery", self.base_domain)
+
+        headers = helper.getRequestHeaders(domain=self.base_domain)
+        headers_bin_req = helper.getRequestHeaders(domain=self.base_domain)
+        headers_bin_req["Content-Type"] = "application/octet-stream"
+        headers_bin_rsp = helper.getRequestHeaders(domain=self.base_domain)
+        headers_bin_rsp["accept"] = "application/octet-stream"
+        req = self.endpoint + "/"
+
+        # Get root uuid
+        rsp = self.session.get(req, headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+        rspJson = json.loads(rsp.text)
+        root_uuid = rspJson["root"]
+        helper.validateId(root_uuid)
+
+        # create 1d dataset with 1MB chunks
+        fields = (
+            {"name": "index", "type": "H5T_STD_I32LE"},
+            {"name": "x", "type": "H5T_STD_I32LE"},
+        )
+        datatype = {"class": "H5T_COMPOUND", "fields": fields}
+        num_elements = 1024 * 1024
+        chunk_rows = 128 * 1024
+        payload = {"type": datatype, "shape": num_elements}
+        payload["creationProperties"] = {
+            "layout": {"class": "H5D_CHUNKED", "dims": [chunk_rows]}
+        }
+        req = self.endpoint + "/datasets"
+        rsp = self.session.post(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 201)  # create dataset
+        rspJson = json.loads(rsp.text)
+        dset_uuid = rspJson["id"]
+        self.assertTrue(helper.validateId(dset_uuid))
+
+        # link new dataset
+        name = "dset" + helper.getRandomName()
+        req = self.endpoint + "/groups/" + root_uuid + "/links/" + name
+        payload = {"id": dset_uuid}
+        rsp = self.session.put(req, data=json.dumps(payload), headers=headers)
+        self.assertEqual(rsp.status_code, 201)
+
+        # write entire array
+        dt = np.dtype([("index", "<i4"), ("x", "<i4")])
+        arr = np.zeros((num_elements,), dtype=dt)
+        arr["index"] = np.arange(num_elements)
+        arr["x"] = arr["index"] % 7
+        req = self.endpoint + "/datasets/" + dset_uuid + "/value"
+        rsp = self.session.put(req, data=arr.tobytes(), headers=headers_bin_req)
+        self.assertEqual(rsp.status_code, 200)
+
+        # query responses have the row index as the first field
+        rsp_dt = np.dtype([("row", "<i8"), ("index", "<i4"), ("x", "<i4")])
+        queries = {
+            "x == 3": list(range(3, num_elements, 7)),
+            "index >= 1000000": list(range(1000000, num_elements)),
+            "index < 0": [],
+        }
+        for query, expected in queries.items():
+            for limit in (0, 1, 10, 1000, 200000):
+                if limit:
+                    expected_rows = expected[:limit]
+                else:
+                    expected_rows = expected
+                params = {"query": query}
+                if limit:
+                    params["Limit"] = limit
+                rsp = self.session.get(req, params=params, headers=headers)
+                self.assertEqual(rsp.status_code, 200)
+                rspJson = json.loads(rsp.text)
+                self.assertTrue("value" in rspJson)
+                self.assertEqual([item[0] for item in rspJson["value"]], expected_rows)
+
+                rsp = self.session.get(req, params=params, headers=headers_bin_rsp)
+                self.assertEqual(rsp.status_code, 200)
+                rsp_arr = np.frombuffer(rsp.content, dtype=rsp_dt)
+                self.assertEqual(rsp_arr["row"].tolist(), expected_rows)
+
     def testChunkedRefIndirectDataset(self):
         print("testChunkedRefIndirectDatasetQuery", self.base_domain)
         headers = helper.getRequestHeaders(domain=self.base_domain)
@@ -0,0 +1,92 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import time
+import numpy as np
+import sys
+
+from hsds.util.chunkUtil import chunkReadPoints, chunkWritePoints
+
+if len(sys.argv) < 2:
+    count = 1_000_000
+elif sys.argv[1] in ("-h", "--help"):
+    sys.exit(f"usage: python {sys.argv[0]} count")
+else:
+    count = int(sys.argv[1])
+
+chunk_id = "c-00de6a9c-6aff5c35-15d5-3864dd-0740f8_3_4"
+chunk_layout = (1000, 1000)
+chunk_coord = np.array((3000, 4000), dtype=np.uint64)
+
+dt = np.dtype([("a", "i4"), ("b", "f8"), ("c", "f4")])
+chunk_arr = np.zeros(chunk_layout, dtype=dt)
+
+rng = np.random.default_rng()
+points = rng.integers(0, 1000, size=(count, 2), dtype=np.uint64) + chunk_coord
+
+# write all fields
+point_dt = np.dtype([("coord", np.uint64, (2,)), ("val", dt)])
+point_arr = np.zeros((count,), dtype=point_dt)
+point_arr["coord"] = points
+point_arr["val"]["a"] = np.arange(count)
+then = time.time()
+chunkWritePoints(
+    chunk_id=chunk_id,
+    chunk_layout=chunk_layout,
+    chunk_arr=chunk_arr,
+    point_arr=point_arr,
+)
+now = time.time()
+print(f"chunkWritePoints - elapsed: {(now - then):6.4f} for {count} points")
+
+# write one field
+select_dt = np.dtype([("b", "f8")])
+point_dt = np.dtype([("coord", np.uint64, (2,)), ("val", select_dt)])
+point_arr = np.zeros((count,), dtype=point_dt)
+point_arr["coord"] = points
+point_arr["val"]["b"] = 3.14
+then = time.time()
+chunkWritePoints(
+    chunk_id=chunk_id,
+    chunk_layout=chunk_layout,
+    chunk_arr=chunk_arr,
+    point_arr=point_arr,
+    select_dt=select_dt,
+)
+now = time.time()
+print(f"chunkWritePoints (field subset) - elapsed: {(now - then):6.4f} for {count} points")
+
+# read all fields
+then = time.time()
+arr = chunkReadPoints(
+    chunk_id=chunk_id,
+    chunk_layout=chunk_layout,
+    chunk_arr=chunk_arr,
+    point_arr=points,
+)
+now = time.time()
+if arr.shape[0] != count:
+    raise ValueError(f"unexpected array shape: {arr.shape}")
+print(f"chunkReadPoints - elapsed: {(now - then):6.4f} for {count} points")
+
+# read field subset
+then = time.time()
+arr = chunkReadPoints(
+    chunk_id=chunk_id,
+    chunk_layout=chunk_layout,
+    chunk_arr=chunk_arr,
+    point_arr=points,
+    select_dt=select_dt,
+)
+now = time.time()
+if not np.all(arr["b"] == 3.14):
+    raise ValueError("unexpected values read")
+print(f"chunkReadPoints (field subset) - elapsed: {(now - then):6.4f} for {count} points")
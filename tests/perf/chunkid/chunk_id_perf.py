@@ -0,0 +1,70 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# Compare per-chunk overhead of plain string chunk ids vs ChunkId objects
+# for the id parsing a request does on the SN and DN
+#
+import time
+import sys
+
+from hsds.util.idUtil import createObjId, getS3Key, getObjPartition
+from hsds.util.chunkUtil import getChunkIds, getChunkIndex, getDatasetId
+from hsds.util.chunkUtil import getChunkCoverage, getDataCoverage
+
+if len(sys.argv) < 2:
+    count = 100_000
+elif sys.argv[1] in ("-h", "--help"):
+    sys.exit(f"usage: python {sys.argv[0]} chunk_count")
+else:
+    count = int(sys.argv[1])
+
+# times each chunk id gets looked at: SN partition lookup, chunk/data selection,
+# DN partition validation, DN cache/storage key, s3sync
+PASSES = 3
+NODE_COUNT = 4
+
+dset_id = createObjId("datasets")
+layout = (10, 10)
+nrows = count // 100
+selection = (slice(0, nrows * 10, 1), slice(0, 1000, 1))
+
+
+def parse_ids(chunk_ids):
+    for i in range(PASSES):
+        for chunk_id in chunk_ids:
+            getObjPartition(chunk_id, NODE_COUNT)
+            getChunkIndex(chunk_id)
+            getDatasetId(chunk_id)
+            getS3Key(chunk_id)
+
+
+def get_selections(chunk_ids):
+    for chunk_id in chunk_ids:
+        getChunkCoverage(chunk_id, selection, layout)
+        getDataCoverage(chunk_id, selection, layout)
+
+
+then = time.time()
+chunk_ids = getChunkIds(dset_id, selection, layout)
+now = time.time()
+print(f"getChunkIds - elapsed: {(now - then):6.4f} for {len(chunk_ids)} chunks")
+
+str_ids = [str(chunk_id) for chunk_id in chunk_ids]
+
+for name, ids in (("str", str_ids), ("ChunkId", chunk_ids)):
+    for func in (parse_ids, get_selections):
+        then = time.time()
+        func(ids)
+        elapsed = time.time() - then
+        msg = f"{name} chunk ids, {func.__name__} - elapsed: {elapsed:6.4f}, "
+        msg += f"per chunk: {(elapsed * 1e6 / len(ids)):6.2f} us"
+        print(msg)
@@ -0,0 +1,131 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# Compare getting chunk data from a DN-like process over a Unix domain
+# socket in the response body with getting it through shared memory
+# (shm_transport).  The server sends back the bytes of an array the way
+# GET_Chunk does, or writes the array to the segment region passed in the
+# request and returns just the byte count.
+#
+# usage: python shm_perf.py [iterations]
+#
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from aiohttp import ClientSession, UnixConnector, web
+
+from hsds import hsds_logger as log
+from hsds.util.arrayUtil import arrayToBytes
+from hsds.util.shmUtil import ShmPool, ShmAttachments
+
+SIZES = (64 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+CONCURRENCY = 4
+
+
+def run_server(socket_path):
+    arr = np.random.rand(max(SIZES) // 8)
+    segments = ShmAttachments()
+
+    async def get_data(request):
+        nbytes = int(request.rel_url.query["nbytes"])
+        output_arr = arr[: nbytes // 8]
+        if "shm" in request.rel_url.query:
+            handle = request.rel_url.query["shm"]
+            nbytes = segments.writeArray(handle, output_arr)
+            return web.json_response({"shm": handle, "nbytes": nbytes})
+        data = arrayToBytes(output_arr)
+        resp = web.StreamResponse()
+        resp.headers["Content-Type"] = "application/octet-stream"
+        resp.content_length = len(data)
+        await resp.prepare(request)
+        await resp.write(data)
+        await resp.write_eof()
+        return resp
+
+    app = web.Application()
+    app.router.add_get("/data", get_data)
+    web.run_app(app, path=socket_path, print=None)
+
+
+async def read_socket(session, nbytes, out):
+    async with session.get("http://localhost/data", params={"nbytes": nbytes}) as rsp:
+        buffer = memoryview(out).cast("B")
+        offset = 0
+        async for data in rsp.content.iter_any():
+            buffer[offset:offset + len(data)] = data
+            offset += len(data)
+    assert offset == nbytes
+
+
+async def read_shm(session, pool, nbytes, out):
+    lease = pool.lease(nbytes)
+    params = {"nbytes": nbytes, "shm": lease.getHandle()}
+    async with session.get("http://localhost/data", params=params) as rsp:
+        rsp_json = await rsp.json()
+    assert rsp_json["nbytes"] == nbytes
+    out[...] = lease.getArray(out.dtype, out.shape)
+    pool.release(lease)
+
+
+async def benchmark(socket_path, iterations):
+    pool = ShmPool(max_bytes=CONCURRENCY * max(SIZES))
+    outs = [np.empty(max(SIZES) // 8) for _ in range(CONCURRENCY)]
+    connector = UnixConnector(path=socket_path)
+    async with ClientSession(connector=connector) as session:
+        print(f"{'bytes':>10} {'socket MB/s':>12} {'shm MB/s':>10} {'speedup':>8}")
+        for nbytes in SIZES:
+            results = []
+            for mode in ("socket", "shm"):
+                start = time.time()
+                for _ in range(iterations // CONCURRENCY):
+                    tasks = []
+                    for out in outs:
+                        out_arr = out[: nbytes // 8]
+                        if mode == "socket":
+                            tasks.append(read_socket(session, nbytes, out_arr))
+                        else:
+                            tasks.append(read_shm(session, pool, nbytes, out_arr))
+                    await asyncio.gather(*tasks)
+                elapsed = time.time() - start
+                count = (iterations // CONCURRENCY) * CONCURRENCY
+                results.append(count * nbytes / elapsed / (1024 * 1024))
+            msg = f"{nbytes:>10} {results[0]:>12.1f} {results[1]:>10.1f} "
+            msg += f"{results[1] / results[0]:>7.2f}x"
+            print(msg)
+    pool.close()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        sys.exit(f"usage: python {sys.argv[0]} [iterations]")
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    log.setLogConfig("WARNING")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = os.path.join(tmp_dir, "dn.sock")
+        server = multiprocessing.Process(target=run_server, args=(socket_path,))
+        server.start()
+        while not os.path.exists(socket_path):
+            time.sleep(0.1)
+        try:
+            asyncio.run(benchmark(socket_path, iterations))
+        finally:
+            server.terminate()
+            server.join()
+
+
+if __name__ == "__main__":
+    main()
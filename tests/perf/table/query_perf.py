@@ -0,0 +1,116 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+#
+# Time evaluating queries on a chunk of a table the way the DN does it:
+#   eval     - parse the query and eval() a numpy expression for every
+#              chunk (how chunkQuery used to work, queries with arithmetic
+#              weren't supported)
+#   numpy    - compiled plan from the cache, numpy operations
+#   numexpr  - compiled plan from the cache, evaluated with numexpr
+#              (if installed)
+#
+# usage: python query_perf.py [rows_per_chunk] [iterations]
+#
+import re
+import sys
+import time
+
+import numpy as np
+
+sys.path.append("../../..")
+from hsds import hsds_logger as log
+from hsds.util.boolparser import BooleanParser
+from hsds.util.queryUtil import compileQuery, getQueryPlan
+from hsds.util import queryUtil
+
+QUERIES = (
+    "temp > 61",
+    "(date >= 22) & (date <= 24)",
+    "(symbol == b'AAPL') & (open > 3000)",
+    "(date == 3) | (temp < 41)",
+    "(temp - 32) * 5 / 9 > 20.5",
+    "open < 4000 where symbol in (b'AAPL', b'EBAY')",
+)
+
+
+def get_chunk(rows):
+    dt = np.dtype([("date", "i4"), ("symbol", "S4"), ("open", "f8"), ("temp", "f8")])
+    arr = np.zeros((rows,), dtype=dt)
+    rng = np.random.default_rng(0)
+    arr["date"] = rng.integers(1, 32, rows)
+    arr["symbol"] = rng.choice([b"AAPL", b"EBAY", b"GOOG", b"MSFT", b"IBM"], rows)
+    arr["open"] = rng.uniform(1000, 5000, rows)
+    arr["temp"] = rng.uniform(40, 90, rows)
+    return arr
+
+
+def eval_query(query, chunk_sel):
+    # parse per chunk and eval, as chunkQuery did before compiled plans
+    n = query.find(" where ")
+    expr = query[:n] if n > 0 else query
+    BooleanParser(expr).getEvalStr()
+    field_names = chunk_sel.dtype.names
+    eval_str = re.sub(r"\b([A-Za-z_]\w*)\b(?!')",
+                      lambda m: f"chunk_sel['{m.group(1)}']" if m.group(1) in field_names
+                      else m.group(1), expr)
+    mask = eval(eval_str)
+    if n > 0:
+        mask &= np.isin(chunk_sel["symbol"], [b"AAPL", b"EBAY"])
+    return np.where(mask)[0]
+
+
+def time_it(func, iterations):
+    func()  # warm up
+    ts = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    elapsed = (time.perf_counter() - ts) / iterations
+    return elapsed, result
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 256 * 1024
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    log.setLogConfig("WARNING")
+    chunk = get_chunk(rows)
+    print(f"{rows} rows per chunk, {chunk.nbytes / (1024 * 1024):.1f} MB")
+    print(f"{'query':50} {'eval':>9} {'numpy':>9} {'numexpr':>9}")
+    for query in QUERIES:
+        plan = compileQuery(query, chunk.dtype, use_numexpr=False)
+        numpy_time, expected = time_it(lambda: plan.getIndices(chunk), iterations)
+        try:
+            eval_time, result = time_it(lambda: eval_query(query, chunk), iterations)
+        except Exception:
+            line = f"{query:50} {'-':>9}"
+        else:
+            if not np.array_equal(result, expected):
+                raise ValueError(f"numpy plan result mismatch for: {query}")
+            line = f"{query:50} {eval_time * 1000:7.2f}ms"
+        line += f" {numpy_time * 1000:7.2f}ms"
+        plan = compileQuery(query, chunk.dtype)
+        if plan.use_numexpr and rows >= queryUtil.NUMEXPR_MIN_ROWS:
+            numexpr_time, result = time_it(lambda: plan.getIndices(chunk), iterations)
+            if not np.array_equal(result, expected):
+                raise ValueError(f"numexpr plan result mismatch for: {query}")
+            line += f" {numexpr_time * 1000:7.2f}ms"
+        else:
+            line += f" {'-':>9}"
+        print(line)
+
+    # cost of getting the plan for each chunk
+    query = QUERIES[2]
+    compile_time, _ = time_it(lambda: compileQuery(query, chunk.dtype), iterations)
+    cached_time, _ = time_it(lambda: getQueryPlan(query, chunk.dtype), iterations)
+    print(f"compile: {compile_time * 1e6:.1f} us, cached plan: {cached_time * 1e6:.1f} us")
+
+
+main()
@@ -0,0 +1,136 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import json
+import sys
+import unittest
+import warnings
+
+import numpy as np
+
+sys.path.append("../..")
+from hsds.util.aggregateUtil import getAggregateFields, getAggregateOptions
+from hsds.util.aggregateUtil import getAggregateParams, getPartialAggregate, Aggregator
+
+
+def aggregate(arr, op, row_splits, axis=None, bins=None, hist_range=None):
+    """ combine the partials for the given row ranges of arr """
+    shape = ()
+    if axis is not None:
+        shape = arr.shape[:axis] + arr.shape[(axis + 1):]
+    aggregator = Aggregator(arr.dtype, op, shape=shape, bins=bins, hist_range=hist_range)
+    starts = [0] + list(row_splits)
+    stops = list(row_splits) + [arr.shape[0]]
+    for start, stop in zip(starts, stops):
+        kwargs = {"axis": axis, "bins": bins, "hist_range": hist_range}
+        partials = getPartialAggregate(arr[start:stop], op, **kwargs)
+        # partials get sent as json
+        partials = json.loads(json.dumps(partials))
+        if axis == 0 or axis is None:
+            sel = ()
+        else:
+            sel = (slice(start, stop),)
+        aggregator.add(partials, sel=sel)
+    return aggregator.getValue()
+
+
+class AggregateUtilTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(AggregateUtilTest, self).__init__(*args, **kwargs)
+        # main
+
+    def testGetAggregateFields(self):
+        dt = np.dtype([("date", "i4"), ("symbol", "S4"), ("temp", "f4"),
+                       ("vec", "f8", (3,)), ("ok", "?")])
+        self.assertEqual(getAggregateFields(dt), ["date", "temp", "ok"])
+        self.assertEqual(getAggregateFields(np.dtype("u2")), [None])
+        for dt in (np.dtype("S4"), np.dtype([("symbol", "S4")])):
+            with self.assertRaises(ValueError):
+                getAggregateFields(dt)
+
+    def testAggregateOptions(self):
+        options = getAggregateOptions({})
+        self.assertEqual(options, {"axis": None, "bins": None, "hist_range": None})
+        params = {"axis": "1", "bins": "20", "range": "-2.5:7"}
+        options = getAggregateOptions(params)
+        self.assertEqual(options, {"axis": 1, "bins": 20, "hist_range": (-2.5, 7.0)})
+        params = getAggregateParams("histogram", **options)
+        self.assertEqual(params["aggregate"], "histogram")
+        self.assertEqual(getAggregateOptions(params), options)
+        bad_params = ({"axis": "x"}, {"axis": "-1"}, {"bins": "0"}, {"range": "1"},
+                      {"range": "3:1"}, {"range": "a:b"}, {"range": "0:inf"})
+        for params in bad_params:
+            with self.assertRaises(ValueError, msg=str(params)):
+                getAggregateOptions(params)
+
+    def testAggregate(self):
+        arr = np.arange(24, dtype="f4").reshape((6, 4))
+        arr[1, 1] = np.nan
+        arr[4, :] = np.nan
+        values = arr[~np.isnan(arr)]
+        self.assertEqual(aggregate(arr, "count", (2, 5)), values.size)
+        self.assertEqual(aggregate(arr, "sum", (2, 5)), float(values.sum()))
+        self.assertEqual(aggregate(arr, "min", (2, 5)), 0.0)
+        self.assertEqual(aggregate(arr, "max", (2, 5)), 23.0)
+        self.assertAlmostEqual(aggregate(arr, "mean", (2, 5)), float(values.mean(dtype="f8")))
+
+        for axis in (0, 1):
+            for op in ("count", "sum", "min", "max", "mean"):
+                if op == "count":
+                    expected = np.count_nonzero(~np.isnan(arr), axis=axis)
+                elif op == "sum":
+                    expected = np.nansum(arr, axis=axis, dtype="f8")
+                else:
+                    with warnings.catch_warnings():
+                        # all-nan row
+                        warnings.simplefilter("ignore", RuntimeWarning)
+                        expected = getattr(np, "nan" + op)(arr.astype("f8"), axis=axis)
+                result = aggregate(arr, op, (3,), axis=axis)
+                np.testing.assert_allclose(result, expected, err_msg=f"{op} {axis}")
+        # no values in row 4
+        self.assertTrue(np.isnan(aggregate(arr, "min", (3,), axis=1)[4]))
+
+    def testAggregateInt(self):
+        arr = np.array([2 ** 40, 7, -3, 2 ** 40, 12], dtype="i8")
+        self.assertEqual(aggregate(arr, "sum", (1, 3)), 2 ** 41 + 16)
+        self.assertEqual(aggregate(arr, "min", (1, 3)), -3)
+        self.assertEqual(aggregate(arr, "max", (1, 3)), 2 ** 40)
+        self.assertEqual(aggregate(arr, "count", (1, 3)), 5)
+        self.assertIsInstance(aggregate(arr, "min", (1, 3)), int)
+
+    def testAggregateCompound(self):
+        dt = np.dtype([("date", "i4"), ("symbol", "S4"), ("temp", "f4")])
+        arr = np.zeros((5,), dtype=dt)
+        arr["date"] = [5, 3, 9, 1, 4]
+        arr["temp"] = [61.5, np.nan, 40.25, 70.0, np.nan]
+        self.assertEqual(aggregate(arr, "max", (2,)), {"date": 9, "temp": 70.0})
+        self.assertEqual(aggregate(arr, "count", (2,)), {"date": 5, "temp": 3})
+        result = aggregate(arr, "mean", (2,))
+        self.assertEqual(result["date"], 4.4)
+        self.assertAlmostEqual(result["temp"], (61.5 + 40.25 + 70.0) / 3)
+
+    def testHistogram(self):
+        arr = np.array([0.5, 1.5, np.nan, 2.5, 2.75, 9.0, 4.0, -1.0], dtype="f8")
+        result = aggregate(arr, "histogram", (3, 6), bins=4, hist_range=(0.0, 4.0))
+        self.assertEqual(result["hist"], [1, 1, 2, 1])
+        self.assertEqual(result["bin_edges"], [0.0, 1.0, 2.0, 3.0, 4.0])
+        with self.assertRaises(ValueError):
+            getPartialAggregate(arr, "histogram")
+        with self.assertRaises(ValueError):
+            getPartialAggregate(arr, "histogram", axis=0, hist_range=(0.0, 1.0))
+        with self.assertRaises(ValueError):
+            getPartialAggregate(arr, "median")
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
@@ -28,7 +28,12 @@ from hsds.util.arrayUtil import (
     IndexIterator,
     ndarray_compare,
     getNumpyValue,
-    getBroadcastShape
+    getBroadcastShape,
+    copyElement,
+    readElement,
+    arrayToIndexedBytes,
+    indexedBytesToArray,
+    isIndexedVlen,
 )
 from hsds.util.hdf5dtype import special_dtype
 from hsds.util.hdf5dtype import check_dtype
@@ -518,6 +523,146 @@ class ArrayUtilTest(unittest.TestCase):
         arr_copy = bytesToArray(buffer, dt, (4,))
         self.assertTrue(ndarray_compare(arr, arr_copy))
 
+    def testVlenFastPath(self):
+        # the vectorized vlen conversions should give the same bytes
+        # as the element by element conversion
+        def slowToBytes(arr):
+            buffer = bytearray(getByteArraySize(arr))
+            offset = 0
+            for e in arr.reshape((arr.size,)):
+                offset = copyElement(e, arr.dtype, buffer, offset)
+            return bytes(buffer)
+
+        def slowToArray(buffer, dt, count):
+            arr = np.zeros((count,), dtype=dt)
+            offset = 0
+            for index in range(count):
+                offset = readElement(buffer, offset, arr, index, dt)
+            return arr
+
+        # vlen str, with multi-byte characters and an empty string
+        dt = np.dtype("O", metadata={"vlen": str})
+        arr = np.zeros((5,), dtype=dt)
+        arr[0] = "hello"
+        arr[1] = "\u03b1\u03b2\u03b3"
+        arr[3] = ""
+        arr[4] = "bye-bye"
+        buffer = arrayToBytes(arr)
+        self.assertEqual(buffer, slowToBytes(arr))
+        arr_copy = bytesToArray(buffer, dt, (5,))
+        self.assertTrue(ndarray_compare(arr_copy, slowToArray(buffer, dt, 5)))
+        self.assertEqual(arr_copy[1], "\u03b1\u03b2\u03b3")
+        self.assertEqual(arr_copy[2], 0)
+
+        # vlen bytes, 2d
+        dt = np.dtype("O", metadata={"vlen": bytes})
+        arr = np.zeros((2, 3), dtype=dt)
+        arr[0, 0] = b"a"
+        arr[0, 2] = b"abc"
+        arr[1, 1] = b"\x00\x01\x02"
+        buffer = arrayToBytes(arr)
+        self.assertEqual(buffer, slowToBytes(arr))
+        arr_copy = bytesToArray(buffer, dt, (2, 3))
+        self.assertEqual(arr_copy.shape, (2, 3))
+        self.assertEqual(arr_copy[1, 1], b"\x00\x01\x02")
+        self.assertEqual(arr_copy[1, 0], 0)
+
+        # vlen of float64's, with arrays and tuples as elements
+        dt = np.dtype("O", metadata={"vlen": np.dtype("<f8")})
+        arr = np.zeros((4,), dtype=dt)
+        arr[0] = np.arange(3, dtype="<f8")
+        arr[1] = (1.5, 2.5)
+        arr[3] = np.zeros((0,), dtype="<f8")
+        buffer = arrayToBytes(arr)
+        self.assertEqual(buffer, slowToBytes(arr))
+        arr_copy = bytesToArray(buffer, dt, (4,))
+        self.assertTrue(ndarray_compare(arr_copy, slowToArray(buffer, dt, 4)))
+        self.assertEqual(list(arr_copy[0]), [0.0, 1.0, 2.0])
+        self.assertEqual(list(arr_copy[1]), [1.5, 2.5])
+        arr_copy[0][0] = 42.0  # elements should be writable
+
+        # bad count values
+        with self.assertRaises(ValueError):
+            bytesToArray(b"\xff\xff\xff\xff", dt, (1,))
+        with self.assertRaises(ValueError):
+            # 3 bytes is not a multiple of the float64 size
+            bytesToArray(b"\x03\x00\x00\x00abc", dt, (1,))
+
+    def testIndexedVlen(self):
+        # vlen str
+        dt = np.dtype("O", metadata={"vlen": str})
+        arr = np.zeros((3, 4), dtype=dt)
+        for i in range(3):
+            for j in range(4):
+                if (i + j) % 3:
+                    arr[i, j] = "x" * i + str(j) + "\u03b1"
+        buffer = arrayToIndexedBytes(arr)
+        self.assertTrue(isIndexedVlen(buffer))
+        self.assertFalse(isIndexedVlen(arrayToBytes(arr)))
+        self.assertEqual(buffer[:4], b"HSVX")
+        # header + offsets table + data
+        data_size = len(arrayToBytes(arr)) - 4 * 12
+        self.assertEqual(len(buffer), 16 + 8 * 13 + data_size)
+
+        # bytesToArray reads either format
+        arr_copy = bytesToArray(buffer, dt, (3, 4))
+        self.assertEqual(arr_copy.shape, (3, 4))
+        self.assertTrue(ndarray_compare(arr_copy, bytesToArray(arrayToBytes(arr), dt, (3, 4))))
+        self.assertEqual(arr_copy[2, 0], "xx0\u03b1")
+        self.assertEqual(arr_copy[0, 0], 0)
+
+        # read just a selection
+        sel = indexedBytesToArray(buffer, dt, (3, 4), select=(slice(1, 3), slice(2, 4)))
+        self.assertEqual(sel.shape, (2, 2))
+        for i in range(2):
+            for j in range(2):
+                self.assertEqual(sel[i, j], arr_copy[i + 1, j + 2])
+        sel = indexedBytesToArray(buffer, dt, (3, 4), select=([0, 2], [1, 3]))
+        self.assertEqual(sel.shape, (2,))
+        self.assertEqual(sel[0], arr_copy[0, 1])
+        self.assertEqual(sel[1], arr_copy[2, 3])
+
+        # vlen int, writable buffers are used without a copy
+        dt = np.dtype("O", metadata={"vlen": np.dtype("<i4")})
+        arr = np.zeros((4,), dtype=dt)
+        arr[0] = np.arange(3, dtype="<i4")
+        arr[2] = (7, 8)
+        buffer = bytearray(arrayToIndexedBytes(arr))
+        arr_copy = indexedBytesToArray(buffer, dt, (4,))
+        self.assertEqual(list(arr_copy[0]), [0, 1, 2])
+        self.assertEqual(list(arr_copy[2]), [7, 8])
+        self.assertEqual(arr_copy[3], 0)
+        arr_copy[2][0] = 42
+        self.assertEqual(list(bytesToArray(bytes(buffer), dt, (4,))[2]), [42, 8])
+        arr_copy = bytesToArray(bytes(buffer), dt, (4,))
+        arr_copy[0][0] = 42  # copy of the data region is writable
+        sel = indexedBytesToArray(bytes(buffer), dt, (4,), select=(slice(0, 4, 2),))
+        self.assertEqual(sel.shape, (2,))
+        self.assertEqual(list(sel[0]), [0, 1, 2])
+        self.assertEqual(list(sel[1]), [42, 8])
+        sel[0][0] = 7  # elements selected from a read-only buffer are copies
+
+        # compound types with vlen fields fall back to the sequential format
+        dt_str = np.dtype("O", metadata={"vlen": str})
+        dt = np.dtype([("a", "i4"), ("b", dt_str)])
+        arr = np.zeros((2,), dtype=dt)
+        arr[1] = (1, "one")
+        buffer = arrayToIndexedBytes(arr)
+        self.assertFalse(isIndexedVlen(buffer))
+        self.assertTrue(ndarray_compare(bytesToArray(buffer, dt, (2,)), arr))
+
+        # bad buffers
+        dt = np.dtype("O", metadata={"vlen": bytes})
+        arr = np.zeros((2,), dtype=dt)
+        arr[0] = b"abc"
+        buffer = arrayToIndexedBytes(arr)
+        with self.assertRaises(ValueError):
+            bytesToArray(buffer[:-1], dt, (2,))  # truncated
+        with self.assertRaises(ValueError):
+            bytesToArray(buffer, dt, (3,))  # wrong element count
+        with self.assertRaises(ValueError):
+            bytesToArray(buffer[:4] + b"\x02" + buffer[5:], dt, (2,))  # version 2
+
     def testArrToBytesBase64(self):
         # Simple array
         dt = np.dtype("<i4")
@@ -0,0 +1,89 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import asyncio
+import sys
+import unittest
+
+sys.path.append("../..")
+from hsds.util.batchUtil import encodeFrame, encodeFrames, decodeFrames, readFrame
+
+
+class StreamStub:
+    """Feeds bytes to readFrame a few at a time like a StreamReader"""
+
+    def __init__(self, data):
+        self._data = data
+        self._offset = 0
+
+    async def readexactly(self, n):
+        await asyncio.sleep(0)
+        data = self._data[self._offset:self._offset + n]
+        self._offset += len(data)
+        if len(data) < n:
+            raise asyncio.IncompleteReadError(data, n)
+        return data
+
+
+class BatchUtilTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(BatchUtilTest, self).__init__(*args, **kwargs)
+        # main
+
+    def testFrames(self):
+        chunk_id = "c-b4c41ad6-6bc1f71b-6c0c-6f4b7e-d4c4ab_0_1"
+        items = [
+            ({"id": chunk_id, "select": "[0:4,0:2]"}, b"\x01\x02\x03\x04"),
+            ({"id": chunk_id, "status": 404}, b""),
+        ]
+        buffer = encodeFrames(items)
+        self.assertEqual(buffer, encodeFrame(*items[0]) + encodeFrame(*items[1]))
+        frames = list(decodeFrames(buffer))
+        self.assertEqual(len(frames), 2)
+        for (header, data), (expected_header, expected_data) in zip(frames, items):
+            self.assertEqual(header, expected_header)
+            self.assertEqual(bytes(data), expected_data)
+        self.assertEqual(list(decodeFrames(b"")), [])
+
+        # truncated buffers
+        for n in (5, 20, len(buffer) - 1):
+            with self.assertRaises(ValueError):
+                list(decodeFrames(buffer[:n]))
+        # header that is not json
+        bad_frame = bytearray(encodeFrame({"id": chunk_id}))
+        bad_frame[12] = ord("!")
+        with self.assertRaises(ValueError):
+            list(decodeFrames(bytes(bad_frame)))
+
+    def testReadFrame(self):
+        items = [({"id": str(i)}, bytes(range(i))) for i in range(5)]
+        buffer = encodeFrames(items)
+
+        async def read_all(data):
+            stream = StreamStub(data)
+            frames = []
+            while True:
+                frame = await readFrame(stream)
+                if frame is None:
+                    break
+                frames.append(frame)
+            return frames
+
+        frames = asyncio.run(read_all(buffer))
+        self.assertEqual(frames, items)
+        with self.assertRaises(ValueError):
+            asyncio.run(read_all(buffer[:-1]))
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
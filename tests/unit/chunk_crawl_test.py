@@ -0,0 +1,243 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import asyncio
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+from aiohttp import web
+from aiohttp.web_exceptions import HTTPInternalServerError
+
+sys.path.append("../..")
+from hsds import chunk_crawl
+from hsds import config
+from hsds.chunk_crawl import ChunkCrawler, read_chunk_hyperslab
+from hsds.util.httpUtil import http_get
+from hsds.util.idUtil import createObjId
+from hsds.util.inProcessUtil import InProcessClient, getInProcessUrl
+
+DN_URL = getInProcessUrl("dn_1")
+
+
+async def slow_get(request):
+    await asyncio.sleep(10)
+    return web.json_response({})
+
+
+class ChunkCrawlTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(ChunkCrawlTest, self).__init__(*args, **kwargs)
+        # main
+
+    @unittest.skipIf(sys.version_info < (3, 11), "task.cancelling needs python 3.11")
+    def testCancelledRequest(self):
+        async def cancel_request():
+            node_app = web.Application()
+            node_app.router.add_route("GET", "/slow", slow_get)
+            node_app.freeze()
+            app = {"dn_urls": [DN_URL], "inprocess_clients": {DN_URL: InProcessClient(node_app)}}
+            task = asyncio.create_task(http_get(app, DN_URL + "/slow"))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            # cancelled by the caller, so not turned into a 500
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_request())
+
+    def testLimitCancel(self):
+        dset_id = createObjId("datasets")
+        chunk_ids = [f"c-{dset_id[2:]}_{i}" for i in range(2)]
+        chunk_map = {chunk_id: {} for chunk_id in chunk_ids}
+        dset_json = {"id": dset_id, "layout": {"class": "H5D_CHUNKED", "dims": [10]}}
+        read_counts = {chunk_id: 0 for chunk_id in chunk_ids}
+
+        async def read_chunk_hyperslab(app, chunk_id, dset_json, arr, chunk_map=None,
+                                       **kwargs):
+            read_counts[chunk_id] += 1
+            if chunk_id == chunk_ids[0]:
+                await asyncio.sleep(0.1)  # let the read for the next chunk start
+                chunk_map[chunk_id]["query_rsp"] = np.arange(10)
+                return
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                # what the http helpers do before python 3.11
+                raise HTTPInternalServerError()
+
+        async def crawl():
+            app = {
+                "node_type": "sn",
+                "node_state": "READY",
+                "dn_urls": [DN_URL],
+                "dn_ids": ["dn-0"],
+                "inprocess_clients": {DN_URL: None},  # reads are mocked
+            }
+            kwargs = {
+                "dset_json": dset_json,
+                "chunk_map": chunk_map,
+                "bucket": "mybucket",
+                "query": "x > 0",
+                "limit": 5,
+                "action": "read_chunk_hyperslab",
+            }
+            crawler = ChunkCrawler(app, chunk_ids, **kwargs)
+            with mock.patch.object(chunk_crawl, "read_chunk_hyperslab", read_chunk_hyperslab):
+                await asyncio.wait_for(crawler.crawl(), 5)
+            return crawler
+
+        crawler = asyncio.run(crawl())
+        self.assertEqual(crawler.get_status(), 200)
+        # the read that was in flight when the limit was reached isn't retried
+        self.assertEqual(read_counts[chunk_ids[1]], 1)
+        self.assertFalse(chunk_ids[1] in crawler._status_map)
+
+    def testZoneMapInvalidate(self):
+        root_id = createObjId("roots")
+        dset_id = createObjId("datasets", rootid=root_id)
+        chunk_ids = [f"c-{dset_id[2:]}_{i}" for i in range(2)]
+        points = {chunk_id: {"indices": [0], "points": [0]} for chunk_id in chunk_ids}
+        dset_json = {
+            "id": dset_id,
+            "type": {
+                "class": "H5T_COMPOUND",
+                "fields": [{"name": "x", "type": "H5T_STD_I32LE"}],
+            },
+            "shape": {"class": "H5S_SIMPLE", "dims": [20]},
+            "layout": {"class": "H5D_CHUNKED", "dims": [10]},
+        }
+        invalidated = []
+
+        async def write_point_sel(app, chunk_id, dset_json, point_list, point_data, **kwargs):
+            if chunk_id == chunk_ids[1]:
+                await asyncio.sleep(10)
+
+        async def invalidate_zone_map(app, dset_json, chunk_ids, bucket=None):
+            invalidated.append(set(chunk_ids))
+
+        def get_crawler(app):
+            kwargs = {
+                "dset_json": dset_json,
+                "bucket": "mybucket",
+                "points": points,
+                "action": "write_point_sel",
+            }
+            return ChunkCrawler(app, chunk_ids, **kwargs)
+
+        async def crawl():
+            app = {
+                "node_type": "sn",
+                "node_state": "READY",
+                "dn_urls": [DN_URL],
+                "dn_ids": ["dn-0"],
+                "inprocess_clients": {DN_URL: None},  # writes are mocked
+            }
+            crawler = get_crawler(app)
+            with mock.patch.object(chunk_crawl, "write_point_sel", write_point_sel):
+                with mock.patch.object(chunk_crawl, "invalidate_zone_map", invalidate_zone_map):
+                    # the crawl is cancelled while the second write is in flight
+                    with self.assertRaises(asyncio.TimeoutError):
+                        await asyncio.wait_for(crawler.crawl(), 0.5)
+
+            # no stats to invalidate if zone maps are turned off
+            config.setOverride("zone_maps", False)
+            try:
+                self.assertEqual(get_crawler(app)._updated_ids, None)
+            finally:
+                config.setOverride("zone_maps", True)
+
+        asyncio.run(crawl())
+        self.assertEqual(invalidated, [set(chunk_ids)])
+
+        # or for datasets that don't get zone maps
+        dset_json["shape"]["dims"] = [20, 20]
+        dset_json["layout"]["dims"] = [10, 10]
+        app = {"node_state": "READY", "dn_urls": [DN_URL], "dn_ids": ["dn-0"]}
+        crawler = ChunkCrawler(app, chunk_ids, dset_json=dset_json, action="write_point_sel")
+        self.assertEqual(crawler._updated_ids, None)
+
+    def testReadHyperslab(self):
+        dset_id = createObjId("datasets")
+        chunk_id = f"c-{dset_id[2:]}_0_0"
+        dset_json = {
+            "id": dset_id,
+            "type": {"class": "H5T_INTEGER", "base": "H5T_STD_I32LE"},
+            "shape": {"class": "H5S_SIMPLE", "dims": [10, 10]},
+            "layout": {"class": "H5D_CHUNKED", "dims": [10, 10]},
+            "creationProperties": {"fillValue": -1},
+        }
+        chunk_arr = np.arange(100, dtype="<i4").reshape((10, 10))
+        responses = []  # body to send for the next requests, else the selection
+
+        async def get_chunk(request):
+            if responses:
+                data = responses.pop(0)
+            else:
+                select = request.rel_url.query["select"]
+                slices = [slice(*map(int, s.split(":"))) for s in select[1:-1].split(",")]
+                data = chunk_arr[tuple(slices)].tobytes()
+            return web.Response(body=data, content_type="application/octet-stream")
+
+        node_app = web.Application()
+        node_app.router.add_route("GET", "/chunks/{id}", get_chunk)
+        node_app.freeze()
+        app = {
+            "node_state": "READY",
+            "dn_urls": [DN_URL],
+            "dn_ids": ["dn-0"],
+            "inprocess_clients": {DN_URL: InProcessClient(node_app)},
+        }
+
+        def read(np_arr, chunk_sel, data_sel):
+            chunk_map = {chunk_id: {"chunk_sel": chunk_sel, "data_sel": data_sel}}
+            scratch = {}
+            kwargs = {"chunk_map": chunk_map, "bucket": "mybucket", "scratch": scratch}
+            asyncio.run(read_chunk_hyperslab(app, chunk_id, dset_json, np_arr, **kwargs))
+            return scratch
+
+        # contiguous in np_arr, so read in place
+        np_arr = np.full((4, 10), -1, dtype="<i4")
+        chunk_sel = (slice(3, 5, 1), slice(0, 10, 1))
+        data_sel = (slice(1, 3, 1), slice(0, 10, 1))
+        scratch = read(np_arr, chunk_sel, data_sel)
+        self.assertEqual(scratch, {})
+        self.assertTrue(np.array_equal(np_arr[data_sel], chunk_arr[chunk_sel]))
+        self.assertTrue(np.all(np_arr[0] == -1) and np.all(np_arr[3] == -1))
+
+        # non-contiguous selections go through the scratch buffer
+        sels = [
+            ((slice(0, 4, 1), slice(5, 8, 1)), (slice(0, 4, 1), slice(2, 5, 1))),
+            ((slice(0, 2, 1), slice(0, 10, 1)), (slice(0, 4, 2), slice(0, 10, 1))),
+        ]
+        for chunk_sel, data_sel in sels:
+            np_arr = np.full((4, 10), -1, dtype="<i4")
+            scratch = read(np_arr, chunk_sel, data_sel)
+            self.assertTrue("buffer" in scratch)
+            self.assertTrue(np.array_equal(np_arr[data_sel], chunk_arr[chunk_sel]))
+            self.assertEqual(np.count_nonzero(np_arr == -1), 40 - chunk_arr[chunk_sel].size)
+
+        # failed in place reads don't leave partial data in np_arr
+        chunk_sel = (slice(3, 5, 1), slice(0, 10, 1))
+        data_sel = (slice(1, 3, 1), slice(0, 10, 1))
+        for body in (chunk_arr[3:4].tobytes(), chunk_arr[0:3].tobytes()):
+            np_arr = np.full((4, 10), -1, dtype="<i4")
+            responses.append(body)
+            with self.assertRaises(HTTPInternalServerError):
+                read(np_arr, chunk_sel, data_sel)
+            self.assertTrue(np.all(np_arr == -1))
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
@@ -0,0 +1,172 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import asyncio
+import sys
+import unittest
+
+sys.path.append("../..")
+from hsds.chunk_sn import _fetchPagesInOrder, _writePagesInOrder
+
+PAGE_COUNT = 6
+
+
+def reverse_pages(page_number):
+    """ delay so that later pages finish first """
+    return (PAGE_COUNT - page_number) * 0.01
+
+
+def slow_pages(page_number):
+    """ delay for pages that shouldn't finish before a failure """
+    return 0 if page_number == 0 else 10
+
+
+class PageTracker:
+    """ record the order pages are handled in and how many are held at once """
+
+    def __init__(self, fail_page=None, delay=reverse_pages):
+        self.fail_page = fail_page
+        self.delay = delay
+        self.held = 0
+        self.max_held = 0
+        self.started = []
+        self.done = []  # page numbers in the order they were finished
+        self.cancelled = []
+
+    def start(self):
+        self.held += 1
+        self.max_held = max(self.held, self.max_held)
+
+    def finish(self, page_number):
+        self.held -= 1
+        self.done.append(page_number)
+
+    async def work(self, page_number):
+        self.started.append(page_number)
+        if page_number == self.fail_page:
+            raise ValueError(f"page {page_number} failed")
+        try:
+            await asyncio.sleep(self.delay(page_number))
+        except asyncio.CancelledError:
+            self.cancelled.append(page_number)
+            raise
+
+
+async def run_failed(pipeline, *args):
+    """ run the pipeline, which is expected to fail, and return the tasks
+    still running afterwards """
+    try:
+        await pipeline(PAGE_COUNT, *args)
+    except ValueError:
+        return asyncio.all_tasks() - {asyncio.current_task()}
+    raise AssertionError("expected the pipeline to fail")
+
+
+class PipelineTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(PipelineTest, self).__init__(*args, **kwargs)
+        # main
+
+    def testFetchPages(self):
+        for depth in (1, 2, 3):
+            tracker = PageTracker()
+
+            async def fetch(page_number):
+                tracker.start()
+                await tracker.work(page_number)
+                return page_number * 10
+
+            async def consume(page_number, result):
+                self.assertEqual(result, page_number * 10)
+                await asyncio.sleep(0)
+                tracker.finish(page_number)
+
+            asyncio.run(_fetchPagesInOrder(PAGE_COUNT, fetch, consume, depth))
+            # written in page order though later pages are fetched first
+            self.assertEqual(tracker.done, list(range(PAGE_COUNT)))
+            self.assertEqual(tracker.max_held, depth)
+
+        # pages still being fetched are cancelled if a fetch fails
+        tracker = PageTracker(fail_page=0, delay=slow_pages)
+
+        async def consume(page_number, result):
+            tracker.finish(page_number)
+
+        tasks = asyncio.run(run_failed(_fetchPagesInOrder, tracker.work, consume, 3))
+        self.assertEqual(tasks, set())
+        self.assertEqual(tracker.done, [])
+        self.assertEqual(tracker.cancelled, [1, 2])
+
+        # or if the write to the client fails
+        tracker = PageTracker(delay=slow_pages)
+
+        async def fail_consume(page_number, result):
+            raise ValueError("write failed")
+
+        tasks = asyncio.run(run_failed(_fetchPagesInOrder, tracker.work, fail_consume, 3))
+        self.assertEqual(tasks, set())
+        self.assertEqual(tracker.cancelled, [1, 2])
+
+    def testWritePages(self):
+        for depth in (1, 2, 3):
+            tracker = PageTracker()
+            reads = []
+
+            async def read(page_number):
+                tracker.start()
+                reads.append(page_number)
+                await asyncio.sleep(0)
+                return page_number * 10
+
+            async def write(page_number, data):
+                self.assertEqual(data, page_number * 10)
+                await tracker.work(page_number)
+                tracker.finish(page_number)
+
+            asyncio.run(_writePagesInOrder(PAGE_COUNT, read, write, depth))
+            self.assertEqual(reads, list(range(PAGE_COUNT)))
+            # all the pages are written before returning
+            self.assertEqual(sorted(tracker.done), list(range(PAGE_COUNT)))
+            self.assertEqual(tracker.max_held, depth)
+
+        # writes in progress are cancelled if a read fails
+        tracker = PageTracker(delay=lambda page_number: 10)
+
+        async def fail_read(page_number):
+            await asyncio.sleep(0)
+            if page_number == 2:
+                raise ValueError("read failed")
+            return page_number
+
+        async def write(page_number, data):
+            await tracker.work(page_number)
+
+        tasks = asyncio.run(run_failed(_writePagesInOrder, fail_read, write, 3))
+        self.assertEqual(tasks, set())
+        self.assertEqual(tracker.cancelled, [0, 1])
+
+        # or if a write fails
+        tracker = PageTracker(fail_page=0, delay=slow_pages)
+
+        async def read(page_number):
+            await asyncio.sleep(0)
+            return page_number
+
+        tasks = asyncio.run(run_failed(_writePagesInOrder, read, write, 3))
+        self.assertEqual(tasks, set())
+        self.assertEqual(tracker.started, [0, 1])
+        self.assertEqual(tracker.cancelled, [1])
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
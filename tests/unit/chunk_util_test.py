@@ -22,6 +22,8 @@ from hsds.util.chunkUtil import (
     chunkWriteSelection,
     chunkReadPoints,
     chunkWritePoints,
+    getPointChunks,
+    iterChunkIds,
     chunkQuery,
     guessChunk,
     getNumChunks,
@@ -38,9 +40,6 @@ from hsds.util.chunkUtil import (
     expandChunk,
     getDatasetId,
     getContiguousLayout,
-    _getEvalStr,
-    _getWhereFieldName,
-    _getWhereElements,
 )
 
 
@@ -1405,69 +1404,6 @@ class ChunkUtilTest(unittest.TestCase):
 
         self.assertEqual(count, 16)
 
-    def testGetEvalStr(self):
-        queries = {}
-        queries["date == 23"] = "rows['date'] == 23"
-        queries["tgt123 == 456"] = "rows['tgt123'] == 456"
-        queries["wind == b'W 5'"] = "rows['wind'] == b'W 5'"
-        queries["temp > 61"] = "rows['temp'] > 61"
-        queries["(date >= 22) & (date <= 24)"] = "(rows['date'] >= 22) & (rows['date'] <= 24)"
-        queries["(date == 21) & (temp > 70)"] = "(rows['date'] == 21) & (rows['temp'] > 70)"
-        expected = "(rows['wind'] == b'E 7') | (rows['wind'] == b'S 7')"
-        queries["(wind == b'E 7') | (wind == b'S 7')"] = expected
-        queries["where 'temp' in (61, 68, 72)"] = None
-        queries["where 'name' in (b'Bob', b'Rob', b'Alice')"] = None
-        queries["date >= 22 where 'temp' in (61, 68, 72)"] = "rows['date'] >= 22"
-        queries["date >= 22 where 'temp F' in (61, 68, 72)"] = "rows['date'] >= 22"
-
-        fields = ["date", "wind", "temp", "tgt123"]
-
-        for query in queries.keys():
-            eval_str = _getEvalStr(query, "rows", fields)
-            self.assertEqual(eval_str, queries[query])
-
-    def testGetWhereFieldName(self):
-        queries = {}
-        queries["date == 23"] = None
-        queries["where 'temp' in (61, 68, 72)"] = "temp"
-        queries["date >= 22 where 'temp' in (61, 68, 72)"] = "temp"
-        queries["date >= 22 where 'temp F' in (61, 68, 72)"] = "temp F"
-        queries["date >= 22 where 'temp F123' in (61, 68, 72)"] = "temp F123"
-
-        for query in queries.keys():
-            field = _getWhereFieldName(query)
-            self.assertEqual(field, queries[query])
-
-    def testGetWhereElements(self):
-        queries = {}
-        queries["where 'temp' in (61, 68, 72)"] = ["61", "68", "72"]
-        queries["where 'temp' in (abc, xyz, abacab)"] = ["abc", "xyz", "abacab"]
-        queries["where 'temp' in ('ab cd', 'xyz ', 'abacab')"] = ["ab cd", "xyz ", "abacab"]
-        queries["where 'temp' in (123, -456, 3.12)"] = ["123", "-456", "3.12"]
-        queries["where 'temp' in (b'abc', b'xyz')"] = [b'abc', b'xyz']
-
-        for query in queries.keys():
-            elements = _getWhereElements(query)
-            self.assertEqual(elements, queries[query])
-
-    def testBadQuery(self):
-        queries = (
-            "foobar",  # no variable used
-            "wind = b'abc",  # non-closed literal
-            "(wind = b'N') & (temp = 32",  # missing paren
-            "foobar > 42",  # invalid field name
-            "import subprocess; subprocess.call(['ls', '/'])",
-        )  # injection attack
-
-        fields = ("date", "wind", "temp")
-
-        for query in queries:
-            try:
-                _getEvalStr(query, "x", fields)
-                self.assertTrue(False)  # shouldn't get here
-            except Exception:
-                pass  # ok
-
     def testChunkReadSelection(self):
         chunk_arr = np.array([2, 3, 5, 7, 11, 13, 17, 19])
         arr = chunkReadSelection(chunk_arr, slices=((slice(3, 5, 1),)))
@@ -1628,6 +1564,97 @@ class ChunkUtilTest(unittest.TestCase):
         except IndexError:
             pass  # expected
 
+    def testIterChunkIds(self):
+        dset_id = "d-12345678-1234-1234-1234-1234567890ab"
+        prefix = "c-12345678-1234-1234-1234-1234567890ab_"
+        layout = (10, 10, 10)
+        selection = (slice(5, 35, 1), slice(0, 100, 25), [3, 15, 4, 99])
+        chunk_ids = getChunkIds(dset_id, selection, layout)
+        # 4 chunks along dim 0, 4 along dim 1 (strided), 3 for the coordinates
+        self.assertEqual(len(chunk_ids), 4 * 4 * 3)
+        self.assertEqual(len(set(chunk_ids)), len(chunk_ids))
+        # coordinate chunks are outermost, then row-major order
+        self.assertEqual(chunk_ids[0], prefix + "0_0_0")
+        self.assertEqual(chunk_ids[1], prefix + "0_2_0")
+        self.assertEqual(chunk_ids[4], prefix + "1_0_0")
+        self.assertEqual(chunk_ids[-1], prefix + "3_7_9")
+
+        # iterator gives the same ids in the same order
+        it = iterChunkIds(dset_id, selection, layout)
+        self.assertEqual(next(it), chunk_ids[0])
+        self.assertEqual(list(it), chunk_ids[1:])
+
+        # strided selection that skips chunks
+        selection = (slice(0, 100, 30),)
+        chunk_ids = getChunkIds(dset_id, selection, (10,))
+        self.assertEqual(chunk_ids, [prefix + "0", prefix + "3", prefix + "6", prefix + "9"])
+
+        # empty selection
+        selection = (slice(0, 0, 1),)
+        self.assertEqual(list(iterChunkIds(dset_id, selection, (10,))), [])
+
+    def testGetPointChunks(self):
+        dset_id = "d-12345678-1234-1234-1234-1234567890ab"
+        # 1d
+        points = np.array([5, 25, 7, 21, 99], dtype=np.uint64)
+        point_chunks = getPointChunks(dset_id, points, (10,))
+        self.assertEqual(len(point_chunks), 3)
+        chunk_ids = list(point_chunks.keys())
+        self.assertEqual(chunk_ids[0], "c-12345678-1234-1234-1234-1234567890ab_0")
+        self.assertEqual(chunk_ids[1], "c-12345678-1234-1234-1234-1234567890ab_2")
+        self.assertEqual(chunk_ids[2], "c-12345678-1234-1234-1234-1234567890ab_9")
+        self.assertEqual(point_chunks[chunk_ids[0]].tolist(), [0, 2])
+        self.assertEqual(point_chunks[chunk_ids[1]].tolist(), [1, 3])
+        self.assertEqual(point_chunks[chunk_ids[2]].tolist(), [4])
+
+        # 2d - compare with getChunkId for each point
+        layout = (10, 20)
+        points = np.random.randint(0, 100, size=(1000, 2)).astype(np.uint64)
+        point_chunks = getPointChunks(dset_id, points, layout)
+        count = 0
+        for chunk_id, point_index in point_chunks.items():
+            for i in point_index:
+                self.assertEqual(getChunkId(dset_id, points[i], layout), chunk_id)
+            count += len(point_index)
+        self.assertEqual(count, 1000)
+
+        self.assertEqual(getPointChunks(dset_id, np.zeros((0, 2)), layout), {})
+
+    def testChunkPointsFields(self):
+        chunk_id = "c-00de6a9c-6aff5c35-15d5-3864dd-0740f8_1_1"
+        chunk_layout = (10, 10)
+        dset_dt = np.dtype([("a", "i4"), ("b", "f8"), ("c", "S4")])
+        chunk_arr = np.zeros(chunk_layout, dtype=dset_dt)
+        select_dt = np.dtype([("b", "f8")])
+        point_dt = np.dtype([("coord", np.uint64, (2,)), ("val", select_dt)])
+        indexes = ((10, 10), (15, 12), (19, 19))
+        num_points = len(indexes)
+        point_arr = np.zeros((num_points,), dtype=point_dt)
+        for i in range(num_points):
+            point_arr[i] = (indexes[i], (i + 0.5,))
+        chunk_arr[5, 2] = (7, 0.0, b"abcd")
+        chunkWritePoints(
+            chunk_id=chunk_id,
+            chunk_layout=chunk_layout,
+            chunk_arr=chunk_arr,
+            point_arr=point_arr,
+            select_dt=select_dt,
+        )
+        # only the b field should be updated
+        self.assertEqual(chunk_arr[0, 0].tolist(), (0, 0.5, b""))
+        self.assertEqual(chunk_arr[5, 2].tolist(), (7, 1.5, b"abcd"))
+        self.assertEqual(chunk_arr[9, 9].tolist(), (0, 2.5, b""))
+
+        point_arr = np.array(indexes, dtype=np.uint64)
+        arr = chunkReadPoints(
+            chunk_id=chunk_id,
+            chunk_layout=chunk_layout,
+            chunk_arr=chunk_arr,
+            point_arr=point_arr,
+            select_dt=np.dtype([("a", "i4"), ("b", "f8")]),
+        )
+        self.assertEqual(arr.tolist(), [(0, 0.5), (7, 1.5), (0, 2.5)])
+
     def testChunkQuery(self):
         chunk_id = "c-00de6a9c-6aff5c35-15d5-3864dd-0740f8_12"
         chunk_layout = (100,)
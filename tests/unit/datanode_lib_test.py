@@ -0,0 +1,270 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import asyncio
+import sys
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+import numpy as np
+from aiohttp import ClientConnectionError, web
+from aiohttp.web_exceptions import HTTPBadRequest, HTTPForbidden, HTTPInternalServerError
+from aiohttp.web_exceptions import HTTPServiceUnavailable
+
+sys.path.append("../..")
+from hsds import config
+from hsds import datanode_lib
+from hsds.datanode_lib import get_chunk_selection, notify_roots, write_s3_obj
+from hsds.group_dn import POST_Roots
+from hsds.util import arrayUtil
+from hsds.util.arrayUtil import arrayToBytes, arrayToIndexedBytes
+from hsds.util.httpUtil import http_post
+from hsds.util.idUtil import createObjId, getDataNodeUrl
+from hsds.util.inProcessUtil import InProcessClient, getInProcessUrl
+from hsds.util.lruCache import LruCache
+from hsds.util.writeConcurrency import WriteConcurrency
+
+DN_URLS = [getInProcessUrl(f"dn_{i}") for i in range(3)]
+
+
+def get_app():
+    app = {
+        "chunk_cache": LruCache(mem_target=1024 * 1024, name="ChunkCache"),
+        "pending_s3_read": {},
+        "filter_map": {},
+    }
+    return app
+
+
+class DataNodeLibTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(DataNodeLibTest, self).__init__(*args, **kwargs)
+        # main
+
+    def testChunkSelection(self):
+        dset_id = createObjId("datasets")
+        chunk_id = f"c-{dset_id[2:]}_0_0"
+        dset_json = {
+            "id": dset_id,
+            "type": {"class": "H5T_STRING", "charSet": "H5T_CSET_UTF8",
+                     "length": "H5T_VARIABLE"},
+            "shape": {"class": "H5S_SIMPLE", "dims": [10, 10]},
+            "layout": {"class": "H5D_CHUNKED", "dims": [10, 10]},
+            "creationProperties": {"vlenChunkFormat": "indexed"},
+        }
+        dt = np.dtype("O", metadata={"vlen": str})
+        arr = np.zeros((10, 10), dtype=dt)
+        for i in range(10):
+            for j in range(10):
+                arr[i, j] = f"{i}:{j}"
+        chunk_bytes = arrayToIndexedBytes(arr)
+        reads = []
+        decodes = []
+
+        async def getStorBytes(app, key, **kwargs):
+            reads.append(key)
+            return chunk_bytes
+
+        def indexedBytesToArray(data, dt, shape, select=None):
+            decodes.append(select)
+            return arrayUtil.indexedBytesToArray(data, dt, shape, select=select)
+
+        async def read(app, selection):
+            with mock.patch.object(datanode_lib, "getStorBytes", getStorBytes):
+                with mock.patch.object(datanode_lib, "indexedBytesToArray",
+                                       indexedBytesToArray):
+                    return await get_chunk_selection(app, chunk_id, dset_json, selection,
+                                                     bucket="mybucket")
+
+        app = get_app()
+        selection = (slice(2, 4), slice(5, 8))
+        sel_arr = asyncio.run(read(app, selection))
+        self.assertEqual(sel_arr.shape, (2, 3))
+        self.assertEqual(sel_arr[0, 0], "2:5")
+        self.assertEqual(sel_arr[1, 2], "3:7")
+        # just the selection was decoded, and the chunk wasn't cached
+        self.assertEqual(decodes, [selection])
+        self.assertEqual(len(reads), 1)
+        self.assertFalse(chunk_id in app["chunk_cache"])
+
+        # large selections are left to get_chunk
+        self.assertEqual(asyncio.run(read(app, (slice(0, 10), slice(0, 5)))), None)
+        self.assertEqual(len(reads), 1)
+
+        # as are chunks that are already in the cache
+        app["chunk_cache"][chunk_id] = arr
+        self.assertEqual(asyncio.run(read(app, selection)), None)
+        self.assertEqual(len(reads), 1)
+
+        # chunks in the sequential format are decoded whole
+        app = get_app()
+        decodes.clear()
+        chunk_bytes = arrayToBytes(arr)
+        sel_arr = asyncio.run(read(app, selection))
+        self.assertEqual(sel_arr.shape, (2, 3))
+        self.assertEqual(sel_arr[1, 2], "3:7")
+        self.assertEqual(decodes, [])
+
+        # datasets that didn't opt in to the indexed format aren't read here
+        del dset_json["creationProperties"]
+        self.assertEqual(asyncio.run(read(app, selection)), None)
+
+    def testNotifyRoots(self):
+        app = {
+            "node_state": "READY",
+            "dn_urls": DN_URLS,
+            "dn_ids": [f"dn-{i}" for i in range(len(DN_URLS))],
+            "root_notify_ids": {},
+        }
+        root_ids = [createObjId("roots") for _ in range(30)]
+        notify_ids = {root_id: "mybucket" for root_id in root_ids}
+        notify_ids["g-not-a-root"] = "mybucket"  # skipped
+        expected = {}
+        for root_id in root_ids:
+            dn_url = getDataNodeUrl(app, root_id)
+            expected.setdefault(dn_url, set()).add(root_id)
+        self.assertEqual(len(expected), len(DN_URLS))
+        posts = {}
+        errors = {}
+
+        async def post(app, url, data=None, **kwargs):
+            dn_url = url[:-len("/roots")]
+            self.assertFalse(dn_url in posts)
+            posts[dn_url] = set(item["id"] for item in data["roots"])
+            self.assertTrue(all(item["bucket"] == "mybucket" for item in data["roots"]))
+            if dn_url in errors:
+                raise errors[dn_url]
+            return {}
+
+        def notify():
+            posts.clear()
+            app["root_notify_ids"] = {}
+            with mock.patch.object(datanode_lib, "http_post", post):
+                asyncio.run(notify_roots(app, notify_ids))
+
+        # one request for each DN with the roots it owns
+        notify()
+        self.assertEqual(posts, expected)
+        self.assertEqual(app["root_notify_ids"], {})
+
+        # roots are requeued for nodes that are unavailable or can't be
+        # reached, and dropped for errors that a retry won't fix
+        connection_error = HTTPInternalServerError()
+        connection_error.__cause__ = ClientConnectionError()
+        for error in (HTTPServiceUnavailable(), connection_error):
+            errors = {DN_URLS[0]: error, DN_URLS[1]: HTTPBadRequest()}
+            notify()
+            self.assertEqual(posts, expected)
+            self.assertEqual(set(app["root_notify_ids"]), expected[DN_URLS[0]])
+        errors = {DN_URLS[0]: HTTPInternalServerError()}
+        notify()
+        self.assertEqual(app["root_notify_ids"], {})
+
+    def testPostRoots(self):
+        config.setOverride("max_request_size", 1024 * 1024)
+        node_app = web.Application()
+        node_app["node_type"] = "dn"
+        node_app["node_state"] = "READY"
+        node_app["max_task_count"] = None
+        node_app["root_scan_ids"] = {}
+        node_app.router.add_route("POST", "/roots", POST_Roots)
+        node_app.freeze()
+        node_url = DN_URLS[0]
+        app = {"dn_urls": DN_URLS, "inprocess_clients": {node_url: InProcessClient(node_app)}}
+        root_scan_ids = node_app["root_scan_ids"]
+        root_ids = [createObjId("roots") for _ in range(3)]
+        roots = [{"id": root_id, "bucket": "mybucket"} for root_id in root_ids]
+
+        async def post(roots):
+            return await http_post(app, node_url + "/roots", data={"roots": roots})
+
+        # nothing is applied if any of the items are invalid
+        bad_items = [
+            {"id": createObjId("groups"), "bucket": "mybucket"},
+            {"id": root_ids[0], "bucket": ""},
+            root_ids[0],
+        ]
+        for item in bad_items:
+            with self.assertRaises(HTTPBadRequest):
+                asyncio.run(post(roots + [item]))
+            self.assertEqual(root_scan_ids, {})
+
+        asyncio.run(post(roots))
+        self.assertEqual(set(root_scan_ids), set(root_ids))
+        self.assertTrue(all(v[0] == "mybucket" for v in root_scan_ids.values()))
+
+    def testWriteErrors(self):
+        def get_write_app():
+            app = get_app()
+            app["meta_cache"] = LruCache(mem_target=1024 * 1024)
+            app["pending_s3_write"] = {}
+            app["pending_s3_write_tasks"] = {}
+            app["dirty_ids"] = {}
+            app["root_notify_ids"] = {}
+            app["deleted_ids"] = set()
+            app["flush_times"] = OrderedDict()
+            app["write_concurrency"] = WriteConcurrency(min_count=2, max_count=20)
+            app["wal"] = None
+            return app
+
+        async def write(app, obj_id, error=None):
+            async def putStorJSONObj(app, key, obj_json, bucket=None):
+                if error is not None:
+                    raise error
+
+            with mock.patch.object(datanode_lib, "putStorJSONObj", putStorJSONObj):
+                return await write_s3_obj(app, obj_id, bucket="mybucket")
+
+        grp_id = createObjId("groups", rootid=createObjId("roots"))
+        obj_json = {"id": grp_id, "links": {}}
+        # timeouts and 5xx responses from storage count as write errors
+        for error in (HTTPInternalServerError(), HTTPServiceUnavailable(),
+                      asyncio.TimeoutError()):
+            app = get_write_app()
+            app["meta_cache"][grp_id] = obj_json
+            app["meta_cache"].setDirty(grp_id)
+            with self.assertRaises(type(error)):
+                asyncio.run(write(app, grp_id, error=error))
+            self.assertEqual(app["write_concurrency"].errorCount, 1)
+            self.assertTrue(app["meta_cache"].isDirty(grp_id))
+
+        # other errors from storage aren't the store being overloaded
+        app = get_write_app()
+        app["meta_cache"][grp_id] = obj_json
+        app["meta_cache"].setDirty(grp_id)
+        with self.assertRaises(HTTPForbidden):
+            asyncio.run(write(app, grp_id, error=HTTPForbidden()))
+        self.assertEqual(app["write_concurrency"].errorCount, 0)
+
+        # nor are errors before the storage call
+        app = get_write_app()
+        with self.assertRaises(KeyError):
+            asyncio.run(write(app, grp_id))
+        app["meta_cache"][grp_id] = obj_json
+        with self.assertRaises(ValueError):
+            asyncio.run(write(app, grp_id))  # not dirty
+        self.assertEqual(app["write_concurrency"].errorCount, 0)
+
+        # successful writes are recorded
+        app["meta_cache"].setDirty(grp_id)
+        app["dirty_ids"][grp_id] = (0, "mybucket")
+        self.assertEqual(asyncio.run(write(app, grp_id)), grp_id)
+        self.assertEqual(app["write_concurrency"].writeCount, 1)
+        self.assertEqual(app["write_concurrency"].errorCount, 0)
+        self.assertFalse(app["meta_cache"].isDirty(grp_id))
+        self.assertFalse(grp_id in app["dirty_ids"])
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
@@ -0,0 +1,208 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import asyncio
+import sys
+import unittest
+
+sys.path.append("../..")
+from hsds.util.dnConcurrency import DnConcurrency, DnWorkQueue
+
+
+class DnConcurrencyTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(DnConcurrencyTest, self).__init__(*args, **kwargs)
+        # main
+
+    def fill(self, dc):
+        # take every available slot
+        count = 0
+        while dc.tryAcquire():
+            count += 1
+        return count
+
+    def testSlots(self):
+        dc = DnConcurrency(name="dn1", min_limit=1, max_limit=10, initial_limit=4)
+        self.assertEqual(dc.limit, 4)
+        self.assertEqual(self.fill(dc), 4)
+        self.assertEqual(dc.inflight, 4)
+        self.assertFalse(dc.tryAcquire())
+        dc.release()
+        self.assertEqual(dc.inflight, 3)
+        self.assertTrue(dc.tryAcquire())
+
+    def testIncrease(self):
+        dc = DnConcurrency(name="dn1", min_limit=1, max_limit=20, initial_limit=4)
+        # steady latency with all slots in use grows the limit
+        for i in range(100):
+            self.fill(dc)
+            dc.record(0.01)
+        self.assertEqual(dc.limit, 20)
+        self.assertEqual(dc.requestCount, 100)
+        self.assertAlmostEqual(dc.baseLatency, 0.01, places=2)
+
+    def testNoIncreaseWhenIdle(self):
+        dc = DnConcurrency(name="dn1", min_limit=1, max_limit=20, initial_limit=4)
+        # requests one at a time don't need a higher limit
+        for i in range(100):
+            dc.tryAcquire()
+            dc.record(0.01)
+            dc.release()
+        self.assertEqual(dc.limit, 4)
+
+    def testLatencyDecrease(self):
+        dc = DnConcurrency(name="dn1", min_limit=2, max_limit=32, initial_limit=32)
+        self.fill(dc)
+        for i in range(50):
+            dc.record(0.01)
+        self.assertEqual(dc.limit, 32)
+        # latency well beyond tolerance shrinks the limit
+        for i in range(20):
+            dc.record(0.1)
+        self.assertTrue(dc.limit < 16)
+        self.assertTrue(dc.limit >= 2)
+        self.assertTrue(dc.baseLatency < 0.05)
+        # and it comes back when latency does
+        for i in range(200):
+            self.fill(dc)
+            dc.record(0.01)
+        self.assertEqual(dc.limit, 32)
+
+    def testOverload(self):
+        dc = DnConcurrency(name="dn1", min_limit=2, max_limit=32, initial_limit=16)
+        dc.recordOverload()
+        self.assertEqual(dc.limit, 8)
+        dc.recordOverload()
+        dc.recordOverload()
+        dc.recordOverload()
+        self.assertEqual(dc.limit, 2)  # capped at min
+        self.assertEqual(dc.overloadCount, 4)
+
+    def testWorkQueue(self):
+        limiters = {
+            "dn1": DnConcurrency(name="dn1", initial_limit=1),
+            "dn2": DnConcurrency(name="dn2", initial_limit=2),
+        }
+
+        def get_limiter(dn_url):
+            return limiters[dn_url]
+
+        async def run():
+            q = DnWorkQueue(get_limiter)
+            for i in range(3):
+                q.put_nowait("dn1", f"a{i}")
+            for i in range(3):
+                q.put_nowait("dn2", f"b{i}")
+            self.assertEqual(q.qsize(), 6)
+
+            # dn1 only has room for one request, the rest go to dn2
+            items = [await q.get() for i in range(3)]
+            self.assertEqual(items, [("dn1", "a0"), ("dn2", "b0"), ("dn2", "b1")])
+            self.assertEqual(limiters["dn1"].inflight, 1)
+            self.assertEqual(limiters["dn2"].inflight, 2)
+
+            # everything is busy, get waits for a slot to free up
+            getter = asyncio.ensure_future(q.get())
+            await asyncio.sleep(0)
+            self.assertFalse(getter.done())
+            q.task_done("dn2")
+            self.assertEqual(await getter, ("dn2", "b2"))
+
+            # only a free slot on a DN with items waiting is any use
+            getter = asyncio.ensure_future(q.get())
+            await asyncio.sleep(0)
+            self.assertFalse(getter.done())
+            q.task_done("dn2")
+            await asyncio.sleep(0)
+            self.assertFalse(getter.done())  # dn2 has nothing left
+            q.task_done("dn1")
+            self.assertEqual(await getter, ("dn1", "a1"))
+            self.assertEqual(q.qsize(), 1)
+
+            # a slot freed by another queue sharing the limiter wakes us too
+            q2 = DnWorkQueue(get_limiter)
+            q2.put_nowait("dn1", "c0")
+            q.task_done("dn1")
+            self.assertEqual(await q2.get(), ("dn1", "c0"))
+            getter = asyncio.ensure_future(q.get())
+            await asyncio.sleep(0)
+            self.assertFalse(getter.done())
+            q2.task_done("dn1")
+            self.assertEqual(await getter, ("dn1", "a2"))
+            self.assertEqual(q.qsize(), 0)
+
+            join = asyncio.ensure_future(q.join())
+            await asyncio.sleep(0)
+            self.assertFalse(join.done())
+            q.task_done("dn2")
+            await asyncio.sleep(0)
+            self.assertFalse(join.done())
+            q.task_done("dn1")
+            await asyncio.wait_for(join, 1.0)
+            self.assertEqual(limiters["dn1"].inflight, 0)
+            self.assertEqual(limiters["dn2"].inflight, 0)
+
+        asyncio.run(run())
+
+    def testWorkQueueMaxSize(self):
+        limiter = DnConcurrency(name="dn1", initial_limit=4)
+
+        async def run():
+            q = DnWorkQueue(lambda dn_url: limiter, maxsize=2)
+            await q.put("dn1", 1)
+            await q.put("dn1", 2)
+            self.assertTrue(q.full())
+            putter = asyncio.ensure_future(q.put("dn1", 3))
+            await asyncio.sleep(0)
+            self.assertFalse(putter.done())
+            self.assertEqual(await q.get(), ("dn1", 1))
+            await asyncio.wait_for(putter, 1.0)
+            self.assertEqual(q.qsize(), 2)
+
+            # close drops the waiting items
+            q.close()
+            self.assertEqual(q.qsize(), 0)
+
+        asyncio.run(run())
+
+    def testWorkQueueDrain(self):
+        limiter = DnConcurrency(name="dn1", initial_limit=1)
+
+        async def run():
+            q = DnWorkQueue(lambda dn_url: limiter)
+            for i in range(4):
+                q.put_nowait("dn1", i)
+            self.assertEqual(await q.get(), ("dn1", 0))
+            join = asyncio.ensure_future(q.join())
+
+            # the waiting items are done, but not the one in progress
+            self.assertEqual(q.drain(), 3)
+            self.assertEqual(q.qsize(), 0)
+            await asyncio.sleep(0)
+            self.assertFalse(join.done())
+            q.task_done("dn1")
+            await asyncio.wait_for(join, 1.0)
+            self.assertEqual(limiter.inflight, 0)
+
+            # the queue can still be used
+            q.put_nowait("dn1", 5)
+            self.assertEqual(await q.get(), ("dn1", 5))
+            q.task_done("dn1")
+            await asyncio.wait_for(q.join(), 1.0)
+            self.assertEqual(q.drain(), 0)
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
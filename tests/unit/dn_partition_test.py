@@ -0,0 +1,217 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import sys
+import time
+import unittest
+import numpy as np
+
+sys.path.append("../..")
+from hsds import config
+from hsds.basenode import _evictMovedItems
+from hsds.util.dnPartition import HashRing, ModuloPartitioner, createPartitioner
+from hsds.util.idUtil import createObjId, getObjHash, getObjPartition
+from hsds.util.idUtil import getDnPartitioner, getPrevDnPartitioner
+from hsds.util.idUtil import validateInPartition, getDataNodeUrl, isMovedId
+from hsds.util.lruCache import LruCache
+
+KEY_COUNT = 20000
+
+
+def getUrls(count):
+    return [f"http://10.0.0.{i + 1}:6101" for i in range(count)]
+
+
+class DnPartitionTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(DnPartitionTest, self).__init__(*args, **kwargs)
+        # main
+        dset_id = createObjId("datasets")
+        self.hash_values = []
+        for i in range(KEY_COUNT):
+            chunk_id = f"c-{dset_id[2:]}_{i // 100}_{i % 100}"
+            self.hash_values.append(getObjHash(chunk_id))
+
+    def getMoved(self, before, after):
+        """fraction of keys that map to a different node"""
+        moved = 0
+        for hash_value in self.hash_values:
+            if before.getNode(hash_value) != after.getNode(hash_value):
+                moved += 1
+        return moved / KEY_COUNT
+
+    def testModulo(self):
+        partitioner = createPartitioner(getUrls(7), scheme="modulo")
+        self.assertTrue(isinstance(partitioner, ModuloPartitioner))
+        for hash_value in self.hash_values[:100]:
+            self.assertEqual(partitioner.getPartition(hash_value), hash_value % 7)
+        dset_id = createObjId("datasets")
+        obj_id = "c-" + dset_id[2:] + "_0_0"
+        self.assertEqual(partitioner.getPartition(getObjHash(obj_id)), getObjPartition(obj_id, 7))
+
+    def testBalance(self):
+        for node_count in (1, 4, 12):
+            ring = HashRing(getUrls(node_count), vnodes=128)
+            counts = [0] * node_count
+            for hash_value in self.hash_values:
+                counts[ring.getPartition(hash_value)] += 1
+            expected = KEY_COUNT / node_count
+            for count in counts:
+                self.assertTrue(count > expected * 0.75)
+                self.assertTrue(count < expected * 1.25)
+
+    def testNodeOrder(self):
+        # ownership depends on the node names, not their order in the list
+        urls = getUrls(5)
+        ring = HashRing(urls)
+        ring_reversed = HashRing(list(reversed(urls)))
+        for hash_value in self.hash_values[:1000]:
+            self.assertEqual(ring.getNode(hash_value), ring_reversed.getNode(hash_value))
+
+    def testRemapSimulation(self):
+        # fraction of keys that move when a DN is added or removed
+        for node_count in (4, 8, 16):
+            urls = getUrls(node_count)
+            scale_up = getUrls(node_count + 1)
+            scale_down = urls[:-1]
+            for scheme in ("modulo", "ring"):
+                before = createPartitioner(urls, scheme=scheme)
+                up = self.getMoved(before, createPartitioner(scale_up, scheme=scheme))
+                down = self.getMoved(before, createPartitioner(scale_down, scheme=scheme))
+                msg = f"{scheme} {node_count} nodes - moved on add: {up:.3f} "
+                msg += f"on remove: {down:.3f}"
+                print(msg)
+                if scheme == "modulo":
+                    self.assertTrue(up > 0.7)
+                    self.assertTrue(down > 0.7)
+                else:
+                    # ideal is 1/(n+1) on add and 1/n on remove
+                    self.assertTrue(up < 1.5 / (node_count + 1))
+                    self.assertTrue(down < 1.5 / node_count)
+
+        # with the ring, keys only move to an added node or off a removed one
+        urls = getUrls(8)
+        ring = HashRing(urls)
+        ring_up = HashRing(getUrls(9))
+        ring_down = HashRing(urls[1:])
+        for hash_value in self.hash_values:
+            node = ring.getNode(hash_value)
+            if ring_up.getNode(hash_value) != node:
+                self.assertEqual(ring_up.getNode(hash_value), getUrls(9)[-1])
+            if ring_down.getNode(hash_value) != node:
+                self.assertEqual(node, urls[0])
+
+    def testTransition(self):
+        urls = getUrls(4)
+        app = {
+            "node_type": "dn",
+            "node_state": "READY",
+            "id": "dn-2",
+            "dn_urls": urls,
+            "dn_ids": ["dn-0", "dn-1", "dn-2", "dn-3"],
+        }
+        ring = getDnPartitioner(app)
+        self.assertTrue(getDnPartitioner(app) is ring)
+        self.assertTrue(getPrevDnPartitioner(app) is None)
+
+        dset_id = createObjId("datasets")
+        chunk_ids = [f"c-{dset_id[2:]}_{i}" for i in range(500)]
+        owned = [x for x in chunk_ids if getDataNodeUrl(app, x) == urls[2]]
+        self.assertTrue(len(owned) > 0)
+        for chunk_id in chunk_ids:
+            if chunk_id in owned:
+                validateInPartition(app, chunk_id)
+            else:
+                with self.assertRaises(KeyError):
+                    validateInPartition(app, chunk_id)
+
+        # add a node, reads for keys moving to it are still accepted during
+        # transition, writes are not
+        app["dn_urls"] = getUrls(5)
+        app["dn_ids"] = ["dn-0", "dn-1", "dn-2", "dn-3", "dn-4"]
+        new_ring = getDnPartitioner(app)
+        self.assertFalse(new_ring is ring)
+        self.assertTrue(app["dn_partitioner_prev"] is ring)
+        # transition time comes from config, use a fixed window here
+        app["dn_partition_transition_end"] = time.time() + 60
+        self.assertTrue(getPrevDnPartitioner(app) is ring)
+        moved = [x for x in owned if getDataNodeUrl(app, x) != urls[2]]
+        self.assertTrue(len(moved) < len(owned) / 2)
+        for chunk_id in owned:
+            validateInPartition(app, chunk_id, readonly=True)
+            if chunk_id in moved:
+                with self.assertRaises(KeyError):
+                    validateInPartition(app, chunk_id)
+            else:
+                validateInPartition(app, chunk_id)
+
+        # after the transition only the new owners are valid
+        app["dn_partition_transition_end"] = time.time() - 1
+        self.assertTrue(getPrevDnPartitioner(app) is None)
+        for chunk_id in owned:
+            if chunk_id in moved:
+                with self.assertRaises(KeyError):
+                    validateInPartition(app, chunk_id, readonly=True)
+            else:
+                validateInPartition(app, chunk_id)
+
+    def testEvictMovedItems(self):
+        urls = getUrls(4)
+        app = {
+            "node_type": "dn",
+            "node_state": "READY",
+            "node_number": 2,
+            "dn_urls": urls,
+            "dn_ids": ["dn-0", "dn-1", "dn-2", "dn-3"],
+            "meta_cache": LruCache(mem_target=1024 * 1024),
+            "chunk_cache": LruCache(mem_target=1024 * 1024),
+            "handoff_items": {},
+        }
+        config.setOverride("cache_handoff_max_bytes", 1024 * 1024)
+        getDnPartitioner(app)
+        dset_id = createObjId("datasets")
+        chunk_ids = [f"c-{dset_id[2:]}_{i}" for i in range(500)]
+        owned = [x for x in chunk_ids if getDataNodeUrl(app, x) == urls[2]]
+        chunk_cache = app["chunk_cache"]
+        for chunk_id in owned:
+            chunk_cache[chunk_id] = np.zeros((10,), dtype="i4")
+        self.assertEqual(_evictMovedItems(app), 0)  # no change
+        self.assertEqual(len(chunk_cache), len(owned))
+
+        # add a node, moved items are removed from the cache right away
+        app["dn_urls"] = getUrls(5)
+        app["dn_ids"] = ["dn-0", "dn-1", "dn-2", "dn-3", "dn-4"]
+        moved = [x for x in owned if getDataNodeUrl(app, x) != urls[2]]
+        self.assertTrue(len(moved) > 1)
+        chunk_cache.setDirty(moved[0])
+        self.assertEqual(_evictMovedItems(app), 0)  # in the transition window
+        for chunk_id in owned:
+            self.assertEqual(chunk_id in chunk_cache, chunk_id not in moved[1:])
+            self.assertEqual(isMovedId(app, chunk_id), chunk_id in moved)
+        # the moved items are kept for handoff
+        self.assertEqual(set(app["handoff_items"]), set(moved[1:]))
+
+        # after the window, wait on the dirty item
+        app["dn_partition_transition_end"] = time.time() - 3600
+        self.assertEqual(_evictMovedItems(app), 1)
+        self.assertTrue(moved[0] in chunk_cache)
+        chunk_cache.clearDirty(moved[0])
+        self.assertEqual(_evictMovedItems(app), 0)
+        self.assertFalse(moved[0] in chunk_cache)
+        self.assertTrue(app["dn_partitioner_prev"] is None)
+        self.assertEqual(app["handoff_items"], {})
+        self.assertFalse(isMovedId(app, moved[1]))
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
@@ -11,11 +11,14 @@
 ##############################################################################
 import unittest
 import logging
+import math
 import sys
+from itertools import product
 
 sys.path.append("../..")
 from hsds.util.dsetUtil import getHyperslabSelection, getSelectionShape
 from hsds.util.dsetUtil import getSelectionList, ItemIterator, getSelectionPagination
+from hsds.util.dsetUtil import getVlenChunkFormat
 
 
 class DsetUtilTest(unittest.TestCase):
@@ -285,6 +288,164 @@ class DsetUtilTest(unittest.TestCase):
             self.assertTrue(page_size < max_request_size)
             start = page[0].stop
 
+    def testGetSelectionPaginationChunkAligned(self):
+
+        def getPageChunks(page, layout):
+            # return set of chunk indices touched by the page selection
+            chunk_indices = []
+            for s, extent in zip(page, layout):
+                if isinstance(s, slice):
+                    coords = range(s.start, s.stop, s.step if s.step else 1)
+                else:
+                    coords = s
+                chunk_indices.append(set(c // extent for c in coords))
+            return set(product(*chunk_indices))
+
+        def checkPages(pages, select, layout, itemsize, max_request_size):
+            # pages cover the selection, fit max_request_size, and don't
+            # share any chunks
+            touched = set()
+            count = 0
+            for page in pages:
+                page_size = math.prod(getSelectionShape(page))
+                self.assertTrue(page_size * itemsize <= max_request_size)
+                count += page_size
+                page_chunks = getPageChunks(page, layout)
+                self.assertFalse(touched & page_chunks)
+                touched |= page_chunks
+            self.assertEqual(count, math.prod(getSelectionShape(select)))
+            self.assertEqual(touched, getPageChunks(select, layout))
+
+        itemsize = 4
+
+        # 1D case - pages end on chunk boundaries
+        datashape = [1000,]
+        layout = [30,]
+        max_request_size = 1000  # 250 elements, 8 chunks per page
+        select = [slice(5, 1000, 1),]
+        pages = getSelectionPagination(
+            select, datashape, itemsize, max_request_size, layout=layout
+        )
+        self.assertEqual(len(pages), 5)
+        start = 5
+        for page in pages:
+            s = page[0]
+            self.assertEqual(s.start, start)
+            if s.stop < 1000:
+                self.assertEqual(s.stop % 30, 0)
+            start = s.stop
+        self.assertEqual(start, 1000)
+        checkPages(pages, select, layout, itemsize, max_request_size)
+
+        # with a step, page starts fall on the step
+        select = [slice(3, 1000, 7),]
+        pages = getSelectionPagination(
+            select, datashape, itemsize, 200, layout=layout
+        )
+        self.assertTrue(len(pages) > 1)
+        for page in pages:
+            self.assertEqual(page[0].start % 7, 3)
+            self.assertEqual(page[0].step, 7)
+        checkPages(pages, select, layout, itemsize, 200)
+
+        # 2D case, paginate along the first dimension
+        datashape = [200, 300]
+        layout = [16, 64]
+        max_request_size = 32 * 300 * itemsize  # two chunk rows per page
+        for select in (
+            [slice(0, 200, 1), slice(0, 300, 1)],
+            [slice(7, 190, 1), slice(10, 290, 1)],
+            [slice(0, 200, 3), slice(5, 300, 2)],
+        ):
+            pages = getSelectionPagination(
+                select, datashape, itemsize, max_request_size, layout=layout
+            )
+            self.assertTrue(len(pages) > 1)
+            start = select[0].start
+            for page in pages:
+                # pages follow each other along the first dimension
+                self.assertEqual(page[0].start, start)
+                self.assertEqual(page[1], select[1])
+                start = page[0].stop
+            checkPages(pages, select, layout, itemsize, max_request_size)
+
+        # 3D case with leading single index
+        datashape = [10, 500, 500]
+        layout = [1, 100, 100]
+        select = [slice(4, 5, 1), slice(0, 500, 1), slice(0, 500, 1)]
+        max_request_size = 250 * 500 * itemsize
+        pages = getSelectionPagination(
+            select, datashape, itemsize, max_request_size, layout=layout
+        )
+        self.assertEqual(len(pages), 3)
+        checkPages(pages, select, layout, itemsize, max_request_size)
+
+        # chunks spanning the whole first dimension can't be kept whole on
+        # the first dimension, but can on the second
+        datashape = [1000, 1000]
+        layout = [1000, 10]
+        select = [slice(0, 1000, 1), slice(0, 1000, 1)]
+        max_request_size = 100 * 1000 * itemsize
+        pages = getSelectionPagination(
+            select, datashape, itemsize, max_request_size, layout=layout
+        )
+        # row-major pages still touch every chunk more than once
+        self.assertEqual(len(pages), 10)
+        for page in pages:
+            self.assertEqual(page[1], select[1])
+        pages = getSelectionPagination(
+            select, datashape, itemsize, max_request_size, layout=layout, contiguous=False
+        )
+        self.assertEqual(len(pages), 10)
+        for page in pages:
+            self.assertEqual(page[0], select[0])
+            self.assertEqual(page[1].start % 10, 0)
+        checkPages(pages, select, layout, itemsize, max_request_size)
+
+        # a single row that's too big can't be paged in row-major order by
+        # splitting columns, so that's an error as without a layout
+        datashape = [2, 1000]
+        layout = [1, 100]
+        select = [slice(0, 2, 1), slice(0, 1000, 1)]
+        with self.assertRaises(ValueError):
+            getSelectionPagination(select, datashape, 4, 1000, layout=layout)
+        with self.assertRaises(ValueError):
+            getSelectionPagination(select, datashape, 4, 1000)
+        # unless the caller doesn't need row-major order
+        pages = getSelectionPagination(
+            select, datashape, 4, 1000, layout=layout, contiguous=False
+        )
+        self.assertEqual(len(pages), 10)
+        for page in pages:
+            self.assertEqual(page[0], select[0])
+
+        # a page that can't hold one chunk splits each chunk evenly
+        datashape = [1000,]
+        layout = [400,]
+        select = [slice(0, 1000, 1),]
+        max_request_size = 150 * itemsize
+        pages = getSelectionPagination(
+            select, datashape, itemsize, max_request_size, layout=layout
+        )
+        boundaries = [page[0].stop for page in pages]
+        self.assertTrue(400 in boundaries)
+        self.assertTrue(800 in boundaries)
+        for page in pages:
+            count = page[0].stop - page[0].start
+            self.assertTrue(count * itemsize <= max_request_size)
+            # no page crosses a chunk boundary
+            self.assertEqual(page[0].start // 400, (page[0].stop - 1) // 400)
+
+        # coordinate lists fall back to even pagination
+        datashape = [200, 300]
+        layout = [16, 64]
+        select = [list(range(0, 200, 2)), slice(0, 300, 1)]
+        max_request_size = 30 * 300 * itemsize
+        pages = getSelectionPagination(
+            select, datashape, itemsize, max_request_size, layout=layout
+        )
+        self.assertEqual(sum(len(page[0]) for page in pages), 100)
+
     def testItemIterator(self):
         # 1-D case
         datashape = [10,]
@@ -605,6 +766,14 @@ class DsetUtilTest(unittest.TestCase):
         except ValueError:
             pass  # expected
 
+    def testGetVlenChunkFormat(self):
+        dset_json = {"id": "d-b4c41ad6-6bc1f71b-6c0c-6f4b7e-d4c4ab"}
+        self.assertEqual(getVlenChunkFormat(dset_json), "sequential")
+        dset_json["creationProperties"] = {"fillValue": 0}
+        self.assertEqual(getVlenChunkFormat(dset_json), "sequential")
+        dset_json["creationProperties"]["vlenChunkFormat"] = "indexed"
+        self.assertEqual(getVlenChunkFormat(dset_json), "indexed")
+
 
 if __name__ == "__main__":
     # setup test files
@@ -0,0 +1,243 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import asyncio
+import sys
+import time
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+from aiohttp import web
+
+sys.path.append("../..")
+from hsds import config
+from hsds.handoff_dn import GET_Handoff, PUT_Handoff, recordFlush
+from hsds.handoff_dn import _addItems, _decodeItem, _encodeItem, _getFrames
+from hsds.util.batchUtil import decodeFrames, encodeFrame
+from hsds.util.httpUtil import http_get, http_put
+from hsds.util.idUtil import createDnPartitioner, createObjId, getDnPartitioner, getObjHash
+from hsds.util.inProcessUtil import InProcessClient, getInProcessUrl
+from hsds.util.lruCache import LruCache
+
+DN_URLS = [getInProcessUrl(f"dn_{i}") for i in range(3)]
+NEW_URL = getInProcessUrl("dn_3")
+
+
+def get_chunk_ids(count):
+    dset_id = createObjId("datasets")
+    return [f"c-{dset_id[2:]}_{i}" for i in range(count)]
+
+
+def init_app(app):
+    """set up the state of DN 1 of DN_URLS in app"""
+    app["node_type"] = "dn"
+    app["node_state"] = "READY"
+    app["max_task_count"] = None
+    app["node_number"] = 1
+    app["dn_urls"] = DN_URLS
+    app["dn_ids"] = [f"dn-{i}" for i in range(len(DN_URLS))]
+    app["meta_cache"] = LruCache(mem_target=1024 * 1024)
+    app["chunk_cache"] = LruCache(mem_target=1024 * 1024, name="ChunkCache")
+    app["deleted_ids"] = set()
+    app["flush_times"] = OrderedDict()
+    app["handoff_items"] = {}
+    getDnPartitioner(app)
+    return app
+
+
+def get_body(items, update_time=None):
+    """return request body for the given (cache_name, obj_id, data) items"""
+    if update_time is None:
+        update_time = time.time()
+    frames = []
+    for cache_name, obj_id, data in items:
+        header, data = _encodeItem(cache_name, obj_id, data, update_time)
+        frames.append(encodeFrame(header, data))
+    return b"".join(frames)
+
+
+class HandoffTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(HandoffTest, self).__init__(*args, **kwargs)
+        # main
+
+    def testEncodeDecode(self):
+        now = time.time()
+        dt = np.dtype([("a", "<i4"), ("b", "<f8")])
+        items = [
+            np.arange(12, dtype="<i2").reshape((3, 4)),
+            np.zeros((2,), dtype=dt),
+            {"id": "g-1", "links": {"a": 1}},
+            b"some bytes",
+        ]
+        for data in items:
+            header, item_bytes = _encodeItem("chunk_cache", "x", data, now)
+            self.assertEqual(header["id"], "x")
+            self.assertEqual(header["cache"], "chunk_cache")
+            self.assertEqual(header["updated"], now)
+            # items go through the frame encoding
+            frames = list(decodeFrames(encodeFrame(header, item_bytes)))
+            self.assertEqual(len(frames), 1)
+            copy = _decodeItem(*frames[0])
+            if isinstance(data, np.ndarray):
+                self.assertEqual(copy.dtype, data.dtype)
+                self.assertEqual(copy.shape, data.shape)
+                self.assertTrue(np.array_equal(copy, data))
+                copy[...] = 0  # a writable copy
+            else:
+                self.assertEqual(copy, data)
+
+        # vlen data and other types aren't sent
+        vlen_arr = np.zeros((2,), dtype=np.dtype("O", metadata={"vlen": str}))
+        self.assertEqual(_encodeItem("chunk_cache", "x", vlen_arr, now), None)
+        self.assertEqual(_encodeItem("meta_cache", "x", ["a"], now), None)
+        with self.assertRaises(ValueError):
+            _decodeItem({"id": "x", "cache": "meta_cache"}, b"")
+
+    def testAddItems(self):
+        app = init_app({})
+        chunk_cache = app["chunk_cache"]
+        chunk_ids = get_chunk_ids(6)
+        arr = np.arange(10, dtype="i4")
+        items = [("chunk_cache", chunk_id, arr) for chunk_id in chunk_ids]
+        chunk_cache[chunk_ids[0]] = np.zeros((10,), dtype="i4")
+        app["deleted_ids"].add(chunk_ids[1])
+        update_time = time.time() - 10.0
+        recordFlush(app, chunk_ids[2])  # written after the copies were cached
+        app["flush_times"][chunk_ids[3]] = update_time - 1.0  # written before
+
+        def is_owner(obj_id):
+            return obj_id != chunk_ids[4]
+
+        count = _addItems(app, get_body(items, update_time), is_owner)
+        self.assertEqual(count, 2)
+        # items already in the cache are kept
+        self.assertEqual(chunk_cache[chunk_ids[0]][1], 0)
+        for chunk_id in chunk_ids[1:5]:
+            self.assertEqual(chunk_id in chunk_cache, chunk_id == chunk_ids[3])
+        self.assertTrue(np.array_equal(chunk_cache[chunk_ids[5]], arr))
+        # the copies keep the time they were cached by the sender
+        self.assertEqual(chunk_cache.getUpdateTime(chunk_ids[5]), update_time)
+
+        # copies older than the flush times that are kept aren't taken
+        chunk_id = get_chunk_ids(1)[0]
+        body = get_body([("chunk_cache", chunk_id, arr)], update_time=time.time() - 7200)
+        self.assertEqual(_addItems(app, body, is_owner), 0)
+
+        # items that don't fit in the cache aren't added
+        big_arr = np.zeros((1024 * 1024,), dtype="u1")
+        body = get_body([("chunk_cache", chunk_id, big_arr)])
+        self.assertEqual(_addItems(app, body, is_owner), 0)
+        self.assertFalse(chunk_id in chunk_cache)
+
+        # frames without the cache time are rejected
+        body = encodeFrame({"id": chunk_id, "cache": "chunk_cache", "format": "bytes"}, b"x")
+        with self.assertRaises(ValueError):
+            _addItems(app, body, is_owner)
+
+    def testFlushTimes(self):
+        app = init_app({})
+        flush_times = app["flush_times"]
+        chunk_ids = get_chunk_ids(3)
+        flush_times[chunk_ids[0]] = time.time() - 7200  # past the limit
+        flush_times[chunk_ids[1]] = time.time() - 60
+        recordFlush(app, chunk_ids[2])
+        recordFlush(app, chunk_ids[1])
+        self.assertEqual(list(flush_times), [chunk_ids[2], chunk_ids[1]])
+
+    def testGetFrames(self):
+        app = init_app({})
+        chunk_cache = app["chunk_cache"]
+        chunk_ids = get_chunk_ids(10)
+        for chunk_id in chunk_ids[:8]:
+            chunk_cache[chunk_id] = np.zeros((100,), dtype="u1")
+        for i, chunk_id in enumerate(chunk_ids[:8]):
+            for _ in range(i):
+                chunk_cache[chunk_id]  # hits
+        chunk_cache.setDirty(chunk_ids[7])  # dirty items aren't sent
+        # moved items are sent first
+        for chunk_id in chunk_ids[8:]:
+            item = ("chunk_cache", np.zeros((100,), dtype="u1"), 100, time.time())
+            app["handoff_items"][chunk_id] = item
+
+        frames = _getFrames(app, None, 10000, 0)
+        ids = [header["id"] for header, _ in frames]
+        self.assertEqual(ids, chunk_ids[8:] + chunk_ids[6::-1])
+
+        # item limit
+        frames = _getFrames(app, None, 10000, 4)
+        ids = [header["id"] for header, _ in frames]
+        self.assertEqual(ids, chunk_ids[8:] + chunk_ids[6:4:-1])
+        frames = _getFrames(app, None, 10000, 1)
+        self.assertEqual([header["id"] for header, _ in frames], chunk_ids[8:9])
+
+        # byte limit
+        frames = _getFrames(app, None, 450, 0)
+        ids = [header["id"] for header, _ in frames]
+        self.assertEqual(ids, chunk_ids[8:] + chunk_ids[6:4:-1])
+        self.assertTrue(sum(len(data) for _, data in frames) <= 450)
+
+        # key filter
+        frames = _getFrames(app, lambda x: x in chunk_ids[1::2], 10000, 0)
+        ids = [header["id"] for header, _ in frames]
+        self.assertEqual(ids, [chunk_ids[9], chunk_ids[5], chunk_ids[3], chunk_ids[1]])
+
+    def testHandoffRequests(self):
+        config.setOverride("max_request_size", 1024 * 1024)
+        node_app = init_app(web.Application())
+        node_app.router.add_route("GET", "/handoff", GET_Handoff)
+        node_app.router.add_route("PUT", "/handoff", PUT_Handoff)
+        node_app.freeze()
+        node_url = DN_URLS[1]
+        app = {"dn_urls": DN_URLS, "inprocess_clients": {node_url: InProcessClient(node_app)}}
+        chunk_ids = get_chunk_ids(200)
+        arr = np.arange(4, dtype="i4")
+
+        # DN 0 is leaving, items are taken if DN 1 owns them now or will
+        # once DN 0 is gone
+        current = createDnPartitioner(DN_URLS)
+        after = createDnPartitioner(DN_URLS[1:])
+        expected = set()
+        for chunk_id in chunk_ids:
+            obj_hash = getObjHash(chunk_id)
+            if node_url in (current.getNode(obj_hash), after.getNode(obj_hash)):
+                expected.add(chunk_id)
+        self.assertTrue(0 < len(expected) < len(chunk_ids))
+        body = get_body([("chunk_cache", chunk_id, arr) for chunk_id in chunk_ids])
+        params = {"leaving": DN_URLS[0]}
+        rsp = asyncio.run(http_put(app, node_url + "/handoff", data=body, params=params))
+        self.assertEqual(rsp["count"], len(expected))
+        chunk_cache = node_app["chunk_cache"]
+        self.assertEqual(set(chunk_cache), expected)
+
+        # a new DN gets the items it will own
+        joined = createDnPartitioner(DN_URLS + [NEW_URL])
+        expected = set(x for x in expected if joined.getNode(getObjHash(x)) == NEW_URL)
+        self.assertTrue(len(expected) > 1)
+        params = {"node": NEW_URL, "max_bytes": 1024 * 1024}
+        body = asyncio.run(http_get(app, node_url + "/handoff", params=params))
+        ids = set(header["id"] for header, _ in decodeFrames(body))
+        self.assertEqual(ids, expected)
+
+        # within the given limits
+        params["max_items"] = 1
+        body = asyncio.run(http_get(app, node_url + "/handoff", params=params))
+        self.assertEqual(len(list(decodeFrames(body))), 1)
+        params = {"node": NEW_URL, "max_bytes": len(arr.tobytes())}
+        body = asyncio.run(http_get(app, node_url + "/handoff", params=params))
+        self.assertEqual(len(list(decodeFrames(body))), 1)
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
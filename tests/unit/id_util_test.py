@@ -16,7 +16,8 @@ sys.path.append("../..")
 from hsds.util.idUtil import getObjPartition, isValidUuid, validateUuid
 from hsds.util.idUtil import createObjId, getCollectionForId
 from hsds.util.idUtil import isObjId, isS3ObjKey, getS3Key, getObjId, isSchema2Id
-from hsds.util.idUtil import isRootObjId, getRootObjId
+from hsds.util.idUtil import isRootObjId, getRootObjId, ChunkId, toChunkId
+from hsds.util.chunkUtil import getChunkIndex, getDatasetId, getPartitionKey
 
 
 class IdUtilTest(unittest.TestCase):
@@ -205,6 +206,38 @@ class IdUtilTest(unittest.TestCase):
             self.assertEqual(getObjId(s3key), oid)
             self.assertTrue(isS3ObjKey(s3key))
 
+    def testChunkId(self):
+        dset_id = createObjId("datasets")
+        id_str = "c-" + dset_id[2:] + "_3_17_4"
+        chunk_id = toChunkId(id_str)
+        self.assertTrue(isinstance(chunk_id, ChunkId))
+        self.assertTrue(toChunkId(chunk_id) is chunk_id)
+        # behaves just like the string version
+        self.assertEqual(chunk_id, id_str)
+        self.assertEqual(hash(chunk_id), hash(id_str))
+        d = {id_str: 42}
+        self.assertEqual(d[chunk_id], 42)
+        self.assertEqual(f"{chunk_id}", id_str)
+        self.assertEqual(type(str(chunk_id)), str)
+        self.assertTrue(isValidUuid(chunk_id, "Chunk"))
+
+        self.assertEqual(chunk_id.dsetId, dset_id)
+        self.assertEqual(chunk_id.chunkIndex, (3, 17, 4))
+        self.assertEqual(chunk_id.index("_"), id_str.index("_"))
+        self.assertEqual(getDatasetId(chunk_id), dset_id)
+        self.assertEqual(getChunkIndex(chunk_id), [3, 17, 4])
+        self.assertEqual(getS3Key(chunk_id), getS3Key(id_str))
+        self.assertEqual(getS3Key(chunk_id), getS3Key(chunk_id))  # cached
+        for count in (1, 3, 7):
+            self.assertEqual(getObjPartition(chunk_id, count), getObjPartition(id_str, count))
+
+        # partitioned chunk ids
+        partition_id = getPartitionKey(chunk_id, 10)
+        self.assertTrue(isinstance(partition_id, ChunkId))
+        self.assertEqual(partition_id, getPartitionKey(id_str, 10))
+        self.assertEqual(partition_id.dsetId, dset_id)
+        self.assertEqual(getS3Key(partition_id), getS3Key(str(partition_id)))
+
 
 if __name__ == "__main__":
     # setup test files
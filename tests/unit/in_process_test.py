@@ -0,0 +1,170 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import asyncio
+import sys
+import unittest
+
+from aiohttp import web
+from aiohttp.web_exceptions import HTTPInternalServerError, HTTPNotFound
+
+sys.path.append("../..")
+from hsds.util.batchUtil import encodeFrames, readFrame
+from hsds.util.httpUtil import get_base_url, get_http_client, http_get, http_post
+from hsds.util.inProcessUtil import InProcessClient, getInProcessUrl, isInProcessUrl
+
+
+async def get_item(request):
+    item_id = request.match_info["id"]
+    if item_id == "missing":
+        raise HTTPNotFound()
+    params = dict(request.rel_url.query)
+    return web.json_response({"id": item_id, "params": params})
+
+
+async def post_item(request):
+    data = await request.read()
+    if request.content_type == "application/json":
+        body = await request.json()
+        return web.json_response({"body": body})
+    # return the bytes reversed
+    resp = web.StreamResponse()
+    resp.content_type = "application/octet-stream"
+    resp.content_length = len(data)
+    await resp.prepare(request)
+    await resp.write(data[::-1])
+    await resp.write_eof()
+    return resp
+
+
+async def post_frames(request):
+    count = int(request.rel_url.query.get("count", "0"))
+    items = [({"index": i}, bytes([i]) * i) for i in range(count)]
+    return web.Response(body=encodeFrames(items), content_type="application/octet-stream")
+
+
+async def get_bytes(request):
+    count = int(request.rel_url.query.get("count", "0"))
+    # send the body in pieces so it's read in more than one chunk
+    resp = web.StreamResponse()
+    resp.content_type = "application/octet-stream"
+    resp.content_length = count
+    await resp.prepare(request)
+    for i in range(0, count, 100):
+        await resp.write(bytes([j % 256 for j in range(i, min(i + 100, count))]))
+    await resp.write_eof()
+    return resp
+
+
+def create_app():
+    app = web.Application()
+    app.router.add_route("GET", "/items/{id}", get_item)
+    app.router.add_route("POST", "/items/{id}", post_item)
+    app.router.add_route("POST", "/frames", post_frames)
+    app.router.add_route("GET", "/bytes", get_bytes)
+    # as AppRunner.setup would
+    app.freeze()
+    return app
+
+
+class InProcessTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(InProcessTest, self).__init__(*args, **kwargs)
+        # main
+
+    def testUrls(self):
+        url = getInProcessUrl("dn_1")
+        self.assertEqual(url, "http+inproc://dn_1")
+        self.assertTrue(isInProcessUrl(url))
+        self.assertFalse(isInProcessUrl("http://localhost:6101"))
+        self.assertFalse(isInProcessUrl("http+unix://%2Ftmp%2Fdn_1.sock"))
+        self.assertEqual(get_base_url(url + "/chunks/c-123"), url)
+        self.assertEqual(get_base_url(url), url)
+
+    def testRequests(self):
+        async def run_requests():
+            client = InProcessClient(create_app())
+            url = getInProcessUrl("dn_1")
+            results = {}
+            async with client.get(url + "/items/abc", params={"x": "1"}) as rsp:
+                results["get"] = (rsp.status, await rsp.json())
+            async with client.post(url + "/items/abc", json={"a": [1, 2]}) as rsp:
+                results["json"] = (rsp.status, await rsp.json())
+            async with client.post(url + "/items/abc", data=b"\x01\x02\x03") as rsp:
+                ctype = rsp.headers["Content-Type"]
+                results["binary"] = (rsp.status, ctype, await rsp.read())
+            async with client.get(url + "/items/missing") as rsp:
+                results["missing"] = rsp.status
+            async with client.get(url + "/nosuchpath") as rsp:
+                results["nosuchpath"] = rsp.status
+            return results
+
+        results = asyncio.run(run_requests())
+        self.assertEqual(results["get"], (200, {"id": "abc", "params": {"x": "1"}}))
+        self.assertEqual(results["json"], (200, {"body": {"a": [1, 2]}}))
+        self.assertEqual(results["binary"], (200, "application/octet-stream", b"\x03\x02\x01"))
+        self.assertEqual(results["missing"], 404)
+        self.assertEqual(results["nosuchpath"], 404)
+
+    def testHttpHelpers(self):
+        async def run_helpers():
+            url = getInProcessUrl("dn_1")
+            app = {"inprocess_clients": {url: InProcessClient(create_app())}}
+            rsp_json = await http_get(app, url + "/items/xyz", params={"y": "2"})
+            data = await http_post(app, url + "/items/xyz", data=b"abcd")
+            with self.assertRaises(HTTPNotFound):
+                await http_get(app, url + "/items/missing")
+            client = get_http_client(app, url=url)
+            async with client.post(url + "/frames", params={"count": 4}) as rsp:
+                frames = []
+                while True:
+                    frame = await readFrame(rsp.content)
+                    if frame is None:
+                        break
+                    frames.append(frame)
+            return rsp_json, data, frames
+
+        rsp_json, data, frames = asyncio.run(run_helpers())
+        self.assertEqual(rsp_json, {"id": "xyz", "params": {"y": "2"}})
+        self.assertEqual(data, b"dcba")
+        self.assertEqual(len(frames), 4)
+        for i, (header, frame_data) in enumerate(frames):
+            self.assertEqual(header, {"index": i})
+            self.assertEqual(frame_data, bytes([i]) * i)
+
+    def testReadInto(self):
+        url = getInProcessUrl("dn_1")
+        app = {"inprocess_clients": {url: InProcessClient(create_app())}}
+        expected = bytes([j % 256 for j in range(1000)])
+
+        async def read(count, out):
+            return await http_get(app, url + "/bytes", params={"count": count}, out=out)
+
+        # the response fills the buffer exactly
+        out = bytearray(1000)
+        self.assertEqual(asyncio.run(read(1000, out)), 1000)
+        self.assertEqual(bytes(out), expected)
+
+        # a short response returns the count read, for the caller to check
+        out = bytearray(1000)
+        self.assertEqual(asyncio.run(read(550, out)), 550)
+        self.assertEqual(bytes(out[:550]), expected[:550])
+        self.assertEqual(bytes(out[550:]), bytes(450))
+
+        # a response larger than the buffer is an error
+        with self.assertRaises(HTTPInternalServerError):
+            asyncio.run(read(1001, bytearray(1000)))
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
@@ -296,6 +296,34 @@ class LruCacheTest(unittest.TestCase):
         mem_per = cc.cacheUtilizationPercent
         self.assertEqual(mem_per, 0)  # no memory used
 
+    def testHotKeys(self):
+        """check hot key selection"""
+        cc = LruCache(mem_target=1024 * 100, name="ChunkCache")
+        ids = []
+        for i in range(10):
+            id = createObjId("groups")
+            cc[id] = {"i": i}  # 1024 bytes each
+            ids.append(id)
+        # read each item i times
+        for i in range(10):
+            for _ in range(i):
+                cc[ids[i]]
+        # peek doesn't count as a hit
+        for _ in range(20):
+            cc.peek(ids[0])
+        self.assertEqual(cc.getHotKeys(1024 * 3), [ids[9], ids[8], ids[7]])
+        self.assertEqual(cc.getHotKeys(1024 * 100, max_count=2), [ids[9], ids[8]])
+        self.assertEqual(cc.getHotKeys(1024 * 100, key_filter=lambda x: x in ids[:3]),
+                         [ids[2], ids[1], ids[0]])
+        self.assertEqual(cc.getHotKeys(1000), [])
+        # dirty items aren't included
+        cc.setDirty(ids[9])
+        self.assertEqual(cc.getHotKeys(1024 * 2), [ids[8], ids[7]])
+        # old hits count for less
+        node = cc._hash[ids[8]]
+        node._last_hit -= 3000.0
+        self.assertEqual(cc.getHotKeys(1024 * 2), [ids[7], ids[6]])
+
 
 if __name__ == "__main__":
     # setup test files
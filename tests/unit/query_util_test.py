@@ -0,0 +1,293 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append("../..")
+from hsds.util import queryUtil
+from hsds.util.queryUtil import compileQuery, getQueryPlan
+from hsds.util.queryUtil import _getWhereFieldName, _getWhereElements
+
+
+def get_rows(count=1000):
+    dt = np.dtype([("date", "i4"), ("wind", "S5"), ("temp", "f8"), ("tgt123", "u2"),
+                   ("flags", "i8"), ("ok", "?")])
+    rows = np.zeros((count,), dtype=dt)
+    rows["date"] = np.arange(count) % 31
+    rows["wind"] = [f"{d} {i % 9}".encode("ascii") for i, d in zip(range(count), "NSEW" * count)]
+    rows["temp"] = np.linspace(40.0, 90.0, count)
+    rows["tgt123"] = np.arange(count) % 500
+    rows["flags"] = np.arange(count)
+    rows["ok"] = np.arange(count) % 3 == 0
+    return rows
+
+
+class QueryUtilTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(QueryUtilTest, self).__init__(*args, **kwargs)
+        # main
+
+    def testCompileQuery(self):
+        rows = get_rows()
+        queries = {}
+        queries["date == 23"] = rows["date"] == 23
+        queries["tgt123 == 456"] = rows["tgt123"] == 456
+        queries["wind == b'W 5'"] = rows["wind"] == b"W 5"
+        queries["temp > 61"] = rows["temp"] > 61
+        queries["(date >= 22) & (date <= 24)"] = (rows["date"] >= 22) & (rows["date"] <= 24)
+        queries["(date == 21) & (temp > 70)"] = (rows["date"] == 21) & (rows["temp"] > 70)
+        expected = (rows["wind"] == b"E 7") | (rows["wind"] == b"S 7")
+        queries["(wind == b'E 7') | (wind == b'S 7')"] = expected
+        # AND and OR bind less tightly than comparisons
+        queries["date >= 22 & date <= 24"] = (rows["date"] >= 22) & (rows["date"] <= 24)
+        queries["date == 1 OR date == 2 AND temp > 80"] = (rows["date"] == 1) | (
+            (rows["date"] == 2) & (rows["temp"] > 80))
+        queries["(temp - 32) * 5 / 9 > 20.5"] = (rows["temp"] - 32) * 5 / 9 > 20.5
+        queries["-temp < -85"] = -rows["temp"] < -85
+        queries["date % 7 == 0"] = rows["date"] % 7 == 0
+        queries["(flags & 4) > 0"] = (rows["flags"] & 4) > 0
+        queries["ok & (date > 10)"] = rows["ok"] & (rows["date"] > 10)
+        queries["ok"] = rows["ok"]
+        # mostly decided by the left side
+        queries["(date == 3) & (temp > 50)"] = (rows["date"] == 3) & (rows["temp"] > 50)
+        queries["(date != 3) | (temp > 50)"] = (rows["date"] != 3) | (rows["temp"] > 50)
+        queries["(temp > 200) & (date == 3)"] = np.zeros((len(rows),), dtype=bool)
+        queries["(temp < 200) | (date == 3)"] = np.ones((len(rows),), dtype=bool)
+
+        for use_numexpr in (False, True):
+            for query in queries:
+                plan = compileQuery(query, rows.dtype, use_numexpr=use_numexpr)
+                expected = np.flatnonzero(queries[query])
+                indices = plan.getIndices(rows)
+                np.testing.assert_array_equal(indices, expected, err_msg=query)
+        # the source array isn't changed by queries
+        np.testing.assert_array_equal(rows, get_rows())
+
+    def testBoolFieldNotChanged(self):
+        # a bool field that decides every row is returned by the inner OR,
+        # and mustn't be updated in place by the outer AND
+        rows = get_rows(count=100)
+        rows["ok"] = True
+        source = rows.copy()
+        queries = {
+            "(ok | (date > 5)) & (temp < 50)": rows["temp"] < 50,
+            "(ok | (date > 5)) & (date < 3)": rows["date"] < 3,
+            "((date > 50) | ok) & (temp > 80)": rows["temp"] > 80,
+        }
+        for query, expected in queries.items():
+            plan = compileQuery(query, rows.dtype, use_numexpr=False)
+            indices = plan.getIndices(rows)
+            np.testing.assert_array_equal(indices, np.flatnonzero(expected), err_msg=query)
+            np.testing.assert_array_equal(rows, source, err_msg=query)
+
+    def testNumexpr(self):
+        if queryUtil.numexpr is None:
+            print("numexpr not installed, skipping")
+            return
+        rows = get_rows(count=queryUtil.NUMEXPR_MIN_ROWS)
+        queries = ("(date >= 22) & (temp < 60.5)", "(temp - 32) * 5 / 9 > 20.5",
+                   "(date == 1) | ok")
+        for query in queries:
+            plan = compileQuery(query, rows.dtype)
+            self.assertTrue(plan.use_numexpr)
+            expected = compileQuery(query, rows.dtype, use_numexpr=False).getIndices(rows)
+            np.testing.assert_array_equal(plan.getIndices(rows), expected)
+        # string compares and bitwise ops use numpy
+        for query in ("wind == b'W 5'", "(flags & 4) > 0", "tgt123 > 5"):
+            self.assertFalse(compileQuery(query, rows.dtype).use_numexpr)
+
+    def testBytesCompare(self):
+        # fixed length strings of 1, 2, 4, or 8 bytes are compared as ints
+        dt = np.dtype([("s1", "S1"), ("s4", "S4"), ("s8", "S8"), ("s3", "S3")])
+        rows = np.zeros((6,), dtype=dt)
+        values = [b"", b"A", b"AB", b"ABC", b"ABCD", b"A\0C"]
+        for field in dt.names:
+            size = dt[field].itemsize
+            rows[field] = [v[:size] for v in values]
+        for field in dt.names:
+            for value in values + [b"ABCDEFGHI", b"AB\0"]:
+                for op in ("==", "!="):
+                    for query in (f"{field} {op} {value!r}", f"{value!r} {op} {field}"):
+                        plan = compileQuery(query, dt)
+                        if op == "==":
+                            mask = rows[field] == value
+                        else:
+                            mask = rows[field] != value
+                        expected = np.flatnonzero(mask)
+                        np.testing.assert_array_equal(plan.getIndices(rows), expected,
+                                                      err_msg=query)
+                        # and on a subset of the rows
+                        sel = rows[1::2]
+                        expected = np.flatnonzero(mask[1::2])
+                        np.testing.assert_array_equal(plan.getIndices(sel), expected,
+                                                      err_msg=query)
+
+    def testWhereQuery(self):
+        rows = get_rows()
+        plan = compileQuery("where 'tgt123' in (61, 68, 72)", rows.dtype)
+        expected = np.flatnonzero(np.isin(rows["tgt123"], (61, 68, 72)))
+        np.testing.assert_array_equal(plan.getIndices(rows), expected)
+        self.assertEqual(plan.where_field, "tgt123")
+
+        plan = compileQuery("date >= 22 where wind in (b'N 0', b'E 2')", rows.dtype)
+        mask = (rows["date"] >= 22) & np.isin(rows["wind"], (b"N 0", b"E 2"))
+        np.testing.assert_array_equal(plan.getIndices(rows), np.flatnonzero(mask))
+
+        dt = np.dtype([("symbol", "S4"), ("open", "f8")])
+        stocks = np.zeros((5,), dtype=dt)
+        stocks["symbol"] = [b"AAPL", b"IBM", b"EBAY", b"IBM", b"A"]
+        plan = compileQuery("where symbol in (b'IBM', b'A', b'MSFT')", dt)
+        np.testing.assert_array_equal(plan.getIndices(stocks), [1, 3, 4])
+
+        plan = compileQuery("where tgt123 in (1000, 2000)", rows.dtype)
+        self.assertEqual(len(plan.getIndices(rows)), 0)
+
+    def testMayMatch(self):
+        rows = get_rows()
+        dt = rows.dtype
+        # stats for one chunk: [min, max, nan_count]
+        stats = {"date": [10, 20, 0], "temp": [50.0, 60.0, 3], "flags": [0, 99, 0]}
+        queries = {
+            "date > 19": True,
+            "date > 20": False,
+            "date >= 20": True,
+            "date < 10": False,
+            "date <= 10": True,
+            "date == 15": True,
+            "date == 21": False,
+            "5 > date": False,
+            "25 > date": True,
+            "date != 15": True,
+            "date != 10": True,
+            "temp > 60.5": False,
+            "temp != 55.0": True,
+            "(date > 30) | (temp < 55)": True,
+            "(date > 30) | (temp < 45)": False,
+            "(date > 15) & (temp > 70)": False,
+            "(date > 15) & (temp > 55)": True,
+            "date * 2 > 100": True,  # no range check for arithmetic
+            "wind == b'N 5'": True,  # no stats for strings
+            "tgt123 > 1000": True,  # no stats for this field
+            "where date in (1, 2, 3)": False,
+            "where date in (1, 12)": True,
+            "date > 25 where date in (1, 12)": False,
+            "date > 5 where wind in (b'N 1', b'E 2')": True,
+        }
+        for query, expected in queries.items():
+            plan = compileQuery(query, dt)
+            self.assertEqual(plan.mayMatch(stats), expected, msg=query)
+
+        # nans don't match anything except !=
+        stats = {"date": [10, 10, 0], "temp": [None, None, 100]}
+        self.assertFalse(compileQuery("temp > 0", dt).mayMatch(stats))
+        self.assertTrue(compileQuery("temp != 0", dt).mayMatch(stats))
+        self.assertFalse(compileQuery("date != 10", dt).mayMatch(stats))
+
+        # the constant is cast to the field type like it is for the query
+        dt = np.dtype([("x", "f4")])
+        value = float(np.float32(0.1))
+        stats = {"x": [value, value, 0]}
+        arr = np.array([value], dtype="f4").view(dt)
+        plan = compileQuery("x == 0.1", dt)
+        self.assertEqual(len(plan.getIndices(arr)), 1)
+        self.assertTrue(plan.mayMatch(stats))
+
+    def testGetWhereRange(self):
+        dt = np.dtype([("date", "i4"), ("symbol", "S4"), ("open", "f8")])
+        # key index for a chunk: [keys, starts, stops]
+        index = {
+            "date": [[1, 3, 5, 9], [6, 1, 0, 3], [7, 6, 8, 4]],
+            "symbol": [["AAPL", "EBAY", "IBM"], [1, 5, 0], [5, 6, 8]],
+        }
+        queries = {
+            "where date in (3, 9)": (1, 6),
+            "where date in (1)": (6, 7),
+            "where date in (2, 4, 10, 0)": (0, 0),
+            "where date in (9, 9, 100)": (3, 4),
+            "open > 5 where date in (5, 2)": (0, 8),
+            "where symbol in (b'EBAY', b'MSFT')": (5, 6),
+            "where symbol in (b'IB', b'IBMX')": (0, 0),
+            "where symbol in (b'AAPL', b'EBAY')": (1, 6),
+            "where open in (1.0, 2.0)": None,  # not indexed
+            "date > 3": None,  # not a where query
+        }
+        for query, expected in queries.items():
+            plan = compileQuery(query, dt)
+            self.assertEqual(plan.getWhereRange(index), expected, msg=query)
+        # chunk with too many keys to index
+        plan = compileQuery("where date in (3, 9)", dt)
+        self.assertEqual(plan.getWhereRange({"date": None}), None)
+        self.assertEqual(plan.getWhereRange({"date": [[], [], []]}), (0, 0))
+
+    def testPlanCache(self):
+        rows = get_rows()
+        plan = getQueryPlan("temp > 61", rows.dtype)
+        self.assertTrue(getQueryPlan("temp > 61", rows.dtype) is plan)
+        self.assertTrue(getQueryPlan("temp > 61", np.dtype(rows.dtype.descr)) is plan)
+        self.assertFalse(getQueryPlan("temp > 62", rows.dtype) is plan)
+        other_dt = np.dtype([("temp", "f4")])
+        self.assertFalse(getQueryPlan("temp > 61", other_dt) is plan)
+
+    def testGetWhereFieldName(self):
+        queries = {}
+        queries["date == 23"] = None
+        queries["where 'temp' in (61, 68, 72)"] = "temp"
+        queries["date >= 22 where 'temp' in (61, 68, 72)"] = "temp"
+        queries["date >= 22 where 'temp F' in (61, 68, 72)"] = "temp F"
+        queries["date >= 22 where 'temp F123' in (61, 68, 72)"] = "temp F123"
+
+        for query in queries.keys():
+            field = _getWhereFieldName(query)
+            self.assertEqual(field, queries[query])
+
+    def testGetWhereElements(self):
+        queries = {}
+        queries["where 'temp' in (61, 68, 72)"] = ["61", "68", "72"]
+        queries["where 'temp' in (abc, xyz, abacab)"] = ["abc", "xyz", "abacab"]
+        queries["where 'temp' in ('ab cd', 'xyz ', 'abacab')"] = ["ab cd", "xyz ", "abacab"]
+        queries["where 'temp' in (123, -456, 3.12)"] = ["123", "-456", "3.12"]
+        queries["where 'temp' in (b'abc', b'xyz')"] = [b'abc', b'xyz']
+
+        for query in queries.keys():
+            elements = _getWhereElements(query)
+            self.assertEqual(elements, queries[query])
+
+    def testBadQuery(self):
+        queries = (
+            "foobar",  # no variable used
+            "wind = b'abc",  # non-closed literal
+            "(wind = b'N') & (temp = 32",  # missing paren
+            "(wind == b'N') & (temp == 32",  # missing paren
+            "(temp > 32))",  # extra paren
+            "foobar > 42",  # invalid field name
+            "42 > 7",  # no field
+            "temp > ",  # missing operand
+            "3 < temp < 7",  # chained compare
+            "temp @ 5",  # unknown operator
+            "where foobar in (1, 2)",  # invalid where field
+            "where date in (b'abc', 1)",  # wrong type for where field
+            "import subprocess; subprocess.call(['ls', '/'])",
+        )  # injection attack
+
+        dt = np.dtype([("date", "i4"), ("wind", "S5"), ("temp", "f8")])
+
+        for query in queries:
+            with self.assertRaises(ValueError, msg=query):
+                compileQuery(query, dt)
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
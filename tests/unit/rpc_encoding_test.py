@@ -0,0 +1,114 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import asyncio
+import sys
+import unittest
+
+from aiohttp import web
+
+sys.path.append("../..")
+from hsds.util.httpUtil import http_get, http_post, http_put
+from hsds.util.httpUtil import getRequestJson, rpcResponse, MSGPACK_CONTENT_TYPE
+from hsds.util.inProcessUtil import InProcessClient, getInProcessUrl
+from hsds import config
+
+DN_URL = getInProcessUrl("dn_1")
+OTHER_URL = getInProcessUrl("head")
+
+
+async def get_obj(request):
+    request.app["accepts"].append(request.headers.get("Accept"))
+    obj_json = {"id": request.match_info["id"], "links": [{"title": "a", "n": 1.5}]}
+    if request.match_info["id"] == "big":
+        # too large an int for msgpack, json is used instead
+        obj_json["value"] = 2 ** 70
+    return rpcResponse(request, obj_json)
+
+
+async def put_obj(request):
+    request.app["content_types"].append(request.content_type)
+    body = await getRequestJson(request)
+    return rpcResponse(request, {"body": body}, status=201)
+
+
+def create_app():
+    app = web.Application()
+    app["accepts"] = []
+    app["content_types"] = []
+    app.router.add_route("GET", "/objs/{id}", get_obj)
+    app.router.add_route("POST", "/objs/{id}", put_obj)
+    app.router.add_route("PUT", "/objs/{id}", put_obj)
+    app.freeze()
+    return app
+
+
+class RpcEncodingTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(RpcEncodingTest, self).__init__(*args, **kwargs)
+        # main
+
+    def tearDown(self):
+        config.setOverride("rpc_encoding", "json")
+
+    def run_requests(self, base_url):
+        async def do_requests():
+            node_app = create_app()
+            client = InProcessClient(node_app)
+            app = {"dn_urls": [DN_URL], "inprocess_clients": {base_url: client}}
+            body = {"links": {"a": {"id": "g-123", "class": "H5L_TYPE_HARD"}}, "x": None}
+            results = []
+            results.append(await http_get(app, base_url + "/objs/abc"))
+            results.append(await http_get(app, base_url + "/objs/big"))
+            results.append(await http_post(app, base_url + "/objs/abc", data=body))
+            results.append(await http_put(app, base_url + "/objs/abc", data=body))
+            # too large an int for msgpack, json is used instead
+            results.append(await http_put(app, base_url + "/objs/abc", data={"v": 2 ** 70}))
+            return results, node_app["accepts"], node_app["content_types"]
+
+        return asyncio.run(do_requests())
+
+    def checkResults(self, results):
+        self.assertEqual(results[0], {"id": "abc", "links": [{"title": "a", "n": 1.5}]})
+        self.assertEqual(results[1]["value"], 2 ** 70)
+        body = {"links": {"a": {"id": "g-123", "class": "H5L_TYPE_HARD"}}, "x": None}
+        self.assertEqual(results[2], {"body": body})
+        self.assertEqual(results[3], {"body": body})
+        self.assertEqual(results[4], {"body": {"v": 2 ** 70}})
+
+    def testMsgpack(self):
+        config.setOverride("rpc_encoding", "msgpack")
+        results, accepts, content_types = self.run_requests(DN_URL)
+        self.checkResults(results)
+        self.assertEqual(accepts, [MSGPACK_CONTENT_TYPE] * 2)
+        expected = [MSGPACK_CONTENT_TYPE] * 2 + ["application/json"]
+        self.assertEqual(content_types, expected)
+
+    def testJson(self):
+        config.setOverride("rpc_encoding", "json")
+        results, accepts, content_types = self.run_requests(DN_URL)
+        self.checkResults(results)
+        self.assertEqual(accepts, [None] * 2)
+        self.assertEqual(content_types, ["application/json"] * 3)
+
+    def testNonDnUrl(self):
+        # only DNs get msgpack requests
+        config.setOverride("rpc_encoding", "msgpack")
+        results, accepts, content_types = self.run_requests(OTHER_URL)
+        self.checkResults(results)
+        self.assertEqual(accepts, [None] * 2)
+        self.assertEqual(content_types, ["application/json"] * 3)
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
@@ -0,0 +1,107 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append("../..")
+from hsds.util.shmUtil import ShmPool, ShmAttachments
+from hsds.util.shmUtil import decodeHandle, encodeHandle, isSameHost
+
+MB = 1024 * 1024
+
+
+class ShmUtilTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(ShmUtilTest, self).__init__(*args, **kwargs)
+        # main
+
+    def testSameHost(self):
+        self.assertTrue(isSameHost("http://localhost:6101"))
+        self.assertTrue(isSameHost("http://127.0.0.1:6101"))
+        self.assertTrue(isSameHost("http+unix://%2Ftmp%2Fdn_1.sock"))
+        self.assertFalse(isSameHost("http://10.0.0.1:6101"))
+
+    def testHandle(self):
+        handle = encodeHandle("hsds_1_2", 64, 1024)
+        self.assertEqual(decodeHandle(handle), ("hsds_1_2", 64, 1024))
+        self.assertEqual(decodeHandle(handle.split(":")), ("hsds_1_2", 64, 1024))
+        for bad_handle in ("hsds_1_2:64", "other:0:10", "hsds_1:-1:10", "hsds_1:a:10", 42):
+            with self.assertRaises(ValueError):
+                decodeHandle(bad_handle)
+
+    def testPool(self):
+        pool = ShmPool(max_bytes=4 * MB, min_segment_size=MB)
+        lease = pool.lease(1000)
+        self.assertEqual(lease.nbytes, 1000)
+        name = lease.name
+        pool.release(lease)
+        # free segment is reused
+        lease = pool.lease(2000)
+        self.assertEqual(lease.name, name)
+        stats = pool.getStats()
+        self.assertEqual(stats["segment_count"], 1)
+        self.assertEqual(stats["leased"], 1)
+
+        # no room for another 4MB segment
+        self.assertTrue(pool.lease(4 * MB) is None)
+        self.assertTrue(pool.lease(0) is None)
+        self.assertEqual(pool.getStats()["miss_count"], 2)
+
+        # segment isn't reused after a failed request
+        pool.release(lease, reuse=False)
+        self.assertEqual(pool.getStats()["segment_count"], 0)
+        lease = pool.lease(4 * MB)
+        self.assertFalse(lease is None)
+        self.assertNotEqual(lease.name, name)
+        pool.release(lease)
+        # releasing twice is harmless
+        pool.release(lease)
+        pool.close()
+        self.assertEqual(pool.getStats()["size"], 0)
+
+    def testWriteArray(self):
+        pool = ShmPool(max_bytes=4 * MB)
+        attachments = ShmAttachments(max_count=2)
+        arr = np.arange(100, dtype=">i4").reshape((10, 10))
+        lease = pool.lease(2 * arr.nbytes)
+        handle = lease.getHandle(offset=arr.nbytes, nbytes=arr.nbytes)
+        self.assertEqual(attachments.writeArray(handle, arr), arr.nbytes)
+        out = lease.getArray(arr.dtype, arr.shape, offset=arr.nbytes)
+        self.assertTrue(np.array_equal(out, arr))
+        del out
+
+        # region too small
+        handle = lease.getHandle(offset=0, nbytes=arr.nbytes - 4)
+        with self.assertRaises(ValueError):
+            attachments.writeArray(handle, arr)
+        # region past end of segment
+        handle = encodeHandle(lease.name, 2 * MB, arr.nbytes)
+        with self.assertRaises(ValueError):
+            attachments.writeArray(handle, arr)
+        # unknown segment
+        with self.assertRaises(ValueError):
+            attachments.writeArray("hsds_no_such_segment:0:400", arr)
+        # vlen data isn't written to shared memory
+        vlen_arr = np.array(["abc", "de"], dtype=object)
+        self.assertTrue(attachments.writeArray(lease.getHandle(), vlen_arr) is None)
+
+        attachments.close()
+        pool.release(lease)
+        pool.close()
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
@@ -0,0 +1,222 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append("../..")
+from hsds.util.writeAheadLog import WriteAheadLog, readRecords, encodeRecord
+from hsds.util.idUtil import createObjId
+
+
+class WriteAheadLogTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(WriteAheadLogTest, self).__init__(*args, **kwargs)
+        # main
+
+    def setUp(self):
+        self.wal_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.wal_dir)
+
+    def testReplay(self):
+        root_id = createObjId("groups")
+        chunk_id = "c" + createObjId("datasets", rootid=root_id)[1:] + "_0_0"
+        dset_id = createObjId("datasets", rootid=root_id)
+
+        async def write_records():
+            wal = WriteAheadLog(self.wal_dir)
+            wal.append(root_id, header={"bucket": "mybucket"}, data=b'{"a": 1}')
+            wal.append(chunk_id, header={"bucket": "mybucket"}, data=b"\x00" * 10)
+            wal.append(root_id, header={"bucket": "mybucket"}, data=b'{"a": 2}')
+            wal.append(dset_id, header={"bucket": "mybucket"}, data=b"{}")
+            lsn = wal.append(dset_id, op="delete")
+            # concurrent commits share one write
+            await asyncio.gather(wal.commit(lsn), wal.commit(lsn), wal.commit())
+            self.assertEqual(wal.commitCount, 1)
+            self.assertEqual(wal.recordCount, 5)
+            self.assertEqual(wal.pendingCount, 0)
+            self.assertEqual(wal.dirtyCount, 2)
+            wal.close()
+
+        asyncio.run(write_records())
+
+        # simulate restart
+        wal = WriteAheadLog(self.wal_dir)
+        self.assertEqual(wal.segmentCount, 1)
+        replayed = {}
+        for header, data in wal.replay():
+            self.assertEqual(header["bucket"], "mybucket")
+            replayed[header["id"]] = data
+        self.assertEqual(len(replayed), 2)
+        self.assertEqual(replayed[root_id], b'{"a": 2}')  # latest version
+        self.assertEqual(replayed[chunk_id], b"\x00" * 10)
+        self.assertFalse(dset_id in replayed)  # deleted
+        wal.removeSegments()
+        self.assertEqual(wal.segmentCount, 0)
+
+    def testTornWrite(self):
+        obj_ids = [createObjId("groups") for i in range(3)]
+
+        async def write_records():
+            wal = WriteAheadLog(self.wal_dir, fsync="never")
+            for obj_id in obj_ids:
+                wal.append(obj_id, data=b"x" * 100)
+            await wal.commit()
+            wal.close()
+
+        asyncio.run(write_records())
+        seg_files = os.listdir(self.wal_dir)
+        self.assertEqual(len(seg_files), 1)
+        filepath = os.path.join(self.wal_dir, seg_files[0])
+        # chop off the end of the last record
+        size = os.path.getsize(filepath)
+        with open(filepath, "r+b") as f:
+            f.truncate(size - 10)
+        records = list(readRecords(filepath))
+        self.assertEqual(len(records), 2)
+        wal = WriteAheadLog(self.wal_dir)
+        replayed = [header["id"] for header, _ in wal.replay()]
+        self.assertEqual(replayed, obj_ids[:2])
+
+    def testCheckpoint(self):
+        obj_ids = [createObjId("groups") for i in range(4)]
+
+        async def write_records():
+            # small segment size so that each record gets its own segment
+            wal = WriteAheadLog(self.wal_dir, segment_size=100)
+            for obj_id in obj_ids:
+                wal.append(obj_id, data=b"x" * 100)
+                await wal.commit()
+            self.assertEqual(wal.segmentCount, 4)
+            self.assertEqual(wal.dirtyCount, 4)
+
+            # nothing clean, nothing to remove
+            self.assertEqual(wal.checkpoint(), 0)
+
+            wal.markClean(obj_ids[0])
+            wal.markClean(obj_ids[2])
+            self.assertEqual(wal.checkpoint(), 2)
+            self.assertEqual(wal.segmentCount, 2)
+
+            # a newer record for obj 1 makes its old segment removable
+            wal.append(obj_ids[1], data=b"y" * 100)
+            await wal.commit()
+            self.assertEqual(wal.checkpoint(), 1)
+            self.assertEqual(wal.segmentCount, 2)
+
+            # everything clean - all segments are removed
+            wal.markClean(obj_ids[1])
+            wal.markClean(obj_ids[3])
+            self.assertEqual(wal.dirtyCount, 0)
+            wal.checkpoint()
+            self.assertEqual(wal.segmentCount, 0)
+
+            # can keep appending after that
+            wal.append(obj_ids[0], data=b"z")
+            await wal.commit()
+            self.assertEqual(wal.segmentCount, 1)
+            wal.close()
+
+        asyncio.run(write_records())
+
+    def testCheckpointDelete(self):
+        obj_ids = [createObjId("groups") for i in range(3)]
+        deleted_id = obj_ids[1]
+
+        async def write_records():
+            # segments that hold two puts
+            record_size = len(encodeRecord({"id": obj_ids[0], "op": "put"}, b"x" * 100))
+            wal = WriteAheadLog(self.wal_dir, segment_size=2 * record_size)
+            wal.append(obj_ids[0], data=b"x" * 100)
+            wal.append(deleted_id, data=b"x" * 100)
+            await wal.commit()
+            self.assertEqual(wal.segmentCount, 1)
+            # the delete goes in the next segment
+            wal.append(deleted_id, op="delete")
+            wal.append(obj_ids[2], data=b"x" * 100)
+            wal.append(obj_ids[2], data=b"y" * 100)
+            await wal.commit()
+            self.assertEqual(wal.segmentCount, 3)
+
+            # obj 0 is still dirty, so the put for the deleted object in the
+            # first segment is kept, along with the delete
+            self.assertEqual(wal.checkpoint(), 0)
+            self.assertEqual(wal.segmentCount, 3)
+            wal.close()
+
+            replayed = [header["id"] for header, _ in WriteAheadLog(self.wal_dir).replay()]
+            self.assertEqual(set(replayed), {obj_ids[0], obj_ids[2]})
+
+            # once the first segment is gone the delete isn't needed
+            wal.markClean(obj_ids[0])
+            self.assertEqual(wal.checkpoint(), 2)
+            self.assertEqual(wal.segmentCount, 1)
+
+        asyncio.run(write_records())
+
+    def testCheckpointSuperseded(self):
+        obj_ids = [createObjId("groups") for i in range(3)]
+
+        async def write_records():
+            # segments that hold two puts
+            record_size = len(encodeRecord({"id": obj_ids[0], "op": "put"}, b"x" * 100))
+            wal = WriteAheadLog(self.wal_dir, segment_size=2 * record_size)
+            wal.append(obj_ids[0], data=b"x" * 100)
+            wal.append(obj_ids[1], data=b"x" * 100)
+            await wal.commit()
+            # newer version of obj 0 in the next segment
+            wal.append(obj_ids[0], data=b"y" * 100)
+            wal.append(obj_ids[0], data=b"z" * 100)
+            await wal.commit()
+            wal.append(obj_ids[2], data=b"x" * 200)
+            await wal.commit()
+            self.assertEqual(wal.segmentCount, 3)
+
+            # obj 1 keeps the first segment, so the second one is needed to
+            # replay the latest version of obj 0
+            wal.markClean(obj_ids[0])
+            wal.markClean(obj_ids[2])
+            self.assertEqual(wal.checkpoint(), 0)
+            self.assertEqual(wal.segmentCount, 3)
+            wal.close()
+
+            replayed = {}
+            for header, data in WriteAheadLog(self.wal_dir).replay():
+                replayed[header["id"]] = data
+            self.assertEqual(replayed[obj_ids[0]], b"z" * 100)
+
+            wal.markClean(obj_ids[1])
+            wal.checkpoint()
+            self.assertEqual(wal.segmentCount, 0)
+
+        asyncio.run(write_records())
+
+    def testFsyncPolicy(self):
+        try:
+            WriteAheadLog(self.wal_dir, fsync="sometimes")
+            self.assertTrue(False)
+        except ValueError:
+            pass  # expected
+        for policy in ("always", "interval", "never"):
+            wal = WriteAheadLog(self.wal_dir, fsync=policy)
+            self.assertEqual(wal.fsyncPolicy, policy)
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
@@ -0,0 +1,80 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import sys
+import unittest
+
+sys.path.append("../..")
+from hsds.util.writeConcurrency import WriteConcurrency
+
+
+class WriteConcurrencyTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(WriteConcurrencyTest, self).__init__(*args, **kwargs)
+        # main
+
+    def runRound(self, wc, latency=0.1, nbytes=1024, errors=0):
+        count = wc.limit
+        for i in range(count):
+            if i < errors:
+                wc.recordError()
+            else:
+                wc.record(nbytes, latency)
+
+    def testIncrease(self):
+        wc = WriteConcurrency(min_count=2, max_count=20)
+        self.assertEqual(wc.limit, 2)
+        # slow start doubles the limit each round
+        self.runRound(wc)
+        self.assertEqual(wc.limit, 4)
+        self.runRound(wc)
+        self.assertEqual(wc.limit, 8)
+        self.runRound(wc)
+        self.runRound(wc)
+        self.assertEqual(wc.limit, 20)  # capped at max
+        self.runRound(wc)
+        self.assertEqual(wc.limit, 20)
+        self.assertEqual(wc.writeCount, 2 + 4 + 8 + 16 + 20)
+        self.assertTrue(wc.bandwidth > 0.0)
+        self.assertAlmostEqual(wc.latency, 0.1)
+
+    def testDecrease(self):
+        wc = WriteConcurrency(min_count=2, max_count=100)
+        for i in range(3):
+            self.runRound(wc)
+        self.assertEqual(wc.limit, 16)
+        # errors cut the limit in half and end slow start
+        self.runRound(wc, errors=1)
+        self.assertEqual(wc.limit, 8)
+        self.assertEqual(wc.errorCount, 1)
+        # after that, additive increase
+        self.runRound(wc)
+        self.assertEqual(wc.limit, 9)
+        # latency spike with no more bytes getting written
+        self.runRound(wc, latency=1.0, nbytes=0)
+        self.assertEqual(wc.limit, 4)
+        # never goes below min
+        for i in range(3):
+            self.runRound(wc, errors=1)
+        self.assertEqual(wc.limit, 2)
+
+    def testLimits(self):
+        wc = WriteConcurrency(min_count=0, max_count=0)
+        self.assertEqual(wc.minCount, 1)
+        self.assertEqual(wc.maxCount, 1)
+        self.runRound(wc)
+        self.assertEqual(wc.limit, 1)
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
@@ -0,0 +1,102 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import asyncio
+import sys
+import time
+import unittest
+import numpy as np
+
+sys.path.append("../..")
+from hsds.util.writeCredit import WriteCredit
+from hsds.util.lruCache import LruCache
+from hsds.util.idUtil import createObjId
+
+
+class WriteCreditTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(WriteCreditTest, self).__init__(*args, **kwargs)
+        # main
+
+    def testCredit(self):
+        wc = WriteCredit(name="dn1")
+        # no credit info yet, anything goes
+        self.assertEqual(wc.credit, None)
+        self.assertTrue(wc.hasCredit(1000))
+
+        wc.update(1000, flush_rate=0.0)
+        self.assertTrue(wc.hasCredit(2000))  # nothing inflight, let it probe
+
+        async def charge():
+            await wc.acquire(600)
+            self.assertEqual(wc.inflight, 600)
+            self.assertTrue(wc.hasCredit(400))
+            self.assertFalse(wc.hasCredit(500))
+            wc.release(600)
+            self.assertEqual(wc.inflight, 0)
+
+        asyncio.run(charge())
+        self.assertEqual(wc.waitCount, 0)
+
+        # with no flush rate, wait the max time
+        self.assertEqual(wc.getWait(5000), 1.0)
+        wc.update(0, flush_rate=1000.0)
+        wait = wc.getWait(500)
+        self.assertTrue(wait > 0.4)
+        self.assertTrue(wait <= 0.5)
+
+    def testPacing(self):
+        wc = WriteCredit(name="dn1", max_wait=0.1)
+        # DN is full, but flushing 10000 bytes/sec
+        wc.update(0, flush_rate=10000.0)
+
+        async def send(nbytes):
+            await wc.acquire(nbytes)
+            await asyncio.sleep(0.01)
+            wc.release(nbytes)
+
+        async def send_all():
+            await asyncio.gather(*[send(500) for i in range(4)])
+
+        start = time.time()
+        asyncio.run(send_all())
+        elapsed = time.time() - start
+        # first request is sent right away, the others need to wait
+        # for credit to accumulate
+        self.assertTrue(wc.waitCount > 0)
+        self.assertTrue(elapsed > 0.1)
+        self.assertEqual(wc.inflight, 0)
+
+    def testFlushRate(self):
+        cc = LruCache(mem_target=1000 * 1000 * 10, name="ChunkCache")
+        self.assertEqual(cc.flushRate, 0.0)
+        ids = []
+        for i in range(4):
+            id = createObjId("chunks")
+            cc[id] = np.zeros((1000,), dtype="i4")
+            cc.setDirty(id)
+            ids.append(id)
+        self.assertEqual(cc.memDirty, 16000)
+        self.assertEqual(cc.memFree, 1000 * 1000 * 10 - 16000)
+        cc.clearDirty(ids[0])
+        # rate isn't computed till a window has passed
+        self.assertEqual(cc.flushRate, 0.0)
+        time.sleep(1.0)
+        cc.clearDirty(ids[1])
+        rate = cc.flushRate
+        self.assertTrue(rate > 0.0)
+        self.assertTrue(rate <= 8000.0)
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()
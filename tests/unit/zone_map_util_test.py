@@ -0,0 +1,163 @@
+##############################################################################
+# Copyright by The HDF Group.                                                #
+# All rights reserved.                                                       #
+#                                                                            #
+# This file is part of HSDS (HDF5 Scalable Data Service), Libraries and      #
+# Utilities.  The full HSDS copyright notice, including                      #
+# terms governing use, modification, and redistribution, is contained in     #
+# the file COPYING, which can be found at the root of the source code        #
+# distribution tree.  If you do not have access to this file, you may        #
+# request a copy from help@hdfgroup.org.                                     #
+##############################################################################
+import json
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append("../..")
+from hsds.util.idUtil import createObjId, getS3Key, isS3ObjKey
+from hsds.util.zoneMapUtil import getChunkStats, getZoneMapKey, getChunkCoordKey
+from hsds.util.zoneMapUtil import isZoneMapType, getZoneMapFields, isZoneMapDataset
+from hsds.util.zoneMapUtil import getChunkKeyIndex, decodeKeys, checkIndexedFields
+
+
+class ZoneMapUtilTest(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super(ZoneMapUtilTest, self).__init__(*args, **kwargs)
+        # main
+
+    def testZoneMapType(self):
+        dt = np.dtype([("date", "i4"), ("symbol", "S4"), ("temp", "f4"),
+                       ("vec", "f8", (3,)), ("ok", "?")])
+        self.assertEqual(getZoneMapFields(dt), ["date", "temp"])
+        self.assertTrue(isZoneMapType(dt, 1))
+        self.assertFalse(isZoneMapType(dt, 2))
+        self.assertFalse(isZoneMapType(dt, 0))
+        self.assertFalse(isZoneMapType(np.dtype("f8"), 1))
+        self.assertFalse(isZoneMapType(np.dtype([("symbol", "S4")]), 1))
+
+    def testGetChunkStats(self):
+        dt = np.dtype([("date", "i4"), ("symbol", "S4"), ("temp", "f4"),
+                       ("big", "u8"), ("empty", "f8")])
+        arr = np.zeros((6,), dtype=dt)
+        arr["date"] = [5, -3, 12, 7, 7, 0]
+        arr["temp"] = [np.nan, 61.5, 40.25, np.nan, 70.0, 55.0]
+        arr["big"] = 2 ** 64 - 1
+        arr["empty"] = np.nan
+        stats = getChunkStats(arr)
+        self.assertEqual(set(stats), {"date", "temp", "big", "empty"})
+        self.assertEqual(stats["date"], [-3, 12, 0])
+        self.assertEqual(stats["temp"], [40.25, 70.0, 2])
+        self.assertEqual(stats["big"], [2 ** 64 - 1, 2 ** 64 - 1, 0])
+        self.assertEqual(stats["empty"], [None, None, 6])
+        # stats get sent as json
+        self.assertEqual(json.loads(json.dumps(stats)), stats)
+
+        self.assertEqual(getChunkStats(arr.reshape((2, 3))), None)
+        self.assertEqual(getChunkStats(np.arange(10)), None)
+        self.assertEqual(getChunkStats(arr[0:0]), None)
+
+    def testKeys(self):
+        root_id = createObjId("roots")
+        dset_id = createObjId("datasets", rootid=root_id)
+        stats_key = getZoneMapKey(dset_id)
+        dset_key = getS3Key(dset_id)
+        self.assertTrue(dset_key.endswith("/.dataset.json"))
+        self.assertEqual(stats_key, dset_key[: -len(".dataset.json")] + ".stats.json")
+        # the stats object isn't counted as a chunk or other object
+        self.assertFalse(isS3ObjKey(stats_key))
+
+        chunk_id = "c-" + dset_id[2:] + "_12"
+        self.assertEqual(getChunkCoordKey(chunk_id), "12")
+        chunk_id = "c3-" + dset_id[2:] + "_3_4"
+        self.assertEqual(getChunkCoordKey(chunk_id), "3_4")
+        with self.assertRaises(ValueError):
+            getChunkCoordKey(dset_id)
+
+    def testZoneMapDataset(self):
+        root_id = createObjId("roots")
+        type_json = {"class": "H5T_COMPOUND", "fields": [
+            {"name": "date", "type": "H5T_STD_I32LE"},
+            {"name": "symbol", "type": {"class": "H5T_STRING", "charSet": "H5T_CSET_ASCII",
+                                        "length": 4, "strPad": "H5T_STR_NULLPAD"}}]}
+        dset_json = {"id": createObjId("datasets", rootid=root_id), "type": type_json,
+                     "shape": {"class": "H5S_SIMPLE", "dims": [100]}}
+        self.assertTrue(isZoneMapDataset(dset_json))
+        dset_json["shape"] = {"class": "H5S_SIMPLE", "dims": [10, 10]}
+        self.assertFalse(isZoneMapDataset(dset_json))
+        dset_json["shape"] = {"class": "H5S_SCALAR"}
+        self.assertFalse(isZoneMapDataset(dset_json))
+        # schema v1 ids don't get zone maps
+        dset_json["id"] = createObjId("datasets")
+        dset_json["shape"] = {"class": "H5S_SIMPLE", "dims": [100]}
+        self.assertFalse(isZoneMapDataset(dset_json))
+
+    def testIndexedDataset(self):
+        root_id = createObjId("roots")
+        type_json = {"class": "H5T_COMPOUND", "fields": [
+            {"name": "symbol", "type": {"class": "H5T_STRING", "charSet": "H5T_CSET_ASCII",
+                                        "length": 4, "strPad": "H5T_STR_NULLPAD"}}]}
+        dset_json = {"id": createObjId("datasets", rootid=root_id), "type": type_json,
+                     "shape": {"class": "H5S_SIMPLE", "dims": [100]}}
+        # no numeric fields
+        self.assertFalse(isZoneMapDataset(dset_json))
+        dset_json["creationProperties"] = {"indexedFields": ["symbol"]}
+        self.assertTrue(isZoneMapDataset(dset_json))
+
+    def testCheckIndexedFields(self):
+        dt = np.dtype([("date", "i4"), ("symbol", "S4"), ("temp", "f4"),
+                       ("vec", "i4", (3,))])
+        checkIndexedFields(["date", "symbol"], dt, 1)
+        checkIndexedFields([], dt, 1)
+        bad_values = (
+            ("date", 1),  # not a list
+            (["temp"], 1),  # float field
+            (["vec"], 1),  # array field
+            (["foo"], 1),  # not a field
+            (["date", "date"], 1),  # duplicate
+            (["date"], 2),  # not one-dimensional
+        )
+        for fields, rank in bad_values:
+            with self.assertRaises(ValueError, msg=str(fields)):
+                checkIndexedFields(fields, dt, rank)
+        with self.assertRaises(ValueError):
+            checkIndexedFields(["date"], np.dtype("i4"), 1)
+
+    def testGetChunkIndex(self):
+        dt = np.dtype([("date", "i4"), ("symbol", "S4"), ("temp", "f4")])
+        arr = np.zeros((8,), dtype=dt)
+        arr["date"] = [5, 3, 5, 9, 3, 3, 1, 5]
+        arr["symbol"] = [b"IBM", b"AAPL", b"IBM", b"A\xff", b"AAPL", b"EBAY", b"A", b"IBM"]
+        index = getChunkKeyIndex(arr, ["date", "symbol"])
+        self.assertEqual(index["date"], [[1, 3, 5, 9], [6, 1, 0, 3], [7, 6, 8, 4]])
+        keys, starts, stops = index["symbol"]
+        self.assertEqual(keys, ["A", "AAPL", "A\xff", "EBAY", "IBM"])
+        self.assertEqual(starts, [6, 1, 3, 5, 0])
+        self.assertEqual(stops, [7, 5, 4, 6, 8])
+        # index gets sent as json
+        self.assertEqual(json.loads(json.dumps(index)), index)
+        keys = decodeKeys(keys, dt["symbol"])
+        self.assertEqual(keys.dtype, dt["symbol"])
+        self.assertEqual(keys.tolist(), [b"A", b"AAPL", b"A\xff", b"EBAY", b"IBM"])
+        # every row with a key is in its range
+        for field in ("date", "symbol"):
+            keys, starts, stops = index[field]
+            keys = decodeKeys(keys, dt[field])
+            for key, start, stop in zip(keys, starts, stops):
+                rows = np.flatnonzero(arr[field] == key)
+                self.assertEqual(rows.min(), start)
+                self.assertEqual(rows.max() + 1, stop)
+
+        # too many keys
+        index = getChunkKeyIndex(arr, ["date", "symbol"], max_keys=4)
+        self.assertEqual(index["date"], [[1, 3, 5, 9], [6, 1, 0, 3], [7, 6, 8, 4]])
+        self.assertEqual(index["symbol"], None)
+        self.assertEqual(getChunkKeyIndex(arr[0:0], ["date"]), None)
+        self.assertEqual(getChunkKeyIndex(np.arange(10), ["date"]), None)
+
+
+if __name__ == "__main__":
+    # setup test files
+
+    unittest.main()